@@ -7,6 +7,10 @@
  * with an OpenMV camera for ball and goal detection.
  */
 
+#include "vision_stream_parser.h"
+#include "task_scheduler.h"
+#include "omni_kinematics.h"
+
 // Motors pin configuration
 const int motorDirectionPins[4] = {4, 12, 8, 7};  // Direction pins for motors 0-3
 const int motorSpeedPins[4] = {3, 11, 5, 6};      // Speed pins (PWM) for motors 0-3
@@ -19,14 +23,13 @@ const int TURN_SPEED = 120;       // Speed for rotation
 const float DISTANCE_THRESHOLD = 15.0;  // CM - when to slow down
 const float CLOSE_THRESHOLD = 5.0;      // CM - when to consider "arrived"
 const float ANGLE_MARGIN = 10.0;        // Degrees - precision for angle alignment
+const float LINE_AVOID_DISTANCE = 20.0; // CM - back away from a field line closer than this
+const float LINE_AVOID_MARGIN = 60.0;   // Degrees - only if we are heading towards it
 
 // Communication parameters
 const int ARDUINO_RX_PIN = 10; // RX pin for Arduino (connects to OpenMV TX)
 const int ARDUINO_TX_PIN = 9;  // TX pin for Arduino (connects to OpenMV RX)
-const int BUFFER_SIZE = 256;    // Buffer size for RPC messages
-char buffer[BUFFER_SIZE];       // Buffer for incoming messages
-int bufferIndex = 0;            // Current position in buffer
-bool messageComplete = false;   // Whether a complete message has been received
+VisionStreamParser visionParser; // Parses OpenMV messages byte by byte as they arrive
 
 // Object detection data
 bool ballDetected = false;         // Whether ball is currently detected
@@ -42,17 +45,67 @@ bool blueGoalDetected = false;     // Whether blue goal is detected
 float blueGoalAngle = 0.0;         // Angle to blue goal
 float blueGoalDistance = 100.0;    // Distance to blue goal
 
+bool lineDetected = false;         // Whether a white field line is seen
+float lineAngle = 0.0;             // Angle to the nearest point of the line
+float lineDistance = 100.0;        // Distance to the nearest point of the line
+
+// Obstacle free-space profile: distance to the first obstacle for evenly
+// spaced camera bearings (index i covers i * 360 / freeSpaceCount degrees)
+const int MAX_FREE_SPACE_BEARINGS = VISION_FREE_BEARINGS;
+const int FREE_SPACE_CLEAR = VISION_FREE_CLEAR; // No obstacle seen on this bearing
+uint8_t freeSpaceCm[MAX_FREE_SPACE_BEARINGS];
+int freeSpaceCount = 0;
+
+// Latency log: one "LAT,seq,captureMs,procMs,rxUs,motorUs,parseErrors" line
+// per camera frame on the USB serial port, for host/latency.py. captureMs
+// and procMs are on the camera's clock, rxUs and motorUs on ours. motorUs is
+// the first motor write after the frame arrived, latched by motorTask, or 0
+// if the next frame replaced it first. Records wait in a small queue until
+// debugTask prints them, so frames arriving between debug runs are all logged.
+const bool LOG_LATENCY = true;
+const int LATENCY_QUEUE = 8;              // Records kept between debugTask runs; the oldest is dropped when full
+struct LatencyRecord {
+  unsigned long seq, captureMs, procMs, rxUs, motorUs, errors;
+};
+LatencyRecord latencyQueue[LATENCY_QUEUE];
+int latencyHead = 0;                      // Oldest record not printed yet
+int latencyCount = 0;
+bool frameAwaitingMotor = false;          // The newest record still waits for its first motor write
+
 // Timing variables
 unsigned long lastDetectionTime = 0;      // Last time an object was detected
 const unsigned long TIMEOUT_MS = 1000;    // Time without detection before stopping
 unsigned long lastDebugTime = 0;          // Time of last debug output
 const unsigned long DEBUG_INTERVAL = 500; // Interval for debug output
 
+// Fixed-rate tasks. Serial ingest runs most often so the UART buffer never
+// fills; debug printing has its own slot so the time spent printing no
+// longer changes how often the motors are updated.
+TaskScheduler scheduler;
+const unsigned long SERIAL_PERIOD_US = 1000;
+const unsigned long CONTROL_PERIOD_US = 10000;
+const unsigned long MOTOR_PERIOD_US = 10000;
+const unsigned long DEBUG_PERIOD_US = 20000;
+const bool LOG_SCHEDULER = true;              // Print the task statistics every SCHEDULER_LOG_MS
+const unsigned long SCHEDULER_LOG_MS = 5000;
+unsigned long lastSchedulerLogTime = 0;
+
+// Motor command from the control task, written out by the motor task
+int motorCommand[4] = {0, 0, 0, 0};
+bool motorCommandPending = false;
+const char *motionState = "";             // What the control task did last, for the debug output
+
 // Function declarations
-void parseMessage(const char* message); // Renamed from parseRPCMessage
+void serialTask();
+void controlTask();
+void motorTask();
+void debugTask();
+void applyVisionMessage();
+void logLatency();
 void moveTowardsBall();
 void rotateToAngle(float targetAngle);
 void moveOmniDirectional(float angle, float speed);
+void turnInPlace(int speed);
 void stopMotors();
 void setMotorSpeeds(int m0, int m1, int m2, int m3);
 
@@ -73,6 +126,8 @@ void setup() {
   // Initialize all motors to stopped
   stopMotors();
   
+  visionParser.begin();
+  
   Serial.println("Omnidirectional Robot Controller Initialized");
   Serial.println("Waiting for OpenMV RPC data...");
   
@@ -87,67 +142,46 @@ void setup() {
   Serial1.begin(115200);
   Serial.println("[DEBUG] Serial1 for OpenMV initialized");
 #endif
+
+  scheduler.begin();
+  scheduler.add("serial", serialTask, SERIAL_PERIOD_US);
+  scheduler.add("control", controlTask, CONTROL_PERIOD_US);
+  scheduler.add("motors", motorTask, MOTOR_PERIOD_US);
+  scheduler.add("debug", debugTask, DEBUG_PERIOD_US);
+  scheduler.start();
 }
 
 void loop() {
-  // Check for incoming UART data from OpenMV
+  scheduler.poll();
+}
+
+// Check for incoming UART data from OpenMV. Each byte advances the parser;
+// a complete line is applied as soon as its newline arrives.
+void serialTask() {
 #if defined(ARDUINO_AVR_UNO)
   while (OpenMVSerial.available() > 0) {
-    // Read a character
-    char c = OpenMVSerial.read();
-    
-    // Process complete messages on newline
-    if (c == '\n') {
-      // Null-terminate the string
-      buffer[bufferIndex] = '\0';
-      
-      // Process the message
-      messageComplete = true;
-      
-      // Reset buffer for next message
-      bufferIndex = 0;
-    } 
-    // Add character to buffer if there's room
-    else if (bufferIndex < BUFFER_SIZE - 1) {
-      buffer[bufferIndex++] = c;
+    if (visionParser.feed(OpenMVSerial.read())) {
+      applyVisionMessage();
     }
   }
 #else
   while (Serial1.available() > 0) {
-    // Read a character
-    char c = Serial1.read();
-    
-    // Process complete messages on newline
-    if (c == '\n') {
-      // Null-terminate the string
-      buffer[bufferIndex] = '\0';
-      
-      // Process the message
-      messageComplete = true;
-      
-      // Reset buffer for next message
-      bufferIndex = 0;
-    } 
-    // Add character to buffer if there's room
-    else if (bufferIndex < BUFFER_SIZE - 1) {
-      buffer[bufferIndex++] = c;
+    if (visionParser.feed(Serial1.read())) {
+      applyVisionMessage();
     }
   }
 #endif
-  
-  // Process complete messages
-  if (messageComplete) {
-    parseMessage(buffer); // Call renamed function
-    messageComplete = false;
-  }
-  
+}
+
+// Decide the motor command from the latest detections
+void controlTask() {
   // Check for detection timeout
   if (millis() - lastDetectionTime > TIMEOUT_MS) {
     // Stop if we haven't seen the ball recently
     if (ballDetected) {
       ballDetected = false;
       stopMotors();
-      Serial.println("Ball detection timed out, stopping");
+      motionState = "Ball detection timed out, stopping";
     }
   }
   
@@ -156,6 +190,41 @@ void loop() {
     moveTowardsBall();
     lastDetectionTime = millis();
   }
+}
+
+// Write the latest motor command to the driver
+void motorTask() {
+  if (!motorCommandPending) {
+    return;
+  }
+  for (int i = 0; i < 4; i++) {
+    int speed = motorCommand[i];
+    
+    // Set direction based on speed sign
+    if (speed >= 0) {
+      digitalWrite(motorDirectionPins[i], HIGH);
+    } else {
+      digitalWrite(motorDirectionPins[i], LOW);
+      speed = -speed; // Make speed positive for PWM
+    }
+    
+    // Apply PWM (constrain to valid range)
+    speed = constrain(speed, 0, 255);
+    analogWrite(motorSpeedPins[i], speed);
+  }
+  motorCommandPending = false;
+  if (frameAwaitingMotor) {
+    // First write since the frame arrived
+    latencyQueue[(latencyHead + latencyCount - 1) % LATENCY_QUEUE].motorUs = micros();
+    frameAwaitingMotor = false;
+  }
+}
+
+// All Serial output happens here
+void debugTask() {
+  if (LOG_LATENCY) {
+    logLatency();
+  }
   
   // Print debug info periodically
   if (millis() - lastDebugTime > DEBUG_INTERVAL) {
@@ -167,89 +236,103 @@ void loop() {
       Serial.print("cm Confidence=");
       Serial.println(ballConfidence);
     }
+    if (motionState[0]) {
+      Serial.println(motionState);
+      motionState = "";
+    }
     lastDebugTime = millis();
   }
+  
+  if (LOG_SCHEDULER && millis() - lastSchedulerLogTime > SCHEDULER_LOG_MS) {
+    scheduler.printStats(Serial);
+    lastSchedulerLogTime = millis();
+  }
 }
 
-void parseMessage(const char* message) { // Renamed from parseRPCMessage
-  // Look for the ball data section
-  char* ballSection = strstr(message, "\"ball\":");
-  if (ballSection != NULL) {
-    char* foundStr = strstr(ballSection, "\"found\":");
-    if (foundStr != NULL && strstr(foundStr, "true") != NULL) {
-      // Ball was found
-      ballDetected = true;
-      
-      // Extract angle
-      char* angleStr = strstr(ballSection, "\"angle\":");
-      if (angleStr != NULL) {
-        ballAngle = atof(angleStr + 8); // Skip "angle":
-      }
-      
-      // Extract distance
-      char* distStr = strstr(ballSection, "\"distance\":");
-      if (distStr != NULL) {
-        ballDistance = atof(distStr + 11); // Skip "distance":
-      }
-      
-      // Extract confidence
-      char* confStr = strstr(ballSection, "\"confidence\":");
-      if (confStr != NULL) {
-        ballConfidence = atof(confStr + 13); // Skip "confidence":
-      }
-      
-      // Update last detection time
+// Copy the targets of the line the parser just committed. Sections missing
+// from the line keep their previous values.
+void applyVisionMessage() {
+  if (LOG_LATENCY && visionParser.frameUpdated) {
+    if (latencyCount == LATENCY_QUEUE) {
+      latencyHead = (latencyHead + 1) % LATENCY_QUEUE;
+      latencyCount--;
+    }
+    LatencyRecord &r = latencyQueue[(latencyHead + latencyCount) % LATENCY_QUEUE];
+    r.seq = visionParser.frameSeq;
+    r.captureMs = visionParser.frameCaptureMs;
+    r.procMs = visionParser.frameProcessingMs;
+    r.rxUs = micros();
+    r.motorUs = 0;
+    r.errors = visionParser.errors;
+    latencyCount++;
+    frameAwaitingMotor = true;   // A frame replaced before any write keeps motorUs 0
+  }
+  
+  const VisionTarget &ball = visionParser.targets[VISION_BALL];
+  if (ball.updated) {
+    ballDetected = ball.found;
+    if (ball.found) {
+      ballAngle = ball.angle;
+      ballDistance = ball.distance;
+      ballConfidence = ball.confidence;
       lastDetectionTime = millis();
-    } else {
-      ballDetected = false;
     }
   }
   
-  // Parse yellow goal data
-  char* yellowSection = strstr(message, "\"yellow_goal\":");
-  if (yellowSection != NULL) {
-    char* foundStr = strstr(yellowSection, "\"found\":");
-    if (foundStr != NULL && strstr(foundStr, "true") != NULL) {
-      yellowGoalDetected = true;
-      
-      // Extract angle
-      char* angleStr = strstr(yellowSection, "\"angle\":");
-      if (angleStr != NULL) {
-        yellowGoalAngle = atof(angleStr + 8);
-      }
-      
-      // Extract distance
-      char* distStr = strstr(yellowSection, "\"distance\":");
-      if (distStr != NULL) {
-        yellowGoalDistance = atof(distStr + 11);
-      }
-    } else {
-      yellowGoalDetected = false;
+  const VisionTarget &yellow = visionParser.targets[VISION_YELLOW_GOAL];
+  if (yellow.updated) {
+    yellowGoalDetected = yellow.found;
+    if (yellow.found) {
+      yellowGoalAngle = yellow.angle;
+      yellowGoalDistance = yellow.distance;
     }
   }
   
-  // Parse blue goal data
-  char* blueSection = strstr(message, "\"blue_goal\":");
-  if (blueSection != NULL) {
-    char* foundStr = strstr(blueSection, "\"found\":");
-    if (foundStr != NULL && strstr(foundStr, "true") != NULL) {
-      blueGoalDetected = true;
-      
-      // Extract angle
-      char* angleStr = strstr(blueSection, "\"angle\":");
-      if (angleStr != NULL) {
-        blueGoalAngle = atof(angleStr + 8);
-      }
-      
-      // Extract distance
-      char* distStr = strstr(blueSection, "\"distance\":");
-      if (distStr != NULL) {
-        blueGoalDistance = atof(distStr + 11);
-      }
-    } else {
-      blueGoalDetected = false;
+  const VisionTarget &blue = visionParser.targets[VISION_BLUE_GOAL];
+  if (blue.updated) {
+    blueGoalDetected = blue.found;
+    if (blue.found) {
+      blueGoalAngle = blue.angle;
+      blueGoalDistance = blue.distance;
     }
   }
+  
+  const VisionTarget &line = visionParser.targets[VISION_LINE];
+  if (line.updated) {
+    lineDetected = line.found;
+    if (line.found) {
+      lineAngle = line.angle;
+      lineDistance = line.distance;
+    }
+  }
+  
+  // Obstacle free-space profile, already scaled to cm by the parser
+  if (visionParser.freeSpaceUpdated) {
+    freeSpaceCount = visionParser.freeSpaceCount;
+    memcpy(freeSpaceCm, visionParser.freeSpaceCm, freeSpaceCount);
+  }
+}
+
+// Print the queued records that are final: all but a newest one still waiting for its motor write
+void logLatency() {
+  int ready = frameAwaitingMotor ? latencyCount - 1 : latencyCount;
+  for (int n = 0; n < ready; n++) {
+    const LatencyRecord &r = latencyQueue[latencyHead];
+    Serial.print("LAT,");
+    Serial.print(r.seq);
+    Serial.print(',');
+    Serial.print(r.captureMs);
+    Serial.print(',');
+    Serial.print(r.procMs);
+    Serial.print(',');
+    Serial.print(r.rxUs);
+    Serial.print(',');
+    Serial.print(r.motorUs);
+    Serial.print(',');
+    Serial.println(r.errors);
+    latencyHead = (latencyHead + 1) % LATENCY_QUEUE;
+    latencyCount--;
+  }
 }
 
 void moveTowardsBall() {
@@ -266,6 +349,19 @@ void moveTowardsBall() {
   float angleDiff = robotAngleToBall;
   if (angleDiff > 180) angleDiff -= 360; // e.g., 270 becomes -90 (turn left)
 
+  // Don't drive out over the field line: if it is close and roughly in the
+  // direction of the ball, move straight away from it instead
+  if (lineDetected && lineDistance < LINE_AVOID_DISTANCE) {
+    float robotAngleToLine = lineAngle - 90;
+    float lineDiff = robotAngleToBall - robotAngleToLine;
+    while (lineDiff > 180) lineDiff -= 360;
+    while (lineDiff < -180) lineDiff += 360;
+    if (abs(lineDiff) < LINE_AVOID_MARGIN) {
+      moveOmniDirectional(robotAngleToLine + 180, SLOW_SPEED);
+      return;
+    }
+  }
+
   // Choose appropriate movement based on ball position
   if (abs(angleDiff) < ANGLE_MARGIN || ballDistance < DISTANCE_THRESHOLD) {
     // Ball is roughly in front or very close, move directly toward it
@@ -283,7 +379,7 @@ void moveTowardsBall() {
     if (ballDistance <= CLOSE_THRESHOLD) {
       // We're very close to the ball, optionally perform action
       stopMotors(); // Stop when very close
-      Serial.println("Ball reached!");
+      motionState = "Ball reached!";
     }
   } else {
     // Need to rotate significantly first
@@ -301,92 +397,50 @@ void rotateToAngle(float angleDifference) {
   
   // Determine rotation direction
   if (angleDifference > 0) { // Ball is to the right, robot needs to turn right (clockwise)
-    // Rotate clockwise (motors: M0,M2 forward; M1,M3 backward for typical X omni)
-    // This depends heavily on motor setup and omni wheel type. Assuming standard X-drive:
-    // To rotate clockwise: all wheels push tangentially clockwise.
-    // M0 (FL), M2 (RR) -> HIGH (forward/clockwise spin of wheel)
-    // M1 (FR), M3 (RL) -> LOW (backward/clockwise spin of wheel)
-    // This is simplified, actual omni rotation might need specific motor directions.
-    // For simple rotation, all wheels can spin in the same direction if mounted appropriately.
-    // Let's assume all motors spinning one way rotates the chassis.
-    digitalWrite(motorDirectionPins[0], HIGH); analogWrite(motorSpeedPins[0], rotationSpeed);
-    digitalWrite(motorDirectionPins[1], LOW);  analogWrite(motorSpeedPins[1], rotationSpeed);
-    digitalWrite(motorDirectionPins[2], HIGH); analogWrite(motorSpeedPins[2], rotationSpeed);
-    digitalWrite(motorDirectionPins[3], LOW);  analogWrite(motorSpeedPins[3], rotationSpeed);
-    Serial.println("Rotating Clockwise");
+    // Rotate clockwise: M0 (FL) and M2 (RL) forward, M1 (FR) and M3 (RR) backward
+    // (OMNI_TURN in omni_kinematics.h). This depends on motor setup and wheel mounting.
+    turnInPlace(rotationSpeed);
+    motionState = "Rotating Clockwise";
 
   } else { // Ball is to the left, robot needs to turn left (counter-clockwise)
     // Rotate counterclockwise
-    digitalWrite(motorDirectionPins[0], LOW);  analogWrite(motorSpeedPins[0], rotationSpeed);
-    digitalWrite(motorDirectionPins[1], HIGH); analogWrite(motorSpeedPins[1], rotationSpeed);
-    digitalWrite(motorDirectionPins[2], LOW);  analogWrite(motorSpeedPins[2], rotationSpeed);
-    digitalWrite(motorDirectionPins[3], HIGH); analogWrite(motorSpeedPins[3], rotationSpeed);
-    Serial.println("Rotating Counter-Clockwise");
+    turnInPlace(-rotationSpeed);
+    motionState = "Rotating Counter-Clockwise";
   }
 }
 
+// Rotate on the spot, positive speed clockwise
+void turnInPlace(int speed) {
+  int speeds[4];
+  omniMix(0, 0, speed, speeds);
+  setMotorSpeeds(speeds[0], speeds[1], speeds[2], speeds[3]);
+}
+
 // Move the robot in any direction using omnidirectional wheels
 void moveOmniDirectional(float angleDegrees, float speed) {
   // angleDegrees is relative to the robot's front (0 is straight ahead).
-  float angleRad = angleDegrees * PI / 180.0;
-  
-  // Calculate X and Y components for movement
-  // Y is forward/backward, X is left/right
-  float moveX = sin(angleRad) * speed; // Strafe component
-  float moveY = cos(angleRad) * speed; // Forward/backward component
-
-  // Motor speeds for a 4-wheel omni-drive (X configuration)
-  // M0: Front-Left, M1: Front-Right, M2: Rear-Right, M3: Rear-Left
-  // These formulas assume motors are numbered 0,1,2,3 starting front-left and going clockwise.
-  // And that HIGH on direction pin is forward spin of the wheel.
-  // Adjust signs based on your specific motor wiring and mounting.
-  int m0_speed = round(moveY + moveX); // Front-Left
-  int m1_speed = round(moveY - moveX); // Front-Right
-  int m2_speed = round(moveY - moveX); // Rear-Left (for X-drive, should be same as FR for forward, opposite for strafe)
-                            // Corrected: M2 (RL) should be similar to M1 for forward, opposite for strafe. 
-                            // Let's use a widely accepted X-Drive model:
-  // Motor 0 (Front-Left):  +vy +vx +vt
-  // Motor 1 (Front-Right): +vy -vx -vt
-  // Motor 2 (Rear-Left):   +vy -vx +vt  -- this is if motors are FL, FR, RL, RR
-  // Motor 3 (Rear-Right):  +vy +vx -vt
-  // Our pins are {4,3 FL}, {12,11 FR}, {8,5 RL}, {7,6 RR}
-  // So motorDirectionPins[0] is FL, [1] is FR, [2] is RL, [3] is RR.
-
-  // Assuming no rotation component for now (vt=0)
+  // Motor speeds for a 4-wheel omni-drive (X configuration), motors
+  // 0 FL, 1 FR, 2 RL, 3 RR:
+  //   FL = forward + right, FR = forward - right, RL = forward - right, RR = forward + right
+  // Our pins are {4,3 FL}, {12,11 FR}, {8,5 RL}, {7,6 RR}. The mixing is done
+  // in fixed point with a sine table (omni_kinematics.h), which avoids the
+  // software float sin()/cos() of AVR boards.
   int speeds[4];
-  speeds[0] = round(moveY + moveX); // Motor 0 (FL)
-  speeds[1] = round(moveY - moveX); // Motor 1 (FR)
-  speeds[2] = round(moveY - moveX); // Motor 2 (RL) - Error in previous logic, for X drive RL is often moveY - moveX for forward, moveY + moveX for strafe right
-  speeds[3] = round(moveY + moveX); // Motor 3 (RR)
+  omniMix((int16_t)round(angleDegrees * 10), (int16_t)speed, 0, speeds);
   
   setMotorSpeeds(speeds[0], speeds[1], speeds[2], speeds[3]);
 }
 
-// Set speeds for all four motors
+// Set speeds for all four motors; the motor task writes them out
 void setMotorSpeeds(int m0, int m1, int m2, int m3) {
-  int motorSpeeds[4] = {m0, m1, m2, m3};
-  
-  // Apply speeds to each motor
-  for (int i = 0; i < 4; i++) {
-    int speed = motorSpeeds[i];
-    
-    // Set direction based on speed sign
-    if (speed >= 0) {
-      digitalWrite(motorDirectionPins[i], HIGH);
-    } else {
-      digitalWrite(motorDirectionPins[i], LOW);
-      speed = -speed; // Make speed positive for PWM
-    }
-    
-    // Apply PWM (constrain to valid range)
-    speed = constrain(speed, 0, 255);
-    analogWrite(motorSpeedPins[i], speed);
-  }
+  motorCommand[0] = m0;
+  motorCommand[1] = m1;
+  motorCommand[2] = m2;
+  motorCommand[3] = m3;
+  motorCommandPending = true;
 }
 
 // Stop all motors
 void stopMotors() {
-  for (int i = 0; i < 4; i++) {
-    analogWrite(motorSpeedPins[i], 0);
-  }
-}
\ No newline at end of file
+  setMotorSpeeds(0, 0, 0, 0);
+}
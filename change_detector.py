@@ -0,0 +1,168 @@
+from array import array
+
+# Block-level change detection for when the robot stands still (the defense
+# bot parked in goal, kickoff setup). The mirror ring is split into square
+# blocks and a sparse grid of pixels in each block is compared with the
+# block's reference samples, taken the last time the block counted as
+# changed. Blocks that stayed put let the scripts reuse the previous frame's
+# blobs and results there and threshold only the changed area. Comparing
+# with the reference instead of the previous frame catches slow drift, and
+# every max_reuse frames a full pass runs regardless.
+#
+# 16 px blocks sampled every 4 px are about 2,200 pixel reads per frame on
+# the default ring, less than one find_blobs threshold pass over it.
+
+BLOCK = 16             # Block size in pixels
+STEP = 4               # Sample spacing inside a block
+SAMPLE_DIFF = 4        # Summed channel change (5-bit units, green halved) that counts a sample as changed
+BLOCK_SAMPLES = 2      # Changed samples that make a block changed
+MAX_REUSE = 15         # Frames a reused result may get before a full pass
+FULL_FRACTION = 0.5    # Changed block fraction above which the whole frame is redone
+
+FULL = 0       # Run the full detection pass
+PARTIAL = 1    # Detect inside changed_roi(), reuse the rest
+STATIC = 2     # Nothing changed, reuse everything
+
+def build_blocks(center_x, center_y, inner_radius, outer_radius, width, height, block=BLOCK, step=STEP):
+    """Blocks overlapping the mirror ring and their sample points.
+
+    Returns (rects, offsets, xs, ys): block i is rects[4 * i:4 * i + 4]
+    (x, y, w, h) and samples xs/ys[offsets[i]:offsets[i + 1]], the ring
+    pixels of a step-spaced grid inside it.
+    """
+    rects = array('H')
+    offsets = array('H', [0])
+    xs = array('H')
+    ys = array('H')
+    inner2 = inner_radius * inner_radius
+    outer2 = outer_radius * outer_radius
+    for by in range(0, height, block):
+        for bx in range(0, width, block):
+            n = len(xs)
+            for y in range(by + step // 2, min(by + block, height), step):
+                for x in range(bx + step // 2, min(bx + block, width), step):
+                    d2 = (x - center_x) ** 2 + (y - center_y) ** 2
+                    if inner2 <= d2 <= outer2:
+                        xs.append(x)
+                        ys.append(y)
+            if len(xs) > n:
+                rects.extend((bx, by, min(block, width - bx), min(block, height - by)))
+                offsets.append(len(xs))
+    return rects, offsets, xs, ys
+
+class ChangeDetector:
+    def __init__(self, blocks, sample_diff=SAMPLE_DIFF, block_samples=BLOCK_SAMPLES, max_reuse=MAX_REUSE,
+                 full_fraction=FULL_FRACTION):
+        self.blocks = blocks
+        rects, offsets, xs, ys = blocks
+        self.count = len(offsets) - 1
+        self.reference = array('H', [0] * len(xs))
+        self.changed = bytearray(self.count)
+        self.sample_diff = sample_diff
+        self.block_samples = block_samples
+        self.max_reuse = max_reuse
+        self.full_blocks = int(self.count * full_fraction)
+        self.primed = False
+        self.age = 0        # Frames since the last full pass
+        self.changed_count = 0
+        # frames, full passes, partial passes, static frames, changed blocks summed
+        self.stats = array('i', [0] * 5)
+
+    def update(self, img):
+        """Compare img with the block references; returns FULL, PARTIAL or STATIC"""
+        rects, offsets, xs, ys = self.blocks
+        ref = self.reference
+        changed = self.changed
+        get_pixel = img.get_pixel
+        diff = self.sample_diff
+        need = self.block_samples
+        primed = self.primed
+        n_changed = 0
+        for i in range(self.count):
+            start = offsets[i]
+            end = offsets[i + 1]
+            moved = 0
+            if primed:
+                for j in range(start, end):
+                    v = get_pixel(xs[j], ys[j], False)
+                    p = ref[j]
+                    if v != p:
+                        d = (abs((v >> 11) - (p >> 11)) + (abs(((v >> 5) & 0x3F) - ((p >> 5) & 0x3F)) >> 1) +
+                             abs((v & 0x1F) - (p & 0x1F)))
+                        if d >= diff:
+                            moved += 1
+                            if moved >= need:
+                                break
+            if not primed or moved >= need:
+                # New reference for the block, so drift is measured from here on
+                for j in range(start, end):
+                    ref[j] = get_pixel(xs[j], ys[j], False)
+                changed[i] = 1
+                n_changed += 1
+            else:
+                changed[i] = 0
+        self.changed_count = n_changed
+        s = self.stats
+        s[0] += 1
+        s[4] += n_changed
+        self.age += 1
+        if not primed or self.age >= self.max_reuse or n_changed > self.full_blocks:
+            self.primed = True
+            self.age = 0
+            s[1] += 1
+            return FULL
+        if n_changed:
+            s[2] += 1
+            return PARTIAL
+        s[3] += 1
+        return STATIC
+
+    def changed_roi(self, width, height, margin=BLOCK):
+        """Bounding (x, y, w, h) of the changed blocks grown by margin and clipped to
+        the width x height image, None if none changed"""
+        rects = self.blocks[0]
+        x0 = y0 = 0xFFFF
+        x1 = y1 = 0
+        for i in range(self.count):
+            if self.changed[i]:
+                b = 4 * i
+                x0 = min(x0, rects[b])
+                y0 = min(y0, rects[b + 1])
+                x1 = max(x1, rects[b] + rects[b + 2])
+                y1 = max(y1, rects[b + 1] + rects[b + 3])
+        if x1 == 0:
+            return None
+        x0 = max(0, x0 - margin)
+        y0 = max(0, y0 - margin)
+        return (x0, y0, min(width, x1 + margin) - x0, min(height, y1 + margin) - y0)
+
+    def report(self):
+        """CHANGE,frames,full,partial,static,mean changed blocks,blocks; then start over"""
+        s = self.stats
+        line = "CHANGE,%d,%d,%d,%d,%d,%d" % (s[0], s[1], s[2], s[3], s[4] // s[0] if s[0] else 0, self.count)
+        for i in range(5):
+            s[i] = 0
+        return line
+
+def overlaps(rect, roi):
+    """Whether two (x, y, w, h) rectangles intersect"""
+    return (rect[0] < roi[0] + roi[2] and roi[0] < rect[0] + rect[2] and
+            rect[1] < roi[1] + roi[3] and roi[1] < rect[1] + rect[3])
+
+def grow_roi(roi, rect):
+    """Smallest (x, y, w, h) holding both"""
+    x0 = min(roi[0], rect[0])
+    y0 = min(roi[1], rect[1])
+    return (x0, y0, max(roi[0] + roi[2], rect[0] + rect[2]) - x0, max(roi[1] + roi[3], rect[1] + rect[3]) - y0)
+
+def reuse_blobs(last_blobs, roi):
+    """Blobs of the last frame clear of roi, and roi grown over the ones it cuts so they are found whole again"""
+    kept = list(last_blobs)
+    i = 0
+    while i < len(kept):
+        if overlaps(kept[i].rect(), roi):
+            roi = grow_roi(roi, kept.pop(i).rect())
+            i = 0  # The grown roi can reach blobs already passed
+        else:
+            i += 1
+    return kept, roi
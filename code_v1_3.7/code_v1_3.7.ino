@@ -1,6 +1,7 @@
 #include <Arduino.h>
 #include <Adafruit_Sensor.h>
 #include <Adafruit_LSM303_U.h>
+#include "ir_ring.h"   // Copy of ../ir_ring.h: the IDE only builds files in the sketch folder
 
 // IMU setup for LSM303DLHC
 Adafruit_LSM303_Mag_Unified mag = Adafruit_LSM303_Mag_Unified(12345);
@@ -18,7 +19,7 @@ const int MOTOR4_PWM = 6;
 const int MOTOR4_DIR = 11;
 
 // Variables
-int sensorValues[NUM_SENSORS];
+IRRing irRing;              // Read one sensor per loop(), see ir_ring.h
 int strongestSignalIndex = -1;
 int strongestSignalValue = 0;
 float initialHeading = 0.0;
@@ -28,11 +29,20 @@ float currentHeading = 0.0;
 const int STOP_THRESHOLD = 800;  // Stop threshold for the ball
 const int ALIGN_THRESHOLD = 700; // Alignment threshold for the ball
 
+// IR fallback speed from the ring's distance estimate: slow close to the
+// ball so the robot doesn't overrun it, full speed when it is far away
+const float IR_NEAR_DISTANCE = 20.0;   // cm, at or below this drive at IR_NEAR_SPEED
+const float IR_FAR_DISTANCE = 80.0;    // cm, at or beyond this drive at IR_FAR_SPEED
+const int IR_NEAR_SPEED = 120;
+const int IR_FAR_SPEED = 220;
+
 // Function prototypes
 void initializeIMU();
 float getHeading();
 void findStrongestSignal();
+bool ballInPushRange();
 void moveTowardsBall();
+void driveToward(float bearing, int speed);
 void alignWithBall();
 void pushBallStraight();
 
@@ -43,6 +53,7 @@ void setup() {
     for (int i = 0; i < NUM_SENSORS; i++) {
         pinMode(IR_PINS[i], INPUT);
     }
+    irRing.begin(IR_PINS);
 
     // Initialize motor control pins
     pinMode(MOTOR1_PWM, OUTPUT);
@@ -62,11 +73,11 @@ void setup() {
 }
 
 void loop() {
-    // Step 1: Find the strongest IR signal
-    findStrongestSignal();
+    // Step 1: Read the next IR sensor
+    irRing.poll();
 
-    // Step 2: If a strong signal is detected, align with the ball
-    if (strongestSignalValue >= ALIGN_THRESHOLD) {
+    // Step 2: If a strong signal is detected, take a fresh sweep and align with the ball
+    if (ballInPushRange()) {
         alignWithBall();
         pushBallStraight();
     } else {
@@ -97,40 +108,51 @@ float getHeading() {
 }
 
 void findStrongestSignal() {
-    strongestSignalValue = 0;
-    strongestSignalIndex = -1;
+    strongestSignalValue = irRing.peak;
+    strongestSignalIndex = irRing.peakIndex;
+}
 
-    for (int i = 0; i < NUM_SENSORS; i++) {
-        sensorValues[i] = analogRead(IR_PINS[i]);
-        if (sensorValues[i] > strongestSignalValue) {
-            strongestSignalValue = sensorValues[i];
-            strongestSignalIndex = i;
-        }
+// Whether the ball is close enough for the blocking align and push. Those
+// stall loop() for seconds, so the decision takes a fresh full sweep instead
+// of the estimate poll() left, which may be from before the last push.
+bool ballInPushRange() {
+    findStrongestSignal();
+    if (strongestSignalValue < ALIGN_THRESHOLD) {
+        return false;
     }
+    irRing.sweep();
+    findStrongestSignal();
+    return strongestSignalValue >= ALIGN_THRESHOLD;
 }
 
 void moveTowardsBall() {
     int speed = 200;
-    if (strongestSignalIndex < NUM_SENSORS / 2) {
-        // Move left
-        analogWrite(MOTOR1_PWM, speed);
-        analogWrite(MOTOR2_PWM, speed);
-        digitalWrite(MOTOR1_DIR, LOW);
-        digitalWrite(MOTOR2_DIR, HIGH);
-        analogWrite(MOTOR3_PWM, speed);
-        analogWrite(MOTOR4_PWM, speed);
-        digitalWrite(MOTOR3_DIR, HIGH);
-        digitalWrite(MOTOR4_DIR, LOW);
-    } else {
-        // Move right
-        analogWrite(MOTOR1_PWM, speed);
-        analogWrite(MOTOR2_PWM, speed);
-        digitalWrite(MOTOR1_DIR, HIGH);
-        digitalWrite(MOTOR2_DIR, LOW);
-        analogWrite(MOTOR3_PWM, speed);
-        analogWrite(MOTOR4_PWM, speed);
-        digitalWrite(MOTOR3_DIR, LOW);
-        digitalWrite(MOTOR4_DIR, HIGH);
+    float bearing = PI / 2;   // No ball: keep strafing left to search
+    if (irRing.valid) {
+        // Weighted bearing of all 12 sensors, positive to the left, and
+        // speed from the estimated distance
+        bearing = irRing.bearing;
+        float t = (irRing.distance - IR_NEAR_DISTANCE) / (IR_FAR_DISTANCE - IR_NEAR_DISTANCE);
+        t = constrain(t, 0.0, 1.0);
+        speed = IR_NEAR_SPEED + (int)(t * (IR_FAR_SPEED - IR_NEAR_SPEED));
+    }
+    driveToward(bearing, speed);
+}
+
+// Translate toward bearing (radians, 0 ahead, positive left) at speed. Each
+// wheel mixes the forward part (all DIR HIGH) with the left part (M1/M4 LOW,
+// M2/M3 HIGH, the strafe the old left/right moves used) and the fastest wheel
+// runs at speed.
+void driveToward(float bearing, int speed) {
+    float forward = cos(bearing);
+    float left = sin(bearing);
+    float wheel[4] = {forward - left, forward + left, forward + left, forward - left};
+    float largest = max(fabs(forward - left), fabs(forward + left));
+    const int pwmPins[4] = {MOTOR1_PWM, MOTOR2_PWM, MOTOR3_PWM, MOTOR4_PWM};
+    const int dirPins[4] = {MOTOR1_DIR, MOTOR2_DIR, MOTOR3_DIR, MOTOR4_DIR};
+    for (int i = 0; i < 4; i++) {
+        analogWrite(pwmPins[i], (int)(fabs(wheel[i]) / largest * speed));
+        digitalWrite(dirPins[i], wheel[i] >= 0 ? HIGH : LOW);
     }
 }
 
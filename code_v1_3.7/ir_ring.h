@@ -0,0 +1,126 @@
+/*
+ * ir_ring.h
+ *
+ * Description: Ball bearing and distance from the ring of 12 IR sensors.
+ * Instead of taking the strongest sensor (30 degree steps that jump between
+ * neighbours), every reading is weighted onto its sensor's direction and the
+ * vector sum gives a continuous bearing; the total signal above the ambient
+ * floor gives a rough distance.
+ *
+ * poll() reads one sensor per call, so the 12 analogRead() conversions are
+ * spread over 12 passes of loop() instead of stalling one of them; a new
+ * estimate is published after each full sweep. sweep() reads all 12 at once
+ * (about 1.3 ms on the Mega) for decisions that block the loop afterwards:
+ * the estimate poll() left may be from before the last blocking manoeuvre. Only plain C++ is used so the
+ * same header builds for the Arduino and for host/ir_harness.cpp.
+ *
+ * Angles are radians, 0 straight ahead and positive to the left, the same as
+ * the ball theta movetogoal1 gets from the camera. Sensor i sits at i * 30
+ * degrees counter-clockwise from the front.
+ */
+
+#ifndef IR_RING_H
+#define IR_RING_H
+
+#include <math.h>
+
+const int IR_SENSORS = 12;
+const float IR_MIN_MAGNITUDE = 60.0;      // Summed signal below this is treated as no ball
+const float IR_DISTANCE_SCALE = 1150.0;   // distance = scale / sqrt(magnitude), calibrate with the harness
+
+// cos/sin of the sensor directions (i * 30 degrees)
+const float IR_COS[IR_SENSORS] = {
+  1.0f, 0.8660254f, 0.5f, 0.0f, -0.5f, -0.8660254f,
+  -1.0f, -0.8660254f, -0.5f, 0.0f, 0.5f, 0.8660254f
+};
+const float IR_SIN[IR_SENSORS] = {
+  0.0f, 0.5f, 0.8660254f, 1.0f, 0.8660254f, 0.5f,
+  0.0f, -0.5f, -0.8660254f, -1.0f, -0.8660254f, -0.5f
+};
+
+struct IRRing {
+  const int *pins;
+  int readings[IR_SENSORS];     // Last complete sweep
+  int next;                     // Sensor poll() reads next
+
+  bool valid;                   // Enough signal for a bearing
+  bool updated;                 // Set by poll() when a sweep completes, clear it once used
+  float bearing;                // Radians, 0 ahead, positive left
+  float magnitude;              // Summed signal above the ambient floor
+  float distance;               // cm, from the magnitude
+  float concentration;          // 0..1, how much the readings agree on one direction
+  int peak;                     // Strongest reading and its sensor, as findStrongestSignal() gave
+  int peakIndex;
+  float distanceScale;
+  unsigned long sweeps;
+
+  void begin(const int *sensorPins) {
+    pins = sensorPins;
+    next = 0;
+    valid = false;
+    updated = false;
+    bearing = 0.0;
+    magnitude = 0.0;
+    distance = 0.0;
+    concentration = 0.0;
+    peak = 0;
+    peakIndex = -1;
+    distanceScale = IR_DISTANCE_SCALE;
+    sweeps = 0;
+    for (int i = 0; i < IR_SENSORS; i++) readings[i] = 0;
+  }
+
+  // Read the next sensor; returns true when this completed a sweep
+  bool poll() {
+    readings[next] = analogRead(pins[next]);
+    next++;
+    if (next < IR_SENSORS) return false;
+    next = 0;
+    estimate();
+    return true;
+  }
+
+  // Read all sensors now and publish the estimate; poll() starts a new sweep after it
+  void sweep() {
+    for (int i = 0; i < IR_SENSORS; i++) readings[i] = analogRead(pins[i]);
+    next = 0;
+    estimate();
+  }
+
+  // Recompute the estimate from readings[]
+  void estimate() {
+    int floor = readings[0];
+    peak = readings[0];
+    peakIndex = 0;
+    for (int i = 1; i < IR_SENSORS; i++) {
+      if (readings[i] < floor) floor = readings[i];
+      if (readings[i] > peak) {
+        peak = readings[i];
+        peakIndex = i;
+      }
+    }
+
+    // The weakest sensor faces away from the ball, so it sees only ambient
+    float x = 0.0, y = 0.0, total = 0.0;
+    for (int i = 0; i < IR_SENSORS; i++) {
+      float w = readings[i] - floor;
+      x += w * IR_COS[i];
+      y += w * IR_SIN[i];
+      total += w;
+    }
+
+    magnitude = total;
+    valid = total >= IR_MIN_MAGNITUDE;
+    if (valid) {
+      bearing = atan2(y, x);
+      concentration = sqrt(x * x + y * y) / total;
+      distance = distanceScale / sqrt(total);
+    } else {
+      concentration = 0.0;
+    }
+    sweeps++;
+    updated = true;
+  }
+};
+
+#endif
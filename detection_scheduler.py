@@ -0,0 +1,69 @@
+# Per-target detection scheduler shared by the OpenMV scripts and the host emulator.
+# Goals barely move in the image compared with the ball, so they don't need a
+# fresh search every frame: a target runs every Nth frame (or early when motion
+# demands it) and in between its last result is reused with an age in frames.
+
+class DetectionScheduler:
+    def __init__(self):
+        self.targets = {}
+
+    def add(self, name, every=1, phase=0, motion_limit=None, max_age=None):
+        """Register a target that runs every `every` frames, offset by `phase`.
+
+        motion_limit forces a run when the motion passed to due() exceeds it;
+        max_age forces a run when the stored result gets that old.
+        """
+        self.targets[name] = {
+            'every': every, 'phase': phase, 'motion_limit': motion_limit, 'max_age': max_age,
+            'frame': 0, 'result': None, 'age': 0,
+            'runs': 0, 'skips': 0, 'forced': 0, 'age_sum': 0, 'age_max': 0
+        }
+
+    def due(self, name, motion=0.0):
+        """Advance the target by one frame and say whether it should run now"""
+        t = self.targets[name]
+        t['frame'] += 1
+        if t['runs'] == 0 or (t['frame'] - t['phase']) % t['every'] == 0:
+            return True
+        if t['motion_limit'] is not None and motion > t['motion_limit']:
+            t['forced'] += 1
+            return True
+        if t['max_age'] is not None and t['age'] + 1 >= t['max_age']:
+            t['forced'] += 1
+            return True
+        t['age'] += 1
+        t['skips'] += 1
+        t['age_sum'] += t['age']
+        if t['age'] > t['age_max']:
+            t['age_max'] = t['age']
+        return False
+
+    def update(self, name, result):
+        """Store a fresh result for a target that just ran"""
+        t = self.targets[name]
+        t['result'] = result
+        t['age'] = 0
+        t['runs'] += 1
+
+    def result(self, name):
+        """Last result of a target and its age in frames"""
+        t = self.targets[name]
+        return t['result'], t['age']
+
+    def age(self, name):
+        """Frames since the target last ran"""
+        return self.targets[name]['age']
+
+    def stats(self, name):
+        """Run/skip counts, fraction of frames saved and staleness of the reused results"""
+        t = self.targets[name]
+        frames = t['runs'] + t['skips']
+        return {
+            'frames': frames,
+            'runs': t['runs'],
+            'skips': t['skips'],
+            'forced': t['forced'],
+            'saved': t['skips'] / frames if frames else 0.0,
+            'mean_age': t['age_sum'] / frames if frames else 0.0,
+            'max_age': t['age_max']
+        }
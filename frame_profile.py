@@ -0,0 +1,160 @@
+import gc
+import time
+from array import array
+
+# Frame profiling shared by the OpenMV scripts. ProfileRing keeps one record
+# per frame in a preallocated array (the last `size` frames), and GcPolicy
+# moves garbage collection to a fixed point in the loop: right after the
+# results are sent, so a collection no longer lands in the middle of
+# detection as a random frame-time spike. Each collection's pause and the
+# heap in use before and after it go into the ring; lines() prints it as
+#
+#   PROF,seq,frame_us,gc_us,heap_before,heap_after,auto
+#
+# where auto counts collections MicroPython ran by itself during the frame.
+# Without explicit byte limits, the scheduled collection waits until a
+# quarter of the heap free at boot has been used, and gc.threshold() is set
+# to half of it as the safety net for frames that allocate a lot.
+# LatencyHistogram counts frame times into fixed buckets for percentiles
+# (LATH lines) and full dumps (HIST lines) that host/frame_latency.py reads.
+
+SEQ = 0
+FRAME_US = 1     # Loop start to the collection point
+GC_US = 2        # Scheduled collection pause, 0 when skipped
+HEAP_BEFORE = 3  # gc.mem_alloc() before / after the collection
+HEAP_AFTER = 4
+AUTO = 5
+FIELDS = 6
+
+COLLECT_SHARE = 4     # Default collect_above: in use at boot plus 1/COLLECT_SHARE of the free heap
+THRESHOLD_SHARE = 2   # Default gc.threshold(): 1/THRESHOLD_SHARE of the free heap
+
+class ProfileRing:
+    def __init__(self, size=64):
+        self.size = size
+        self.data = array('i', [0] * (size * FIELDS))
+        self.count = 0   # Records written since the start
+
+    def record(self, seq, frame_us, gc_us, heap_before, heap_after, auto):
+        base = (self.count % self.size) * FIELDS
+        d = self.data
+        d[base + SEQ] = seq
+        d[base + FRAME_US] = frame_us
+        d[base + GC_US] = gc_us
+        d[base + HEAP_BEFORE] = heap_before
+        d[base + HEAP_AFTER] = heap_after
+        d[base + AUTO] = auto
+        self.count += 1
+
+    def lines(self):
+        """The stored records as PROF lines, oldest first"""
+        n = min(self.count, self.size)
+        for k in range(self.count - n, self.count):
+            base = (k % self.size) * FIELDS
+            yield "PROF," + ",".join(str(self.data[base + i]) for i in range(FIELDS))
+
+class GcPolicy:
+    def __init__(self, ring, scheduled=True, collect_above=None, threshold=None):
+        """collect_above: bytes in use before the scheduled collection bothers (0 = every frame);
+        threshold: gc.threshold() safety net for frames that allocate a lot (0 = MicroPython's).
+        None derives either from the heap measured here; threshold only when scheduled."""
+        self.ring = ring
+        self.scheduled = scheduled
+        gc.collect()
+        free = gc.mem_free()
+        if collect_above is None:
+            collect_above = gc.mem_alloc() + free // COLLECT_SHARE
+        if threshold is None:
+            threshold = free // THRESHOLD_SHARE if scheduled else 0
+        self.collect_above = collect_above
+        self.threshold = threshold
+        if threshold:
+            gc.threshold(threshold)
+        # collections, automatic ones, pause total us, pause max us, heap high-water, heap at frame start
+        self.stats = array('i', [0] * 6)
+
+    def frame_start(self):
+        self.stats[5] = gc.mem_alloc()
+
+    def collect(self, seq, frame_start_us):
+        """Scheduled collection point; records the frame in the ring"""
+        s = self.stats
+        before = gc.mem_alloc()
+        frame_us = time.ticks_diff(time.ticks_us(), frame_start_us)
+        # Less in use than at the start of the frame means a collection already ran in it
+        auto = 1 if before < s[5] else 0
+        s[1] += auto
+        if before > s[4]:
+            s[4] = before
+        pause = 0
+        after = before
+        if self.scheduled and before >= self.collect_above:
+            t0 = time.ticks_us()
+            gc.collect()
+            pause = time.ticks_diff(time.ticks_us(), t0)
+            after = gc.mem_alloc()
+            s[0] += 1
+            s[2] += pause
+            if pause > s[3]:
+                s[3] = pause
+        self.ring.record(seq, frame_us, pause, before, after, auto)
+
+    def settings(self):
+        """GCSET,collect_above,threshold as in use"""
+        return "GCSET,%d,%d" % (self.collect_above, self.threshold)
+
+    def report(self):
+        """GC,collections,automatic,mean pause us,max pause us,heap high-water; then start over"""
+        s = self.stats
+        line = "GC,%d,%d,%d,%d,%d" % (s[0], s[1], s[2] // s[0] if s[0] else 0, s[3], s[4])
+        for i in range(5):
+            s[i] = 0
+        return line
+
+class LatencyHistogram:
+    def __init__(self, name, bucket_us=1000, buckets=128):
+        """Fixed buckets of bucket_us; the last bucket collects everything longer"""
+        self.name = name
+        self.bucket_us = bucket_us
+        self.counts = array('i', [0] * (buckets + 1))
+        self.stats = array('i', [0, 0])  # samples, longest us
+
+    def add(self, us):
+        i = us // self.bucket_us
+        last = len(self.counts) - 1
+        self.counts[i if i < last else last] += 1
+        s = self.stats
+        s[0] += 1
+        if us > s[1]:
+            s[1] = us
+
+    def percentile(self, p):
+        """Upper edge (us) of the bucket holding the p-th percentile, the maximum in the overflow bucket"""
+        target = (self.stats[0] * p + 99) // 100
+        seen = 0
+        last = len(self.counts) - 1
+        for i in range(last):
+            seen += self.counts[i]
+            if seen >= target and seen:
+                return min((i + 1) * self.bucket_us, self.stats[1])
+        return self.stats[1]
+
+    def summary(self):
+        """LATH,name,samples,p50_us,p90_us,p99_us,max_us"""
+        return "LATH,%s,%d,%d,%d,%d,%d" % (self.name, self.stats[0], self.percentile(50), self.percentile(90),
+                                           self.percentile(99), self.stats[1])
+
+    def dump(self):
+        """HIST,name,bucket_us,buckets,samples,max_us,then bucket:count for the non-empty buckets"""
+        parts = ["HIST,%s,%d,%d,%d,%d" % (self.name, self.bucket_us, len(self.counts) - 1, self.stats[0],
+                                          self.stats[1])]
+        for i in range(len(self.counts)):
+            if self.counts[i]:
+                parts.append("%d:%d" % (i, self.counts[i]))
+        return ",".join(parts)
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.stats[0] = 0
+        self.stats[1] = 0
@@ -0,0 +1,108 @@
+import struct
+import time
+
+# Recording mode shared by the OpenMV scripts: frames go to a host recorder
+# (host/frame_recorder.py) as JPEG, together with the detection line sent to
+# the controller for that frame, over USB or a spare UART. Streaming is
+# strictly best effort so detection keeps its frame rate:
+#
+#  - at most max_fps frames per second are streamed
+#  - a frame is dropped while the link is still busy with the previous one
+#    (its transmit time estimated from link_bytes_per_s)
+#  - compressing and writing is charged against budget_ms per detection
+#    frame; a frame that would put streaming over budget is dropped
+#
+# Decide with due() right after the snapshot, capture() before the image is
+# filtered or drawn on, and send() once the detection line is ready.
+#
+# Packet: STREAM_HEADER, the detection line (ASCII), the image bytes.
+# Images are JPEG, or raw little-endian RGB565 when quality is 0.
+
+STREAM_MAGIC = b"OMVF"
+# magic, seq, capture ms, format, quality, window x, y, w, h, mirror center x, y, text length, image length
+STREAM_HEADER = "<4sIIBBHHHHHHHI"
+STREAM_HEADER_SIZE = struct.calcsize(STREAM_HEADER)
+FORMAT_JPEG = 0
+FORMAT_RGB565 = 1
+
+def pack_header(seq, capture_ms, fmt, quality, window, center, text_len, image_len):
+    """Packet header; window is the frame's (x, y, w, h) in full-frame pixels, center in frame pixels"""
+    x, y, w, h = window
+    return struct.pack(STREAM_HEADER, STREAM_MAGIC, seq, capture_ms & 0xFFFFFFFF, fmt, quality,
+                       x, y, w, h, int(center[0]), int(center[1]), text_len, image_len)
+
+class FrameStreamer:
+    def __init__(self, link, link_bytes_per_s, max_fps=5, budget_ms=8, quality=50):
+        """link is a UART or pyb.USB_VCP; quality 0 streams raw RGB565"""
+        self.link = link
+        self.link_bytes_per_s = link_bytes_per_s
+        self.min_interval_ms = int(1000 / max_fps) if max_fps else 0
+        self.budget_ms = budget_ms
+        self.quality = quality
+        self.next_ms = None
+        self.busy_until = None
+        self.debt_ms = 0
+        self.sent = 0
+        self.bytes = 0
+        self.dropped_rate = 0
+        self.dropped_busy = 0
+        self.dropped_budget = 0
+        self.dropped_link = 0
+
+    def due(self):
+        """Whether to stream this frame; call once per detection frame"""
+        now = time.ticks_ms()
+        self.debt_ms = max(0, self.debt_ms - self.budget_ms)
+        if self.busy_until is not None and time.ticks_diff(self.busy_until, now) > 0:
+            self.dropped_busy += 1
+            return False
+        if self.next_ms is not None and time.ticks_diff(self.next_ms, now) > 0:
+            self.dropped_rate += 1
+            return False
+        if self.debt_ms > 0:
+            self.dropped_budget += 1
+            return False
+        return True
+
+    def capture(self, img):
+        """Compressed (or copied) frame to send later, None when out of memory"""
+        start = time.ticks_ms()
+        try:
+            if self.quality:
+                frame = img.compressed(quality=self.quality)
+            else:
+                frame = img.copy()
+        except MemoryError:
+            self.dropped_link += 1
+            return None
+        self.debt_ms += time.ticks_diff(time.ticks_ms(), start)
+        return frame
+
+    def send(self, frame, seq, capture_ms, line, offset, center):
+        """Write one packet: frame from capture(), the detection line, the sensor
+        window offset and the mirror center in frame coordinates"""
+        start = time.ticks_ms()
+        text = line.encode() if isinstance(line, str) else line
+        data = frame.bytearray()
+        fmt = FORMAT_JPEG if self.quality else FORMAT_RGB565
+        window = (offset[0], offset[1], frame.width(), frame.height())
+        header = pack_header(seq, capture_ms, fmt, self.quality, window, center, len(text), len(data))
+        total = 0
+        for part in (header, text, data):
+            written = self.link.write(part)
+            total += written or 0
+            if written != len(part):
+                # Host not reading (USB) or write timed out; the recorder resyncs on the magic
+                self.dropped_link += 1
+                break
+        now = time.ticks_ms()
+        self.debt_ms += time.ticks_diff(now, start)
+        self.busy_until = time.ticks_add(start, total * 1000 // self.link_bytes_per_s)
+        self.next_ms = time.ticks_add(start, self.min_interval_ms)
+        if total == len(header) + len(text) + len(data):
+            self.sent += 1
+        self.bytes += total
+
+    def stats(self):
+        return "STREAM,%d,%d,%d,%d,%d,%d" % (self.sent, self.bytes, self.dropped_rate, self.dropped_busy,
+                                              self.dropped_budget, self.dropped_link)
@@ -0,0 +1 @@
+"""Host-side tools: OpenMV emulator, benchmarks and analyzers."""
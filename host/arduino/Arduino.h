@@ -0,0 +1,141 @@
+/*
+ * Arduino.h (host stand-in)
+ *
+ * Just enough of the Arduino core to build the controller sketches on a PC:
+ * a virtual microsecond clock that the host program advances, Serial and
+ * Serial1 backed by byte queues, and pin writes recorded in arrays. Used by
+ * host/replay_controller.cpp; include it before the sketch.
+ *
+ * With chargeTime set on a port, everything written to it advances the clock
+ * by its transmit time at the port's baud rate, as a sketch printing faster
+ * than the line drains would be held up on the real board.
+ */
+
+#ifndef HOST_ARDUINO_H
+#define HOST_ARDUINO_H
+
+#include <math.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <deque>
+#include <string>
+
+typedef bool boolean;
+typedef uint8_t byte;
+
+#define HIGH 1
+#define LOW 0
+#define INPUT 0
+#define OUTPUT 1
+#define INPUT_PULLUP 2
+#define PI 3.1415926535897932384626433832795
+#define DEG_TO_RAD 0.017453292519943295769236907684886
+#define RAD_TO_DEG 57.295779513082320876798154814105
+
+// Same macros as the AVR core
+#define constrain(amt, low, high) ((amt) < (low) ? (low) : ((amt) > (high) ? (high) : (amt)))
+#define abs(x) ((x) > 0 ? (x) : -(x))
+#define min(a, b) ((a) < (b) ? (a) : (b))
+#define max(a, b) ((a) > (b) ? (a) : (b))
+#define round(x) ((x) >= 0 ? (long)((x) + 0.5) : (long)((x) - 0.5))
+
+const int HOST_PIN_COUNT = 100;
+
+// ----- Virtual time, advanced by the host program -----
+
+inline uint64_t &hostMicros() {
+  static uint64_t now = 0;
+  return now;
+}
+
+inline unsigned long micros() { return (unsigned long)(uint32_t)hostMicros(); }
+inline unsigned long millis() { return (unsigned long)(uint32_t)(hostMicros() / 1000); }
+inline void delay(unsigned long ms) { hostMicros() += (uint64_t)ms * 1000; }
+inline void delayMicroseconds(unsigned int us) { hostMicros() += us; }
+
+inline long map(long x, long inMin, long inMax, long outMin, long outMax) {
+  return (x - inMin) * (outMax - outMin) / (inMax - inMin) + outMin;
+}
+
+// ----- Pins -----
+
+struct HostPins {
+  int mode[HOST_PIN_COUNT];
+  int digital[HOST_PIN_COUNT];
+  int analog[HOST_PIN_COUNT];
+  unsigned long writes;
+};
+
+inline HostPins &hostPins() {
+  static HostPins pins;
+  return pins;
+}
+
+inline void pinMode(int pin, int mode) { hostPins().mode[pin] = mode; }
+inline void digitalWrite(int pin, int value) { hostPins().digital[pin] = value; hostPins().writes++; }
+inline void analogWrite(int pin, int value) { hostPins().analog[pin] = value; hostPins().writes++; }
+inline int digitalRead(int pin) { return hostPins().digital[pin]; }
+inline int analogRead(int pin) { return hostPins().analog[pin]; }
+
+// ----- Serial ports -----
+
+class HardwareSerial {
+ public:
+  std::deque<uint8_t> input;   // Bytes the sketch will read
+  FILE *output;                // Where the sketch's prints go (NULL drops them)
+  unsigned long baud;
+  bool chargeTime;             // Advance the clock by the transmit time of writes
+
+  HardwareSerial() : output(NULL), baud(0), chargeTime(false) {}
+
+  void begin(unsigned long rate) { baud = rate; }
+  int available() { return (int)input.size(); }
+  int read() {
+    if (input.empty()) return -1;
+    int c = input.front();
+    input.pop_front();
+    return c;
+  }
+  int peek() { return input.empty() ? -1 : input.front(); }
+  void push(const uint8_t *data, size_t length) { input.insert(input.end(), data, data + length); }
+
+  size_t write(uint8_t c) { if (output) fputc(c, output); return charge(1); }
+  size_t print(const char *s) { if (output) fputs(s, output); return charge(strlen(s)); }
+  size_t print(const std::string &s) { return print(s.c_str()); }
+  size_t print(char c) { return write((uint8_t)c); }
+  size_t print(int n) { return printf_("%d", n); }
+  size_t print(unsigned int n) { return printf_("%u", n); }
+  size_t print(long n) { return printf_("%ld", n); }
+  size_t print(unsigned long n) { return printf_("%lu", n); }
+  size_t print(double n, int digits = 2) { return printf_("%.*f", digits, n); }
+
+  size_t println() { return print("\r\n"); }
+  template <typename T> size_t println(T value) { size_t n = print(value); return n + println(); }
+  size_t println(double value, int digits) { size_t n = print(value, digits); return n + println(); }
+
+ private:
+  // 10 bits per byte on the wire
+  size_t charge(size_t bytes) {
+    if (chargeTime && baud) hostMicros() += (uint64_t)bytes * 10000000ULL / baud;
+    return bytes;
+  }
+  template <typename T> size_t printf_(const char *format, T value) {
+    char buf[64];
+    int n = snprintf(buf, sizeof(buf), format, value);
+    if (output) fputs(buf, output);
+    return charge(n > 0 ? n : 0);
+  }
+  size_t printf_(const char *format, int digits, double value) {
+    char buf[64];
+    int n = snprintf(buf, sizeof(buf), format, digits, value);
+    if (output) fputs(buf, output);
+    return charge(n > 0 ? n : 0);
+  }
+};
+
+static HardwareSerial Serial;
+static HardwareSerial Serial1;
+
+#endif
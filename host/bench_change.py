@@ -0,0 +1,161 @@
+"""Savings and correctness of block change detection with result reuse.
+
+Usage:
+    python -m host.bench_change [frames.npy|frames.corpus] [--count 60] [--max-reuse 15]
+
+Runs the mainNationals ball path two ways on the same frames: a full
+find_blobs pass every frame, and change_detector.ChangeDetector deciding per
+frame between a full pass, thresholding only the changed blocks (reusing the
+last blobs elsewhere) and reusing everything. Reports pixel reads (sampling
+included), host time, how often the ring scan would be skipped and how far
+the reused ball bearing is from the full pass. Without a recording it runs a
+synthetic stationary sequence (robot parked, the ball lying still and then
+rolling past, another robot driving by), a moving one (ball orbiting, goals
+drifting) and a driving one, where the robot turns and drives so the whole
+scene (goals, line, ball, other robots) moves through the mirror every frame.
+
+The block sampling is interpreted get_pixel() calls on the camera while
+find_blobs is native, so the sampling reads are reported separately: they
+cost far more per read than the find_blobs reads they save.
+"""
+
+import argparse
+import math
+import time
+
+import change_detector
+from host import emulator
+from host.bench_windowing import ORANGE_THRESHOLDS
+
+CX, CY = emulator.MIRROR_CENTER_X, emulator.MIRROR_CENTER_Y
+INNER, OUTER = emulator.MIRROR_INNER_RADIUS, emulator.MIRROR_OUTER_RADIUS
+
+
+def find_orange_blobs(img, roi):
+    return img.find_blobs(ORANGE_THRESHOLDS, roi=roi, pixels_threshold=10, area_threshold=10, merge=True, margin=10)
+
+
+def in_mirror(blobs):
+    return [b for b in blobs if INNER <= math.hypot(b.cx() - CX, b.cy() - CY) <= OUTER]
+
+
+def ball_bearing(blobs):
+    if not blobs:
+        return None
+    b = max(blobs, key=lambda b: b.pixels() * (1.2 - 0.004 * math.hypot(b.cx() - CX, b.cy() - CY)))
+    return (math.degrees(math.atan2(b.cy() - CY, b.cx() - CX)) + 360) % 360
+
+
+def stationary_sequence(count, seed=0):
+    """Parked robot: goals and line fixed, the ball still for a third of the frames, then rolling, a robot passing"""
+    frames = []
+    for i in range(count):
+        roll = max(0, i - count // 3)
+        robot = ()
+        if count // 2 <= i < count // 2 + count // 4:
+            robot = (((i - count // 2) * 6 + 200) % 360, 85, 10),
+        frames.append(emulator.synthetic_mirror_frame(
+            ball=((40 + roll * 3) % 360, 60 + roll % 20, 6), yellow=(90, 40, 18), blue=(270, 40, 18),
+            line=(0, 80, 3), robots=robot, seed=seed + i))
+    return frames
+
+
+def driving_sequence(count, seed=0, turn_rate=4.0, drive_rate=0.15):
+    """Robot turning by turn_rate deg/frame while driving, so every feature moves in bearing and radius"""
+    frames = []
+    for i in range(count):
+        heading = i * turn_rate
+        # Driving back and forth changes how far the goals, line and ball are
+        sway = math.sin(i * drive_rate)
+        frames.append(emulator.synthetic_mirror_frame(
+            ball=((40 - heading) % 360, 70 + 25 * sway, 6),
+            yellow=((90 - heading) % 360, 40 + 10 * sway, 18 + 4 * sway),
+            blue=((270 - heading) % 360, 40 - 10 * sway, 18 - 4 * sway),
+            line=((180 - heading) % 360, 85 - 15 * sway, 3),
+            robots=(((300 - heading) % 360, 80 + 10 * sway, 10),), seed=seed + i))
+    return frames
+
+
+def run(frames, max_reuse, sample_diff, block_samples):
+    blocks = change_detector.build_blocks(CX, CY, INNER, OUTER, emulator.FRAME_WIDTH, emulator.FRAME_HEIGHT)
+    changes = change_detector.ChangeDetector(blocks, sample_diff, block_samples, max_reuse)
+    full_reads = reuse_reads = sample_reads = 0
+    full_s = reuse_s = 0.0
+    modes = [0, 0, 0]
+    errors = []
+    disagree = 0
+    last_blobs = []
+    for frame in frames:
+        h, w = frame.shape[:2]
+        full_img = emulator.Image(frame)
+        reuse_img = emulator.Image(frame)
+        for img in (full_img, reuse_img):
+            img.lab()
+            img.get_pixel(0, 0, False)
+            img.pixel_reads = 0
+
+        t0 = time.perf_counter()
+        full = ball_bearing(in_mirror(find_orange_blobs(full_img, (0, 0, w, h))))
+        full_s += time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        mode = changes.update(reuse_img)
+        sample_reads += reuse_img.pixel_reads
+        if mode == change_detector.FULL:
+            blobs = find_orange_blobs(reuse_img, (0, 0, w, h))
+        elif mode == change_detector.PARTIAL:
+            blobs, roi = change_detector.reuse_blobs(last_blobs, changes.changed_roi(w, h))
+            blobs.extend(find_orange_blobs(reuse_img, roi))
+        else:
+            blobs = list(last_blobs)
+        blobs = in_mirror(blobs)
+        last_blobs = blobs
+        reused = ball_bearing(blobs)
+        reuse_s += time.perf_counter() - t0
+
+        modes[mode] += 1
+        full_reads += full_img.pixel_reads
+        reuse_reads += reuse_img.pixel_reads
+        if (full is None) != (reused is None):
+            disagree += 1
+        elif full is not None:
+            errors.append(abs((full - reused + 180) % 360 - 180))
+
+    n = len(frames)
+    print("  frames: %d  full passes: %d  partial: %d  static: %d  (%d blocks)" %
+          (n, modes[change_detector.FULL], modes[change_detector.PARTIAL], modes[change_detector.STATIC],
+           changes.count))
+    print("  pixel reads/frame: full %d  with reuse %d (%.0f%% saved)" %
+          (full_reads // n, reuse_reads // n, 100 * (1 - reuse_reads / full_reads)))
+    print("  find_blobs reads/frame saved: %d  get_pixel sampling reads/frame added: %d" %
+          ((full_reads - reuse_reads + sample_reads) // n, sample_reads // n))
+    print("  host time/frame:   full %.2f ms  with reuse %.2f ms" % (1000 * full_s / n, 1000 * reuse_s / n))
+    print("  ring scans skipped: %d of %d frames" % (modes[change_detector.STATIC], n))
+    if errors:
+        print("  ball bearing vs full pass: mean %.2f deg  max %.2f deg" % (sum(errors) / len(errors), max(errors)))
+    print("  ball found by one path only: %d frames" % disagree)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("frames", nargs="?", help=".npy stack of recorded RGB frames or a .corpus file")
+    parser.add_argument("--count", type=int, default=60, help="frames per synthetic sequence")
+    parser.add_argument("--turn-rate", type=float, default=4.0, help="deg/frame of the moving sequence")
+    parser.add_argument("--max-reuse", type=int, default=change_detector.MAX_REUSE)
+    parser.add_argument("--sample-diff", type=int, default=change_detector.SAMPLE_DIFF)
+    parser.add_argument("--block-samples", type=int, default=change_detector.BLOCK_SAMPLES)
+    args = parser.parse_args()
+
+    if args.frames:
+        sequences = [(args.frames, emulator.load_frames(args.frames))]
+    else:
+        sequences = [("stationary", stationary_sequence(args.count)),
+                     ("moving", emulator.synthetic_sequence(args.count, turn_rate=args.turn_rate)),
+                     ("driving", driving_sequence(args.count, turn_rate=args.turn_rate))]
+    for name, frames in sequences:
+        print(name)
+        run(frames, args.max_reuse, args.sample_diff, args.block_samples)
+
+
+if __name__ == "__main__":
+    main()
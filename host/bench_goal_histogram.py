@@ -0,0 +1,118 @@
+"""Benchmark the angular histogram goal detector against the find_blobs path.
+
+Usage:
+    python -m host.bench_goal_histogram [frames.npy] [--bins 360] [--step 2]
+
+Without a recording it runs on synthetic mirror frames. Reports pixel reads and
+host time per frame for both paths, and how far the goal bearings disagree.
+"""
+
+import argparse
+import math
+import time
+
+import ring_goal_detector as rgd
+from host import emulator
+
+# Yellow boxes from mainNationalsBallAndGoal. Its blue boxes (A and B both
+# strongly negative at low L) contain no sRGB colour at all, so the blue box
+# from opencv2.py is used to give the blue goal something to find.
+YELLOW_THRESHOLDS = [
+    (20, 80, -40, 50, 20, 127),
+    (30, 100, -50, 40, 30, 127),
+    (40, 120, -40, 50, 40, 127)
+]
+BLUE_THRESHOLDS = [
+    (-15, 20, 10, 45, -80, -10)
+]
+
+
+def bearing(x, y):
+    return (math.degrees(math.atan2(y - emulator.MIRROR_CENTER_Y, x - emulator.MIRROR_CENTER_X)) + 360) % 360
+
+
+def blob_path(img):
+    """find_objects() goal search: full find_blobs per goal, filtered to the ring"""
+    found = []
+    for thresholds in (YELLOW_THRESHOLDS, BLUE_THRESHOLDS):
+        blobs = img.find_blobs(thresholds, pixels_threshold=30, area_threshold=50, merge=True, margin=10)
+        best = None
+        for b in blobs:
+            d = math.sqrt((b.cx() - emulator.MIRROR_CENTER_X) ** 2 + (b.cy() - emulator.MIRROR_CENTER_Y) ** 2)
+            if emulator.MIRROR_INNER_RADIUS <= d <= emulator.MIRROR_OUTER_RADIUS:
+                score = b.pixels() * (1.0 - 0.002 * d)
+                if best is None or score > best[0]:
+                    best = (score, b)
+        found.append(bearing(best[1].cx(), best[1].cy()) if best else None)
+    return found
+
+
+def histogram_path(img, bearing_map, lut, bins):
+    found = []
+    for counts, radius_sums in rgd.goal_histograms(img, bearing_map, lut, bins):
+        arc = rgd.find_goal_arc(counts, radius_sums, bins)
+        found.append(arc['angle'] if arc else None)
+    return found
+
+
+def angle_error(a, b):
+    if a is None or b is None:
+        return None
+    return abs((a - b + 180) % 360 - 180)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("frames", nargs="?", help=".npy stack of recorded RGB frames or a .corpus file")
+    parser.add_argument("--bins", type=int, default=rgd.GOAL_BINS)
+    parser.add_argument("--step", type=int, default=rgd.RING_STEP)
+    parser.add_argument("--count", type=int, default=20, help="synthetic frames when no recording is given")
+    args = parser.parse_args()
+
+    frames = emulator.load_frames(args.frames) if args.frames else emulator.synthetic_sequence(args.count)
+
+    t0 = time.perf_counter()
+    lut = rgd.build_class_lut(emulator.rgb_to_lab_tuple, YELLOW_THRESHOLDS, BLUE_THRESHOLDS)
+    bearing_map = rgd.build_bearing_map(emulator.MIRROR_CENTER_X, emulator.MIRROR_CENTER_Y,
+                                        emulator.MIRROR_INNER_RADIUS, emulator.MIRROR_OUTER_RADIUS,
+                                        args.bins, args.step)
+    setup_s = time.perf_counter() - t0
+
+    blob_reads = hist_reads = 0
+    blob_s = hist_s = 0.0
+    errors = []
+    missed = 0
+    for frame in frames:
+        img = emulator.Image(frame)
+        img.lab()  # Conversion is shared setup, not part of either detector
+        t0 = time.perf_counter()
+        blob_goals = blob_path(img)
+        blob_s += time.perf_counter() - t0
+        blob_reads += img.pixel_reads
+
+        img.pixel_reads = 0
+        img.get_pixel(0, 0, False)  # Prime the raw RGB565 cache outside the timed region
+        img.pixel_reads = 0
+        t0 = time.perf_counter()
+        hist_goals = histogram_path(img, bearing_map, lut, args.bins)
+        hist_s += time.perf_counter() - t0
+        hist_reads += img.pixel_reads
+
+        for a, b in zip(blob_goals, hist_goals):
+            err = angle_error(a, b)
+            if err is None:
+                missed += (a is None) != (b is None)
+            else:
+                errors.append(err)
+
+    n = len(frames)
+    print("frames: %d  ring map entries: %d  setup: %.2fs" % (n, len(bearing_map[0]), setup_s))
+    print("blob path:      %8d pixel reads/frame  %7.2f ms/frame (host)" % (blob_reads // n, 1000 * blob_s / n))
+    print("histogram path: %8d pixel reads/frame  %7.2f ms/frame (host)" % (hist_reads // n, 1000 * hist_s / n))
+    if errors:
+        print("goal bearing difference: mean %.2f deg  max %.2f deg" % (sum(errors) / len(errors), max(errors)))
+    print("detections found by only one path: %d" % missed)
+
+
+if __name__ == "__main__":
+    main()
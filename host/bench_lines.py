@@ -0,0 +1,70 @@
+"""Accuracy and cost of the radial ray-cast field line detector.
+
+Usage:
+    python -m host.bench_lines [--count 20] [--rays 64] [--step 2]
+
+Renders synthetic frames with a straight white line whose point nearest the
+robot is at a known bearing and radius (the line's largest radius, see
+emulator.synthetic_mirror_frame), runs radial_scan.scan_lines() and
+nearest_hit() on them and reports pixel reads per frame (vs thresholding the
+full frame) and the bearing/radius error.
+"""
+
+import argparse
+import time
+
+import radial_scan
+import ring_goal_detector as rgd
+from host import emulator
+from host.bench_goal_histogram import YELLOW_THRESHOLDS, BLUE_THRESHOLDS
+
+# Same box as mainNationalsBallAndGoal
+WHITE_THRESHOLDS = [(75, 100, -15, 15, -15, 15)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--rays", type=int, default=radial_scan.RAY_COUNT)
+    parser.add_argument("--step", type=int, default=radial_scan.RAY_STEP)
+    args = parser.parse_args()
+
+    lut = rgd.build_class_lut(emulator.rgb_to_lab_tuple, YELLOW_THRESHOLDS, BLUE_THRESHOLDS, WHITE_THRESHOLDS)
+    rays = radial_scan.build_rays(emulator.MIRROR_CENTER_X, emulator.MIRROR_CENTER_Y,
+                                  emulator.MIRROR_INNER_RADIUS, emulator.MIRROR_OUTER_RADIUS,
+                                  emulator.FRAME_WIDTH, emulator.FRAME_HEIGHT, args.rays, args.step)
+    reads = 0
+    elapsed = 0.0
+    angle_errors = []
+    radius_errors = []
+    misses = 0
+    hits = None
+    for i in range(args.count):
+        angle = (i * 37) % 360
+        radius = 45 + (i * 13) % 55
+        frame = emulator.synthetic_mirror_frame(ball=((angle + 180) % 360, 60, 6), line=(angle, radius, 4), seed=i)
+        img = emulator.Image(frame)
+        img.get_pixel(0, 0, False)
+        img.pixel_reads = 0
+        t0 = time.perf_counter()
+        hits = radial_scan.scan_lines(img, rays, lut, hits)
+        nearest = radial_scan.nearest_hit(rays, hits)
+        elapsed += time.perf_counter() - t0
+        reads += img.pixel_reads
+        if nearest is None:
+            misses += 1
+            continue
+        angle_errors.append(abs((nearest[0] - angle + 180) % 360 - 180))
+        radius_errors.append(abs(nearest[1] - (radius + 2)))   # Rays come in from the outer (near) edge
+
+    print("rays: %d  samples: %d  frames: %d" % (args.rays, len(rays[2]), args.count))
+    print("pixel reads: %d/frame (full frame: %d)  %.2f ms/frame (host)" %
+          (reads // args.count, emulator.FRAME_WIDTH * emulator.FRAME_HEIGHT, 1000 * elapsed / args.count))
+    if angle_errors:
+        print("bearing error: mean %.1f deg  max %.1f deg" % (sum(angle_errors) / len(angle_errors), max(angle_errors)))
+        print("radius error:  mean %.1f px   max %.1f px" % (sum(radius_errors) / len(radius_errors), max(radius_errors)))
+    print("missed lines: %d" % misses)
+
+
+if __name__ == "__main__":
+    main()
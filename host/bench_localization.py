@@ -0,0 +1,83 @@
+"""Update cost vs particle count for the particle-filter localization.
+
+Usage:
+    python -m host.bench_localization [--counts 500,1000,2000,5000,10000] [--steps 200]
+
+Drives a simulated robot around the field, feeds the filter noisy goal
+bearings, occasional line observations and noisy odometry at the camera
+rate, and reports time per update cycle, achievable rate and pose error.
+"""
+
+import argparse
+import math
+import time
+
+import numpy as np
+
+from host import localization as loc
+
+CAMERA_HZ = 30.0
+
+
+def observe_goal(rng, pose, goal):
+    x, y, heading = pose
+    bearing = math.atan2(goal[1] - y, goal[0] - x) - heading
+    return loc.wrap_angle(bearing + rng.normal(0.0, math.radians(4.0)))
+
+
+def observe_line(pose):
+    """Nearest boundary line (bearing, distance) if it is within 40 cm"""
+    x, y, heading = pose
+    lines = [(loc.FIELD_WIDTH / 2 - x, 0.0), (loc.FIELD_WIDTH / 2 + x, math.pi),
+             (loc.FIELD_LENGTH / 2 - y, math.pi / 2), (loc.FIELD_LENGTH / 2 + y, -math.pi / 2)]
+    distance, direction = min(lines)
+    if distance > 40:
+        return None
+    return loc.wrap_angle(direction - heading), distance
+
+
+def run(count, steps, seed=0):
+    rng = np.random.default_rng(seed)
+    pf = loc.ParticleFilter(count, seed=seed)
+    dt = 1.0 / CAMERA_HZ
+    pose = [0.0, -40.0, 0.3]
+    elapsed = 0.0
+    errors = []
+    for i in range(steps):
+        # Drive a slow circle: forward 40 cm/s while turning 0.6 rad/s
+        vx, vy, omega = 40.0, 0.0, 0.6
+        c, s = math.cos(pose[2]), math.sin(pose[2])
+        pose[0] += c * vx * dt
+        pose[1] += s * vx * dt
+        pose[2] = loc.wrap_angle(pose[2] + omega * dt)
+
+        t0 = time.perf_counter()
+        pf.predict(vx, vy, omega, dt)
+        pf.update_goal(loc.YELLOW_GOAL, observe_goal(rng, pose, loc.YELLOW_GOAL))
+        pf.update_goal(loc.BLUE_GOAL, observe_goal(rng, pose, loc.BLUE_GOAL))
+        line = observe_line(pose)
+        if line is not None:
+            pf.update_line(*line)
+        pf.resample()
+        (x, y, heading), _ = pf.estimate()
+        elapsed += time.perf_counter() - t0
+        if i >= steps // 2:
+            errors.append(math.hypot(x - pose[0], y - pose[1]))
+    return elapsed / steps, sum(errors) / len(errors), pf.estimate()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--counts", default="500,1000,2000,5000,10000")
+    parser.add_argument("--steps", type=int, default=200)
+    args = parser.parse_args()
+
+    print("%9s %12s %10s %14s %22s" % ("particles", "ms/update", "max Hz", "mean error cm", "std x/y cm, heading deg"))
+    for count in [int(c) for c in args.counts.split(",")]:
+        per_step, error, (sx, sy, sh) = run(count, args.steps)
+        print("%9d %12.3f %10.0f %14.1f %11.1f/%.1f, %.1f" %
+              (count, 1000 * per_step, 1.0 / per_step, error, sx, sy, math.degrees(sh)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Accuracy and cost of the radial free-space obstacle profile.
+
+Usage:
+    python -m host.bench_obstacles [--count 20] [--rays 64] [--step 2]
+
+Renders synthetic frames with a few dark robots at known bearings and radii,
+runs radial_scan.scan_rays() and reports pixel reads per frame against the
+ray table size, plus how well the profile locates each robot.
+"""
+
+import argparse
+import time
+from array import array
+
+import radial_scan
+import ring_goal_detector as rgd
+from host import emulator
+from host.bench_goal_histogram import YELLOW_THRESHOLDS, BLUE_THRESHOLDS
+from host.bench_lines import WHITE_THRESHOLDS
+
+# Same box as mainNationalsBallAndGoal
+TURF_THRESHOLDS = [(15, 75, -70, -10, -10, 45)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--rays", type=int, default=radial_scan.RAY_COUNT)
+    parser.add_argument("--step", type=int, default=radial_scan.RAY_STEP)
+    args = parser.parse_args()
+
+    lut = rgd.build_class_lut(emulator.rgb_to_lab_tuple, YELLOW_THRESHOLDS, BLUE_THRESHOLDS,
+                              WHITE_THRESHOLDS, TURF_THRESHOLDS)
+    rays = radial_scan.build_rays(emulator.MIRROR_CENTER_X, emulator.MIRROR_CENTER_Y,
+                                  emulator.MIRROR_INNER_RADIUS, emulator.MIRROR_OUTER_RADIUS,
+                                  emulator.FRAME_WIDTH, emulator.FRAME_HEIGHT, args.rays, args.step)
+    line_hits = array('B', [radial_scan.NO_HIT] * args.rays)
+    obstacle_hits = array('B', [radial_scan.NO_HIT] * args.rays)
+    deg_per_ray = 360.0 / args.rays
+
+    reads = 0
+    worst_reads = 0
+    elapsed = 0.0
+    radius_errors = []
+    missed = 0
+    for i in range(args.count):
+        robots = [((i * 53 + k * 120) % 360, 45 + (i * 7 + k * 20) % 45, 9) for k in range(3)]
+        img = emulator.Image(emulator.synthetic_mirror_frame(robots=robots, seed=i))
+        img.get_pixel(0, 0, False)
+        t0 = time.perf_counter()
+        frame_reads = radial_scan.scan_rays(img, rays, lut, line_hits, obstacle_hits)
+        elapsed += time.perf_counter() - t0
+        reads += frame_reads
+        worst_reads = max(worst_reads, frame_reads)
+
+        for angle, radius, size in robots:
+            ray = int(round(angle / deg_per_ray)) % args.rays
+            if obstacle_hits[ray] == radial_scan.NO_HIT:
+                missed += 1
+            else:
+                # The ray through the robot center should stop at its near edge,
+                # the outer one (estimate_real_distance: larger radius is nearer)
+                radius_errors.append(abs(obstacle_hits[ray] - (radius + size)))
+
+    print("rays: %d  ray table: %d samples  frames: %d" % (args.rays, len(rays[2]), args.count))
+    print("pixel reads: mean %d  worst %d per frame  %.2f ms/frame (host)" %
+          (reads // args.count, worst_reads, 1000 * elapsed / args.count))
+    if radius_errors:
+        print("robot near-edge error: mean %.1f px  max %.1f px" %
+              (sum(radius_errors) / len(radius_errors), max(radius_errors)))
+    print("robots missed: %d of %d" % (missed, 3 * args.count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Candidate counts and time of motion-cued ball proposals.
+
+Usage:
+    python -m host.bench_proposals [frames.npy|frames.corpus] [--count 90] [--k 2]
+
+Runs find_reflective_sphere() the way opencv2.py does, once shape scoring
+every candidate blob of the loose black ball threshold and once scoring only
+the top k of motion_proposals.MotionMap. It reports candidates and scored
+blobs per frame, host time per frame of the motion map and of the scoring,
+and how often the two paths pick the same blob. Without a recording it
+renders a forward-camera sequence: dark clutter fixed in the world (screws,
+wheels, shadows), a reflective black ball that lies still and then rolls,
+and the robot standing, turning one way and then the other. Synthetic runs
+also check both picks against the true ball position.
+"""
+
+import argparse
+import math
+import time
+
+import numpy as np
+
+import motion_proposals
+from host import emulator
+
+BALL_THRESHOLD = [(0, 70, -25, 25, -25, 25)]
+WIDTH, HEIGHT = 320, 240
+WORLD = 1280    # Pixels for a full turn
+WALL_ROWS = 70
+TURF_RGB = (30, 125, 60)  # Greener than the emulator turf so its noise stays out of the loose threshold
+
+
+def forward_sequence(count, seed=0, clutter=60):
+    """Frames plus the true ball center (x, y) in each (None when out of view)"""
+    rng = np.random.default_rng(seed)
+    world = np.zeros((HEIGHT, WORLD, 3), dtype=np.int16)
+    world[:WALL_ROWS] = (190, 190, 195)
+    world[WALL_ROWS:] = TURF_RGB
+    ys, xs = np.mgrid[0:HEIGHT, 0:WORLD]
+    for _ in range(clutter):
+        cx = rng.uniform(0, WORLD)
+        cy = rng.uniform(WALL_ROWS - 10, HEIGHT - 20)
+        if rng.random() < 0.4:
+            r = rng.uniform(2, 4)
+            shape = (xs - cx) ** 2 + (ys - cy) ** 2 <= r * r    # Screw heads
+        else:
+            half_w = rng.uniform(6, 14)
+            half_h = half_w / rng.uniform(1.6, 4)
+            shape = (np.abs(xs - cx) <= half_w) & (np.abs(ys - cy) <= half_h)  # Wheels, shadows, robot edges
+        world[shape] = (25, 25, 28)
+
+    frames = []
+    truth = []
+    pan = 0.0
+    for i in range(count):
+        phase = 3 * i // count
+        pan += (0.0, 6.0, -4.0)[phase]
+        roll = max(0, i - count // 4)
+        ball_x = (WORLD // 2 + 40 + roll * 2.5) % WORLD
+        ball_y = 170 + 10 * math.sin(roll / 10.0)
+        frame = np.roll(world, -int(pan), axis=1)[:, WORLD // 2 - WIDTH // 2:WORLD // 2 + WIDTH // 2].copy()
+        bx = (ball_x - pan - (WORLD // 2 - WIDTH // 2)) % WORLD
+        fy, fx = np.mgrid[0:HEIGHT, 0:WIDTH]
+        frame[(fx - bx) ** 2 + (fy - ball_y) ** 2 <= 49] = (20, 20, 22)
+        frame[(fx - bx + 2) ** 2 + (fy - ball_y + 2) ** 2 <= 2] = (240, 240, 240)  # Highlight
+        frame += rng.integers(-6, 7, size=frame.shape, dtype=np.int16)
+        frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+        truth.append((bx, ball_y) if 8 <= bx < WIDTH - 8 else None)
+    return frames, truth
+
+
+def candidates(img):
+    """find_reflective_sphere() candidates: loose threshold, no huge or edge blobs"""
+    out = []
+    for blob in img.find_blobs(BALL_THRESHOLD, pixels_threshold=10, area_threshold=20, merge=True, margin=10):
+        if blob.area() > 5000:
+            continue
+        if blob.x() == 0 or blob.y() == 0 or blob.x() + blob.w() == img.width() or blob.y() + blob.h() == img.height():
+            continue
+        out.append(blob)
+    return out
+
+
+def shape_score(blobs):
+    """find_reflective_sphere() scoring: best of the round enough blobs"""
+    best = None
+    best_score = 0
+    for blob in blobs:
+        circularity = blob.roundness()
+        if blob.h() == 0:
+            continue
+        aspect = float(blob.w()) / blob.h()
+        score = circularity * 0.8 + max(0, 1.0 - abs(aspect - 1.0)) * 0.2
+        if circularity < 0.6:
+            continue
+        if score > best_score:
+            best_score = score
+            best = blob
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("frames", nargs="?", help=".npy stack of recorded RGB frames or a .corpus file")
+    parser.add_argument("--count", type=int, default=90, help="synthetic frames")
+    parser.add_argument("--clutter", type=int, default=60, help="synthetic dark objects around a full turn")
+    parser.add_argument("--k", type=int, default=2, help="proposals shape scored per frame")
+    parser.add_argument("--cell", type=int, default=motion_proposals.CELL)
+    args = parser.parse_args()
+
+    if args.frames:
+        frames = emulator.load_frames(args.frames)
+        truth = [None] * len(frames)
+        synthetic = False
+    else:
+        frames, truth = forward_sequence(args.count, clutter=args.clutter)
+        synthetic = True
+    h, w = frames[0].shape[:2]
+    motion = motion_proposals.MotionMap(w, h, cell=args.cell)
+
+    all_count = scored_count = 0
+    update_s = full_score_s = top_score_s = 0.0
+    same = 0
+    hits = {"all": 0, "top-k": 0}
+    visible = 0
+    for frame, ball in zip(frames, truth):
+        img = emulator.Image(frame)
+        img.lab()
+        img.get_pixel(0, 0, False)
+        found = candidates(img)
+        for b in found:
+            b.roundness()
+
+        t0 = time.perf_counter()
+        best_all = shape_score(found)
+        full_score_s += time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        motion.update(img)
+        t1 = time.perf_counter()
+        top = motion.top(found, args.k)
+        best_top = shape_score(top)
+        if best_top is not None:
+            motion.seen(best_top)
+        top_score_s += time.perf_counter() - t1
+        update_s += t1 - t0
+
+        all_count += len(found)
+        scored_count += len(top)
+        same += best_all is best_top
+        if ball is not None:
+            visible += 1
+            for name, pick in (("all", best_all), ("top-k", best_top)):
+                if pick is not None and math.hypot(pick.cx() - ball[0], pick.cy() - ball[1]) <= 8:
+                    hits[name] += 1
+
+    n = len(frames)
+    print("frames: %d  grid: %dx%d cells of %d px (%d pixel reads/frame)" %
+          (n, motion.cols, motion.rows, motion.cell, motion.cols * motion.rows))
+    print("candidates/frame: %.1f  shape scored with proposals: %.1f (k=%d)" % (all_count / n, scored_count / n, args.k))
+    print("host ms/frame: scoring all %.3f | motion map %.3f + ranking and scoring top-k %.3f" %
+          (1000 * full_score_s / n, 1000 * update_s / n, 1000 * top_score_s / n))
+    print("same pick as scoring all: %d of %d frames" % (same, n))
+    if synthetic:
+        print("true ball picked (%d frames in view): scoring all %d, top-k %d" % (visible, hits["all"], hits["top-k"]))
+    print(motion.report())
+
+
+if __name__ == "__main__":
+    main()
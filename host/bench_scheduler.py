@@ -0,0 +1,98 @@
+"""Budget savings and staleness of the goal detection schedule.
+
+Usage:
+    python -m host.bench_scheduler [frames.npy] [--every 3] [--motion-limit 15] [--turn-rate 0.5]
+
+Runs the mainNationals pipeline shape in the emulator (ball find_blobs every
+frame, histogram goal search through DetectionScheduler) and compares it with
+searching the goals every frame: time per frame, fraction of goal searches
+saved, result age and the bearing error the reused results carry.
+"""
+
+import argparse
+import math
+import time
+
+import ring_goal_detector as rgd
+from detection_scheduler import DetectionScheduler
+from host import emulator
+from host.bench_goal_histogram import YELLOW_THRESHOLDS, BLUE_THRESHOLDS
+from host.bench_windowing import ORANGE_THRESHOLDS
+
+
+def find_ball(img):
+    blobs = img.find_blobs(ORANGE_THRESHOLDS, pixels_threshold=10, area_threshold=10, merge=True, margin=10)
+    if not blobs:
+        return None
+    b = max(blobs, key=lambda b: b.pixels())
+    return (math.degrees(math.atan2(b.cy() - emulator.MIRROR_CENTER_Y, b.cx() - emulator.MIRROR_CENTER_X)) + 360) % 360
+
+
+def find_goals(img, bearing_map, lut):
+    goals = []
+    for counts, radius_sums in rgd.goal_histograms(img, bearing_map, lut):
+        arc = rgd.find_goal_arc(counts, radius_sums)
+        goals.append(arc['angle'] if arc else None)
+    return goals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("frames", nargs="?", help=".npy stack of recorded RGB frames or a .corpus file")
+    parser.add_argument("--count", type=int, default=30, help="synthetic frames when no recording is given")
+    parser.add_argument("--every", type=int, default=3, help="goal search period in frames")
+    parser.add_argument("--motion-limit", type=float, default=15.0, help="ball bearing jump that forces a search")
+    parser.add_argument("--turn-rate", type=float, default=0.5, help="synthetic goal drift in deg/frame")
+    args = parser.parse_args()
+
+    frames = (emulator.load_frames(args.frames) if args.frames
+              else emulator.synthetic_sequence(args.count, turn_rate=args.turn_rate))
+    lut = rgd.build_class_lut(emulator.rgb_to_lab_tuple, YELLOW_THRESHOLDS, BLUE_THRESHOLDS)
+    bearing_map = rgd.build_bearing_map(emulator.MIRROR_CENTER_X, emulator.MIRROR_CENTER_Y,
+                                        emulator.MIRROR_INNER_RADIUS, emulator.MIRROR_OUTER_RADIUS)
+
+    scheduler = DetectionScheduler()
+    scheduler.add('goals', every=args.every, motion_limit=args.motion_limit)
+    every_frame_s = scheduled_s = 0.0
+    errors = []
+    last_ball = None
+    for frame in frames:
+        img = emulator.Image(frame)
+        img.lab()
+        img.get_pixel(0, 0, False)
+
+        t0 = time.perf_counter()
+        find_ball(img)
+        fresh = find_goals(img, bearing_map, lut)
+        every_frame_s += time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        ball = find_ball(img)
+        motion = 0.0
+        if ball is not None and last_ball is not None:
+            motion = abs((ball - last_ball + 180) % 360 - 180)
+        last_ball = ball
+        if scheduler.due('goals', motion):
+            scheduler.update('goals', find_goals(img, bearing_map, lut))
+        reused, age = scheduler.result('goals')
+        scheduled_s += time.perf_counter() - t0
+
+        for a, b in zip(fresh, reused):
+            if a is not None and b is not None:
+                errors.append(abs((a - b + 180) % 360 - 180))
+
+    n = len(frames)
+    stats = scheduler.stats('goals')
+    print("frames: %d  goal period: %d" % (n, args.every))
+    print("goals every frame: %6.2f ms/frame (host)" % (1000 * every_frame_s / n))
+    print("scheduled goals:   %6.2f ms/frame (host)  (%.0f%% of the frame budget saved)" %
+          (1000 * scheduled_s / n, 100 * (1 - scheduled_s / every_frame_s)))
+    print("goal searches: %d run, %d skipped (%.0f%%), %d forced by motion" %
+          (stats['runs'], stats['skips'], 100 * stats['saved'], stats['forced']))
+    print("result age: mean %.2f frames  max %d frames" % (stats['mean_age'], stats['max_age']))
+    if errors:
+        print("bearing error of reused goals: mean %.2f deg  max %.2f deg" % (sum(errors) / len(errors), max(errors)))
+
+
+if __name__ == "__main__":
+    main()
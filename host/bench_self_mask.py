@@ -0,0 +1,181 @@
+"""Learned robot self-mask: mask quality, false candidates and pixel work saved.
+
+Usage:
+    python -m host.bench_self_mask [--learn 120] [--test 20] [--cell 4] [--save mask.bin]
+
+Renders mirror frames with the robot's own body at fixed pixels (camera
+mount ring, yellow screw terminals, a blue connector, wheel guards at the
+mirror edge) while the field turns and moves around it, learns the mask with
+self_mask.SelfMaskLearner from the learning frames and checks it on fresh
+test frames: how much of the body it covers and how much field it wrongly
+covers, goal-coloured find_blobs candidates off the real goals, goal bearing
+error of the histogram detector, obstacle hits on the body, and the sample
+tables of the histogram, the rays and the change detector before and after.
+"""
+
+import argparse
+import math
+
+import numpy as np
+
+import change_detector
+import radial_scan
+import ring_goal_detector as rgd
+import self_mask
+from host import emulator
+from host.bench_goal_histogram import YELLOW_THRESHOLDS, BLUE_THRESHOLDS
+from host.bench_lines import WHITE_THRESHOLDS
+from host.bench_obstacles import TURF_THRESHOLDS
+
+CX, CY = emulator.MIRROR_CENTER_X, emulator.MIRROR_CENTER_Y
+INNER, OUTER = emulator.MIRROR_INNER_RADIUS, emulator.MIRROR_OUTER_RADIUS
+W, H = emulator.FRAME_WIDTH, emulator.FRAME_HEIGHT
+
+
+def body_parts():
+    """Boolean masks and colours of the robot parts seen in the mirror"""
+    ys, xs = np.mgrid[0:H, 0:W]
+    dist = np.hypot(xs - CX, ys - CY)
+    angle = (np.degrees(np.arctan2(ys - CY, xs - CX)) + 360) % 360
+    parts = [((dist >= INNER) & (dist <= INNER + 5), emulator.ROBOT_RGB)]  # Camera mount
+    for a in (45, 135, 225, 315):   # Screw terminals
+        px = CX + 45 * math.cos(math.radians(a))
+        py = CY + 45 * math.sin(math.radians(a))
+        parts.append(((np.abs(xs - px) <= 3) & (np.abs(ys - py) <= 2), emulator.YELLOW_RGB))
+    px, py = CX - 52, CY  # Connector
+    parts.append(((np.abs(xs - px) <= 3) & (np.abs(ys - py) <= 4), emulator.BLUE_RGB))
+    for a in (90, 270):   # Wheel guards
+        off = np.abs((angle - a + 180) % 360 - 180)
+        parts.append(((dist >= OUTER - 14) & (dist <= OUTER) & (off <= 5), (90, 90, 95)))
+    return parts
+
+
+def render(i, parts, seed):
+    """The field around the robot at step i (turning and driving), body drawn on top"""
+    turn = i * 7.0
+    frame = emulator.synthetic_mirror_frame(
+        ball=((turn * 1.7 + 20) % 360, 45 + (i * 13) % 55, 6),
+        yellow=((90 + turn) % 360, 30 + (i * 3) % 30, 10 + (i * 5) % 20),
+        blue=((270 + turn) % 360, 30 + (i * 7) % 30, 10 + (i * 3) % 20),
+        line=((turn * 0.8) % 360, 40 + (i * 11) % 65, 4),
+        robots=[((200 - turn * 1.3) % 360, 50 + (i * 17) % 50, 9)],
+        seed=seed)
+    body = np.zeros((H, W), dtype=bool)
+    for shape, rgb in parts:
+        frame[shape] = rgb
+        body |= shape
+    return frame, body
+
+
+def mask_pixels(mask):
+    out = np.zeros((H, W), dtype=bool)
+    for x, y, w, h in mask.rects():
+        out[max(0, y):y + h, max(0, x):x + w] = True
+    return out
+
+
+def goal_truth(i):
+    turn = i * 7.0
+    return (90 + turn) % 360, (270 + turn) % 360
+
+
+def off_goal_candidates(img, goals):
+    """Goal-coloured blobs in the ring more than 30 degrees from the goal of their colour"""
+    count = 0
+    for thresholds, goal in ((YELLOW_THRESHOLDS, goals[0]), (BLUE_THRESHOLDS, goals[1])):
+        for b in img.find_blobs(thresholds, pixels_threshold=5, area_threshold=5):
+            dist = math.hypot(b.cx() - CX, b.cy() - CY)
+            bearing = (math.degrees(math.atan2(b.cy() - CY, b.cx() - CX)) + 360) % 360
+            if INNER <= dist <= OUTER and abs((bearing - goal + 180) % 360 - 180) > 30:
+                count += 1
+    return count
+
+
+def goal_errors(img, bearing_map, lut, goals):
+    errors = []
+    for (counts, radius_sums), goal in zip(rgd.goal_histograms(img, bearing_map, lut), goals):
+        arc = rgd.find_goal_arc(counts, radius_sums)
+        errors.append(180.0 if arc is None else abs((arc['angle'] - goal + 180) % 360 - 180))
+    return errors
+
+
+def body_obstacles(img, rays, lut, body):
+    """Rays whose first obstacle is a pixel of the robot body"""
+    bearings, offsets, xs, ys, radii = rays
+    line_hits = np.zeros(len(bearings), dtype=np.uint8)
+    obstacle_hits = np.zeros(len(bearings), dtype=np.uint8)
+    radial_scan.scan_rays(img, rays, lut, line_hits, obstacle_hits)
+    count = 0
+    for i in range(len(bearings)):
+        for j in range(offsets[i], offsets[i + 1]):
+            if radii[j] == obstacle_hits[i]:
+                count += bool(body[ys[j], xs[j]])
+                break
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--learn", type=int, default=120, help="learning frames")
+    parser.add_argument("--test", type=int, default=20, help="test frames")
+    parser.add_argument("--cell", type=int, default=self_mask.CELL)
+    parser.add_argument("--save", default=None, help="write the learned mask file here")
+    args = parser.parse_args()
+
+    lut = rgd.build_class_lut(emulator.rgb_to_lab_tuple, YELLOW_THRESHOLDS, BLUE_THRESHOLDS,
+                              WHITE_THRESHOLDS, TURF_THRESHOLDS)
+    parts = body_parts()
+    learner = self_mask.SelfMaskLearner(W, H, args.cell)
+    for i in range(args.learn):
+        frame, _ = render(i, parts, seed=i)
+        learner.add(emulator.Image(frame))
+    print(learner.progress())
+    mask = learner.build(lut)
+    if args.save:
+        mask.save(args.save)
+        assert self_mask.SelfMask.load(args.save, W, H).bits == mask.bits
+        assert self_mask.SelfMask.load(args.save, W // 2, H // 2) is None
+
+    masked = mask_pixels(mask)
+    ys, xs = np.mgrid[0:H, 0:W]
+    dist = np.hypot(xs - CX, ys - CY)
+    ring = (dist >= INNER) & (dist <= OUTER)
+    inside = (dist >= INNER + 2 * args.cell) & (dist <= OUTER - 2 * args.cell)  # Away from the ring edges
+    _, body = render(0, parts, seed=0)
+    body &= ring
+    field = ring & ~body
+    print("mask: %d cells of %d px; ring pixels: body %d, body covered %.1f%%, field covered %.1f%% "
+          "(%.1f%% away from the ring edges)" %
+          (mask.count(), args.cell, body.sum(), 100.0 * (masked & body).sum() / body.sum(),
+           100.0 * (masked & field).sum() / field.sum(), 100.0 * (masked & field & inside).sum() / (field & inside).sum()))
+
+    bearing_map = rgd.build_bearing_map(CX, CY, INNER, OUTER)
+    rays = radial_scan.build_rays(CX, CY, INNER, OUTER, W, H)
+    blocks = change_detector.build_blocks(CX, CY, INNER, OUTER, W, H)
+    masked_map = mask.mask_bearing_map(bearing_map)
+    masked_rays = mask.mask_rays(rays)
+    masked_blocks = mask.mask_blocks(blocks)
+    print("samples per frame: goal histogram %d -> %d, rays %d -> %d, change blocks %d -> %d" %
+          (len(bearing_map[0]), len(masked_map[0]), len(rays[2]), len(masked_rays[2]),
+           len(blocks[2]), len(masked_blocks[2])))
+
+    totals = {"without": [0, [], 0], "with": [0, [], 0]}
+    for i in range(args.learn, args.learn + args.test):
+        frame, body = render(i, parts, seed=10000 + i)
+        cleared = frame.copy()
+        cleared[masked | ~ring] = 0   # img.clear() with the exclusion mask
+        goals = goal_truth(i)
+        for name, f, bmap, r in (("without", frame, bearing_map, rays), ("with", cleared, masked_map, masked_rays)):
+            img = emulator.Image(f)
+            totals[name][0] += off_goal_candidates(img, goals)
+            totals[name][1].extend(goal_errors(img, bmap, lut, goals))
+            totals[name][2] += body_obstacles(img, r, lut, body)
+    for name in ("without", "with"):
+        candidates, errors, obstacles = totals[name]
+        print("%-7s mask: off-goal candidates/frame %.1f  goal bearing error mean %.1f max %.1f deg  "
+              "rays stopped by the body %.1f/%d" % (name, candidates / args.test, sum(errors) / len(errors),
+                                                  max(errors), obstacles / args.test, len(rays[0])))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Fixed vs online-adapted ball thresholds under changing light.
+
+Usage:
+    python -m host.bench_threshold_adapt [--count 300] [--log thresh.log]
+
+Renders mirror frames whose light changes over the run (normal, dimming to
+65%, back up to 90%, with a little falloff towards the mirror edge) with an
+orange ball and orange-ish clutter fixed around the field that the wide
+ORANGE_THRESHOLDS hull also matches (brown bumpers, wood, cardboard, pink
+stickers). The ball is picked like mainNationals does, once with the
+configured boxes and once through threshold_adapter.ThresholdAdapter fed
+with the round, tracked picks. Reports ball hit rate, false candidates per
+frame and threshold boxes per pass per lighting phase, and checks that
+host.threshold_replay rebuilds the live boxes of every frame from the
+THRESH lines (written to --log if given).
+"""
+
+import argparse
+import math
+
+import numpy as np
+
+import threshold_adapter
+from host import emulator
+from host import threshold_replay
+from host.bench_windowing import ORANGE_THRESHOLDS
+
+CX, CY = emulator.MIRROR_CENTER_X, emulator.MIRROR_CENTER_Y
+INNER, OUTER = emulator.MIRROR_INNER_RADIUS, emulator.MIRROR_OUTER_RADIUS
+CLUTTER = [   # (bearing, radius, length, width, rgb): patches lying along the ring
+    (20, 70, 14, 5, (150, 60, 40)),     # Brown bumper
+    (75, 95, 16, 6, (200, 140, 100)),   # Wood
+    (130, 55, 3, 3, (220, 90, 90)),     # Pink sticker
+    (200, 85, 18, 7, (160, 100, 60)),   # Cardboard
+    (250, 60, 12, 5, (150, 60, 40)),
+    (310, 100, 14, 6, (200, 140, 100)),
+]
+PHASES = ("normal", "dimming", "dim", "brightening")
+
+
+def light(i, count):
+    """Global light level and phase name at frame i"""
+    t = i / float(count)
+    if t < 0.25:
+        return 1.0, PHASES[0]
+    if t < 0.5:
+        return 1.0 - 0.35 * (t - 0.25) / 0.25, PHASES[1]
+    if t < 0.75:
+        return 0.65, PHASES[2]
+    return 0.65 + 0.25 * (t - 0.75) / 0.25, PHASES[3]
+
+
+def render(i, count, seed):
+    """Frame i and the true ball center"""
+    gain, _ = light(i, count)
+    turn = i * 1.5
+    frame = emulator.synthetic_mirror_frame(
+        yellow=((90 + turn) % 360, 30, 15), blue=((270 + turn) % 360, 30, 15),
+        line=((turn * 0.8) % 360, 60 + 30 * math.sin(i / 20.0), 4), seed=seed).astype(np.float64)
+    ys, xs = np.mgrid[0:frame.shape[0], 0:frame.shape[1]]
+    dist = np.hypot(xs - CX, ys - CY)
+    angle = (np.degrees(np.arctan2(ys - CY, xs - CX)) + 360) % 360
+    for a, r, length, width, rgb in CLUTTER:
+        off = np.abs(((angle - a - turn) + 180) % 360 - 180) * np.pi / 180 * r
+        frame[(off <= length / 2.0) & (np.abs(dist - r) <= width / 2.0)] = rgb
+    ball = ((i * 3.1) % 360, 55 + 40 * (0.5 + 0.5 * math.sin(i / 15.0)), 6)
+    bx = CX + ball[1] * math.cos(math.radians(ball[0]))
+    by = CY + ball[1] * math.sin(math.radians(ball[0]))
+    frame[(xs - bx) ** 2 + (ys - by) ** 2 <= ball[2] ** 2] = emulator.ORANGE_RGB
+    falloff = 1.0 - 0.15 * np.clip((dist - INNER) / (OUTER - INNER), 0, 1)
+    frame *= (gain * falloff)[..., None]
+    return np.clip(frame, 0, 255).astype(np.uint8), (bx, by)
+
+
+def ball_score(b):
+    return b.pixels() * (1.2 - 0.004 * math.hypot(b.cx() - CX, b.cy() - CY))
+
+
+def pick(blobs):
+    """mainNationals' ball: best scored blob if round enough"""
+    if not blobs:
+        return None
+    best = max(blobs, key=ball_score)
+    return best if best.roundness() > 0.6 else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--count", type=int, default=300, help="frames")
+    parser.add_argument("--log", help="write the THRESH lines here")
+    args = parser.parse_args()
+
+    adapter = threshold_adapter.ThresholdAdapter("ball", ORANGE_THRESHOLDS)
+    log = []
+    used = []
+    stats = {}   # (mode, phase) -> [frames, hits, false candidates, boxes]
+    last = None
+    for i in range(args.count):
+        seq = i + 1
+        frame, truth = render(i, args.count, seed=i)
+        img = emulator.Image(frame)
+        _, phase = light(i, args.count)
+        used.append(adapter.thresholds)
+        for mode, thresholds in (("fixed", ORANGE_THRESHOLDS), ("adaptive", adapter.thresholds)):
+            blobs = threshold_replay.candidates(img, thresholds)
+            ball = pick(blobs)
+            s = stats.setdefault((mode, phase), [0, 0, 0, 0])
+            s[0] += 1
+            s[1] += ball is not None and math.hypot(ball.cx() - truth[0], ball.cy() - truth[1]) <= 6
+            s[2] += sum(1 for b in blobs if math.hypot(b.cx() - truth[0], b.cy() - truth[1]) > 10)
+            s[3] += len(thresholds)
+            if mode == "adaptive":
+                # Confident: round, big enough and tracked from the last pick
+                if (ball is not None and ball.roundness() >= 0.75 and last is not None and
+                        math.hypot(ball.cx() - last[0], ball.cy() - last[1]) < 30):
+                    adapter.observe(img, ball)
+                last = (ball.cx(), ball.cy()) if ball is not None else None
+        line = adapter.update(seq)
+        if line:
+            log.append(line)
+
+    print("%-12s %-9s %9s %18s %10s" % ("phase", "mode", "ball hit", "false cand/frame", "boxes"))
+    for phase in PHASES:
+        for mode in ("fixed", "adaptive"):
+            n, hits, false, boxes = stats[(mode, phase)]
+            print("%-12s %-9s %8.0f%% %18.2f %10.1f" % (phase, mode, 100.0 * hits / n, false / n, boxes / n))
+    print("%d THRESH lines, last: %s" % (len(log), log[-1] if log else "-"))
+
+    events = threshold_replay.parse(log).get("ball", [])
+    mismatched = sum(1 for i, t in enumerate(used)
+                     if threshold_replay.thresholds_at(events, i + 1, ORANGE_THRESHOLDS) != t)
+    print("replay: %d of %d frames with the live boxes" % (len(used) - mismatched, len(used)))
+    if args.log:
+        with open(args.log, "w") as f:
+            f.write("\n".join(log) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Unbounded vs top-k ball candidates: serial time, work and picks.
+
+Usage:
+    python -m host.bench_top_candidates [--count 60] [--specks 40] [--k 1] [--budget-us 30000] [--check]
+
+Renders mirror frames with an orange ball and orange speckle noise (small
+clusters that pass raghavopenopenmv.py's pixels_threshold=5) and runs its
+ball loop twice: once writing a BALL line for every blob, once through
+top_candidates.TopK and FrameBudget. Reports candidates per frame, lines and
+serial time per frame at 9600 baud (10 bits a byte, the write blocks), how
+often the controller's ball (the last BALL line it read) was the real ball,
+host time of the top-k selection, and the TOPK/BUDGET counters. --check
+first runs TopK.select and FrameBudget.best on a fake clock, where every
+candidate takes 1 ms against a 2.5 ms budget, and checks that the candidates
+after the budget runs out are cut and counted.
+"""
+
+import argparse
+import math
+import time
+
+import numpy as np
+
+import top_candidates
+from host import emulator
+
+ORANGE_THRESHOLDS = [   # raghavopenopenmv.py
+    (10, 70, 30, 127, 40, 127),
+    (20, 90, 40, 127, 50, 127),
+    (30, 110, 50, 127, 60, 127)
+]
+BAUD = 9600
+
+
+def noisy_frame(i, specks, seed):
+    """Frame i with orange specks and the true ball center"""
+    rng = np.random.default_rng(seed)
+    angle = (i * 6.0) % 360
+    radius = 50 + 40 * (0.5 + 0.5 * math.sin(i / 9.0))
+    frame = emulator.synthetic_mirror_frame(ball=(angle, radius, 6), seed=seed)
+    h, w = frame.shape[:2]
+    for _ in range(specks):
+        x = int(rng.integers(0, w - 4))
+        y = int(rng.integers(0, h - 4))
+        sw, sh = (int(v) for v in rng.integers(2, 5, size=2))
+        frame[y:y + sh, x:x + sw] = emulator.ORANGE_RGB
+    bx = emulator.MIRROR_CENTER_X + radius * math.cos(math.radians(angle))
+    by = emulator.MIRROR_CENTER_Y + radius * math.sin(math.radians(angle))
+    return frame, (bx, by)
+
+
+def send(blobs, cx, cy, budget=None):
+    """The BALL lines the loop writes; returns (lines, bytes, last blob written)"""
+    lines = 0
+    sent = 0
+    last = None
+    for i in range(len(blobs)):
+        if i and budget is not None and not budget.has_time(len(blobs) - i):
+            break   # The biggest blob is always sent, as in the script
+        b = blobs[i]
+        oa = (math.degrees(math.atan2(b.cy() - cy, b.cx() - cx)) + 360) % 360
+        line = "BALL,{:.0f},{:.0f}\n".format(oa, b.pixels())
+        lines += 1
+        sent += len(line)
+        last = b
+        if budget is not None:
+            budget.start_us -= len(line) * 10 * 1000000 // BAUD   # The write blocks this long
+    return lines, sent, last
+
+
+def check_budget():
+    """Candidates past the budget are skipped, the first is always taken; asserts"""
+    import time
+    clock = [0]
+    real_ticks = time.ticks_us
+    time.ticks_us = lambda: clock[0]
+    try:
+        def slow_pixels(b):
+            clock[0] += 1000   # 1 ms of work per candidate
+            return b
+
+        budget = top_candidates.FrameBudget(2500)
+        top = top_candidates.TopK("check", 10)
+        kept = []
+        blobs = [5, 9, 1, 7, 3, 8, 2, 6, 4, 0]
+
+        # Offered at 0, 1 and 2 ms; the budget is gone at 3 ms
+        budget.start()
+        top.select(blobs, slow_pixels, kept, budget)
+        assert kept == [9, 5, 1], kept
+        budget.finish()
+        assert budget.report() == "BUDGET,1,1,7,3000", budget.report()
+
+        # Scoring stops the same way, the best of those scored wins
+        budget.start()
+        assert budget.best(blobs, slow_pixels) == 9
+        assert not budget.has_time()
+        budget.finish()
+        assert budget.report() == "BUDGET,1,1,8,3000", budget.report()
+
+        # Late frame: the first candidate still gets through
+        budget.start()
+        clock[0] += 10000
+        assert budget.best(blobs, slow_pixels) == 5
+        budget.finish()
+
+        # Time spent paused (find_blobs) is not charged
+        budget.start()
+        budget.pause()
+        clock[0] += 10000
+        budget.resume()
+        assert budget.has_time()
+        budget.finish()
+
+        # No limit
+        budget = top_candidates.FrameBudget(0)
+        budget.start()
+        assert budget.best(blobs, slow_pixels) == 9
+    finally:
+        time.ticks_us = real_ticks
+    print("budget check: OK")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--count", type=int, default=60, help="frames")
+    parser.add_argument("--specks", type=int, default=40, help="orange noise clusters per frame")
+    parser.add_argument("--k", type=int, default=1, help="BALL_TOP_K")
+    parser.add_argument("--budget-us", type=int, default=30000, help="CANDIDATE_BUDGET_US")
+    parser.add_argument("--check", action="store_true", help="check that the budget cuts candidates first")
+    args = parser.parse_args()
+
+    emulator.install_ticks()
+    if args.check:
+        check_budget()
+    top = top_candidates.TopK("ball", args.k)
+    budget = top_candidates.FrameBudget(args.budget_us)
+    kept = []
+    totals = {"all": [0, 0, 0], "top-k": [0, 0, 0]}   # lines, bytes, real ball last
+    candidates = 0
+    select_s = 0.0
+    for i in range(args.count):
+        frame, ball = noisy_frame(i, args.specks, seed=i)
+        img = emulator.Image(frame)
+        cx, cy = img.width() // 2, img.height() // 2
+        blobs = img.find_blobs(ORANGE_THRESHOLDS, pixels_threshold=5, area_threshold=5, merge=True)
+        candidates += len(blobs)
+
+        t0 = time.perf_counter()
+        top.select(blobs, lambda b: b.pixels(), kept)
+        select_s += time.perf_counter() - t0
+
+        budget.start()
+        for name, chosen, b in (("all", blobs, None), ("top-k", kept, budget)):
+            lines, sent, last = send(chosen, cx, cy, b)
+            t = totals[name]
+            t[0] += lines
+            t[1] += sent
+            t[2] += last is not None and math.hypot(last.cx() - ball[0], last.cy() - ball[1]) <= 6
+        budget.finish()
+
+    n = args.count
+    print("candidates/frame: %.1f" % (candidates / n))
+    for name in ("all", "top-k"):
+        lines, sent, hits = totals[name]
+        print("%-6s BALL lines/frame %5.1f  serial ms/frame %6.1f  controller's ball is the real one %d of %d" %
+              (name, lines / n, 1000.0 * sent * 10 / BAUD / n, hits, n))
+    print("top-k selection: %.3f host ms/frame" % (1000 * select_s / n))
+    print(top.report())
+    print(budget.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Check and measure sensor windowing to the mirror's bounding square.
+
+Usage:
+    python -m host.bench_windowing [frames.npy]
+
+Runs the histogram goal detector and the ball find_blobs on full frames and on
+frames windowed with mirror_geometry.mirror_window(), then compares pixel
+counts, time per frame and the resulting bearings (which must not change).
+"""
+
+import argparse
+import math
+import time
+
+import mirror_geometry
+import ring_goal_detector as rgd
+from host import emulator
+from host.bench_goal_histogram import YELLOW_THRESHOLDS, BLUE_THRESHOLDS
+
+# Same boxes as mainNationalsBallAndGoal
+ORANGE_THRESHOLDS = [
+    (10, 60, 10, 127, 20, 127),
+    (20, 70, 20, 127, 30, 127),
+    (30, 90, 40, 127, 50, 127),
+    (40, 100, 50, 127, 60, 127)
+]
+
+
+def detect(sensor, count, center_x, center_y, lut):
+    """Ball and goal bearings for count frames, with the center in image coordinates"""
+    bearing_map = rgd.build_bearing_map(center_x, center_y, emulator.MIRROR_INNER_RADIUS,
+                                        emulator.MIRROR_OUTER_RADIUS)
+    bearings = []
+    pixels = 0
+    elapsed = 0.0
+    for _ in range(count):
+        img = sensor.snapshot()
+        pixels += img.width() * img.height()
+        t0 = time.perf_counter()
+        ball = None
+        blobs = img.find_blobs(ORANGE_THRESHOLDS, pixels_threshold=10, area_threshold=10, merge=True, margin=10)
+        if blobs:
+            b = max(blobs, key=lambda b: b.pixels())
+            ball = (math.degrees(math.atan2(b.cy() - center_y, b.cx() - center_x)) + 360) % 360
+        goals = []
+        for counts, radius_sums in rgd.goal_histograms(img, bearing_map, lut):
+            arc = rgd.find_goal_arc(counts, radius_sums)
+            goals.append(arc['angle'] if arc else None)
+        elapsed += time.perf_counter() - t0
+        bearings.append([ball] + goals)
+    return bearings, pixels / count, 1000 * elapsed / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("frames", nargs="?", help=".npy stack of recorded RGB frames or a .corpus file")
+    parser.add_argument("--count", type=int, default=10, help="synthetic frames when no recording is given")
+    args = parser.parse_args()
+
+    frames = emulator.load_frames(args.frames) if args.frames else emulator.synthetic_sequence(args.count)
+    lut = rgd.build_class_lut(emulator.rgb_to_lab_tuple, YELLOW_THRESHOLDS, BLUE_THRESHOLDS)
+
+    full, full_px, full_ms = detect(emulator.Sensor(frames), len(frames),
+                                    emulator.MIRROR_CENTER_X, emulator.MIRROR_CENTER_Y, lut)
+
+    window = mirror_geometry.mirror_window(emulator.MIRROR_CENTER_X, emulator.MIRROR_CENTER_Y,
+                                           emulator.MIRROR_OUTER_RADIUS, frames[0].shape[1], frames[0].shape[0])
+    sensor = emulator.Sensor(frames)
+    sensor.set_windowing(window)
+    cropped, crop_px, crop_ms = detect(sensor, len(frames), emulator.MIRROR_CENTER_X - window[0],
+                                       emulator.MIRROR_CENTER_Y - window[1], lut)
+
+    worst = 0.0
+    for a, b in zip(full, cropped):
+        for x, y in zip(a, b):
+            if (x is None) != (y is None):
+                worst = float("inf")
+            elif x is not None:
+                worst = max(worst, abs((x - y + 180) % 360 - 180))
+
+    print("window: %r" % (window,))
+    print("full frame: %6d pixels  %6.2f ms/frame (host)" % (full_px, full_ms))
+    print("windowed:   %6d pixels  %6.2f ms/frame (host)  (%.0f%% fewer pixels)" %
+          (crop_px, crop_ms, 100.0 * (1 - crop_px / full_px)))
+    print("largest bearing change: %.2f deg" % worst)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Build the ring detectors' RGB565 colour class table offline.
+
+Usage:
+    python -m host.build_class_lut [SCRIPT] [--out class_lut.bin] [--check]
+
+Reads YELLOW/BLUE/WHITE/TURF_THRESHOLDS from the camera script (default
+mainNationalsBallAndGoal!!!!!!!!!.py), builds the same table
+ring_goal_detector.build_class_lut makes at boot (vectorised, with the
+emulator's copy of image.rgb_to_lab) and writes it in the file format
+load_class_lut reads. Copy the file next to the script on the camera; the
+script skips its own 64K-conversion build when the file's thresholds key
+matches its boxes. --check also builds the table the slow way and compares.
+"""
+
+import argparse
+import ast
+import time
+
+import numpy as np
+
+import ring_goal_detector as rgd
+from host import emulator
+
+SCRIPT = "mainNationalsBallAndGoal!!!!!!!!!.py"
+NAMES = ("YELLOW_THRESHOLDS", "BLUE_THRESHOLDS", "WHITE_THRESHOLDS", "TURF_THRESHOLDS")
+
+
+def read_thresholds(path):
+    """The threshold lists assigned at the top level of a script, in NAMES order"""
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    found = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            if node.targets[0].id in NAMES:
+                found[node.targets[0].id] = [tuple(t) for t in ast.literal_eval(node.value)]
+    return [found.get(name, []) for name in NAMES]
+
+
+def build(groups):
+    """build_class_lut over all 65536 values at once: earlier classes win"""
+    # One 1 x 65536 image of every RGB565 value
+    lab = emulator.rgb_to_lab(emulator.rgb565_to_rgb888(np.arange(65536, dtype=np.uint16).reshape(1, -1)))
+    lut = np.zeros((1, 65536), dtype=np.uint8)
+    for cls, thresholds in zip((rgd.CLASS_YELLOW, rgd.CLASS_BLUE, rgd.CLASS_WHITE, rgd.CLASS_TURF), groups):
+        if thresholds:
+            lut[(lut == 0) & emulator.threshold_mask(lab, thresholds)] = cls
+    return bytearray(lut.tobytes())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("script", nargs="?", default=SCRIPT, help="camera script to take the thresholds from")
+    parser.add_argument("--out", default="class_lut.bin")
+    parser.add_argument("--check", action="store_true", help="compare with the per-value build")
+    args = parser.parse_args()
+
+    groups = read_thresholds(args.script)
+    for name, thresholds in zip(NAMES, groups):
+        print("%s: %d boxes" % (name, len(thresholds)))
+    lut = build(groups)
+    key = rgd.thresholds_key(*groups)
+    rgd.save_class_lut(lut, key, args.out)
+    counts = np.bincount(np.frombuffer(bytes(lut), dtype=np.uint8), minlength=5)
+    print("wrote %s: key %d, classes none/yellow/blue/white/turf %s" % (args.out, key, "/".join(str(c) for c in counts)))
+    assert rgd.load_class_lut(args.out, key) == lut
+
+    if args.check:
+        t0 = time.perf_counter()
+        slow = rgd.build_class_lut(emulator.rgb_to_lab_tuple, *groups)
+        print("per-value build: %.1f s, %s" % (time.perf_counter() - t0, "same" if slow == lut else "DIFFERENT"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""Indexed, memory-mapped frame corpus for replay and the benchmarks.
+
+Usage:
+    python -m host.corpus info match.corpus
+    python -m host.corpus convert corpus.npz|frames.npy match.corpus [--exposure-us 10000]
+    python -m host.corpus synthetic test.corpus [--frames 200]
+    python -m host.corpus bench match.corpus [--reads 2000]
+
+One file holds raw RGB565 frames of a fixed size with a fixed-size entry per
+frame: receive time, sequence number, camera capture time, sensor settings,
+window and mirror center, ground-truth bearings and the camera's own
+detections (NaN when absent). Corpus maps the file and hands out zero-copy
+numpy views: frames as (N, H, W) uint16, which emulator.Image takes as is,
+and the index as a structured array. Frames are found by number or by time.
+CorpusWriter appends frame by frame, so the recorder never holds a match in
+memory, and can reopen a file to add to it.
+
+File layout (little endian):
+    header  "FCORPUS1", version (u16), width (u16), height (u16),
+            pixel format (u16, 0 = RGB565), entry size (u32),
+            start time (u64, unix us), reserved (u32)
+    chunks  entry (ENTRY_DTYPE), frame (height * width u16)
+    index   one entry per frame
+    footer  index offset (u64), entries (u64), "FIDX"
+The index and footer are written on close; a file cut short by a crash is
+still readable because the chunks have a fixed size and carry their entry.
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+from host import emulator
+
+MAGIC = b"FCORPUS1"
+VERSION = 1
+HEADER = struct.Struct("<8sHHHHIQI")
+FOOTER = struct.Struct("<QQ4s")
+FOOTER_MAGIC = b"FIDX"
+FORMAT_RGB565 = 0
+TARGETS = ("ball", "yellow", "blue")
+
+ENTRY_DTYPE = np.dtype([
+    ("offset", "<u8"),          # File offset of the frame
+    ("time_us", "<u8"),         # Receive time since the start of the recording
+    ("seq", "<u4"),             # Camera frame number
+    ("capture_ms", "<u4"),      # Camera clock at capture
+    ("exposure_us", "<f4"),     # Sensor settings, NaN when unknown
+    ("gain_db", "<f4"),
+    ("window", "<u2", (4,)),    # Sensor window (x, y, w, h) the frame was captured with
+    ("center", "<i2", (2,)),    # Mirror center, full-frame pixels
+    ("label", "<f4", (3,)),     # Ground-truth bearings in TARGETS order
+    ("detection", "<f4", (3,)), # Camera's bearings in TARGETS order
+    ("flags", "<u4"),
+])
+
+
+class Corpus:
+    """Read-only memory-mapped corpus"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.width, self.height, fmt, entry_size, self.start_unix_us, _ = \
+            HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError("%s is not a frame corpus" % path)
+        if version != VERSION or fmt != FORMAT_RGB565 or entry_size != ENTRY_DTYPE.itemsize:
+            raise ValueError("%s: unsupported corpus version %d / format %d" % (path, version, fmt))
+        self.chunk = ENTRY_DTYPE.itemsize + self.width * self.height * 2
+        self.index = self._read_index()
+        count = len(self.index)
+        # Chunks have a fixed size, so all frames are one strided view
+        self.frames = np.ndarray((count, self.height, self.width), dtype="<u2", buffer=self.map,
+                                 offset=HEADER.size + ENTRY_DTYPE.itemsize,
+                                 strides=(self.chunk, self.width * 2, 2))
+
+    def _read_index(self):
+        size = len(self.map)
+        if size >= HEADER.size + FOOTER.size:
+            index_offset, count, footer = FOOTER.unpack_from(self.map, size - FOOTER.size)
+            if footer == FOOTER_MAGIC and index_offset + count * ENTRY_DTYPE.itemsize + FOOTER.size == size:
+                return np.frombuffer(self.map, dtype=ENTRY_DTYPE, count=count, offset=index_offset)
+        # No index: take the entries from the complete chunks
+        count = (size - HEADER.size) // self.chunk
+        entries = np.ndarray((count,), dtype=ENTRY_DTYPE, buffer=self.map, offset=HEADER.size,
+                             strides=(self.chunk,))
+        expected = HEADER.size + np.arange(count, dtype=np.uint64) * self.chunk + ENTRY_DTYPE.itemsize
+        valid = np.flatnonzero(entries["offset"] != expected)
+        return entries[:valid[0]] if len(valid) else entries
+
+    def __len__(self):
+        return len(self.index)
+
+    def frame(self, i):
+        """Frame i as an (H, W) RGB565 view"""
+        return self.frames[i]
+
+    def rgb(self, i):
+        """Frame i converted to RGB888"""
+        return emulator.rgb565_to_rgb888(self.frames[i])
+
+    def at_time(self, seconds):
+        """Number of the last frame received at or before seconds into the recording"""
+        i = int(np.searchsorted(self.index["time_us"], int(seconds * 1e6), side="right")) - 1
+        return max(0, i)
+
+    def labels(self, source="label"):
+        """{target: bearings} from the ground truth or the camera's detections"""
+        return {name: self.index[source][:, i].astype(np.float64) for i, name in enumerate(TARGETS)}
+
+    def close(self):
+        self.frames = self.index = None
+        try:
+            self.map.close()
+        except BufferError:
+            pass  # Views handed out are still alive; the map goes with the last of them
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CorpusWriter:
+    """Append frames to a corpus; append=True continues an existing file"""
+
+    def __init__(self, path, width=emulator.FRAME_WIDTH, height=emulator.FRAME_HEIGHT, append=False,
+                 start_unix_us=None):
+        self.path = path
+        self.entries = []
+        if append and os.path.exists(path):
+            with Corpus(path) as old:
+                self.width, self.height = old.width, old.height
+                self.entries = [e.tobytes() for e in old.index]
+            self.file = open(path, "r+b")
+            self.file.truncate(HEADER.size + len(self.entries) * self._chunk())
+            self.file.seek(0, os.SEEK_END)
+        else:
+            self.width, self.height = width, height
+            if start_unix_us is None:
+                start_unix_us = int(time.time() * 1e6)
+            self.file = open(path, "wb")
+            self.file.write(HEADER.pack(MAGIC, VERSION, width, height, FORMAT_RGB565, ENTRY_DTYPE.itemsize,
+                                        start_unix_us, 0))
+
+    def _chunk(self):
+        return ENTRY_DTYPE.itemsize + self.width * self.height * 2
+
+    def __len__(self):
+        return len(self.entries)
+
+    def append(self, frame, time_us=0, seq=None, capture_ms=0, exposure_us=np.nan, gain_db=np.nan,
+               window=None, center=None, labels=None, detections=None, flags=0):
+        """Add one frame (RGB888 or RGB565, full size); labels/detections map target to bearing"""
+        if frame.ndim == 3:
+            frame = emulator.rgb888_to_rgb565(frame)
+        if frame.shape != (self.height, self.width):
+            raise ValueError("frame is %r, corpus is %dx%d" % (frame.shape, self.width, self.height))
+        entry = np.zeros((), dtype=ENTRY_DTYPE)
+        entry["offset"] = self.file.tell() + ENTRY_DTYPE.itemsize
+        entry["time_us"] = time_us
+        entry["seq"] = len(self.entries) + 1 if seq is None else seq
+        entry["capture_ms"] = capture_ms
+        entry["exposure_us"] = exposure_us
+        entry["gain_db"] = gain_db
+        entry["window"] = window if window is not None else (0, 0, self.width, self.height)
+        entry["center"] = center if center is not None else (emulator.MIRROR_CENTER_X, emulator.MIRROR_CENTER_Y)
+        for source, values in (("label", labels), ("detection", detections)):
+            entry[source] = [np.nan if values is None or values.get(name) is None else values[name]
+                             for name in TARGETS]
+        entry["flags"] = flags
+        data = entry.tobytes()
+        self.file.write(data)
+        self.file.write(np.ascontiguousarray(frame, dtype="<u2").tobytes())
+        self.entries.append(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        index_offset = self.file.tell()
+        self.file.write(b"".join(self.entries))
+        self.file.write(FOOTER.pack(index_offset, len(self.entries), FOOTER_MAGIC))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def convert(source, path, exposure_us=np.nan):
+    """Write an .npz corpus (frames + bearings) or an .npy frame stack as a corpus"""
+    data = np.load(source)
+    if isinstance(data, np.ndarray):
+        frames, labels = data, {}
+    else:
+        frames = data["frames"]
+        labels = {name: data[name] for name in TARGETS if name in data}
+        if "exposure_us" in data:
+            exposure_us = float(data["exposure_us"])
+    with CorpusWriter(path, frames.shape[2], frames.shape[1]) as writer:
+        for i, frame in enumerate(frames):
+            writer.append(frame, time_us=i * 50000, exposure_us=exposure_us,
+                          labels={name: values[i] for name, values in labels.items()})
+    return len(frames)
+
+
+def synthetic(path, count=200, seed=0):
+    """The sweep's labelled synthetic sequence as a corpus"""
+    from host.sweep import synthetic_corpus
+    corpus = synthetic_corpus(count, seed)
+    with CorpusWriter(path) as writer:
+        for i, frame in enumerate(corpus["frames"]):
+            writer.append(frame, time_us=i * 50000, exposure_us=corpus["exposure_us"],
+                          labels={name: values[i] for name, values in corpus["labels"].items()})
+
+
+def info(path):
+    with Corpus(path) as corpus:
+        index = corpus.index
+        print("%s: %d frames %dx%d RGB565, %.1f s" % (path, len(corpus), corpus.width, corpus.height,
+                                                      index["time_us"][-1] / 1e6 if len(corpus) else 0.0))
+        for i, name in enumerate(TARGETS):
+            print("  %-6s labelled in %d frames, detected in %d" % (
+                name, int(np.sum(~np.isnan(index["label"][:, i]))), int(np.sum(~np.isnan(index["detection"][:, i])))))
+        exposure = index["exposure_us"][~np.isnan(index["exposure_us"])]
+        if len(exposure):
+            print("  exposure %g..%g us" % (exposure.min(), exposure.max()))
+
+
+def bench(path, reads=2000, seed=0):
+    """Opening and random frame access through the map vs loading an .npy stack of the same frames"""
+    import tempfile
+    rng = np.random.default_rng(seed)
+    t0 = time.perf_counter()
+    corpus = Corpus(path)
+    opened = time.perf_counter() - t0
+    order = rng.integers(0, len(corpus), reads)
+    total = 0
+    t0 = time.perf_counter()
+    for i in order:
+        total += int(emulator.Image(corpus.frame(i)).get_pixel(160, 120, False))
+    mapped = time.perf_counter() - t0
+    with tempfile.TemporaryDirectory() as tmp:
+        npy = os.path.join(tmp, "frames.npy")
+        np.save(npy, np.stack([corpus.rgb(i) for i in range(len(corpus))]))
+        t0 = time.perf_counter()
+        frames = emulator.load_frames(npy)
+        loaded = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for i in order:
+            total += int(emulator.Image(frames[i]).get_pixel(160, 120, False))
+        stacked = time.perf_counter() - t0
+        del frames
+    count = len(corpus)
+    corpus.close()
+    print("%d frames, %d random frames read through emulator.Image" % (count, reads))
+    print("  corpus: open %.2f ms, %.1f us per frame" % (opened * 1e3, mapped / reads * 1e6))
+    print("  .npy:   load %.2f ms, %.1f us per frame" % (loaded * 1e3, stacked / reads * 1e6))
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("info")
+    p.add_argument("path")
+    p = sub.add_parser("convert")
+    p.add_argument("source")
+    p.add_argument("path")
+    p.add_argument("--exposure-us", type=float, default=np.nan)
+    p = sub.add_parser("synthetic")
+    p.add_argument("path")
+    p.add_argument("--frames", type=int, default=200)
+    p = sub.add_parser("bench")
+    p.add_argument("path")
+    p.add_argument("--reads", type=int, default=2000)
+    args = parser.parse_args()
+
+    if args.command == "info":
+        info(args.path)
+    elif args.command == "convert":
+        print("%d frames written to %s" % (convert(args.source, args.path, args.exposure_us), args.path))
+    elif args.command == "synthetic":
+        synthetic(args.path, args.frames)
+    else:
+        bench(args.path, args.reads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,455 @@
+"""Host-side stand-in for the OpenMV camera so vision code can run on a PC.
+
+Only the parts of the OpenMV API our scripts use are emulated: get_pixel,
+find_blobs (LAB thresholds, merge/margin, pixel/area filters), a few blob
+getters and get_histogram (LAB bins). Frames are numpy RGB888 arrays of
+shape (height, width, 3), or raw RGB565 arrays of shape (height, width)
+such as the views host/corpus.py hands out.
+"""
+
+import math
+import os
+
+import numpy as np
+
+FRAME_WIDTH = 320
+FRAME_HEIGHT = 240
+
+# Mirror geometry defaults, same as mainNationalsBallAndGoal
+MIRROR_CENTER_X = 160
+MIRROR_CENTER_Y = 120
+MIRROR_INNER_RADIUS = 30
+MIRROR_OUTER_RADIUS = 110
+# estimate_real_distance() of mainNationalsBallAndGoal: the outer mirror edge
+# is DISTANCE_OFFSET cm away and the inner edge the farthest
+DISTANCE_SCALE_FACTOR = 0.8
+DISTANCE_OFFSET = 10
+
+
+def radius_to_cm(radius, inner_radius=MIRROR_INNER_RADIUS, outer_radius=MIRROR_OUTER_RADIUS):
+    """Ground distance of a mirror radius (scalar or array), as estimate_real_distance"""
+    return DISTANCE_OFFSET + (outer_radius - radius) / float(outer_radius - inner_radius) * DISTANCE_SCALE_FACTOR * 100
+
+
+def rgb_to_lab(rgb):
+    """Convert RGB888 (..., 3) to integer LAB the way image.rgb_to_lab does"""
+    rgb = np.asarray(rgb, dtype=np.float32) / 255.0
+    linear = np.where(rgb > 0.04045, ((rgb + 0.055) / 1.055) ** 2.4, rgb / 12.92)
+    x = (linear[..., 0] * 0.4124 + linear[..., 1] * 0.3576 + linear[..., 2] * 0.1805) / 0.95047
+    y = linear[..., 0] * 0.2126 + linear[..., 1] * 0.7152 + linear[..., 2] * 0.0722
+    z = (linear[..., 0] * 0.0193 + linear[..., 1] * 0.1192 + linear[..., 2] * 0.9505) / 1.08883
+    xyz = np.stack([x, y, z], axis=-1)
+    f = np.where(xyz > 0.008856, np.cbrt(xyz), 7.787 * xyz + 16.0 / 116.0)
+    lab = np.empty(f.shape, dtype=np.int16)
+    lab[..., 0] = np.floor(116.0 * f[..., 1] - 16.0)
+    lab[..., 1] = np.floor(500.0 * (f[..., 0] - f[..., 1]))
+    lab[..., 2] = np.floor(200.0 * (f[..., 1] - f[..., 2]))
+    return lab
+
+
+def rgb_to_lab_tuple(rgb):
+    """Scalar version with the image.rgb_to_lab signature"""
+    return tuple(int(v) for v in rgb_to_lab(np.array(rgb, dtype=np.uint8)))
+
+
+def rgb888_to_rgb565(frame):
+    """Pack an RGB888 frame into raw RGB565 values (uint16)"""
+    frame = frame.astype(np.uint16)
+    return ((frame[..., 0] >> 3) << 11) | ((frame[..., 1] >> 2) << 5) | (frame[..., 2] >> 3)
+
+
+def rgb565_to_rgb888(raw):
+    """Unpack raw RGB565 values to an RGB888 frame"""
+    raw = raw.astype(np.uint16)
+    r = (raw >> 11) & 0x1F
+    g = (raw >> 5) & 0x3F
+    b = raw & 0x1F
+    return np.stack([(r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)], axis=-1).astype(np.uint8)
+
+
+def threshold_mask(lab, thresholds):
+    """Boolean mask of pixels inside any of the LAB threshold boxes"""
+    mask = np.zeros(lab.shape[:2], dtype=bool)
+    for t in thresholds:
+        mask |= ((lab[..., 0] >= t[0]) & (lab[..., 0] <= t[1]) &
+                 (lab[..., 1] >= t[2]) & (lab[..., 1] <= t[3]) &
+                 (lab[..., 2] >= t[4]) & (lab[..., 2] <= t[5]))
+    return mask
+
+
+class Blob:
+    """Subset of the OpenMV blob object built from pixel moments"""
+
+    def __init__(self, n, sx, sy, sxx, syy, sxy, x0, y0, x1, y1):
+        self._n = n
+        self._m = (sx, sy, sxx, syy, sxy)
+        self._rect = (x0, y0, x1 - x0 + 1, y1 - y0 + 1)
+
+    def pixels(self):
+        return self._n
+
+    def cx(self):
+        return int(round(self._m[0] / self._n))
+
+    def cy(self):
+        return int(round(self._m[1] / self._n))
+
+    def x(self):
+        return self._rect[0]
+
+    def y(self):
+        return self._rect[1]
+
+    def w(self):
+        return self._rect[2]
+
+    def h(self):
+        return self._rect[3]
+
+    def rect(self):
+        return self._rect
+
+    def area(self):
+        return self._rect[2] * self._rect[3]
+
+    def density(self):
+        return self._n / float(self.area())
+
+    def roundness(self):
+        """Minor/major axis ratio from the second moments, like OpenMV"""
+        n = float(self._n)
+        sx, sy, sxx, syy, sxy = self._m
+        mx, my = sx / n, sy / n
+        a = sxx / n - mx * mx
+        c = syy / n - my * my
+        b = sxy / n - mx * my
+        root = math.sqrt(((a - c) / 2) ** 2 + b * b)
+        major = (a + c) / 2 + root
+        minor = (a + c) / 2 - root
+        if major <= 0:
+            return 1.0
+        return math.sqrt(max(minor, 0.0) / major)
+
+    def merged(self, other):
+        sx, sy, sxx, syy, sxy = (p + q for p, q in zip(self._m, other._m))
+        x0 = min(self.x(), other.x())
+        y0 = min(self.y(), other.y())
+        x1 = max(self.x() + self.w(), other.x() + other.w()) - 1
+        y1 = max(self.y() + self.h(), other.y() + other.h()) - 1
+        return Blob(self._n + other._n, sx, sy, sxx, syy, sxy, x0, y0, x1, y1)
+
+
+def _label_runs(mask, x_offset=0, y_offset=0):
+    """8-connected components of a mask, returned as Blobs (run-length union-find)"""
+    parent = []
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    runs = []       # (y, x0, x1, label)
+    prev = []
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    for y in range(mask.shape[0]):
+        starts = np.flatnonzero(edges[y] == 1)
+        ends = np.flatnonzero(edges[y] == -1) - 1
+        row = []
+        j = 0
+        for x0, x1 in zip(starts.tolist(), ends.tolist()):
+            label = -1
+            while j < len(prev) and prev[j][1] < x0 - 1:
+                j += 1
+            k = j
+            while k < len(prev) and prev[k][0] <= x1 + 1:
+                other = find(prev[k][2])
+                if label < 0:
+                    label = other
+                elif other != label:
+                    parent[other] = label
+                k += 1
+            if label < 0:
+                label = len(parent)
+                parent.append(label)
+            row.append((x0, x1, label))
+            runs.append((y, x0, x1, label))
+        prev = row
+
+    stats = {}
+    for y, x0, x1, label in runs:
+        root = find(label)
+        n = x1 - x0 + 1
+        ax0, ax1, ay = x0 + x_offset, x1 + x_offset, y + y_offset
+        sx = n * (ax0 + ax1) / 2.0
+        sxx = (ax1 * (ax1 + 1) * (2 * ax1 + 1) - (ax0 - 1) * ax0 * (2 * ax0 - 1)) / 6.0
+        s = stats.get(root)
+        if s is None:
+            stats[root] = [n, sx, n * ay, sxx, n * ay * ay, sx * ay, ax0, ay, ax1, ay]
+        else:
+            s[0] += n
+            s[1] += sx
+            s[2] += n * ay
+            s[3] += sxx
+            s[4] += n * ay * ay
+            s[5] += sx * ay
+            s[6] = min(s[6], ax0)
+            s[8] = max(s[8], ax1)
+            s[9] = ay
+    return [Blob(*s) for s in stats.values()]
+
+
+def _merge_blobs(blobs, margin):
+    """Merge blobs whose bounding boxes (grown by margin) overlap"""
+    merged = True
+    while merged:
+        merged = False
+        out = []
+        for blob in blobs:
+            for i, other in enumerate(out):
+                if (blob.x() - margin <= other.x() + other.w() and other.x() - margin <= blob.x() + blob.w() and
+                        blob.y() - margin <= other.y() + other.h() and other.y() - margin <= blob.y() + blob.h()):
+                    out[i] = other.merged(blob)
+                    merged = True
+                    break
+            else:
+                out.append(blob)
+        blobs = out
+    return blobs
+
+
+class Histogram:
+    """Normalised LAB bins, like the object image.get_histogram returns"""
+
+    def __init__(self, l_bins, a_bins, b_bins):
+        self._l = l_bins
+        self._a = a_bins
+        self._b = b_bins
+
+    def l_bins(self):
+        return self._l
+
+    def a_bins(self):
+        return self._a
+
+    def b_bins(self):
+        return self._b
+
+    def get_percentile(self, percentile):
+        """Lowest bin values holding at least percentile (0-1) of the pixels, per channel"""
+        values = []
+        for bins, lo, hi in ((self._l, 0, 100), (self._a, -128, 127), (self._b, -128, 127)):
+            acc = 0.0
+            i = 0
+            while i < len(bins) - 1 and acc + bins[i] < percentile:
+                acc += bins[i]
+                i += 1
+            values.append(int(lo + i * (hi - lo + 1) / len(bins)))
+        return Percentile(*values)
+
+
+class Percentile:
+    def __init__(self, l, a, b):
+        self._values = (l, a, b)
+
+    def l_value(self):
+        return self._values[0]
+
+    def a_value(self):
+        return self._values[1]
+
+    def b_value(self):
+        return self._values[2]
+
+
+def _bins(values, lo, hi, count):
+    counts = np.histogram(values, bins=count, range=(lo, hi + 1))[0].astype(np.float64)
+    total = counts.sum()
+    return (counts / total if total else counts).tolist()
+
+
+class Image:
+    """numpy-backed image with the OpenMV methods our detectors call"""
+
+    def __init__(self, frame):
+        # 2-D frames are raw RGB565 (e.g. views into a host.corpus file) and
+        # are only converted to RGB888 when something needs it
+        self._rgb565 = frame if frame.ndim == 2 else None
+        self._frame = None if frame.ndim == 2 else frame
+        self._lab = None
+        self._raw = None
+        self.pixel_reads = 0
+
+    @property
+    def frame(self):
+        if self._frame is None:
+            self._frame = rgb565_to_rgb888(self._rgb565)
+        return self._frame
+
+    def width(self):
+        return (self._frame if self._frame is not None else self._rgb565).shape[1]
+
+    def height(self):
+        return (self._frame if self._frame is not None else self._rgb565).shape[0]
+
+    def lab(self):
+        if self._lab is None:
+            self._lab = rgb_to_lab(self.frame)
+        return self._lab
+
+    def get_pixel(self, x, y, rgbtuple=True):
+        self.pixel_reads += 1
+        if rgbtuple:
+            return tuple(int(v) for v in self.frame[y, x])
+        if self._raw is None:
+            raw = self._rgb565 if self._rgb565 is not None else rgb888_to_rgb565(self.frame)
+            self._raw = raw.tolist()
+        return self._raw[y][x]
+
+    def find_blobs(self, thresholds, roi=None, pixels_threshold=10, area_threshold=10, merge=False, margin=0):
+        x, y, w, h = roi if roi else (0, 0, self.width(), self.height())
+        lab = self.lab()[y:y + h, x:x + w]
+        blobs = []
+        for t in thresholds:
+            # OpenMV makes one full pass over the ROI per threshold box
+            self.pixel_reads += w * h
+            blobs.extend(_label_runs(threshold_mask(lab, [t]), x, y))
+        if merge:
+            blobs = _merge_blobs(blobs, margin)
+        return [b for b in blobs if b.pixels() >= pixels_threshold and b.area() >= area_threshold]
+
+    def get_histogram(self, thresholds=None, roi=None, l_bins=100, a_bins=256, b_bins=256):
+        x, y, w, h = roi if roi else (0, 0, self.width(), self.height())
+        lab = self.lab()[y:y + h, x:x + w]
+        if thresholds:
+            lab = lab[threshold_mask(lab, thresholds)]
+        lab = lab.reshape(-1, 3)
+        self.pixel_reads += w * h
+        return Histogram(_bins(lab[:, 0], 0, 100, l_bins), _bins(lab[:, 1], -128, 127, a_bins),
+                         _bins(lab[:, 2], -128, 127, b_bins))
+
+
+class Sensor:
+    """Plays a list of frames through snapshot(), with sensor.set_windowing support"""
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.index = 0
+        self.window = None
+
+    def set_windowing(self, roi):
+        self.window = tuple(roi)
+
+    def get_windowing(self):
+        return self.window
+
+    def snapshot(self):
+        """Next frame as an Image; windowed frames are numpy views, not copies"""
+        frame = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        if self.window:
+            x, y, w, h = self.window
+            frame = frame[y:y + h, x:x + w]
+        return Image(frame)
+
+
+def install_ticks():
+    """Give the host time module the MicroPython ticks_us/ticks_ms/ticks_diff/ticks_add the camera modules call"""
+    import time
+    if not hasattr(time, "ticks_us"):
+        time.ticks_us = lambda: time.perf_counter_ns() // 1000
+        time.ticks_ms = lambda: time.perf_counter_ns() // 1000000
+        time.ticks_diff = lambda a, b: a - b
+        time.ticks_add = lambda a, b: a + b
+
+
+# Synthetic mirror frames used when no recording is available
+TURF_RGB = (40, 110, 80)
+YELLOW_RGB = (235, 200, 40)
+BLUE_RGB = (10, 30, 110)
+ORANGE_RGB = (245, 110, 20)
+WHITE_RGB = (235, 235, 235)
+ROBOT_RGB = (30, 30, 35)
+
+
+def synthetic_mirror_frame(ball=None, yellow=None, blue=None, line=None, robots=(), seed=0,
+                           center=(MIRROR_CENTER_X, MIRROR_CENTER_Y),
+                           inner_radius=MIRROR_INNER_RADIUS, outer_radius=MIRROR_OUTER_RADIUS):
+    """Render a mirror-camera frame.
+
+    ball is (angle_deg, radius_px, size_px); yellow/blue are goal arcs given as
+    (center_angle_deg, width_deg, radial_depth_px) measured inward from the
+    outer mirror edge. line is a straight white field line on the ground
+    given by the bearing and mirror radius of its point nearest the robot
+    and its thickness: (normal_angle_deg, radius_px, thickness_px). It is
+    drawn through radius_to_cm, so the rest of the line bends toward the
+    mirror center (farther away) and the given point is the line's largest
+    radius. robots are dark discs given as (angle_deg, radius_px, size_px)
+    like the ball.
+    """
+    rng = np.random.default_rng(seed)
+    ys, xs = np.mgrid[0:FRAME_HEIGHT, 0:FRAME_WIDTH]
+    dx = xs - center[0]
+    dy = ys - center[1]
+    dist = np.sqrt(dx * dx + dy * dy)
+    angle = (np.degrees(np.arctan2(dy, dx)) + 360) % 360
+
+    frame = np.zeros((FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.int16)
+    frame[...] = (60, 60, 60)
+    ring = (dist >= inner_radius) & (dist <= outer_radius)
+    frame[ring] = TURF_RGB
+    frame[dist < inner_radius] = (15, 15, 15)
+
+    for goal, rgb in ((yellow, YELLOW_RGB), (blue, BLUE_RGB)):
+        if goal is None:
+            continue
+        goal_angle, goal_width, depth = goal
+        off = (angle - goal_angle + 180) % 360 - 180
+        frame[ring & (np.abs(off) <= goal_width / 2.0) & (dist >= outer_radius - depth)] = rgb
+
+    if line is not None:
+        line_angle, line_radius, thickness = line
+        # Ground distance along the line's normal, in cm, thickness converted at the line's radius
+        ground = radius_to_cm(dist, inner_radius, outer_radius)
+        along_normal = ground * np.cos(np.radians(angle - line_angle))
+        line_cm = radius_to_cm(line_radius, inner_radius, outer_radius)
+        cm_per_px = DISTANCE_SCALE_FACTOR * 100 / float(outer_radius - inner_radius)
+        frame[ring & (np.abs(along_normal - line_cm) <= thickness * cm_per_px / 2.0)] = WHITE_RGB
+
+    for disc, rgb in [(r, ROBOT_RGB) for r in robots] + [(ball, ORANGE_RGB)]:
+        if disc is None:
+            continue
+        disc_angle, disc_radius, size = disc
+        bx = center[0] + disc_radius * math.cos(math.radians(disc_angle))
+        by = center[1] + disc_radius * math.sin(math.radians(disc_angle))
+        frame[(xs - bx) ** 2 + (ys - by) ** 2 <= size * size] = rgb
+
+    frame += rng.integers(-6, 7, size=frame.shape, dtype=np.int16)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+
+def synthetic_sequence(count, seed=0, turn_rate=0.5):
+    """A short sequence with the ball orbiting and both goals drifting by turn_rate deg/frame"""
+    frames = []
+    for i in range(count):
+        frames.append(synthetic_mirror_frame(
+            ball=((i * 7) % 360, 50 + (i % 40), 6),
+            yellow=((90 + i * turn_rate) % 360, 40, 18),
+            blue=((270 + i * turn_rate) % 360, 40, 18),
+            seed=seed + i))
+    return frames
+
+
+def load_frames(path):
+    """Load recorded frames from a .npy stack (N, H, W, 3) or a host.corpus file (RGB565 views)"""
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    if path.endswith(".corpus"):
+        from host.corpus import Corpus
+        return list(Corpus(path).frames)
+    frames = np.load(path)
+    if frames.ndim != 4 or frames.shape[-1] != 3:
+        raise ValueError("expected an (N, H, W, 3) frame stack, got %r" % (frames.shape,))
+    return list(frames)
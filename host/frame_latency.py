@@ -0,0 +1,256 @@
+"""Camera frame latency percentiles from the histograms mainNationals keeps.
+
+Usage:
+    python -m host.frame_latency read camera.log [--bin-ms 5]
+    python -m host.frame_latency request /dev/ttyACM0 [--wait-s 1] [--save camera.log]
+    python -m host.frame_latency synthetic [--samples 20000]
+
+mainNationals counts the loop time (frame start to frame start) and the time
+from capture to the UART write into fixed-bucket histograms
+(frame_profile.LatencyHistogram). Every LATENCY_REPORT_EVERY frames it prints
+
+    LATH,name,samples,p50_us,p90_us,p99_us,max_us
+
+for the window that just ended (and the full HIST bucket dump with
+LATENCY_DUMP); sending "l" over USB prints both for the current window and "p"
+prints the profiling ring (PROF lines). `read` decodes a log of the camera's
+output: HIST dumps of the same histogram are summed and their percentiles
+recomputed, LATH windows are listed with the worst one marked, and PROF lines
+are summarized as frame time and GC pause percentiles. `request` asks a
+connected camera running with LATENCY_REQUESTS = True and decodes the
+answer. `synthetic` feeds random latencies through the camera's own
+histogram class and checks the decoded percentiles against exact ones.
+
+Percentiles are the upper edge of the bucket holding them (capped by the
+maximum), so they are at most one bucket (LATENCY_BUCKET_US) pessimistic.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+import frame_profile
+
+PERCENTILES = (50, 90, 99)
+PROF_FIELDS = ("seq", "frame_us", "gc_us", "heap_before", "heap_after", "auto")
+
+
+class Histogram:
+    """A HIST dump, or several of the same histogram summed"""
+
+    def __init__(self, name, bucket_us, buckets):
+        self.name = name
+        self.bucket_us = bucket_us
+        self.counts = np.zeros(buckets + 1, dtype=np.int64)
+        self.max_us = 0
+        self.dumps = 0
+
+    @property
+    def samples(self):
+        return int(self.counts.sum())
+
+    def add_dump(self, fields):
+        """fields after "HIST,name,bucket_us,buckets": samples, max_us, then bucket:count pairs"""
+        samples, max_us = int(fields[0]), int(fields[1])
+        for pair in fields[2:]:
+            i, count = pair.split(":")
+            self.counts[int(i)] += int(count)
+        self.max_us = max(self.max_us, max_us)
+        self.dumps += 1
+        return samples
+
+    def percentile(self, p):
+        """Same rule as LatencyHistogram.percentile on the camera"""
+        total = self.samples
+        if not total:
+            return 0
+        target = max(1, (total * p + 99) // 100)
+        seen = np.cumsum(self.counts[:-1])
+        i = int(np.searchsorted(seen, target))
+        if i >= len(seen):
+            return self.max_us
+        return min((i + 1) * self.bucket_us, self.max_us)
+
+    def text(self, bin_ms=5.0, width=40):
+        """Text histogram, buckets merged into rows of bin_ms"""
+        if not self.samples:
+            return "  (no samples)"
+        per_row = max(1, int(round(bin_ms * 1000 / self.bucket_us)))
+        used = np.nonzero(self.counts)[0]
+        first = used[0] // per_row * per_row
+        last = min(used[-1], len(self.counts) - 2)
+        rows = []
+        counts = [int(self.counts[lo:lo + per_row].sum()) for lo in range(first, last + 1, per_row)]
+        overflow = int(self.counts[-1])
+        scale = width / max(1, max(counts + [overflow]))
+        for k, count in enumerate(counts):
+            lo = (first + k * per_row) * self.bucket_us / 1000.0
+            rows.append("  %6.1f-%-6.1f %6d %s" % (lo, lo + per_row * self.bucket_us / 1000.0, count,
+                                                   "#" * int(round(count * scale))))
+        if overflow:
+            rows.append("  %6.1f+       %6d %s" % ((len(self.counts) - 1) * self.bucket_us / 1000.0, overflow,
+                                                  "#" * int(round(overflow * scale))))
+        return "\n".join(rows)
+
+
+def read_lines(lines):
+    """Histograms by name, LATH windows as (name, samples, p50, p90, p99, max) and PROF records"""
+    hists = {}
+    windows = []
+    prof = []
+    bad = 0
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("ascii", "replace")
+        line = line.strip()
+        try:
+            if line.startswith("HIST,"):
+                fields = line.split(",")
+                name, bucket_us, buckets = fields[1], int(fields[2]), int(fields[3])
+                key = (name, bucket_us, buckets)
+                if key not in hists:
+                    hists[key] = Histogram(name, bucket_us, buckets)
+                samples = hists[key].add_dump(fields[4:])
+                if samples != int(sum(int(p.split(":")[1]) for p in fields[6:])):
+                    bad += 1
+            elif line.startswith("LATH,"):
+                fields = line.split(",")
+                if len(fields) == 7:
+                    windows.append((fields[1],) + tuple(int(f) for f in fields[2:]))
+            elif line.startswith("PROF,"):
+                fields = line.split(",")[1:]
+                if len(fields) == len(PROF_FIELDS):
+                    prof.append([int(f) for f in fields])
+        except (ValueError, IndexError):
+            bad += 1
+    prof = np.array(prof, dtype=np.int64).reshape(-1, len(PROF_FIELDS))
+    return list(hists.values()), windows, prof, bad
+
+
+def report(hists, windows, prof, bad, bin_ms=5.0):
+    for hist in hists:
+        print("%s (%d dumps, %d samples, %d us buckets): %s  max %.1f ms" % (
+            hist.name, hist.dumps, hist.samples, hist.bucket_us,
+            "  ".join("p%d %.1f" % (p, hist.percentile(p) / 1000.0) for p in PERCENTILES),
+            hist.max_us / 1000.0))
+        print(hist.text(bin_ms))
+        print()
+    for name in sorted(set(w[0] for w in windows)):
+        rows = [w for w in windows if w[0] == name]
+        worst = max(range(len(rows)), key=lambda k: rows[k][4])
+        print("%s windows (ms):" % name)
+        print("  %6s %8s %7s %7s %7s %7s" % ("window", "samples", "p50", "p90", "p99", "max"))
+        for k, (_, samples, p50, p90, p99, longest) in enumerate(rows):
+            print("  %6d %8d %7.1f %7.1f %7.1f %7.1f%s" % (k, samples, p50 / 1000.0, p90 / 1000.0, p99 / 1000.0,
+                                                          longest / 1000.0, "  <- worst p99" if k == worst else ""))
+        print()
+    if len(prof):
+        # The ring is dumped whole each time, so the same frame can appear more than once
+        _, first = np.unique(prof[:, 0], return_index=True)
+        prof = prof[np.sort(first)]
+        for field, label in ((1, "frame time to the collection point"), (2, "scheduled GC pause")):
+            values = prof[:, field] / 1000.0
+            print("%s (%d frames): %s  max %.2f ms" % (
+                label, len(values), "  ".join("p%d %.2f" % (p, v) for p, v in
+                                              zip(PERCENTILES, np.percentile(values, PERCENTILES))),
+                values.max()))
+        print("automatic collections: %d  heap in use: mean %d, max %d bytes" % (
+            int(prof[:, 5].sum()), int(prof[:, 3].mean()), int(prof[:, 3].max())))
+    if not hists and not windows and not len(prof):
+        print("no HIST, LATH or PROF lines")
+    if bad:
+        print("%d malformed lines skipped" % bad)
+
+
+def request(path, what="lp", wait_s=1.0, baud=None):
+    """Send the request letters to the camera and return what it prints until it goes quiet"""
+    import select
+    from host.frame_recorder import open_port
+    fd = open_port(path, baud)
+    data = bytearray()
+    try:
+        os.write(fd, what.encode())
+        last = time.monotonic()
+        while time.monotonic() - last < wait_s:
+            ready, _, _ = select.select([fd], [], [], 0.1)
+            if ready:
+                chunk = os.read(fd, 65536)
+                if chunk:
+                    data += chunk
+                    last = time.monotonic()
+    finally:
+        os.close(fd)
+    return bytes(data)
+
+
+def synthetic(samples, bucket_us, buckets, seed=0):
+    """Random frame times through frame_profile.LatencyHistogram; decoded vs exact percentiles"""
+    rng = np.random.default_rng(seed)
+    # Mostly steady frames, a slow tail and a few stalls past the last bucket
+    us = np.concatenate([rng.normal(62000, 3000, samples), rng.exponential(15000, samples // 20) + 65000,
+                         rng.uniform(130000, 300000, max(1, samples // 500))])
+    us = np.maximum(us, 0).astype(np.int64)
+    rng.shuffle(us)
+    hist = frame_profile.LatencyHistogram("loop", bucket_us, buckets)
+    start = time.perf_counter()
+    for value in us.tolist():
+        hist.add(value)
+    add_us = (time.perf_counter() - start) * 1e6 / len(us)
+    lines = [hist.summary(), hist.dump()]
+    decoded, windows, _, bad = read_lines(lines)
+    # The camera's rank: the ceil(n * p / 100)-th smallest sample
+    exact = np.percentile(us, PERCENTILES, method="inverted_cdf")
+    print("%d samples, %d buckets of %d us; add() %.2f us each on this host" % (len(us), buckets, bucket_us, add_us))
+    print("  %4s %10s %10s %10s %10s" % ("", "exact", "camera", "decoded", "error"))
+    ok = not bad
+    for k, p in enumerate(PERCENTILES):
+        camera = windows[0][2 + k]
+        got = decoded[0].percentile(p)
+        err = got - exact[k]
+        ok &= camera == got and -1 <= err <= bucket_us
+        print("  p%-3d %10.0f %10d %10d %+10.0f" % (p, exact[k], camera, got, err))
+    ok &= decoded[0].max_us == us.max() == windows[0][5]
+    print("  max  %10d %10d %10d" % (us.max(), windows[0][5], decoded[0].max_us))
+    print("HIST line: %d bytes" % len(lines[1]))
+    print("OK" if ok else "MISMATCH")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("read", help="decode a log of the camera's output")
+    p.add_argument("log")
+    p.add_argument("--bin-ms", type=float, default=5.0)
+    p = sub.add_parser("request", help="ask a connected camera for its histograms and profile ring")
+    p.add_argument("port")
+    p.add_argument("--what", default="lp", help="request letters: l = histograms, p = profile ring")
+    p.add_argument("--wait-s", type=float, default=1.0, help="stop reading once the camera is quiet this long")
+    p.add_argument("--baud", type=int, default=None, help="only for a UART adapter; USB ignores it")
+    p.add_argument("--save", default=None, help="also write the raw answer here")
+    p.add_argument("--bin-ms", type=float, default=5.0)
+    p = sub.add_parser("synthetic", help="check the camera histogram against exact percentiles")
+    p.add_argument("--samples", type=int, default=20000)
+    p.add_argument("--bucket-us", type=int, default=1000)
+    p.add_argument("--buckets", type=int, default=128)
+    args = parser.parse_args()
+
+    if args.command == "read":
+        with open(args.log, "rb") as f:
+            report(*read_lines(f), bin_ms=args.bin_ms)
+    elif args.command == "request":
+        data = request(args.port, args.what, args.wait_s, args.baud)
+        if args.save:
+            with open(args.save, "wb") as f:
+                f.write(data)
+        report(*read_lines(data.splitlines()), bin_ms=args.bin_ms)
+    else:
+        if not synthetic(args.samples, args.bucket_us, args.buckets):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""Receive the camera's frame stream and write it as a replay corpus.
+
+Usage:
+    python -m host.frame_recorder record /dev/ttyACM0 match.corpus|corpus.npz [--baud 921600] [--seconds N] [--frames N]
+    python -m host.frame_recorder synthetic match.corpus|corpus.npz [--frames 60] [--quality 50] [--link-bytes 92160]
+    python -m host.frame_recorder info match.corpus|corpus.npz
+
+With STREAM_MODE set, mainNationals sends some frames (frame_stream.py) as
+JPEG or raw RGB565 together with the detection line it sent the controller
+for that frame. "record" reads them from the OpenMV USB port or a serial
+adapter on the stream UART, skips anything between packets (debug prints
+share the USB port) and writes the corpus host/sweep.py loads: "frames"
+(N, 240, 320, 3) with windowed frames put back at their window position,
+"ball", "yellow", "blue" bearings from the detection line (NaN when not
+found) plus "seq", "capture_ms", "center" (full-frame mirror center) and
+the raw "messages". The bearings are the camera's own answers, so check
+and correct them before using the corpus as ground truth. A path ending in
+.corpus is written frame by frame in the memory-mapped format of
+host/corpus.py instead, with the camera's bearings as detections.
+
+"synthetic" tests the receiving side without a camera: a thread sends
+emulator frames with their true bearings through a local pseudo-terminal
+at --link-bytes per second with debug text between packets, and the normal
+receive path records from the other end and compares the corpus with what
+was sent.
+
+Ports are opened raw with termios (POSIX only). JPEG frames need Pillow.
+"""
+
+import argparse
+import os
+import select
+import struct
+import threading
+import time
+
+import numpy as np
+
+import frame_stream
+import mirror_geometry
+from host import corpus, emulator
+from host.vision_message import parse_message
+
+FRAME_WIDTH = emulator.FRAME_WIDTH
+FRAME_HEIGHT = emulator.FRAME_HEIGHT
+MAX_TEXT = 4096
+TARGETS = (("ball", "ball"), ("yellow", "yellow_goal"), ("blue", "blue_goal"))
+
+
+class StreamParser:
+    """Split a byte stream into packets, resynchronising on the magic after junk or corruption"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.skipped_bytes = 0
+        self.bad_packets = 0
+
+    def feed(self, data):
+        """Add received bytes; returns the packets completed by them"""
+        self.buffer += data
+        packets = []
+        while True:
+            start = self.buffer.find(frame_stream.STREAM_MAGIC)
+            if start < 0:
+                # Keep a possible partial magic at the end
+                keep = len(frame_stream.STREAM_MAGIC) - 1
+                self.skipped_bytes += max(0, len(self.buffer) - keep)
+                del self.buffer[:max(0, len(self.buffer) - keep)]
+                return packets
+            self.skipped_bytes += start
+            del self.buffer[:start]
+            if len(self.buffer) < frame_stream.STREAM_HEADER_SIZE:
+                return packets
+            fields = struct.unpack_from(frame_stream.STREAM_HEADER, self.buffer)
+            packet = dict(zip(("magic", "seq", "capture_ms", "format", "quality", "x", "y", "w", "h",
+                               "center_x", "center_y", "text_len", "image_len"), fields))
+            if not self._plausible(packet):
+                self.bad_packets += 1
+                self.skipped_bytes += 1
+                del self.buffer[:1]
+                continue
+            size = frame_stream.STREAM_HEADER_SIZE + packet["text_len"] + packet["image_len"]
+            if len(self.buffer) < size:
+                return packets
+            body = bytes(self.buffer[frame_stream.STREAM_HEADER_SIZE:size])
+            packet["text"] = body[:packet["text_len"]].decode("ascii", "replace")
+            packet["image"] = body[packet["text_len"]:]
+            if packet["format"] == frame_stream.FORMAT_JPEG and not (
+                    packet["image"].startswith(b"\xff\xd8") and packet["image"].rstrip(b"\0").endswith(b"\xff\xd9")):
+                self.bad_packets += 1
+                self.skipped_bytes += 1
+                del self.buffer[:1]
+                continue
+            del self.buffer[:size]
+            packets.append(packet)
+
+    @staticmethod
+    def _plausible(p):
+        if p["format"] not in (frame_stream.FORMAT_JPEG, frame_stream.FORMAT_RGB565):
+            return False
+        if not (0 < p["w"] and 0 < p["h"] and p["x"] + p["w"] <= FRAME_WIDTH and p["y"] + p["h"] <= FRAME_HEIGHT):
+            return False
+        if p["text_len"] > MAX_TEXT:
+            return False
+        if p["format"] == frame_stream.FORMAT_RGB565:
+            return p["image_len"] == p["w"] * p["h"] * 2
+        return 0 < p["image_len"] <= p["w"] * p["h"] * 2
+
+
+def decode_frame(packet):
+    """Full-frame RGB888 array with the packet's window filled in"""
+    w, h = packet["w"], packet["h"]
+    if packet["format"] == frame_stream.FORMAT_RGB565:
+        raw = np.frombuffer(packet["image"], dtype="<u2").reshape(h, w)
+        window = emulator.rgb565_to_rgb888(raw)
+    else:
+        try:
+            from PIL import Image
+        except ImportError:
+            raise SystemExit("JPEG frames need Pillow: pip install pillow")
+        import io
+        window = np.asarray(Image.open(io.BytesIO(packet["image"])).convert("RGB"))[:h, :w]
+    frame = np.zeros((FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.uint8)
+    frame[packet["y"]:packet["y"] + window.shape[0], packet["x"]:packet["x"] + window.shape[1]] = window
+    return frame
+
+
+class RecordingWriter:
+    """Write received packets to a .corpus file as they arrive, or collect them for an .npz"""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self.seq = []
+        self.stream = None
+        if path.endswith(".corpus"):
+            self.stream = corpus.CorpusWriter(path, FRAME_WIDTH, FRAME_HEIGHT)
+        self.frames = []
+        self.labels = {name: [] for name, _ in TARGETS}
+        self.capture_ms = []
+        self.center = []
+        self.messages = []
+
+    def add(self, packet, time_us=0):
+        message = parse_message(packet["text"])
+        bearings = {}
+        for name, section in TARGETS:
+            found = message[section].get("found") and "angle" in message[section]
+            bearings[name] = message[section]["angle"] if found else np.nan
+        center = (packet["x"] + packet["center_x"], packet["y"] + packet["center_y"])
+        self.count += 1
+        self.seq.append(packet["seq"])
+        if self.stream is not None:
+            # The camera's answers are detections; labels are left for checking by hand
+            self.stream.append(decode_frame(packet), time_us=time_us, seq=packet["seq"],
+                               capture_ms=packet["capture_ms"],
+                               window=(packet["x"], packet["y"], packet["w"], packet["h"]),
+                               center=center, detections=bearings)
+            return
+        self.frames.append(decode_frame(packet))
+        for name, _ in TARGETS:
+            self.labels[name].append(bearings[name])
+        self.capture_ms.append(packet["capture_ms"])
+        self.center.append(center)
+        self.messages.append(packet["text"].strip())
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            return
+        frames = np.array(self.frames, dtype=np.uint8).reshape(-1, FRAME_HEIGHT, FRAME_WIDTH, 3)
+        np.savez(self.path, frames=frames,
+                 seq=np.array(self.seq, dtype=np.uint32), capture_ms=np.array(self.capture_ms, dtype=np.uint32),
+                 center=np.array(self.center, dtype=np.int32).reshape(-1, 2),
+                 messages=np.array(self.messages, dtype=str),
+                 **{name: np.array(values, dtype=np.float64) for name, values in self.labels.items()})
+
+
+def load_recording(path):
+    """Frames (RGB888) and the camera's bearings of a recording in either format"""
+    if path.endswith(".corpus"):
+        with corpus.Corpus(path) as c:
+            return np.array([c.rgb(i) for i in range(len(c))]), c.labels("detection")
+    data = np.load(path)
+    return data["frames"], {name: data[name] for name, _ in TARGETS}
+
+
+def open_port(path, baud=None):
+    """File descriptor of a serial port or pseudo-terminal in raw mode"""
+    import termios
+    import tty
+    fd = os.open(path, os.O_RDWR | os.O_NOCTTY)
+    tty.setraw(fd)
+    if baud:
+        speed = getattr(termios, "B%d" % baud, None)
+        if speed is None:
+            raise SystemExit("unsupported baud rate %d" % baud)
+        attrs = termios.tcgetattr(fd)
+        attrs[4] = attrs[5] = speed
+        termios.tcsetattr(fd, termios.TCSANOW, attrs)
+    return fd
+
+
+def receive(fd, writer, seconds=None, frames=None, idle_s=None):
+    """Record packets from fd into writer; returns the parser for its counters"""
+    parser = StreamParser()
+    start = last = time.monotonic()
+    try:
+        while seconds is None or time.monotonic() - start < seconds:
+            if frames is not None and writer.count >= frames:
+                break
+            if idle_s is not None and time.monotonic() - last > idle_s:
+                break
+            ready, _, _ = select.select([fd], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                data = os.read(fd, 65536)
+            except OSError:
+                break  # Other end of a pseudo-terminal closed
+            if not data:
+                break
+            last = time.monotonic()
+            for packet in parser.feed(data):
+                writer.add(packet, int((last - start) * 1e6))
+    except KeyboardInterrupt:
+        pass
+    return parser
+
+
+def report(writer, parser):
+    seq = np.array(writer.seq, dtype=np.int64)
+    gaps = int(np.sum(np.diff(seq) - 1)) if len(seq) > 1 else 0
+    print("%d frames to %s, %d frames not streamed between them, %d bad packets, %d bytes skipped"
+          % (writer.count, writer.path, gaps, parser.bad_packets, parser.skipped_bytes))
+
+
+def _send_synthetic(fd, corpus, quality, link_bytes, fps):
+    """Camera stand-in: packets with the true bearings, paced to the link rate, junk in between"""
+    import io
+    window = mirror_geometry.mirror_window(emulator.MIRROR_CENTER_X, emulator.MIRROR_CENTER_Y,
+                                           emulator.MIRROR_OUTER_RADIUS, FRAME_WIDTH, FRAME_HEIGHT)
+    x, y, w, h = window
+    center = (emulator.MIRROR_CENTER_X - x, emulator.MIRROR_CENTER_Y - y)
+    for i, frame in enumerate(corpus["frames"]):
+        crop = frame[y:y + h, x:x + w]
+        if quality:
+            from PIL import Image
+            out = io.BytesIO()
+            Image.fromarray(crop).save(out, format="JPEG", quality=quality)
+            data = out.getvalue()
+            fmt = frame_stream.FORMAT_JPEG
+        else:
+            data = emulator.rgb888_to_rgb565(crop).astype("<u2").tobytes()
+            fmt = frame_stream.FORMAT_RGB565
+        sections = []
+        for name, section in TARGETS:
+            angle = corpus["labels"][name][i]
+            if np.isnan(angle):
+                sections.append('"%s":{"found":false}' % section)
+            else:
+                sections.append('"%s":{"found":true,"angle":%.1f,"distance":50.0}' % (section, angle))
+        text = ('"frame":{"seq":%d,"t":%d,"proc":20} %s "line":{"found":false}\n'
+                % (i + 1, i * 50, " ".join(sections))).encode("ascii")
+        packet = frame_stream.pack_header(i + 1, i * 50, fmt, quality, window, center, len(text), len(data))
+        packet += text + data
+        junk = b"Sent to Arduino: " + text
+        started = time.monotonic()
+        for chunk in (junk, packet):
+            for j in range(0, len(chunk), 4096):
+                os.write(fd, chunk[j:j + 4096])
+                time.sleep(min(4096, len(chunk) - j) / float(link_bytes))
+        time.sleep(max(0.0, 1.0 / fps - (time.monotonic() - started)))
+
+
+def synthetic(path, count=60, quality=50, link_bytes=92160, fps=5.0, seed=0):
+    """Record a synthetic stream through a pseudo-terminal and check the corpus against it"""
+    from host.sweep import synthetic_corpus
+    if quality:
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            raise SystemExit("JPEG frames need Pillow: pip install pillow (or --quality 0 for raw)")
+    sent = synthetic_corpus(count, seed)
+    master, slave = os.openpty()
+    sender = threading.Thread(target=_send_synthetic, args=(master, sent, quality, link_bytes, fps))
+    fd = open_port(os.ttyname(slave))
+    start = time.monotonic()
+    sender.start()
+    writer = RecordingWriter(path)
+    parser = receive(fd, writer, frames=count, idle_s=2.0)
+    sender.join()
+    elapsed = time.monotonic() - start
+    writer.close()
+    for f in (fd, slave, master):
+        os.close(f)
+    report(writer, parser)
+
+    frames, bearings = load_recording(path)
+    label_error = 0.0
+    for name, _ in TARGETS:
+        truth = sent["labels"][name][:len(frames)]
+        got = bearings[name]
+        if not np.array_equal(np.isnan(truth), np.isnan(got)):
+            raise SystemExit("%s found/not found differs from what was sent" % name)
+        seen = ~np.isnan(truth)
+        if seen.any():
+            label_error = max(label_error, float(np.max(np.abs(truth[seen] - got[seen]))))
+    x, y, w, h = mirror_geometry.mirror_window(emulator.MIRROR_CENTER_X, emulator.MIRROR_CENTER_Y,
+                                               emulator.MIRROR_OUTER_RADIUS, FRAME_WIDTH, FRAME_HEIGHT)
+    sent = np.array(sent["frames"][:len(frames)])[:, y:y + h, x:x + w].astype(np.int16)
+    pixel_error = np.abs(frames[:, y:y + h, x:x + w].astype(np.int16) - sent)
+    print("%.1f s, %.1f frames/s; largest bearing error %.2f deg, pixel error mean %.2f max %d"
+          % (elapsed, len(frames) / elapsed, label_error, pixel_error.mean(), pixel_error.max()))
+
+
+def info(path):
+    if path.endswith(".corpus"):
+        corpus.info(path)
+        return
+    data = np.load(path)
+    frames = data["frames"]
+    print("%s: %d frames %dx%d" % (path, frames.shape[0], frames.shape[2], frames.shape[1]))
+    for name, _ in TARGETS:
+        print("  %-6s seen in %d frames" % (name, int(np.sum(~np.isnan(data[name])))))
+    if "seq" in data and len(data["seq"]) > 1:
+        seq = data["seq"].astype(np.int64)
+        print("  seq %d..%d, %d frames not streamed" % (seq[0], seq[-1], int(np.sum(np.diff(seq) - 1))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("record")
+    p.add_argument("port")
+    p.add_argument("path")
+    p.add_argument("--baud", type=int, help="serial adapter baud rate (not needed for USB)")
+    p.add_argument("--seconds", type=float)
+    p.add_argument("--frames", type=int)
+    p = sub.add_parser("synthetic")
+    p.add_argument("path")
+    p.add_argument("--frames", type=int, default=60)
+    p.add_argument("--quality", type=int, default=50, help="JPEG quality, 0 sends raw RGB565")
+    p.add_argument("--link-bytes", type=int, default=92160, help="link rate in bytes/s (921600 baud)")
+    p.add_argument("--fps", type=float, default=5.0)
+    p = sub.add_parser("info")
+    p.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        fd = open_port(args.port, args.baud)
+        writer = RecordingWriter(args.path)
+        parser = receive(fd, writer, args.seconds, args.frames)
+        os.close(fd)
+        writer.close()
+        report(writer, parser)
+    elif args.command == "synthetic":
+        synthetic(args.path, args.frames, args.quality, args.link_bytes, args.fps)
+    else:
+        info(args.path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+/*
+ * ir_harness.cpp
+ *
+ * Host test bench for ir_ring.h driven by IR sensor traces. Build and run
+ * from the repo root:
+ *
+ *   g++ -O2 -std=c++11 -Wall -o /tmp/ir_harness host/ir_harness.cpp
+ *   /tmp/ir_harness --synthetic /tmp/ir.csv [seconds]
+ *   /tmp/ir_harness /tmp/ir.csv [--calibrate]
+ *
+ * A trace has one "IR,ms,v0,...,v11" line per sweep, as movetogoal1 prints
+ * with LOG_IR set (other lines of a serial log are skipped). Synthetic traces
+ * add the true bearing (degrees, positive left) and distance (cm) as two more
+ * columns; with those the weighted bearing is compared against the strongest
+ * sensor, and --calibrate fits the distance scale for IR_DISTANCE_SCALE.
+ * Each sweep is played through IRRing::poll() one sensor at a time.
+ */
+
+#include <algorithm>
+#include <cmath>
+#include <cstdio>
+#include <cstring>
+#include <random>
+#include <string>
+#include <vector>
+
+#include "arduino/Arduino.h"
+#include "../ir_ring.h"
+
+static const int PINS[IR_SENSORS] = {0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11};
+static const unsigned ANALOG_READ_US = 110;   // One conversion on a 16 MHz AVR
+
+struct Sample {
+  unsigned long ms;
+  int values[IR_SENSORS];
+  bool hasTruth;
+  float bearingDeg, distanceCm;
+};
+
+static float wrapDeg(float a) {
+  while (a > 180.0f) a -= 360.0f;
+  while (a <= -180.0f) a += 360.0f;
+  return a;
+}
+
+static float percentile(std::vector<float> v, float p) {
+  if (v.empty()) return 0.0f;
+  std::sort(v.begin(), v.end());
+  return v[(size_t)(p * (v.size() - 1))];
+}
+
+// A ball circling the robot at a varying distance, seen by cos^2 sensor lobes
+static int writeSynthetic(const char *path, float seconds) {
+  FILE *f = fopen(path, "w");
+  if (!f) {
+    perror(path);
+    return 1;
+  }
+  std::mt19937 rng(7);
+  std::normal_distribution<float> noise(0.0f, 6.0f);
+  const float strength = 400000.0f, ambient = 40.0f;
+  for (unsigned long ms = 0; ms < (unsigned long)(seconds * 1000); ms += 2) {
+    float t = ms / 1000.0f;
+    float bearing = wrapDeg(40.0f * t + 60.0f * sinf(0.7f * t));
+    float distance = 35.0f + 25.0f * sinf(0.45f * t);
+    fprintf(f, "IR,%lu", ms);
+    for (int i = 0; i < IR_SENSORS; i++) {
+      float off = (bearing - i * 30.0f) * (float)DEG_TO_RAD;
+      float lobe = cosf(off) > 0 ? cosf(off) * cosf(off) : 0.0f;
+      float v = ambient + strength / (distance * distance + 25.0f) * lobe + noise(rng);
+      fprintf(f, ",%d", (int)constrain(v, 0.0f, 1023.0f));
+    }
+    fprintf(f, ",%.2f,%.2f\n", bearing, distance);
+  }
+  fclose(f);
+  printf("wrote %.0f s of synthetic IR sweeps to %s\n", seconds, path);
+  return 0;
+}
+
+static bool parseLine(const char *line, Sample &s) {
+  if (strncmp(line, "IR,", 3) != 0) return false;
+  const char *p = line + 3;
+  char *end;
+  s.ms = strtoul(p, &end, 10);
+  if (end == p) return false;
+  for (int i = 0; i < IR_SENSORS; i++) {
+    if (*end != ',') return false;
+    p = end + 1;
+    s.values[i] = (int)strtol(p, &end, 10);
+    if (end == p) return false;
+  }
+  s.hasTruth = false;
+  if (*end == ',') {
+    p = end + 1;
+    s.bearingDeg = strtof(p, &end);
+    if (*end == ',') {
+      p = end + 1;
+      s.distanceCm = strtof(p, &end);
+      s.hasTruth = end != p;
+    }
+  }
+  return true;
+}
+
+int main(int argc, char **argv) {
+  if (argc >= 3 && strcmp(argv[1], "--synthetic") == 0)
+    return writeSynthetic(argv[2], argc > 3 ? atof(argv[3]) : 20.0f);
+  if (argc < 2) {
+    fprintf(stderr, "usage: %s trace.csv [--calibrate] | --synthetic out.csv [seconds]\n", argv[0]);
+    return 2;
+  }
+  bool calibrate = argc > 2 && strcmp(argv[2], "--calibrate") == 0;
+
+  FILE *f = fopen(argv[1], "r");
+  if (!f) {
+    perror(argv[1]);
+    return 1;
+  }
+  std::vector<Sample> samples;
+  char line[512];
+  Sample s;
+  while (fgets(line, sizeof(line), f)) {
+    if (parseLine(line, s)) samples.push_back(s);
+  }
+  fclose(f);
+  if (samples.empty()) {
+    printf("no IR lines in %s\n", argv[1]);
+    return 1;
+  }
+
+  IRRing ring;
+  ring.begin(PINS);
+  std::vector<float> vectorErr, peakErr, distErr, scales;
+  int valid = 0, vectorJumps = 0, peakJumps = 0, truthSamples = 0;
+  float lastVector = 0.0f, lastPeak = 0.0f;
+  bool haveLast = false;
+  for (size_t k = 0; k < samples.size(); k++) {
+    const Sample &smp = samples[k];
+    for (int i = 0; i < IR_SENSORS; i++) hostPins().analog[PINS[i]] = smp.values[i];
+    bool done = false;
+    for (int i = 0; i < IR_SENSORS; i++) {
+      hostMicros() += ANALOG_READ_US;
+      done = ring.poll();
+    }
+    if (!done || !ring.valid) {
+      haveLast = false;
+      continue;
+    }
+    valid++;
+    float vectorDeg = ring.bearing * (float)RAD_TO_DEG;
+    float peakDeg = wrapDeg(ring.peakIndex * 30.0f);
+    // A jump is a bearing step between sweeps 2 ms apart that a ball can't make
+    if (haveLast) {
+      if (fabsf(wrapDeg(vectorDeg - lastVector)) > 10.0f) vectorJumps++;
+      if (fabsf(wrapDeg(peakDeg - lastPeak)) > 10.0f) peakJumps++;
+    }
+    lastVector = vectorDeg;
+    lastPeak = peakDeg;
+    haveLast = true;
+    if (smp.hasTruth) {
+      truthSamples++;
+      vectorErr.push_back(fabsf(wrapDeg(vectorDeg - smp.bearingDeg)));
+      peakErr.push_back(fabsf(wrapDeg(peakDeg - smp.bearingDeg)));
+      distErr.push_back(fabsf(ring.distance - smp.distanceCm) / smp.distanceCm);
+      scales.push_back(smp.distanceCm * sqrtf(ring.magnitude));
+    }
+  }
+
+  printf("%zu sweeps, %d with a bearing, %lu us of analogRead per poll()\n",
+         samples.size(), valid, (unsigned long)ANALOG_READ_US);
+  printf("bearing steps over 10 deg between sweeps: weighted %d, strongest sensor %d\n",
+         vectorJumps, peakJumps);
+  if (truthSamples) {
+    printf("bearing error (deg)   weighted: p50 %.1f  p95 %.1f  max %.1f\n",
+           percentile(vectorErr, 0.5f), percentile(vectorErr, 0.95f), percentile(vectorErr, 1.0f));
+    printf("               strongest sensor: p50 %.1f  p95 %.1f  max %.1f\n",
+           percentile(peakErr, 0.5f), percentile(peakErr, 0.95f), percentile(peakErr, 1.0f));
+    printf("distance error: p50 %.0f%%  p95 %.0f%% (scale %.0f)\n",
+           100 * percentile(distErr, 0.5f), 100 * percentile(distErr, 0.95f), ring.distanceScale);
+    if (calibrate) printf("fitted IR_DISTANCE_SCALE: %.0f\n", percentile(scales, 0.5f));
+  } else if (calibrate) {
+    printf("--calibrate needs bearing and distance columns in the trace\n");
+  }
+  return 0;
+}
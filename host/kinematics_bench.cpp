@@ -0,0 +1,138 @@
+/*
+ * kinematics_bench.cpp
+ *
+ * Host check and benchmark for omni_kinematics.h. Build and run from the
+ * repo root:
+ *
+ *   g++ -O2 -std=c++11 -Wall -o /tmp/kinematics_bench host/kinematics_bench.cpp
+ *   /tmp/kinematics_bench [calls]
+ *
+ * Compares omniMix() with the float mixer it replaces (moveOmniDirectional
+ * with a rotation term and the same saturation scaling) over directions in
+ * 0.1 degree steps, all speeds and rotations, and reports the largest PWM
+ * difference per wheel. Then times both on random commands in CPU cycles
+ * per call (rdtsc on x86, otherwise nanoseconds). These are host numbers on
+ * a CPU with hardware floats, where the two are close (about 1.2x); the
+ * mixer is meant for the Uno, where every float operation is a library
+ * call, and that gap has to be measured on the board.
+ */
+
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <random>
+#include <vector>
+#if defined(__x86_64__) || defined(__i386__)
+#include <x86intrin.h>
+#define HAVE_RDTSC 1
+#endif
+
+#include "../omni_kinematics.h"
+
+// The float version: moveOmniDirectional() plus rotation and saturation scaling
+static void floatMix(float angleDegrees, float speed, float rotation, int out[OMNI_WHEELS]) {
+  float angleRad = angleDegrees * 3.14159265f / 180.0f;
+  float moveX = sinf(angleRad) * speed;
+  float moveY = cosf(angleRad) * speed;
+  float wheels[OMNI_WHEELS];
+  float largest = 0.0f;
+  for (int i = 0; i < OMNI_WHEELS; i++) {
+    wheels[i] = OMNI_FORWARD[i] * moveY + OMNI_RIGHT[i] * moveX + OMNI_TURN[i] * rotation;
+    if (fabsf(wheels[i]) > largest) largest = fabsf(wheels[i]);
+  }
+  float scale = largest > OMNI_MAX_PWM ? OMNI_MAX_PWM / largest : 1.0f;
+  for (int i = 0; i < OMNI_WHEELS; i++) out[i] = (int)roundf(wheels[i] * scale);
+}
+
+static uint64_t ticks() {
+#ifdef HAVE_RDTSC
+  return __rdtsc();
+#else
+  return std::chrono::duration_cast<std::chrono::nanoseconds>(
+      std::chrono::steady_clock::now().time_since_epoch()).count();
+#endif
+}
+
+// Each version gets its commands in its own types, as the controller would
+// hand them over, so the timing doesn't include float to int conversions
+struct Command {
+  float angle, speed, rotation;
+  int16_t angleTenths, speedInt, rotationInt;
+};
+
+int main(int argc, char **argv) {
+  size_t calls = argc > 1 ? atol(argv[1]) : 2000000;
+
+  // Accuracy: whole degrees hit table entries, the others are interpolated
+  long histogram[4] = {0, 0, 0, 0};
+  int worstWhole = 0, worstFraction = 0;
+  long commands = 0;
+  for (int tenth = 0; tenth < 3600; tenth++) {
+    float angle = tenth / 10.0f;
+    for (int speed = 0; speed <= 255; speed += 5) {
+      for (int rotation = -255; rotation <= 255; rotation += 15) {
+        int fixed[OMNI_WHEELS], ref[OMNI_WHEELS];
+        omniMix((int16_t)tenth, speed, rotation, fixed);
+        floatMix(angle, speed, rotation, ref);
+        int worst = 0;
+        for (int i = 0; i < OMNI_WHEELS; i++) {
+          int d = abs(fixed[i] - ref[i]);
+          if (d > worst) worst = d;
+        }
+        histogram[worst < 3 ? worst : 3]++;
+        if (tenth % 10 == 0) {
+          if (worst > worstWhole) worstWhole = worst;
+        } else if (worst > worstFraction) {
+          worstFraction = worst;
+        }
+        commands++;
+      }
+    }
+  }
+  printf("%ld commands: largest wheel difference %d PWM at whole degrees, %d between them\n",
+         commands, worstWhole, worstFraction);
+  printf("  commands off by 0: %.1f%%  1: %.1f%%  2: %.1f%%  3+: %.1f%%\n",
+         100.0 * histogram[0] / commands, 100.0 * histogram[1] / commands,
+         100.0 * histogram[2] / commands, 100.0 * histogram[3] / commands);
+
+  // Speed on random commands, both versions on the same inputs
+  std::mt19937 rng(1);
+  std::vector<Command> cmds(4096);
+  for (size_t i = 0; i < cmds.size(); i++) {
+    cmds[i].angle = std::uniform_int_distribution<int>(-1800, 3599)(rng) / 10.0f;
+    cmds[i].speed = std::uniform_int_distribution<int>(0, 255)(rng);
+    cmds[i].rotation = std::uniform_int_distribution<int>(-120, 120)(rng);
+    cmds[i].angleTenths = (int16_t)lroundf(cmds[i].angle * 10);
+    cmds[i].speedInt = (int16_t)cmds[i].speed;
+    cmds[i].rotationInt = (int16_t)cmds[i].rotation;
+  }
+  long sink = 0;
+  int out[OMNI_WHEELS];
+  uint64_t bestFixed = UINT64_MAX, bestFloat = UINT64_MAX;
+  for (int pass = 0; pass < 5; pass++) {
+    uint64_t t0 = ticks();
+    for (size_t n = 0; n < calls; n++) {
+      const Command &c = cmds[n & (cmds.size() - 1)];
+      omniMix(c.angleTenths, c.speedInt, c.rotationInt, out);
+      sink += out[n & 3];
+    }
+    uint64_t t1 = ticks();
+    for (size_t n = 0; n < calls; n++) {
+      const Command &c = cmds[n & (cmds.size() - 1)];
+      floatMix(c.angle, c.speed, c.rotation, out);
+      sink += out[n & 3];
+    }
+    uint64_t t2 = ticks();
+    if (t1 - t0 < bestFixed) bestFixed = t1 - t0;
+    if (t2 - t1 < bestFloat) bestFloat = t2 - t1;
+  }
+#ifdef HAVE_RDTSC
+  const char *unit = "cycles";
+#else
+  const char *unit = "ns";
+#endif
+  printf("per call (best of 5 x %zu): fixed point %.1f %s, float %.1f %s (%.1fx)\n", calls,
+         (double)bestFixed / calls, unit, (double)bestFloat / calls, unit, (double)bestFloat / bestFixed);
+  return sink == 42 ? 1 : 0;
+}
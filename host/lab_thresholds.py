@@ -0,0 +1,85 @@
+"""LAB threshold tuples from the CAL lines of the camera's calibration mode.
+
+Usage:
+    python -m host.lab_thresholds camera.log [--tail 5] [--margin 3] [--region ball]
+
+With CALIBRATION_MODE on, the OpenMV scripts print per region (lab_calibration.py)
+
+    CAL,name,frames,pixels,L1,L5,L50,L95,L99,A1,A5,A50,A95,A99,B1,B5,B50,B95,B99
+
+every N frames. For each region this takes the --tail percentile pair (1/99
+or 5/95) of every channel over all its summaries in the log (lowest low and
+highest high, so put the object in every position and light you want the
+threshold to cover), widens it by --margin and prints a
+(L_min, L_max, A_min, A_max, B_min, B_max) tuple ready to paste into the
+script's thresholds list.
+"""
+
+import argparse
+
+# Positions of the percentiles within each channel's five values
+TAILS = {1: (0, 4), 5: (1, 3)}
+CHANNEL_RANGES = ((0, 100), (-128, 127), (-128, 127))
+
+
+def read_log(lines):
+    """{name: [(frames, pixels, values), ...]} from the CAL lines in a log"""
+    regions = {}
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("ascii", "replace")
+        line = line.strip()
+        if not line.startswith("CAL,"):
+            continue
+        fields = line[4:].split(",")
+        if len(fields) != 18:
+            continue
+        try:
+            numbers = [int(f) for f in fields[1:]]
+        except ValueError:
+            continue
+        if numbers[1] == 0:
+            continue
+        regions.setdefault(fields[0], []).append((numbers[0], numbers[1], numbers[2:]))
+    return regions
+
+
+def threshold(summaries, tail=5, margin=0):
+    """(L_min, L_max, A_min, A_max, B_min, B_max) covering every summary"""
+    low, high = TAILS[tail]
+    out = []
+    for c, (lo, hi) in enumerate(CHANNEL_RANGES):
+        mins = [values[c * 5 + low] for _, _, values in summaries]
+        maxs = [values[c * 5 + high] for _, _, values in summaries]
+        out.append(max(lo, min(mins) - margin))
+        out.append(min(hi, max(maxs) + margin))
+    return tuple(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("log")
+    parser.add_argument("--tail", type=int, choices=sorted(TAILS), default=5,
+                        help="percentile cut off each end of every channel")
+    parser.add_argument("--margin", type=int, default=0, help="widen every bound by this much")
+    parser.add_argument("--region", action="append", help="only these regions (repeatable)")
+    args = parser.parse_args()
+
+    with open(args.log, "rb") as f:
+        regions = read_log(f)
+    if not regions:
+        raise SystemExit("no CAL lines in %s" % args.log)
+    for name in sorted(regions):
+        if args.region and name not in args.region:
+            continue
+        summaries = regions[name]
+        frames = sum(s[0] for s in summaries)
+        pixels = sum(s[1] for s in summaries)
+        median = [summaries[-1][2][c * 5 + 2] for c in range(3)]
+        print("# %s: %d summaries, %d frames, %d pixels, latest median L%d A%d B%d"
+              % (name, len(summaries), frames, pixels, median[0], median[1], median[2]))
+        print("%s_THRESHOLD = %r" % (name.upper(), threshold(summaries, args.tail, args.margin)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Camera-to-motor latency and dropped frames from the controller's LAT log.
+
+Usage:
+    python -m host.latency controller.log [--min-link-ms 0] [--bin-ms 5]
+
+OmniRPC_Controller prints "LAT,seq,captureMs,procMs,rxUs,motorUs,parseErrors"
+for every camera frame it receives (see LOG_LATENCY); other serial output in
+the log is ignored. captureMs/procMs come from the camera's clock and rxUs/
+motorUs from the controller's, so the offset between the two clocks is
+estimated from the fastest messages: per chunk of the log the smallest
+(receive - capture - processing) is taken as a link time of --min-link-ms and
+the chunks are interpolated to follow clock drift. Link and end-to-end times
+are therefore "above the fastest message" unless --min-link-ms is set to the
+real transmit time (about 10 bits per byte at the baud rate).
+"""
+
+import argparse
+
+import numpy as np
+
+TICKS_MS_PERIOD = 1 << 30   # MicroPython time.ticks_ms() wraps here
+MICROS_PERIOD = 1 << 32     # Arduino micros() wraps here
+
+
+def read_log(lines):
+    """LAT records as an (n, 6) int64 array: seq, capture_ms, proc_ms, rx_us, motor_us, errors"""
+    records = []
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("ascii", "replace")
+        line = line.strip()
+        if not line.startswith("LAT,"):
+            continue
+        fields = line[4:].split(",")
+        if len(fields) != 6:
+            continue
+        try:
+            records.append([int(f) for f in fields])
+        except ValueError:
+            continue
+    return np.array(records, dtype=np.int64).reshape(-1, 6)
+
+
+def unwrap(values, period):
+    """Undo counter wrap-around in a sequence that mostly increases"""
+    steps = np.diff(values)
+    wraps = np.cumsum(np.concatenate([[0], steps < -period // 2]))
+    return values + wraps * period
+
+
+def clock_offset(camera_ms, controller_ms, chunk_ms=10000.0):
+    """Per-record controller minus camera clock offset (ms) from the fastest record of each chunk"""
+    delay = controller_ms - camera_ms
+    chunk = ((controller_ms - controller_ms[0]) // chunk_ms).astype(np.int64)
+    centers = []
+    floors = []
+    for c in np.unique(chunk):
+        sel = chunk == c
+        best = np.argmin(delay[sel])
+        centers.append(controller_ms[sel][best])
+        floors.append(delay[sel][best])
+    if len(centers) == 1:
+        return np.full(len(delay), floors[0])
+    # The fastest messages lie on the floor; interpolate it for drift
+    return np.interp(controller_ms, centers, floors)
+
+
+def analyze(records, min_link_ms=0.0, chunk_ms=10000.0):
+    """Latency components (ms) per received frame plus link health counts"""
+    seq = records[:, 0]
+    capture_ms = unwrap(records[:, 1], TICKS_MS_PERIOD).astype(np.float64)
+    proc_ms = records[:, 2].astype(np.float64)
+    rx_ms = unwrap(records[:, 3], MICROS_PERIOD) / 1000.0
+    motor_us = records[:, 4]
+    moved = motor_us != 0
+    # Motor times wrap with the same counter as the receive times
+    motor_ms = rx_ms + ((motor_us - records[:, 3]) % MICROS_PERIOD) / 1000.0
+
+    sent_ms = capture_ms + proc_ms
+    offset = clock_offset(sent_ms, rx_ms, chunk_ms)
+    link_ms = rx_ms - sent_ms - offset + min_link_ms
+    controller_ms = np.where(moved, motor_ms - rx_ms, np.nan)
+
+    steps = np.diff(seq)
+    return {
+        "frames": len(seq),
+        "processing_ms": proc_ms,
+        "link_ms": link_ms,
+        "controller_ms": controller_ms[moved],
+        "end_to_end_ms": (proc_ms + link_ms + controller_ms)[moved],
+        "dropped": int(np.sum(np.maximum(steps - 1, 0))),
+        "repeated": int(np.sum(steps <= 0)),
+        "parse_errors": int(records[-1, 5] - records[0, 5]) if len(records) else 0,
+        "no_motor": int(np.sum(~moved)),
+    }
+
+
+def histogram_text(values, bin_ms=5.0, width=40):
+    """Text histogram with one row per bin_ms"""
+    if len(values) == 0:
+        return "  (no samples)"
+    bottom = np.floor(values.min() / bin_ms) * bin_ms
+    top = max(bottom + bin_ms, np.ceil(values.max() / bin_ms) * bin_ms)
+    counts, edges = np.histogram(values, bins=np.arange(bottom, top + bin_ms / 2, bin_ms))
+    scale = width / max(1, counts.max())
+    rows = []
+    for count, lo in zip(counts, edges[:-1]):
+        rows.append("  %6.1f-%-6.1f %6d %s" % (lo, lo + bin_ms, count, "#" * int(round(count * scale))))
+    return "\n".join(rows)
+
+
+def summary(values):
+    if len(values) == 0:
+        return "no samples"
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return "p50 %.1f  p90 %.1f  p99 %.1f  max %.1f ms" % (p50, p90, p99, values.max())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("log")
+    parser.add_argument("--min-link-ms", type=float, default=0.0,
+                        help="link time of the fastest message (transmit time of one line)")
+    parser.add_argument("--bin-ms", type=float, default=5.0)
+    parser.add_argument("--chunk-s", type=float, default=10.0,
+                        help="span over which the clock offset is assumed constant")
+    args = parser.parse_args()
+
+    with open(args.log, "rb") as f:
+        records = read_log(f)
+    if len(records) < 2:
+        print("fewer than two LAT records in %s" % args.log)
+        return
+    result = analyze(records, args.min_link_ms, args.chunk_s * 1000.0)
+
+    print("frames received: %d  dropped: %d  repeated/out of order: %d  parse errors: %d  "
+          "without motor command: %d" % (result["frames"], result["dropped"], result["repeated"],
+                                         result["parse_errors"], result["no_motor"]))
+    for name, label in (("processing_ms", "camera processing (capture to send)"),
+                        ("link_ms", "link (send to controller receive)"),
+                        ("controller_ms", "controller (receive to motor command)"),
+                        ("end_to_end_ms", "end to end (capture to motor command)")):
+        print("\n%s: %s" % (label, summary(result[name])))
+        print(histogram_text(result[name], args.bin_ms))
+
+
+if __name__ == "__main__":
+    main()
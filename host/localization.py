@@ -0,0 +1,163 @@
+"""Particle-filter self-localization from goal bearings, lines and odometry.
+
+Runs on the host or a companion board. All particles are updated at once with
+numpy, so a few thousand particles update far faster than the camera rate.
+
+Field frame: origin at the field center, x to the right, y towards the yellow
+goal, headings in radians counter-clockwise with 0 along +x. Observations are
+robot-frame bearings (radians, counter-clockwise, 0 = straight ahead) and
+distances in cm; use camera_to_robot_bearing() for the angles mainNationals
+sends.
+"""
+
+import math
+
+import numpy as np
+
+# RoboCup Junior lightweight field, inside the white lines (cm)
+FIELD_WIDTH = 158.0
+FIELD_LENGTH = 219.0
+YELLOW_GOAL = (0.0, FIELD_LENGTH / 2)
+BLUE_GOAL = (0.0, -FIELD_LENGTH / 2)
+
+# Camera angle that points straight ahead, and whether camera angles grow
+# clockwise (-1) or counter-clockwise (+1) when seen from above
+CAMERA_FORWARD_DEG = 90.0
+CAMERA_BEARING_SIGN = -1.0
+
+# Noise models
+BEARING_SIGMA = math.radians(8.0)
+GOAL_DISTANCE_SIGMA = 30.0
+LINE_DISTANCE_SIGMA = 10.0
+ODOMETRY_SIGMA = 0.15              # Fraction of commanded velocity
+HEADING_DRIFT_SIGMA = math.radians(3.0)
+RESAMPLE_JITTER = 2.0              # cm of roughening after resampling, keeps diversity
+RESAMPLE_HEADING_JITTER = math.radians(1.0)
+
+# Ground speed per PWM step of moveOmniDirectional()'s speed argument (needs calibration)
+CM_S_PER_PWM = 0.5
+
+
+def camera_to_robot_bearing(angle_deg):
+    """Convert a mainNationals angle (degrees, 0 = image right) to a robot bearing"""
+    return math.radians(CAMERA_BEARING_SIGN * (angle_deg - CAMERA_FORWARD_DEG))
+
+
+def odometry_from_command(angle_deg, speed):
+    """Robot-frame (vx, vy) in cm/s for a moveOmniDirectional(angle, speed) command.
+
+    The controller's angle is 0 straight ahead and grows towards the right, so
+    vy (to the left) is negative for positive angles.
+    """
+    a = math.radians(angle_deg)
+    v = speed * CM_S_PER_PWM
+    return v * math.cos(a), -v * math.sin(a)
+
+
+def wrap_angle(a):
+    return (a + np.pi) % (2 * np.pi) - np.pi
+
+
+class ParticleFilter:
+    def __init__(self, count=2000, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.count = count
+        self.x = self.rng.uniform(-FIELD_WIDTH / 2, FIELD_WIDTH / 2, count)
+        self.y = self.rng.uniform(-FIELD_LENGTH / 2, FIELD_LENGTH / 2, count)
+        self.heading = self.rng.uniform(-np.pi, np.pi, count)
+        self.log_weight = np.zeros(count)
+
+    def predict(self, vx, vy, omega, dt):
+        """Move every particle by the commanded robot-frame velocity (cm/s, rad/s)"""
+        n = self.count
+        noisy_vx = vx + self.rng.normal(0.0, ODOMETRY_SIGMA * abs(vx) + 1.0, n)
+        noisy_vy = vy + self.rng.normal(0.0, ODOMETRY_SIGMA * abs(vy) + 1.0, n)
+        c = np.cos(self.heading)
+        s = np.sin(self.heading)
+        # Robot frame: vx is forward, vy is to the left
+        self.x += (c * noisy_vx - s * noisy_vy) * dt
+        self.y += (s * noisy_vx + c * noisy_vy) * dt
+        self.heading = wrap_angle(self.heading + omega * dt +
+                                  self.rng.normal(0.0, HEADING_DRIFT_SIGMA * math.sqrt(dt), n))
+        np.clip(self.x, -FIELD_WIDTH / 2 - 30, FIELD_WIDTH / 2 + 30, out=self.x)
+        np.clip(self.y, -FIELD_LENGTH / 2 - 30, FIELD_LENGTH / 2 + 30, out=self.y)
+
+    def update_goal(self, goal, bearing, distance=None):
+        """Weight particles by how well they explain a goal bearing (and distance)"""
+        dx = goal[0] - self.x
+        dy = goal[1] - self.y
+        expected = wrap_angle(np.arctan2(dy, dx) - self.heading)
+        err = wrap_angle(expected - bearing)
+        self.log_weight -= 0.5 * (err / BEARING_SIGMA) ** 2
+        if distance is not None:
+            derr = np.hypot(dx, dy) - distance
+            self.log_weight -= 0.5 * (derr / GOAL_DISTANCE_SIGMA) ** 2
+
+    def update_line(self, bearing, distance):
+        """Weight particles by the nearest field line distance and its bearing"""
+        # Distance to each of the four boundary lines and the field-frame
+        # direction of its closest point
+        d = np.stack([FIELD_WIDTH / 2 - self.x, FIELD_WIDTH / 2 + self.x,
+                      FIELD_LENGTH / 2 - self.y, FIELD_LENGTH / 2 + self.y])
+        directions = np.array([0.0, np.pi, np.pi / 2, -np.pi / 2])
+        nearest = np.argmin(np.abs(d), axis=0)
+        expected_distance = np.abs(d[nearest, np.arange(self.count)])
+        expected_bearing = wrap_angle(directions[nearest] - self.heading)
+        self.log_weight -= 0.5 * ((expected_distance - distance) / LINE_DISTANCE_SIGMA) ** 2
+        self.log_weight -= 0.5 * (wrap_angle(expected_bearing - bearing) / BEARING_SIGMA) ** 2
+
+    def update_message(self, message, use_distance=False):
+        """Apply the goal and line observations of a parsed vision message"""
+        for name, goal in (("yellow_goal", YELLOW_GOAL), ("blue_goal", BLUE_GOAL)):
+            section = message.get(name, {})
+            if section.get("found"):
+                distance = section.get("distance") if use_distance else None
+                self.update_goal(goal, camera_to_robot_bearing(section["angle"]), distance)
+        line = message.get("line", {})
+        if line.get("found"):
+            self.update_line(camera_to_robot_bearing(line["angle"]), line["distance"])
+
+    def effective_count(self):
+        w = self.weights()
+        return 1.0 / np.sum(w * w)
+
+    def weights(self):
+        w = np.exp(self.log_weight - self.log_weight.max())
+        return w / w.sum()
+
+    def resample(self, threshold=0.5):
+        """Systematic resampling once the effective particle count drops below threshold * count"""
+        if self.effective_count() >= threshold * self.count:
+            return False
+        cumulative = np.cumsum(self.weights())
+        cumulative[-1] = 1.0
+        positions = (self.rng.random() + np.arange(self.count)) / self.count
+        index = np.searchsorted(cumulative, positions)
+        self.x = self.x[index] + self.rng.normal(0.0, RESAMPLE_JITTER, self.count)
+        self.y = self.y[index] + self.rng.normal(0.0, RESAMPLE_JITTER, self.count)
+        self.heading = wrap_angle(self.heading[index] +
+                                  self.rng.normal(0.0, RESAMPLE_HEADING_JITTER, self.count))
+        self.log_weight = np.zeros(self.count)
+        return True
+
+    def estimate(self):
+        """Weighted pose and its uncertainty: (x, y, heading), (sx, sy, sheading)"""
+        w = self.weights()
+        x = np.sum(w * self.x)
+        y = np.sum(w * self.y)
+        c = np.sum(w * np.cos(self.heading))
+        s = np.sum(w * np.sin(self.heading))
+        heading = math.atan2(s, c)
+        sx = math.sqrt(np.sum(w * (self.x - x) ** 2))
+        sy = math.sqrt(np.sum(w * (self.y - y) ** 2))
+        # Circular standard deviation
+        sheading = math.sqrt(max(0.0, -2.0 * math.log(max(math.hypot(c, s), 1e-12))))
+        return (x, y, heading), (sx, sy, sheading)
+
+    def step(self, vx, vy, omega, dt, message=None):
+        """One full cycle: odometry, observations, resampling, estimate"""
+        self.predict(vx, vy, omega, dt)
+        if message is not None:
+            self.update_message(message)
+        self.resample()
+        return self.estimate()
@@ -0,0 +1,339 @@
+"""Vectorized 2-D field simulator for closed-loop controller benchmarks.
+
+Usage:
+    python -m host.omni_sim [--episodes 2048] [--seconds 20] [--latencies 0,50,100,200]
+                            [--policy omnirpc] [--calibration-frames 120]
+
+Every array holds one entry per episode, so thousands of episodes step
+together with numpy. Each control step:
+
+- The camera model observes the ball at the camera rate. Its bearing/radius
+  noise and miss rate come from the real detection code run on emulator
+  frames (calibrate_vision); the observation reaches the controller after
+  the given latency.
+- The controller policy turns the latest observation into four wheel PWMs.
+  "omnirpc" is a port of moveTowardsBall()/moveOmniDirectional()/
+  rotateToAngle() in OmniRPC_Controller.ino, including its habit of keeping
+  the last motor command while the ball is not seen.
+- X-drive kinematics with a first-order motor lag move the robot, and the
+  ball rolls with friction, bounces off the walls and is pushed on contact.
+
+Reports time to reach the ball, time until a goal in the opponent's (+y)
+goal, time until an own goal and how they degrade with camera-to-controller
+latency.
+"""
+
+import argparse
+import math
+import time
+
+import numpy as np
+
+from host import emulator
+from host import localization as loc
+from host.bench_windowing import ORANGE_THRESHOLDS
+
+# Field (cm): origin at the center, +y towards the yellow goal
+WALL_X = loc.FIELD_WIDTH / 2 + 12      # Walls are 12 cm outside the lines
+WALL_Y = loc.FIELD_LENGTH / 2 + 12
+GOAL_HALF_WIDTH = 30.0
+ROBOT_RADIUS = 11.0
+BALL_RADIUS = 3.7
+BALL_FRICTION = 40.0                   # cm/s^2 rolling deceleration
+BALL_RESTITUTION = 0.6                 # Of the robot's approach speed on contact
+WALL_RESTITUTION = 0.5
+
+# Drive model
+CM_S_PER_PWM = loc.CM_S_PER_PWM        # Body speed per PWM step, as for odometry
+WHEEL_BASE_RADIUS = 9.0                # cm from the robot center to the wheels
+MOTOR_TAU = 0.08                       # s, motor/robot velocity time constant
+
+# Camera model (mainNationals sends about every 50 ms)
+CAMERA_HZ = 20.0
+MIRROR_HALF_DISTANCE = 60.0            # cm at which an object sits halfway across the ring
+
+# Default noise if the emulator calibration is skipped
+DEFAULT_VISION = {'bearing_sigma': 1.5, 'radius_sigma': 1.0, 'miss_rate': (0.05, 0.05, 0.2),
+                  'confidence': 85.0}
+
+# OmniRPC_Controller.ino constants
+BASE_SPEED = 150
+SLOW_SPEED = 100
+TURN_SPEED = 120
+DISTANCE_THRESHOLD = 15.0
+CLOSE_THRESHOLD = 5.0
+ANGLE_MARGIN = 10.0
+TIMEOUT_MS = 1000.0
+
+
+def distance_to_radius(distance):
+    """Pixel radius in the mirror ring of an object distance cm from the robot"""
+    span = emulator.MIRROR_OUTER_RADIUS - emulator.MIRROR_INNER_RADIUS
+    return emulator.MIRROR_INNER_RADIUS + span * distance / (distance + MIRROR_HALF_DISTANCE)
+
+
+def radius_to_distance(radius):
+    span = emulator.MIRROR_OUTER_RADIUS - emulator.MIRROR_INNER_RADIUS
+    f = np.clip((radius - emulator.MIRROR_INNER_RADIUS) / span, 0.0, 0.999)
+    return MIRROR_HALF_DISTANCE * f / (1.0 - f)
+
+
+def ball_size_px(distance):
+    return np.clip(10.0 * 25.0 / (distance + 25.0), 2.0, 10.0)
+
+
+def radius_band(radius):
+    """0 near the inner edge, 1 mid ring, 2 near the outer edge"""
+    span = emulator.MIRROR_OUTER_RADIUS - emulator.MIRROR_INNER_RADIUS
+    f = (radius - emulator.MIRROR_INNER_RADIUS) / span
+    return np.clip((f * 3).astype(int), 0, 2)
+
+
+def calibrate_vision(frames=120, seed=0):
+    """Ball noise model from the mainNationals ball detection on emulator frames"""
+    rng = np.random.default_rng(seed)
+    cx, cy = emulator.MIRROR_CENTER_X, emulator.MIRROR_CENTER_Y
+    bearing_err = []
+    radius_err = []
+    confidence = []
+    misses = np.zeros(3)
+    tries = np.zeros(3)
+    for i in range(frames):
+        distance = rng.uniform(5.0, 250.0)
+        angle = rng.uniform(0.0, 360.0)
+        radius = float(distance_to_radius(distance))
+        band = int(radius_band(np.array(radius)))
+        tries[band] += 1
+        img = emulator.Image(emulator.synthetic_mirror_frame(
+            ball=(angle, radius, float(ball_size_px(distance))), seed=i))
+        blobs = img.find_blobs(ORANGE_THRESHOLDS, pixels_threshold=10, area_threshold=10, merge=True, margin=10)
+        blobs = [b for b in blobs if emulator.MIRROR_INNER_RADIUS <=
+                 math.hypot(b.cx() - cx, b.cy() - cy) <= emulator.MIRROR_OUTER_RADIUS]
+        if not blobs:
+            misses[band] += 1
+            continue
+        b = max(blobs, key=lambda b: b.pixels() * (1.2 - 0.004 * math.hypot(b.cx() - cx, b.cy() - cy)))
+        if b.roundness() <= 0.6:
+            misses[band] += 1
+            continue
+        seen = (math.degrees(math.atan2(b.cy() - cy, b.cx() - cx)) + 360) % 360
+        bearing_err.append((seen - angle + 180) % 360 - 180)
+        radius_err.append(math.hypot(b.cx() - cx, b.cy() - cy) - radius)
+        confidence.append(b.roundness() * 100)
+    return {
+        'bearing_sigma': float(np.std(bearing_err)) if bearing_err else DEFAULT_VISION['bearing_sigma'],
+        'radius_sigma': float(np.std(radius_err)) if radius_err else DEFAULT_VISION['radius_sigma'],
+        'miss_rate': tuple(float(m / t) if t else 1.0 for m, t in zip(misses, tries)),
+        'confidence': float(np.mean(confidence)) if confidence else 0.0,
+    }
+
+
+def arduino_map(x, in_min, in_max, out_min, out_max):
+    """Arduino map() with its long arithmetic"""
+    x = np.trunc(x)
+    return np.trunc((x - in_min) * (out_max - out_min) / (in_max - in_min)) + out_min
+
+
+def omni_mix(angle_deg, speed):
+    """moveOmniDirectional(): signed PWM of FL, FR, RL, RR, shape (4, n)"""
+    a = np.radians(angle_deg)
+    move_x = np.sin(a) * speed
+    move_y = np.cos(a) * speed
+    fl = np.round(move_y + move_x)
+    fr = np.round(move_y - move_x)
+    return np.clip(np.stack([fl, fr, fr, fl]), -255, 255)
+
+
+def omnirpc_policy(ctl, wheels, now_ms):
+    """One loop() of OmniRPC_Controller: updates ctl and wheels in place"""
+    # Detection timeout stops the motors once
+    timed_out = ctl['detected'] & (now_ms - ctl['last_detection_ms'] > TIMEOUT_MS)
+    ctl['detected'] &= ~timed_out
+    wheels[:, timed_out] = 0.0
+
+    active = ctl['detected'] & (ctl['confidence'] > 60)
+    robot_angle = (ctl['angle'] - 90.0) % 360.0
+    diff = np.where(robot_angle > 180.0, robot_angle - 360.0, robot_angle)
+    distance = ctl['distance']
+    straight = (np.abs(diff) < ANGLE_MARGIN) | (distance < DISTANCE_THRESHOLD)
+
+    slow = np.clip(arduino_map(distance, CLOSE_THRESHOLD, DISTANCE_THRESHOLD, SLOW_SPEED // 2, SLOW_SPEED),
+                   SLOW_SPEED // 2, SLOW_SPEED)
+    speed = np.where(distance < DISTANCE_THRESHOLD, slow, BASE_SPEED)
+    move = omni_mix(robot_angle, speed)
+    move[:, distance <= CLOSE_THRESHOLD] = 0.0
+
+    rotation = np.clip(arduino_map(np.abs(diff), 0, 180, TURN_SPEED // 2, TURN_SPEED), TURN_SPEED // 4, TURN_SPEED)
+    turn = np.where(diff > 0, 1.0, -1.0) * rotation
+    rotate = np.stack([turn, -turn, turn, -turn])
+
+    command = np.where(straight, move, rotate)
+    wheels[:, active] = command[:, active]
+    ctl['last_detection_ms'] = np.where(active, now_ms, ctl['last_detection_ms'])
+
+
+def direct_policy(ctl, wheels, now_ms):
+    """Baseline: strafe straight at the last seen ball, slowing down close to it"""
+    robot_angle = (ctl['angle'] - 90.0) % 360.0
+    speed = np.clip(ctl['distance'] * 4.0, 60.0, BASE_SPEED)
+    seen = ctl['detected'] & (now_ms - ctl['last_detection_ms'] < TIMEOUT_MS)
+    wheels[:, seen] = omni_mix(robot_angle, speed)[:, seen]
+    wheels[:, ~seen] = 0.0
+
+
+POLICIES = {'omnirpc': omnirpc_policy, 'direct': direct_policy}
+
+
+def run_batch(episodes, seconds, latency_ms, policy, vision, dt=0.005, seed=0):
+    """Simulate a batch of episodes; returns per-episode time to ball, to the first goal in the
+    opponent's (+y) goal and to the first own goal (nan if never)"""
+    rng = np.random.default_rng(seed)
+    n = episodes
+    half_x, half_y = loc.FIELD_WIDTH / 2, loc.FIELD_LENGTH / 2
+    rx = rng.uniform(-half_x, half_x, n)
+    ry = rng.uniform(-half_y, half_y, n)
+    heading = rng.uniform(-np.pi, np.pi, n)
+    bx = rng.uniform(-half_x + 10, half_x - 10, n)
+    by = rng.uniform(-half_y + 10, half_y - 10, n)
+    bvx = np.zeros(n)
+    bvy = np.zeros(n)
+    v_forward = np.zeros(n)
+    v_right = np.zeros(n)
+    omega = np.zeros(n)
+    wheels = np.zeros((4, n))
+
+    ctl = {'detected': np.zeros(n, bool), 'angle': np.zeros(n), 'distance': np.full(n, 100.0),
+           'confidence': np.zeros(n), 'last_detection_ms': np.zeros(n)}
+    policy_fn = POLICIES[policy]
+
+    # Observations in flight from the camera to the controller
+    pending = []
+    next_frame = 0.0
+    frame_period = 1.0 / CAMERA_HZ
+    miss_rate = np.array(vision['miss_rate'])
+
+    t_ball = np.full(n, np.nan)
+    t_goal = np.full(n, np.nan)
+    t_own_goal = np.full(n, np.nan)
+    steps = int(seconds / dt)
+    for step in range(steps):
+        t = step * dt
+        # Camera frame: where the ball appears and whether it is detected
+        if t >= next_frame:
+            next_frame += frame_period
+            dx, dy = bx - rx, by - ry
+            distance = np.hypot(dx, dy)
+            robot_bearing = np.degrees(np.arctan2(dy, dx) - heading)
+            angle = (loc.CAMERA_FORWARD_DEG + loc.CAMERA_BEARING_SIGN * robot_bearing
+                     + rng.normal(0.0, vision['bearing_sigma'], n)) % 360.0
+            radius = distance_to_radius(distance)
+            found = rng.random(n) >= miss_rate[radius_band(radius)]
+            seen_distance = radius_to_distance(radius + rng.normal(0.0, vision['radius_sigma'], n))
+            pending.append((t + latency_ms / 1000.0, found, angle, seen_distance))
+        # Messages that have arrived update the controller like applyVisionMessage()
+        while pending and pending[0][0] <= t:
+            _, found, angle, seen_distance = pending.pop(0)
+            ctl['detected'] = found.copy()
+            ctl['angle'] = np.where(found, angle, ctl['angle'])
+            ctl['distance'] = np.where(found, seen_distance, ctl['distance'])
+            ctl['confidence'] = np.where(found, vision['confidence'], ctl['confidence'])
+        policy_fn(ctl, wheels, t * 1000.0)
+
+        # X-drive forward kinematics (FL, FR, RL, RR) with a first-order lag
+        fl, fr, rl, rr = wheels
+        cmd_forward = (fl + fr + rl + rr) / 4 * CM_S_PER_PWM
+        cmd_right = (fl - fr - rl + rr) / 4 * CM_S_PER_PWM
+        cmd_omega = (fl - fr + rl - rr) / 4 * CM_S_PER_PWM / WHEEL_BASE_RADIUS  # Clockwise
+        k = dt / MOTOR_TAU
+        v_forward += (cmd_forward - v_forward) * k
+        v_right += (cmd_right - v_right) * k
+        omega += (cmd_omega - omega) * k
+        c, s = np.cos(heading), np.sin(heading)
+        vx = c * v_forward + s * v_right
+        vy = s * v_forward - c * v_right
+        rx = np.clip(rx + vx * dt, -WALL_X + ROBOT_RADIUS, WALL_X - ROBOT_RADIUS)
+        ry = np.clip(ry + vy * dt, -WALL_Y + ROBOT_RADIUS, WALL_Y - ROBOT_RADIUS)
+        heading = heading - omega * dt
+
+        # Ball: push on contact, friction, walls
+        dx, dy = bx - rx, by - ry
+        distance = np.hypot(dx, dy)
+        contact = distance < ROBOT_RADIUS + BALL_RADIUS
+        if contact.any():
+            nx = dx / np.maximum(distance, 1e-6)
+            ny = dy / np.maximum(distance, 1e-6)
+            approach = np.maximum(vx * nx + vy * ny - (bvx * nx + bvy * ny), 0.0)
+            push = np.where(contact, approach * (1.0 + BALL_RESTITUTION), 0.0)
+            bvx += push * nx
+            bvy += push * ny
+            # Keep the ball outside the robot
+            overlap = np.where(contact, ROBOT_RADIUS + BALL_RADIUS - distance, 0.0)
+            bx += overlap * nx
+            by += overlap * ny
+        reached = contact & np.isnan(t_ball)
+        t_ball[reached] = t
+        speed = np.hypot(bvx, bvy)
+        scale = np.maximum(speed - BALL_FRICTION * dt, 0.0) / np.maximum(speed, 1e-9)
+        bvx *= scale
+        bvy *= scale
+        bx += bvx * dt
+        by += bvy * dt
+        in_mouth = np.abs(bx) < GOAL_HALF_WIDTH
+        t_goal[in_mouth & (by > half_y) & np.isnan(t_goal)] = t
+        t_own_goal[in_mouth & (by < -half_y) & np.isnan(t_own_goal)] = t
+        # Goals reset the ball to the center like a kick-off
+        reset = in_mouth & (np.abs(by) > half_y)
+        bx[reset] = 0.0
+        by[reset] = 0.0
+        bvx[reset] = 0.0
+        bvy[reset] = 0.0
+        for pos, vel, wall in ((bx, bvx, WALL_X - BALL_RADIUS), (by, bvy, WALL_Y - BALL_RADIUS)):
+            hit = np.abs(pos) > wall
+            vel[hit] *= -WALL_RESTITUTION
+            np.clip(pos, -wall, wall, out=pos)
+    return t_ball, t_goal, t_own_goal
+
+
+def describe(times):
+    done = ~np.isnan(times)
+    if not done.any():
+        return "%5.1f%%      -      -" % 0.0
+    return "%5.1f%% %6.2f %6.2f" % (100.0 * done.mean(), np.median(times[done]), np.percentile(times[done], 90))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--episodes", type=int, default=2048)
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--latencies", default="0,50,100,200,400", help="camera to controller latency, ms")
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="omnirpc")
+    parser.add_argument("--calibration-frames", type=int, default=120,
+                        help="emulator frames for the vision noise model, 0 for the defaults")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.calibration_frames:
+        t0 = time.perf_counter()
+        vision = calibrate_vision(args.calibration_frames, args.seed)
+        print("vision model from %d emulator frames (%.1f s): bearing sigma %.2f deg, radius sigma %.2f px, "
+              "miss rate inner/mid/outer %.2f/%.2f/%.2f, confidence %.0f" % (
+                  args.calibration_frames, time.perf_counter() - t0, vision['bearing_sigma'],
+                  vision['radius_sigma'], vision['miss_rate'][0], vision['miss_rate'][1],
+                  vision['miss_rate'][2], vision['confidence']))
+    else:
+        vision = DEFAULT_VISION
+
+    print("\npolicy %s, %d episodes of %.0f s each" % (args.policy, args.episodes, args.seconds))
+    print("%10s  %-22s  %-22s  %-22s  %10s" % ("latency", "reached ball % / p50 / p90 s", "goal % / p50 / p90 s",
+                                              "own goal % / p50 / p90 s", "episodes/s"))
+    for latency in [float(v) for v in args.latencies.split(",")]:
+        t0 = time.perf_counter()
+        t_ball, t_goal, t_own_goal = run_batch(args.episodes, args.seconds, latency, args.policy, vision,
+                                               seed=args.seed)
+        elapsed = time.perf_counter() - t0
+        print("%8.0fms  %-22s  %-22s  %-22s  %10.0f" % (
+            latency, describe(t_ball), describe(t_goal), describe(t_own_goal), args.episodes / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+/*
+ * parser_harness.cpp
+ *
+ * Host test bench for vision_stream_parser.h. Build and run from the repo root:
+ *
+ *   g++ -O2 -std=c++11 -Wall -o /tmp/parser_harness host/parser_harness.cpp
+ *   /tmp/parser_harness [iterations]
+ *
+ * Checks the streaming parser against the old buffer + strstr()/atof()
+ * parser on valid mainNationals and movetogoal1 lines, fuzzes it with
+ * corrupted lines (it must not crash, must never publish a garbled line's
+ * values and must parse the next clean line correctly), and measures
+ * bytes/second and the worst-case time spent on a single byte for both
+ * parsers. Add -fsanitize=address,undefined to catch out-of-bounds writes.
+ */
+
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <random>
+#include <string>
+#include <vector>
+#include <algorithm>
+
+#include "../vision_stream_parser.h"
+
+typedef std::chrono::steady_clock Clock;
+
+static std::mt19937 rng(12345);
+
+static float uniform(float lo, float hi) {
+  return std::uniform_real_distribution<float>(lo, hi)(rng);
+}
+
+static int randint(int lo, int hi) {
+  return std::uniform_int_distribution<int>(lo, hi)(rng);
+}
+
+// ----- Expected values of a generated line -----
+
+// Fields a line sets; the others keep their previous values
+enum {
+  F_ANGLE = 1, F_DISTANCE = 2, F_CONFIDENCE = 4, F_WIDTH = 8, F_HEIGHT = 16,
+  F_X = 32, F_Y = 64, F_AGE = 128
+};
+
+struct Expected {
+  VisionTarget targets[VISION_TARGET_COUNT];
+  bool mentioned[VISION_TARGET_COUNT];
+  unsigned fields[VISION_TARGET_COUNT];
+  bool hasFrame;
+  uint32_t seq, captureMs, processingMs;
+  bool hasFree;
+  uint8_t freeSpaceCm[VISION_FREE_BEARINGS];
+  int freeSpaceCount;
+};
+
+static const char PROFILE_CHARS[] =
+    "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz";
+
+// A line as mainNationals formats it (values printed with %.1f)
+static std::string makeJsonLine(Expected &e) {
+  static const char *names[VISION_TARGET_COUNT] = {"ball", "yellow_goal", "blue_goal", "line"};
+  memset(&e, 0, sizeof(e));
+  std::string out;
+  char tmp[128];
+  if (randint(0, 3)) {
+    e.hasFrame = true;
+    e.seq = (uint32_t)randint(0, 2000000000);
+    e.captureMs = (uint32_t)randint(0, 1073741823);  // ticks_ms() wraps at 2^30
+    e.processingMs = randint(0, 200);
+    snprintf(tmp, sizeof(tmp), "\"frame\":{\"seq\":%lu,\"t\":%lu,\"proc\":%lu} ",
+             (unsigned long)e.seq, (unsigned long)e.captureMs, (unsigned long)e.processingMs);
+    out += tmp;
+  }
+  for (int i = 0; i < VISION_TARGET_COUNT; i++) {
+    VisionTarget &t = e.targets[i];
+    e.mentioned[i] = true;
+    t.found = randint(0, 3) != 0;
+    if (i) out += " ";
+    if (!t.found) {
+      snprintf(tmp, sizeof(tmp), "\"%s\":{\"found\":false}", names[i]);
+      out += tmp;
+      continue;
+    }
+    t.angle = roundf(uniform(0, 360) * 10) / 10;
+    t.distance = roundf(uniform(0, 250) * 10) / 10;
+    if (i == VISION_BALL) {
+      t.confidence = roundf(uniform(0, 100) * 10) / 10;
+      e.fields[i] = F_ANGLE | F_DISTANCE | F_CONFIDENCE;
+      snprintf(tmp, sizeof(tmp), "\"ball\":{\"found\":true,\"angle\":%.1f,\"distance\":%.1f,\"confidence\":%.1f}",
+               t.angle, t.distance, t.confidence);
+    } else if (i == VISION_LINE) {
+      e.fields[i] = F_ANGLE | F_DISTANCE;
+      snprintf(tmp, sizeof(tmp), "\"line\":{\"found\":true,\"angle\":%.1f,\"distance\":%.1f}",
+               t.angle, t.distance);
+    } else {
+      t.width = roundf(uniform(0, 180) * 10) / 10;
+      t.age = randint(0, 5);
+      e.fields[i] = F_ANGLE | F_DISTANCE | F_WIDTH | F_AGE;
+      snprintf(tmp, sizeof(tmp), "\"%s\":{\"found\":true,\"angle\":%.1f,\"distance\":%.1f,\"width\":%.1f,\"age\":%d}",
+               names[i], t.angle, t.distance, t.width, t.age);
+    }
+    out += tmp;
+  }
+  if (randint(0, 1)) {
+    e.hasFree = true;
+    e.freeSpaceCount = VISION_FREE_BEARINGS;
+    out += " \"free\":{\"cm_per_char\":2,\"profile\":\"";
+    for (int i = 0; i < VISION_FREE_BEARINGS; i++) {
+      int step = randint(-1, 61);
+      out += step < 0 ? '-' : PROFILE_CHARS[step];
+      e.freeSpaceCm[i] = step < 0 ? VISION_FREE_CLEAR : std::min(step * 2, VISION_FREE_CLEAR - 1);
+    }
+    out += "\"}";
+  }
+  return out + "\n";
+}
+
+// A line as the movetogoal1 camera script formats it
+static std::string makeCsvLine(Expected &e) {
+  memset(&e, 0, sizeof(e));
+  char tmp[128];
+  int kind = randint(0, 3);
+  if (kind == 0) {
+    VisionTarget &t = e.targets[VISION_BALL];
+    t.found = true;
+    t.x = roundf(uniform(-100, 100) * 100) / 100;
+    t.y = roundf(uniform(-100, 100) * 100) / 100;
+    t.angle = roundf(uniform(-3.14f, 3.14f) * 1000) / 1000;
+    t.confidence = randint(0, 100);
+    t.distance = sqrtf(t.x * t.x + t.y * t.y);
+    e.mentioned[VISION_BALL] = true;
+    e.fields[VISION_BALL] = F_X | F_Y | F_ANGLE | F_CONFIDENCE | F_DISTANCE;
+    snprintf(tmp, sizeof(tmp), "ball,%.2f,%.2f,%.2f,%.2f,%.3f,%d\n",
+             t.x, t.y, uniform(-5, 5), uniform(-5, 5), t.angle, (int)t.confidence);
+  } else if (kind == 1 || kind == 2) {
+    int id = kind == 1 ? VISION_BLUE_GOAL : VISION_YELLOW_GOAL;
+    VisionTarget &t = e.targets[id];
+    t.found = true;
+    t.distance = roundf(uniform(0, 250) * 100) / 100;
+    t.angle = roundf(uniform(-3.14f, 3.14f) * 1000) / 1000;
+    t.width = roundf(uniform(0, 100) * 10) / 10;
+    t.height = roundf(uniform(0, 50) * 10) / 10;
+    e.mentioned[id] = true;
+    e.fields[id] = F_DISTANCE | F_ANGLE | F_WIDTH | F_HEIGHT;
+    if (kind == 1) {
+      t.confidence = randint(0, 100);
+      e.fields[id] |= F_CONFIDENCE;
+      snprintf(tmp, sizeof(tmp), "blue,%.2f,%.3f,%.1f,%.1f,%d\n",
+               t.distance, t.angle, t.width, t.height, (int)t.confidence);
+    } else {
+      snprintf(tmp, sizeof(tmp), "yellow,%.2f,%.3f,%.1f,%.1f\n",
+               t.distance, t.angle, t.width, t.height);
+    }
+  } else {
+    e.mentioned[VISION_BALL] = true;
+    snprintf(tmp, sizeof(tmp), "no_ball\n");
+  }
+  return tmp;
+}
+
+static bool close(float a, float b) {
+  return fabsf(a - b) <= 1e-3f * std::max(1.0f, fabsf(b));
+}
+
+static bool matches(const VisionStreamParser &p, const Expected &e, std::string &why) {
+  for (int i = 0; i < VISION_TARGET_COUNT; i++) {
+    if (!e.mentioned[i]) continue;
+    const VisionTarget &a = p.targets[i];
+    const VisionTarget &b = e.targets[i];
+    char tmp[160];
+    if (!a.updated || a.found != b.found) {
+      snprintf(tmp, sizeof(tmp), "target %d updated=%d found=%d, expected found=%d", i, a.updated, a.found, b.found);
+      why = tmp;
+      return false;
+    }
+    if (!b.found) continue;
+    unsigned f = e.fields[i];
+    if (((f & F_ANGLE) && !close(a.angle, b.angle)) ||
+        ((f & F_DISTANCE) && !close(a.distance, b.distance)) ||
+        ((f & F_CONFIDENCE) && !close(a.confidence, b.confidence)) ||
+        ((f & F_WIDTH) && !close(a.width, b.width)) ||
+        ((f & F_HEIGHT) && !close(a.height, b.height)) ||
+        ((f & F_X) && !close(a.x, b.x)) || ((f & F_Y) && !close(a.y, b.y)) ||
+        ((f & F_AGE) && a.age != b.age)) {
+      snprintf(tmp, sizeof(tmp), "target %d angle %g/%g distance %g/%g", i, a.angle, b.angle, a.distance, b.distance);
+      why = tmp;
+      return false;
+    }
+  }
+  if (e.hasFrame != p.frameUpdated ||
+      (e.hasFrame && (p.frameSeq != e.seq || p.frameCaptureMs != e.captureMs ||
+                      p.frameProcessingMs != e.processingMs))) {
+    why = "frame header differs";
+    return false;
+  }
+  if (e.hasFree) {
+    if (!p.freeSpaceUpdated || p.freeSpaceCount != e.freeSpaceCount ||
+        memcmp(p.freeSpaceCm, e.freeSpaceCm, e.freeSpaceCount) != 0) {
+      why = "free-space profile differs";
+      return false;
+    }
+  }
+  return true;
+}
+
+// Feed a whole line; true if it committed
+static bool feedLine(VisionStreamParser &p, const std::string &line) {
+  bool committed = false;
+  for (size_t i = 0; i < line.size(); i++) {
+    committed = p.feed(line[i]);
+  }
+  return committed;
+}
+
+// ----- The old parser: 256 byte line buffer, strstr() and atof() per field -----
+
+struct OldParser {
+  char buffer[512];
+  int index;
+  float values[12];
+  bool found[5];
+
+  void parseTarget(const char *message, const char *name, int slot) {
+    const char *section = strstr(message, name);
+    if (section == NULL) return;
+    const char *foundStr = strstr(section, "\"found\":");
+    found[slot] = foundStr != NULL && strncmp(foundStr + 8, "true", 4) == 0;
+    if (!found[slot]) return;
+    const char *s = strstr(section, "\"angle\":");
+    if (s != NULL) values[slot * 3] = atof(s + 8);
+    s = strstr(section, "\"distance\":");
+    if (s != NULL) values[slot * 3 + 1] = atof(s + 11);
+    s = strstr(section, "\"confidence\":");
+    if (s != NULL) values[slot * 3 + 2] = atof(s + 13);
+  }
+
+  void parse(const char *message) {
+    parseTarget(message, "\"ball\":", 0);
+    parseTarget(message, "\"yellow_goal\":", 1);
+    parseTarget(message, "\"blue_goal\":", 2);
+    parseTarget(message, "\"line\":", 3);
+    const char *freeSection = strstr(message, "\"free\":");
+    if (freeSection != NULL) {
+      const char *profile = strstr(freeSection, "\"profile\":\"");
+      if (profile != NULL) found[4] = profile[11] != '"';
+    }
+  }
+
+  bool feed(char c) {
+    if (c == '\n') {
+      buffer[index] = '\0';
+      parse(buffer);
+      index = 0;
+      return true;
+    }
+    if (index < (int)sizeof(buffer) - 1) {
+      buffer[index++] = c;
+    }
+    return false;
+  }
+};
+
+// ----- Fuzzing -----
+
+static std::string mutate(const std::string &line) {
+  std::string s = line.substr(0, line.size() - 1);  // Without the newline
+  int edits = randint(1, 4);
+  for (int k = 0; k < edits && !s.empty(); k++) {
+    int pos = randint(0, s.size() - 1);
+    switch (randint(0, 5)) {
+      case 0: s[pos] = (char)randint(1, 255); break;                       // Bit noise
+      case 1: s.erase(pos, randint(1, 20)); break;                          // Dropped bytes
+      case 2: s.insert(pos, std::string(randint(1, 8), (char)randint(32, 126))); break;
+      case 3: s = s.substr(0, pos); break;                                  // Truncated line
+      case 4: s.insert(pos, std::string(randint(300, 700), 'x')); break;    // Runaway line
+      case 5: s.insert(pos, "\"ball\":{\"found\":true,\"angle\":"); break;  // Spliced section
+    }
+  }
+  s.erase(std::remove(s.begin(), s.end(), '\n'), s.end());
+  return s + "\n";
+}
+
+static int fuzz(int iterations) {
+  VisionStreamParser p;
+  p.begin();
+  int failures = 0;
+  int committedGarbage = 0;
+  for (int i = 0; i < iterations; i++) {
+    Expected e;
+    std::string clean = randint(0, 1) ? makeJsonLine(e) : makeCsvLine(e);
+    std::string bad = mutate(clean);
+
+    // A corrupted line may still be well-formed by chance; if it commits it
+    // must at least stay inside the bounds of the published arrays
+    VisionStreamParser before = p;
+    if (feedLine(p, bad)) {
+      committedGarbage++;
+      if (p.freeSpaceCount < 0 || p.freeSpaceCount > VISION_FREE_BEARINGS) {
+        printf("FAIL: free-space count %d after \"%s\"\n", p.freeSpaceCount, bad.c_str());
+        failures++;
+      }
+    } else if (memcmp(before.targets, p.targets, sizeof(p.targets)) != 0) {
+      printf("FAIL: rejected line changed the targets: \"%s\"\n", bad.c_str());
+      failures++;
+    }
+
+    // The next clean line has to come through intact
+    std::string line = randint(0, 1) ? makeJsonLine(e) : makeCsvLine(e);
+    std::string why;
+    if (!feedLine(p, line) || !matches(p, e, why)) {
+      if (failures < 10) {
+        printf("FAIL: no recovery after \"%s\"\n      clean \"%s\" %s\n",
+               bad.c_str(), line.c_str(), why.c_str());
+      }
+      failures++;
+    }
+  }
+  printf("fuzz: %d corrupted lines, %d still well-formed and committed, %d failures\n",
+         iterations, committedGarbage, failures);
+  return failures;
+}
+
+static int checkValid(int iterations) {
+  VisionStreamParser p;
+  p.begin();
+  OldParser old;
+  memset(&old, 0, sizeof(old));
+  int failures = 0;
+  for (int i = 0; i < iterations; i++) {
+    Expected e;
+    bool json = i % 2 == 0;
+    std::string line = json ? makeJsonLine(e) : makeCsvLine(e);
+    std::string why;
+    if (!feedLine(p, line) || !matches(p, e, why)) {
+      if (failures < 10) printf("FAIL: \"%s\" %s\n", line.c_str(), why.c_str());
+      failures++;
+      continue;
+    }
+    if (json) {
+      // Same answers as the parser it replaces
+      for (size_t k = 0; k < line.size(); k++) old.feed(line[k]);
+      for (int t = 0; t < VISION_TARGET_COUNT; t++) {
+        if (old.found[t] != p.targets[t].found ||
+            (old.found[t] && (!close(old.values[t * 3], p.targets[t].angle) ||
+                              !close(old.values[t * 3 + 1], p.targets[t].distance)))) {
+          if (failures < 10) printf("FAIL: differs from the strstr parser on \"%s\"\n", line.c_str());
+          failures++;
+          break;
+        }
+      }
+    }
+  }
+  printf("valid lines: %d checked, %d failures\n", iterations, failures);
+  return failures;
+}
+
+// ----- Throughput and per-byte latency -----
+
+template <typename Parser>
+static void measure(const char *name, Parser &parser, const std::string &stream) {
+  // Bulk throughput
+  Clock::time_point t0 = Clock::now();
+  int lines = 0;
+  for (int rep = 0; rep < 20; rep++) {
+    for (size_t i = 0; i < stream.size(); i++) {
+      lines += parser.feed(stream[i]);
+    }
+  }
+  double seconds = std::chrono::duration<double>(Clock::now() - t0).count();
+  double bytesPerSecond = 20.0 * stream.size() / seconds;
+
+  // Per byte, minus the cost of reading the clock. Each byte keeps its best
+  // of several passes so preemption by the OS doesn't show up as the maximum.
+  // The clock overhead is the cheapest of many empty timings, and a byte that
+  // still comes out below it (clock granularity) counts as 0 ns, not negative.
+  std::vector<double> ns(stream.size(), 1e12);
+  Clock::time_point a;
+  Clock::time_point b;
+  double overhead = 1e12;
+  for (int i = 0; i < 10000; i++) {
+    a = Clock::now();
+    b = Clock::now();
+    overhead = std::min(overhead, std::chrono::duration<double, std::nano>(b - a).count());
+  }
+  for (int pass = 0; pass < 5; pass++) {
+    for (size_t i = 0; i < stream.size(); i++) {
+      a = Clock::now();
+      lines += parser.feed(stream[i]);
+      b = Clock::now();
+      double t = std::chrono::duration<double, std::nano>(b - a).count() - overhead;
+      ns[i] = std::min(ns[i], std::max(0.0, t));
+    }
+  }
+  std::vector<double> sorted = ns;
+  std::sort(sorted.begin(), sorted.end());
+  double p999 = sorted[(size_t)(0.999 * (sorted.size() - 1))];
+  printf("%-10s %8.1f MB/s  per byte: p99.9 %6.0f ns  max %7.0f ns  (%d lines)\n",
+         name, bytesPerSecond / 1e6, p999, sorted.back(), lines);
+}
+
+int main(int argc, char **argv) {
+  int iterations = argc > 1 ? atoi(argv[1]) : 20000;
+  int failures = 0;
+  failures += checkValid(iterations);
+  failures += fuzz(iterations);
+
+  std::string stream;
+  while (stream.size() < 1000000) {
+    Expected e;
+    stream += makeJsonLine(e);
+  }
+  VisionStreamParser p;
+  p.begin();
+  OldParser old;
+  memset(&old, 0, sizeof(old));
+  printf("\nthroughput on %zu bytes of mainNationals lines (a 115200 baud link is 0.0115 MB/s):\n",
+         stream.size());
+  measure("streaming", p, stream);
+  measure("strstr", old, stream);
+  return failures ? 1 : 0;
+}
@@ -0,0 +1,199 @@
+/*
+ * replay_controller.cpp
+ *
+ * Replays a UART recording (host/uart_capture.py) into OmniRPC_Controller
+ * built for the PC. Build and run from the repo root:
+ *
+ *   g++ -O2 -std=c++11 -o /tmp/replay_controller host/replay_controller.cpp
+ *   /tmp/replay_controller match.uart [--speed 0] [--loop-us 200] [--serial-time 0]
+ *                          [--start s] [--end s] [--motors motors.csv] [--serial serial.log]
+ *
+ * The sketch runs against the Arduino stand-in in host/arduino: every loop()
+ * call advances a virtual clock by --loop-us, and the recorded bytes are
+ * pushed into Serial1 once the clock reaches their receive time, so a replay
+ * is deterministic and independent of how fast the PC is. --speed 1 paces
+ * the virtual clock to real time, 10 runs ten times faster, 0 (default) runs
+ * as fast as possible. Motor outputs are written to --motors whenever they
+ * change (signed PWM per wheel, direction pin applied), the sketch's own
+ * Serial output to --serial, and the host time of each loop() call is
+ * reported to profile the controller logic. --serial-time 1 makes the
+ * sketch's Serial output cost its transmit time on the virtual clock, so
+ * the task scheduler statistics printed at the end show what debug printing
+ * does to the other tasks' deadlines.
+ */
+
+#include <algorithm>
+#include <chrono>
+#include <thread>
+#include <vector>
+
+#include "arduino/Arduino.h"
+#include "../OmniRPC_Controller.ino"
+
+typedef std::chrono::steady_clock Clock;
+
+struct Chunk {
+  uint64_t timeUs;
+  std::vector<uint8_t> data;
+};
+
+static uint32_t readU32(const uint8_t *p) { return p[0] | (p[1] << 8) | (p[2] << 16) | ((uint32_t)p[3] << 24); }
+static uint64_t readU64(const uint8_t *p) { return readU32(p) | ((uint64_t)readU32(p + 4) << 32); }
+
+// Chunks of a recording between startUs and endUs, same rules as UartRecording.chunks()
+static bool loadRecording(const char *path, uint64_t startUs, uint64_t endUs,
+                          std::vector<Chunk> &chunks, uint32_t &baud) {
+  FILE *f = fopen(path, "rb");
+  if (f == NULL) {
+    perror(path);
+    return false;
+  }
+  std::vector<uint8_t> data;
+  uint8_t buf[65536];
+  size_t n;
+  while ((n = fread(buf, 1, sizeof(buf), f)) > 0) data.insert(data.end(), buf, buf + n);
+  fclose(f);
+
+  const size_t header = 20, footer = 20;
+  if (data.size() < header || memcmp(data.data(), "UARTREC1", 8) != 0) {
+    fprintf(stderr, "%s is not a UART recording\n", path);
+    return false;
+  }
+  baud = readU32(&data[8]);
+  size_t end = data.size();
+  if (data.size() >= header + footer && memcmp(&data[data.size() - 4], "UIDX", 4) == 0) {
+    uint64_t indexOffset = readU64(&data[data.size() - footer]);
+    uint64_t count = readU64(&data[data.size() - footer + 8]);
+    if (indexOffset + count * 16 + footer == data.size()) end = indexOffset;
+  }
+
+  uint64_t now = 0;
+  size_t offset = header;
+  while (offset + 6 <= end) {
+    now += readU32(&data[offset]);
+    size_t length = data[offset + 4] | (data[offset + 5] << 8);
+    offset += 6;
+    if (offset + length > end || now > endUs) break;
+    if (length && now >= startUs) {
+      Chunk c;
+      c.timeUs = now;
+      c.data.assign(data.begin() + offset, data.begin() + offset + length);
+      chunks.push_back(c);
+    }
+    offset += length;
+  }
+  return true;
+}
+
+// Signed PWM of each wheel as the driver sees it
+static void wheelOutputs(int out[4]) {
+  HostPins &pins = hostPins();
+  for (int i = 0; i < 4; i++) {
+    int pwm = pins.analog[motorSpeedPins[i]];
+    out[i] = pins.digital[motorDirectionPins[i]] == HIGH ? pwm : -pwm;
+  }
+}
+
+int main(int argc, char **argv) {
+  if (argc < 2) {
+    fprintf(stderr, "usage: %s recording.uart [--speed x] [--loop-us n] [--serial-time 0|1] "
+                    "[--start s] [--end s] [--motors file] [--serial file]\n", argv[0]);
+    return 2;
+  }
+  const char *path = argv[1];
+  double speed = 0.0;
+  uint64_t loopUs = 200;
+  bool serialTime = false;
+  uint64_t startUs = 0, endUs = UINT64_MAX;
+  const char *motorsPath = NULL, *serialPath = NULL;
+  for (int i = 2; i + 1 < argc; i += 2) {
+    std::string opt = argv[i];
+    const char *value = argv[i + 1];
+    if (opt == "--speed") speed = atof(value);
+    else if (opt == "--loop-us") loopUs = atol(value) > 0 ? atol(value) : 1;
+    else if (opt == "--start") startUs = (uint64_t)(atof(value) * 1e6);
+    else if (opt == "--end") endUs = (uint64_t)(atof(value) * 1e6);
+    else if (opt == "--motors") motorsPath = value;
+    else if (opt == "--serial") serialPath = value;
+    else if (opt == "--serial-time") serialTime = atoi(value) != 0;
+    else {
+      fprintf(stderr, "unknown option %s\n", argv[i]);
+      return 2;
+    }
+  }
+
+  std::vector<Chunk> chunks;
+  uint32_t baud = 0;
+  if (!loadRecording(path, startUs, endUs, chunks, baud)) return 1;
+  if (chunks.empty()) {
+    fprintf(stderr, "no data in the selected part of %s\n", path);
+    return 1;
+  }
+
+  FILE *motors = motorsPath ? fopen(motorsPath, "w") : NULL;
+  if (motors) fprintf(motors, "time_s,m0,m1,m2,m3\n");
+  Serial.output = serialPath ? fopen(serialPath, "w") : NULL;
+
+  hostMicros() = chunks.front().timeUs;
+  setup();
+  Serial.chargeTime = serialTime;
+  scheduler.resetStats();
+
+  int lastWheels[4] = {0, 0, 0, 0};
+  unsigned long wheelChanges = 0;
+  std::vector<double> loopNs;
+  size_t bytes = 0;
+  size_t next = 0;
+  uint64_t stopUs = chunks.back().timeUs + 500000;  // Let the timeouts play out
+  Clock::time_point wallStart = Clock::now();
+  uint64_t virtualStart = hostMicros();
+
+  while (hostMicros() < stopUs) {
+    while (next < chunks.size() && chunks[next].timeUs <= hostMicros()) {
+      Serial1.push(chunks[next].data.data(), chunks[next].data.size());
+      bytes += chunks[next].data.size();
+      next++;
+    }
+
+    Clock::time_point t0 = Clock::now();
+    loop();
+    loopNs.push_back(std::chrono::duration<double, std::nano>(Clock::now() - t0).count());
+
+    int wheels[4];
+    wheelOutputs(wheels);
+    if (memcmp(wheels, lastWheels, sizeof(wheels)) != 0) {
+      memcpy(lastWheels, wheels, sizeof(wheels));
+      wheelChanges++;
+      if (motors) {
+        fprintf(motors, "%.6f,%d,%d,%d,%d\n", hostMicros() / 1e6, wheels[0], wheels[1], wheels[2], wheels[3]);
+      }
+    }
+
+    hostMicros() += loopUs;
+    if (speed > 0) {
+      Clock::time_point due = wallStart + std::chrono::microseconds(
+          (long long)((hostMicros() - virtualStart) / speed));
+      std::this_thread::sleep_until(due);
+    }
+  }
+
+  double wall = std::chrono::duration<double>(Clock::now() - wallStart).count();
+  std::sort(loopNs.begin(), loopNs.end());
+  double sum = 0;
+  for (size_t i = 0; i < loopNs.size(); i++) sum += loopNs[i];
+  double seconds = (hostMicros() - virtualStart) / 1e6;
+  printf("replayed %.1f s of %s (%u baud): %zu bytes in %zu chunks, %.2f s wall (%.0fx real time)\n",
+         seconds, path, baud, bytes, chunks.size(), wall, seconds / wall);
+  printf("parser: %lu lines, %lu rejected   motor output changes: %lu\n",
+         visionParser.lines, visionParser.errors, wheelChanges);
+  printf("loop(): %zu calls  mean %.0f ns  p99 %.0f ns  max %.0f ns (host)\n",
+         loopNs.size(), sum / loopNs.size(), loopNs[(size_t)(0.99 * (loopNs.size() - 1))], loopNs.back());
+  printf("scheduler (virtual time%s):\n", serialTime ? ", Serial output charged at its baud rate" : "");
+  HardwareSerial report;
+  report.output = stdout;
+  scheduler.printStats(report);
+
+  if (motors) fclose(motors);
+  if (Serial.output) fclose(Serial.output);
+  return 0;
+}
@@ -0,0 +1,500 @@
+"""Parameter sweep of the ball and goal detection over a labelled corpus.
+
+Usage:
+    python -m host.sweep [--space space.json] [--mode grid|random|refine] [--trials 64]
+                         [--corpus corpus.npz | --frames 200] [--workers N]
+                         [--out sweep_results.jsonl] [--cache .sweep_cache] [--top 15]
+
+Runs the mainNationals detection (find_blobs per target, mirror filter, ball
+pick by pixels and distance with the roundness check, goal pick with the
+find_best_goal_blob scores from the direct-camera scripts) with each
+configuration and scores it against the corpus labels. Configurations are
+spread over a process pool and ranked by accuracy and a cost together:
+non-dominated configurations first, then by accuracy. The default cost is
+the find_blobs candidates scored per frame, which tracks the per-blob work
+and, unlike the measured milliseconds, doesn't change between runs; pixel
+reads are the same for every configuration since find_blobs reads the whole
+frame.
+
+The space file maps parameter names (see DEFAULTS) to a list of values or to
+{"uniform": [lo, hi]}, {"int": [lo, hi]} or {"log": [lo, hi]}. Threshold
+parameters take a list of threshold sets. "grid" runs every combination of
+the listed values, "random" draws --trials configurations and "refine" draws
+a quarter of them at random and the rest around the best results so far.
+
+Every result is appended to --out as soon as it is done and configurations
+already in that file are skipped, so an interrupted sweep picks up where it
+stopped. The find_blobs candidates of each frame are cached in --cache keyed
+by the parameters that affect them, so sweeping only weights, tracking or
+pick settings reuses the searches of earlier configurations.
+
+A corpus is an .npz with "frames" (N, H, W, 3) and "ball", "yellow", "blue"
+bearings per frame (NaN when the target is not in view), optionally with the
+"exposure_us" it was recorded at. Exposure is emulated by scaling the frame
+brightness relative to that. A host/corpus.py .corpus file works too: its
+labels are used, or the camera's detections if nothing is labelled.
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import pickle
+import time
+
+import numpy as np
+
+from host import emulator
+from host.bench_goal_histogram import YELLOW_THRESHOLDS, BLUE_THRESHOLDS
+from host.bench_windowing import ORANGE_THRESHOLDS
+
+# mainNationalsBallAndGoal settings and the find_best_goal_blob weights
+DEFAULTS = {
+    'exposure_us': 10000,
+    'orange_thresholds': ORANGE_THRESHOLDS,
+    'yellow_thresholds': YELLOW_THRESHOLDS,
+    'blue_thresholds': BLUE_THRESHOLDS,
+    'ball_pixels': 10,
+    'ball_area': 10,
+    'goal_pixels': 30,
+    'goal_area': 50,
+    'tracking_threshold': 30,
+    'ball_roundness': 0.6,
+    'rect_weight': 0.2,
+    'size_weight': 0.6,
+    'density_weight': 0.1,
+    'position_weight': 0.1,
+    'continuity_bonus': 0.2,
+}
+
+# find_blobs stages and the parameters each one depends on
+STAGES = {
+    'ball': ('exposure_us', 'orange_thresholds', 'ball_pixels', 'ball_area'),
+    'yellow': ('exposure_us', 'yellow_thresholds', 'goal_pixels', 'goal_area'),
+    'blue': ('exposure_us', 'blue_thresholds', 'goal_pixels', 'goal_area'),
+}
+STAGE_THRESHOLDS = {'ball': 'orange_thresholds', 'yellow': 'yellow_thresholds', 'blue': 'blue_thresholds'}
+STAGE_LIMITS = {'ball': ('ball_pixels', 'ball_area'), 'yellow': ('goal_pixels', 'goal_area'),
+                'blue': ('goal_pixels', 'goal_area')}
+TARGETS = ('ball', 'yellow', 'blue')
+
+# Search space used without --space
+DEFAULT_SPACE = {
+    'exposure_us': [7000, 10000, 14000],
+    'ball_pixels': [10, 25, 50],
+    'goal_pixels': [30, 100, 250],
+    'tracking_threshold': [15, 30, 60],
+    'size_weight': {'uniform': [0.2, 0.8]},
+    'rect_weight': {'uniform': [0.0, 0.4]},
+    'position_weight': {'uniform': [0.0, 0.4]},
+}
+
+# Candidate columns kept from each blob
+CX, CY, PIXELS, W, H, AREA, DENSITY, ROUNDNESS = range(8)
+
+_corpus = None
+
+
+def synthetic_corpus(count=200, seed=0):
+    """A labelled sequence: drifting heading and ball, occlusions, distractors and lighting changes.
+
+    The far ball, the goal-coloured patches and the orange specks overlap in
+    size, so the blob size limits trade misses against false detections.
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    labels = {name: np.full(count, np.nan) for name in TARGETS}
+    heading = rng.uniform(0, 360)
+    ball_angle = rng.uniform(0, 360)
+    ball_radius = 70.0
+    ball_seen = True
+    for i in range(count):
+        heading = (heading + rng.normal(0, 4)) % 360
+        ball_angle = (ball_angle + rng.normal(0, 6)) % 360
+        ball_radius = float(np.clip(ball_radius + rng.normal(0, 8), 40, 106))
+        if rng.random() < 0.05:
+            ball_seen = not ball_seen
+        # Goals are sometimes out of view or mostly hidden behind a robot
+        yellow = blue = None
+        if rng.random() > 0.1:
+            yellow = (heading, rng.uniform(25, 50), 18) if rng.random() > 0.2 else (heading, rng.uniform(5, 9), 8)
+        if rng.random() > 0.1:
+            blue = (((heading + 180) % 360, rng.uniform(25, 50), 18) if rng.random() > 0.2 else
+                    ((heading + 180) % 360, rng.uniform(5, 9), 8))
+        ball = (ball_angle, ball_radius, 7.5 - ball_radius / 20) if ball_seen else None
+        robots = [(rng.uniform(0, 360), rng.uniform(45, 95), rng.uniform(6, 12))
+                  for _ in range(rng.integers(0, 3))]
+        frame = emulator.synthetic_mirror_frame(ball=ball, yellow=yellow, blue=blue, robots=robots,
+                                                seed=seed + i).astype(np.float32)
+        # Small yellow, blue and red patches (screw terminals, cables, robot bumpers)
+        # of 32 to 200 pixels, and orange specks about the size of the far ball
+        for rgb, chance, size in ((emulator.YELLOW_RGB, 0.3, rng.integers(2, 6)),
+                                  (emulator.BLUE_RGB, 0.2, rng.integers(2, 6)), ((200, 60, 40), 0.2, 5)):
+            if rng.random() < chance:
+                a = math.radians(rng.uniform(0, 360))
+                r = rng.uniform(40, 90)
+                x = int(emulator.MIRROR_CENTER_X + r * math.cos(a))
+                y = int(emulator.MIRROR_CENTER_Y + r * math.sin(a))
+                frame[y - size:y + size, x - 2 * size:x + 2 * size] = rgb
+        if rng.random() < 0.3:
+            a = math.radians(rng.uniform(0, 360))
+            r = rng.uniform(40, 100)
+            x = emulator.MIRROR_CENTER_X + r * math.cos(a)
+            y = emulator.MIRROR_CENTER_Y + r * math.sin(a)
+            size = rng.uniform(1.2, 2.4)
+            yy, xx = np.ogrid[:frame.shape[0], :frame.shape[1]]
+            frame[(xx - x) ** 2 + (yy - y) ** 2 <= size * size] = emulator.ORANGE_RGB
+        frame *= rng.uniform(0.7, 1.2)
+        frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+        for name, target in (('ball', ball), ('yellow', yellow), ('blue', blue)):
+            if target is not None:
+                labels[name][i] = target[0]
+    return {'frames': frames, 'labels': labels, 'exposure_us': 10000.0,
+            'id': 'synthetic-%d-%d' % (count, seed)}
+
+
+def load_corpus(path):
+    """A recorded corpus from an .npz (see the module docstring)"""
+    with open(path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:16]
+    if path.endswith('.corpus'):
+        from host.corpus import Corpus
+        c = Corpus(path)
+        labels = c.labels('label')
+        if all(np.isnan(v).all() for v in labels.values()):
+            labels = c.labels('detection')
+        exposure = c.index['exposure_us']
+        exposure = exposure[~np.isnan(exposure)]
+        frames = [c.rgb(i) for i in range(len(c))]
+        return {'frames': frames, 'labels': labels, 'id': digest,
+                'exposure_us': float(np.median(exposure)) if len(exposure) else DEFAULTS['exposure_us']}
+    data = np.load(path)
+    frames = data['frames']
+    if frames.ndim != 4 or frames.shape[-1] != 3:
+        raise ValueError("expected an (N, H, W, 3) frame stack, got %r" % (frames.shape,))
+    labels = {}
+    for name in TARGETS:
+        if name not in data:
+            raise ValueError("%s has no %r bearings" % (path, name))
+        labels[name] = data[name].astype(np.float64)
+    exposure = float(data['exposure_us']) if 'exposure_us' in data else DEFAULTS['exposure_us']
+    return {'frames': list(frames), 'labels': labels, 'exposure_us': exposure, 'id': digest}
+
+
+def param_key(params, names=None):
+    """Stable hash of (a subset of) a configuration"""
+    names = sorted(params) if names is None else names
+    text = json.dumps([[n, params[n]] for n in names], sort_keys=True)
+    return hashlib.sha1(text.encode('ascii')).hexdigest()[:16]
+
+
+def search_blobs(stage, params, cache_dir):
+    """Per-frame candidate arrays plus pixel reads and seconds of one find_blobs stage, cached"""
+    path = None
+    if cache_dir:
+        path = os.path.join(cache_dir, _corpus['id'], '%s-%s.pkl' % (stage, param_key(params, STAGES[stage])))
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+
+    cx, cy = emulator.MIRROR_CENTER_X, emulator.MIRROR_CENTER_Y
+    gain = params['exposure_us'] / _corpus['exposure_us']
+    pixels_min, area_min = (params[n] for n in STAGE_LIMITS[stage])
+    result = []
+    for frame in _corpus['frames']:
+        if gain != 1.0:
+            frame = np.clip(frame * np.float32(gain), 0, 255).astype(np.uint8)
+        img = emulator.Image(frame)
+        t0 = time.perf_counter()
+        blobs = img.find_blobs(params[STAGE_THRESHOLDS[stage]], pixels_threshold=pixels_min,
+                               area_threshold=area_min, merge=True, margin=10)
+        blobs = [b for b in blobs if emulator.MIRROR_INNER_RADIUS <= math.hypot(b.cx() - cx, b.cy() - cy)
+                 <= emulator.MIRROR_OUTER_RADIUS]
+        seconds = time.perf_counter() - t0
+        candidates = np.array([(b.cx(), b.cy(), b.pixels(), b.w(), b.h(), b.area(), b.density(), b.roundness())
+                               for b in blobs], dtype=np.float32).reshape(-1, 8)
+        result.append((candidates, img.pixel_reads, seconds))
+
+    if path:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Several workers may finish the same stage; the rename keeps the file whole
+        tmp = '%s.%d' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            pickle.dump(result, f)
+        os.replace(tmp, path)
+    return result
+
+
+def pick_ball(c, last, params):
+    """mainNationals ball pick with a continuity bonus for the blob tracked from the last frame"""
+    dist = np.hypot(c[:, CX] - emulator.MIRROR_CENTER_X, c[:, CY] - emulator.MIRROR_CENTER_Y)
+    score = c[:, PIXELS] * (1.2 - 0.004 * dist)
+    if last is not None:
+        near = np.hypot(c[:, CX] - last[0], c[:, CY] - last[1]) < params['tracking_threshold']
+        score = score * (1.0 + params['continuity_bonus'] * near)
+    best = int(np.argmax(score))
+    if c[best, ROUNDNESS] <= params['ball_roundness']:
+        return None
+    return best
+
+
+def pick_goal(c, last, params):
+    """find_best_goal_blob scoring; position rewards blobs towards the outer mirror edge"""
+    dist = np.hypot(c[:, CX] - emulator.MIRROR_CENTER_X, c[:, CY] - emulator.MIRROR_CENTER_Y)
+    aspect = np.maximum(c[:, W], c[:, H]) / np.maximum(1.0, np.minimum(c[:, W], c[:, H]))
+    rect = np.where(aspect <= 6.0, 1.0 - np.minimum(1.0, np.abs(aspect - 2.0) / 2.0), 0.0)
+    size = np.minimum(1.0, c[:, AREA] / 3000.0)
+    density = np.where(c[:, DENSITY] <= 1.0, c[:, DENSITY], 0.0)
+    position = np.clip((dist - emulator.MIRROR_INNER_RADIUS) /
+                       (emulator.MIRROR_OUTER_RADIUS - emulator.MIRROR_INNER_RADIUS), 0.0, 1.0)
+    score = (rect * params['rect_weight'] + size * params['size_weight'] +
+             density * params['density_weight'] + position * params['position_weight'])
+    if last is not None:
+        near = np.hypot(c[:, CX] - last[0], c[:, CY] - last[1]) < params['tracking_threshold']
+        score = score + params['continuity_bonus'] * near
+    best = int(np.argmax(score))
+    return best if score[best] > 0 else None
+
+
+def evaluate(job):
+    """Run one configuration over the corpus; returns its result record"""
+    params, cache_dir, tolerance = job
+    record = {'key': param_key(params), 'params': params}
+    reads = 0
+    scored = 0
+    seconds = 0.0
+    metrics = {}
+    correct = 0
+    for target in TARGETS:
+        stage = search_blobs(target, params, cache_dir)
+        pick = pick_ball if target == 'ball' else pick_goal
+        truth = _corpus['labels'][target]
+        last = None
+        found = np.zeros(len(stage), dtype=bool)
+        error = np.full(len(stage), np.nan)
+        for i, (candidates, frame_reads, frame_seconds) in enumerate(stage):
+            t0 = time.perf_counter()
+            best = pick(candidates, last, params) if len(candidates) else None
+            seconds += frame_seconds + time.perf_counter() - t0
+            reads += frame_reads
+            scored += len(candidates)
+            if best is None:
+                last = None
+                continue
+            x, y = candidates[best, CX], candidates[best, CY]
+            last = (x, y)
+            found[i] = True
+            bearing = math.degrees(math.atan2(y - emulator.MIRROR_CENTER_Y, x - emulator.MIRROR_CENTER_X)) % 360
+            error[i] = abs((bearing - truth[i] + 180) % 360 - 180)
+        present = ~np.isnan(truth)
+        hit = found & present & (error <= tolerance)
+        ok = hit | (~found & ~present)
+        correct += int(ok.sum())
+        metrics[target] = {
+            'recall': float(hit.sum() / max(1, present.sum())),
+            'false': int((found & ~present).sum() + (found & present & (error > tolerance)).sum()),
+            'error_deg': float(np.nanmean(error[hit])) if hit.any() else None,
+        }
+    frames = len(_corpus['frames'])
+    record['metrics'] = metrics
+    record['accuracy'] = correct / float(len(TARGETS) * frames)
+    record['reads_per_frame'] = reads / float(frames)
+    record['candidates_per_frame'] = scored / float(frames)
+    record['ms_per_frame'] = 1000.0 * seconds / frames
+    return record
+
+
+def _init_worker(corpus_args):
+    global _corpus
+    _corpus = load_corpus(corpus_args[0]) if corpus_args[0] else synthetic_corpus(*corpus_args[1:])
+
+
+def sample_value(spec, rng):
+    if isinstance(spec, dict):
+        kind, (lo, hi) = next(iter(spec.items()))
+        if kind == 'int':
+            return int(rng.integers(lo, hi + 1))
+        if kind == 'log':
+            return float(math.exp(rng.uniform(math.log(lo), math.log(hi))))
+        return float(rng.uniform(lo, hi))
+    return spec[int(rng.integers(len(spec)))]
+
+
+def perturb_value(spec, value, rng, scale):
+    """A value near one of the best configurations"""
+    if isinstance(spec, dict):
+        kind, (lo, hi) = next(iter(spec.items()))
+        if kind == 'log':
+            value = math.exp(math.log(value) + rng.normal(0, scale * (math.log(hi) - math.log(lo))))
+        else:
+            value = value + rng.normal(0, scale * (hi - lo))
+        value = min(hi, max(lo, value))
+        return int(round(value)) if kind == 'int' else float(value)
+    # Listed values: mostly keep, sometimes step to a neighbour
+    if rng.random() < 0.7 or value not in spec:
+        return value
+    i = spec.index(value) + (1 if rng.random() < 0.5 else -1)
+    return spec[min(len(spec) - 1, max(0, i))]
+
+
+def configurations(space, mode, trials, seed):
+    """Configurations for grid and random mode, in a fixed order so reruns see the same keys"""
+    names = sorted(space)
+    if mode == 'grid':
+        for spec in space.values():
+            if isinstance(spec, dict):
+                raise ValueError("grid mode needs value lists, not %r" % (spec,))
+        for values in itertools.product(*(space[n] for n in names)):
+            params = dict(DEFAULTS)
+            params.update(zip(names, values))
+            yield params
+        return
+    rng = np.random.default_rng(seed)
+    for _ in range(trials):
+        params = dict(DEFAULTS)
+        params.update((n, sample_value(space[n], rng)) for n in names)
+        yield params
+
+
+def refine_batch(space, done, count, rng, scale):
+    """New configurations around the best quarter of the results so far"""
+    ranked = sorted(done.values(), key=lambda r: r['accuracy'], reverse=True)
+    elite = ranked[:max(1, len(ranked) // 4)]
+    batch = []
+    for _ in range(count):
+        base = elite[int(rng.integers(len(elite)))]['params']
+        params = dict(base)
+        for name, spec in space.items():
+            params[name] = perturb_value(spec, base[name], rng, scale)
+        batch.append(params)
+    return batch
+
+
+def pareto_ranks(records, cost):
+    """Non-dominated sorting on (accuracy high, cost low); 0 is the front"""
+    ranks = [None] * len(records)
+    remaining = set(range(len(records)))
+    level = 0
+    while remaining:
+        front = [i for i in remaining if not any(
+            records[j]['accuracy'] >= records[i]['accuracy'] and records[j][cost] <= records[i][cost] and
+            (records[j]['accuracy'] > records[i]['accuracy'] or records[j][cost] < records[i][cost])
+            for j in remaining)]
+        for i in front:
+            ranks[i] = level
+        remaining -= set(front)
+        level += 1
+    return ranks
+
+
+def load_results(path):
+    done = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # A line cut short by an interrupted run
+                done[record['key']] = record
+    return done
+
+
+def normalize(params):
+    """Tuples become lists so a configuration compares equal to its JSON round trip"""
+    return json.loads(json.dumps(params))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--space", help="JSON search space (default: a small built-in space)")
+    parser.add_argument("--mode", choices=("grid", "random", "refine"), default="random")
+    parser.add_argument("--trials", type=int, default=64, help="configurations for random/refine")
+    parser.add_argument("--corpus", help=".npz corpus with frames and bearings")
+    parser.add_argument("--frames", type=int, default=200, help="synthetic frames without --corpus")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--out", default="sweep_results.jsonl")
+    parser.add_argument("--cache", default=".sweep_cache", help="find_blobs cache directory ('' to disable)")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="bearing error (deg) counted as correct")
+    parser.add_argument("--cost", choices=("candidates_per_frame", "ms_per_frame", "reads_per_frame"),
+                        default="candidates_per_frame")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    space = DEFAULT_SPACE
+    if args.space:
+        with open(args.space) as f:
+            space = json.load(f)
+    unknown = set(space) - set(DEFAULTS)
+    if unknown:
+        raise SystemExit("unknown parameters: %s" % ", ".join(sorted(unknown)))
+
+    corpus_args = (args.corpus, args.frames, args.seed)
+    _init_worker(corpus_args)
+    done = load_results(args.out)
+    # Results of a different corpus in the same file are not comparable
+    done = {k: r for k, r in done.items() if r.get('corpus') == _corpus['id']}
+    print("corpus %s: %d frames, %d configurations already done" % (_corpus['id'], len(_corpus['frames']), len(done)))
+
+    t0 = time.perf_counter()
+    ran = 0
+    rng = np.random.default_rng(args.seed + 1)
+    with multiprocessing.Pool(args.workers, _init_worker, (corpus_args,)) as pool, open(args.out, "a") as out:
+        def run(batch):
+            jobs = []
+            for params in batch:
+                params = normalize(params)
+                if param_key(params) not in done:
+                    done[param_key(params)] = None
+                    jobs.append((params, args.cache, args.tolerance))
+            for record in pool.imap_unordered(evaluate, jobs):
+                record['corpus'] = _corpus['id']
+                done[record['key']] = record
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+            return len(jobs)
+
+        if args.mode == "refine":
+            # A random start, then rounds around the best, narrowing as they go
+            start = max(args.workers, args.trials // 4)
+            ran += run(list(configurations(space, "random", start, args.seed)))
+            scale = 0.15
+            while len(done) < args.trials:
+                batch = refine_batch(space, {k: r for k, r in done.items() if r},
+                                     min(args.workers, args.trials - len(done)), rng, scale)
+                count = run(batch)
+                ran += count
+                if count == 0:
+                    scale *= 1.5  # Everything nearby was tried already
+                else:
+                    scale = max(0.02, scale * 0.9)
+        else:
+            ran += run(configurations(space, args.mode, args.trials, args.seed))
+
+    records = [r for r in done.values() if r]
+    print("ran %d configurations in %.1f s" % (ran, time.perf_counter() - t0))
+    ranks = pareto_ranks(records, args.cost)
+    order = sorted(range(len(records)), key=lambda i: (ranks[i], -records[i]['accuracy'], records[i][args.cost]))
+    swept = sorted(space)
+    print("\n%5s %8s %6s %8s %7s  %s" % ("front", "accuracy", "cands", "reads", "ms", "  ".join(swept)))
+    for i in order[:args.top]:
+        r = records[i]
+        values = []
+        for name in swept:
+            v = r['params'][name]
+            values.append("%.3g" % v if isinstance(v, float) else
+                          ("<%d boxes>" % len(v) if isinstance(v, list) else str(v)))
+        print("%5d %8.3f %6.1f %8.0f %7.2f  %s" % (ranks[i], r['accuracy'], r.get('candidates_per_frame', 0.0),
+                                                   r['reads_per_frame'], r['ms_per_frame'], "  ".join(values)))
+    best = records[order[0]]
+    print("\nbest: " + "  ".join("%s recall %.2f false %d err %s" % (
+        t, m['recall'], m['false'], "%.1f" % m['error_deg'] if m['error_deg'] is not None else "-")
+        for t, m in best['metrics'].items()))
+
+
+if __name__ == "__main__":
+    main()
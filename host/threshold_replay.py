@@ -0,0 +1,99 @@
+"""Rebuild the adaptive thresholds of a recorded run from its THRESH lines.
+
+Usage:
+    python -m host.threshold_replay LOG [--frames run.corpus] [--name ball]
+
+threshold_adapter.ThresholdAdapter logs every change of a box as
+
+    THRESH,name,seq,L_lo,L_hi,A_lo,A_hi,B_lo,B_hi,samples,reason
+
+LOG is the camera's serial output (other lines are skipped). Prints the
+timeline of each adapted class. With a corpus recorded in the same run
+(host/frame_recorder.py) the ball boxes are replayed on its frames by their
+sequence numbers: find_blobs candidates in the mirror with the configured
+ORANGE_THRESHOLDS vs the boxes that were active for that frame.
+"""
+
+import argparse
+import math
+
+from host import emulator
+from host.bench_windowing import ORANGE_THRESHOLDS
+
+
+def parse(lines):
+    """{name: [(seq, box or None, samples, reason), ...]} in log order; None is the configured boxes"""
+    events = {}
+    for line in lines:
+        line = line.strip()
+        if not line.startswith("THRESH,"):
+            continue
+        parts = line.split(",")
+        if len(parts) != 11:
+            continue
+        try:
+            seq = int(parts[2])
+            box = tuple(int(v) for v in parts[3:9])
+            samples = int(parts[9])
+        except ValueError:
+            continue
+        reason = parts[10]
+        events.setdefault(parts[1], []).append((seq, None if reason == "reset" else box, samples, reason))
+    return events
+
+
+def thresholds_at(events, seq, configured):
+    """The boxes find_blobs used for frame seq: a change logged at seq applies from seq + 1"""
+    active = configured
+    for event_seq, box, _, _ in events:
+        if event_seq >= seq:
+            break
+        active = configured if box is None else [box]
+    return active
+
+
+def in_mirror(blob):
+    dist = math.hypot(blob.cx() - emulator.MIRROR_CENTER_X, blob.cy() - emulator.MIRROR_CENTER_Y)
+    return emulator.MIRROR_INNER_RADIUS <= dist <= emulator.MIRROR_OUTER_RADIUS
+
+
+def candidates(img, thresholds):
+    blobs = img.find_blobs(thresholds, pixels_threshold=10, area_threshold=10, merge=True, margin=10)
+    return [b for b in blobs if in_mirror(b)]
+
+
+def timeline(events):
+    for name, changes in sorted(events.items()):
+        print("%s: %d changes" % (name, len(changes)))
+        for seq, box, samples, reason in changes:
+            print("  seq %6d  %-6s %s  (%d blobs seen)" % (seq, reason, "configured" if box is None else box, samples))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("log", help="serial output with THRESH lines")
+    parser.add_argument("--frames", help="host.corpus recording of the same run")
+    parser.add_argument("--name", default="ball", help="adapter name to replay on the frames")
+    args = parser.parse_args()
+
+    with open(args.log, errors="replace") as f:
+        events = parse(f)
+    timeline(events)
+    if not args.frames:
+        return
+
+    from host.corpus import Corpus
+    corpus = Corpus(args.frames)
+    changes = events.get(args.name, [])
+    fixed = adapted = 0
+    for i in range(len(corpus)):
+        img = emulator.Image(corpus.frame(i))
+        seq = int(corpus.index["seq"][i])
+        fixed += len(candidates(img, ORANGE_THRESHOLDS))
+        adapted += len(candidates(img, thresholds_at(changes, seq, ORANGE_THRESHOLDS)))
+    n = max(1, len(corpus))
+    print("candidates/frame over %d frames: configured %.2f, replayed %.2f" % (len(corpus), fixed / n, adapted / n))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""Record the camera -> controller UART stream and read it back.
+
+Usage:
+    python -m host.uart_capture record /dev/ttyUSB0 match.uart [--baud 115200] [--seconds N]
+    python -m host.uart_capture info match.uart
+    python -m host.uart_capture dump match.uart [--start 12.5] [--end 20]
+    python -m host.uart_capture synthetic test.uart [--seconds 10] [--hz 20]
+
+Tap the camera's TX line with a USB serial adapter and record. Every read
+from the port is stored with its host receive time, so the controller logic
+can later be fed the exact same bytes at the same moments by
+host/replay_controller.cpp.
+
+File layout (little endian):
+    header  "UARTREC1", baud (u32), start time (u64, unix us)
+    chunks  time since the previous chunk (u32 us), length (u16), bytes
+    index   (time u64 us, file offset u64) about once a second
+    footer  index offset (u64), index entries (u64), "UIDX"
+The index and footer are written on close; a file cut short by a crash is
+still readable by scanning the chunks.
+"""
+
+import argparse
+import os
+import struct
+import time
+
+MAGIC = b"UARTREC1"
+HEADER = struct.Struct("<8sIQ")
+CHUNK = struct.Struct("<IH")
+INDEX_ENTRY = struct.Struct("<QQ")
+FOOTER = struct.Struct("<QQ4s")
+FOOTER_MAGIC = b"UIDX"
+INDEX_INTERVAL_US = 1000000
+MAX_CHUNK = 0xFFFF
+
+
+class UartWriter:
+    """Append timestamped chunks of received bytes to a recording"""
+
+    def __init__(self, path, baud=115200, start_unix_us=None):
+        self.file = open(path, "wb")
+        if start_unix_us is None:
+            start_unix_us = int(time.time() * 1e6)
+        self.file.write(HEADER.pack(MAGIC, baud, start_unix_us))
+        self.last_us = 0
+        self.index = []
+        self.next_index_us = 0
+
+    def write(self, time_us, data):
+        """Store bytes received time_us after the start of the recording"""
+        for i in range(0, len(data), MAX_CHUNK):
+            part = data[i:i + MAX_CHUNK]
+            delta = max(0, time_us - self.last_us)
+            # Gaps longer than a u32 (71 minutes) are split with empty chunks
+            while delta > 0xFFFFFFFF:
+                self.file.write(CHUNK.pack(0xFFFFFFFF, 0))
+                delta -= 0xFFFFFFFF
+            if time_us >= self.next_index_us:
+                self.index.append((self.last_us + delta, self.file.tell()))
+                self.next_index_us = time_us + INDEX_INTERVAL_US
+            self.file.write(CHUNK.pack(delta, len(part)))
+            self.file.write(part)
+            self.last_us = max(self.last_us, time_us)
+
+    def close(self):
+        index_offset = self.file.tell()
+        for entry in self.index:
+            self.file.write(INDEX_ENTRY.pack(*entry))
+        self.file.write(FOOTER.pack(index_offset, len(self.index), FOOTER_MAGIC))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class UartRecording:
+    """Read a recording: header fields, the index and the chunks as (time_us, bytes)"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = f.read()
+        magic, self.baud, self.start_unix_us = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError("%s is not a UART recording" % path)
+        self.end = len(self.data)
+        self.index = []
+        if len(self.data) >= HEADER.size + FOOTER.size:
+            index_offset, count, footer = FOOTER.unpack_from(self.data, len(self.data) - FOOTER.size)
+            if footer == FOOTER_MAGIC and index_offset + count * INDEX_ENTRY.size + FOOTER.size == len(self.data):
+                self.end = index_offset
+                self.index = [INDEX_ENTRY.unpack_from(self.data, index_offset + i * INDEX_ENTRY.size)
+                              for i in range(count)]
+
+    def chunks(self, start_s=0.0, end_s=None):
+        """Yield (time_us, bytes) for chunks received between start_s and end_s"""
+        start_us = int(start_s * 1e6)
+        end_us = None if end_s is None else int(end_s * 1e6)
+        offset = HEADER.size
+        now = 0
+        seek_us = 0
+        # Jump to the last index entry before start_s; chunk times are deltas,
+        # so the first chunk read there takes the entry's time
+        for entry_us, entry_offset in self.index:
+            if entry_us > start_us:
+                break
+            offset, now = entry_offset, None
+            seek_us = entry_us
+        while offset + CHUNK.size <= self.end:
+            delta, length = CHUNK.unpack_from(self.data, offset)
+            if now is None:
+                now = seek_us
+            else:
+                now += delta
+            payload = self.data[offset + CHUNK.size:offset + CHUNK.size + length]
+            offset += CHUNK.size + length
+            if len(payload) < length:
+                break  # Truncated by a crash
+            if end_us is not None and now > end_us:
+                break
+            if now >= start_us and length:
+                yield now, payload
+
+    def duration_s(self):
+        last = 0
+        for last, _ in self.chunks():
+            pass
+        return last / 1e6
+
+
+def record(port, path, baud=115200, seconds=None):
+    """Record a serial port until Ctrl-C or for the given number of seconds"""
+    try:
+        import serial
+    except ImportError:
+        raise SystemExit("recording needs pyserial: pip install pyserial")
+    link = serial.Serial(port, baud, timeout=0.005)
+    start = time.perf_counter()
+    total = 0
+    with UartWriter(path, baud) as writer:
+        try:
+            while seconds is None or time.perf_counter() - start < seconds:
+                data = link.read(max(1, link.in_waiting))
+                if data:
+                    writer.write(int((time.perf_counter() - start) * 1e6), data)
+                    total += len(data)
+        except KeyboardInterrupt:
+            pass
+    print("recorded %d bytes in %.1f s to %s" % (total, time.perf_counter() - start, path))
+
+
+def synthetic(path, seconds=10.0, hz=20.0, baud=115200, seed=0):
+    """A recording of mainNationals-style messages for trying out the replayer"""
+    import math
+    import random
+    rng = random.Random(seed)
+    with UartWriter(path, baud) as writer:
+        for seq in range(1, int(seconds * hz) + 1):
+            t_ms = seq * 1000.0 / hz
+            ball_angle = (90 + 120 * math.sin(t_ms / 1500.0)) % 360
+            ball = '"ball":{"found":true,"angle":%.1f,"distance":%.1f,"confidence":%.1f}' % (
+                ball_angle, 10 + 60 * (1 + math.cos(t_ms / 2000.0)), 80.0)
+            if rng.random() < 0.1:
+                ball = '"ball":{"found":false}'
+            line = ('"frame":{"seq":%d,"t":%d,"proc":%d} %s "yellow_goal":{"found":false} '
+                    '"blue_goal":{"found":false} "line":{"found":false}\n') % (seq, t_ms, 25, ball)
+            # Split the line the way a USB adapter hands it over, a few bytes at a time
+            data = line.encode("ascii")
+            t_us = int((t_ms + 25) * 1000)
+            for i in range(0, len(data), 32):
+                writer.write(t_us + i * 10 * 1000000 // baud, data[i:i + 32])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("record")
+    p.add_argument("port")
+    p.add_argument("path")
+    p.add_argument("--baud", type=int, default=115200)
+    p.add_argument("--seconds", type=float)
+    p = sub.add_parser("info")
+    p.add_argument("path")
+    p = sub.add_parser("dump")
+    p.add_argument("path")
+    p.add_argument("--start", type=float, default=0.0)
+    p.add_argument("--end", type=float)
+    p = sub.add_parser("synthetic")
+    p.add_argument("path")
+    p.add_argument("--seconds", type=float, default=10.0)
+    p.add_argument("--hz", type=float, default=20.0)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.port, args.path, args.baud, args.seconds)
+    elif args.command == "synthetic":
+        synthetic(args.path, args.seconds, args.hz)
+    elif args.command == "info":
+        rec = UartRecording(args.path)
+        chunks = list(rec.chunks())
+        total = sum(len(c) for _, c in chunks)
+        lines = sum(c.count(b"\n") for _, c in chunks)
+        print("%s: %d bytes on disk, %d baud, started %s" % (
+            args.path, os.path.getsize(args.path), rec.baud,
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(rec.start_unix_us / 1e6))))
+        print("%.1f s, %d chunks, %d payload bytes, %d lines, %d index entries%s" % (
+            chunks[-1][0] / 1e6 if chunks else 0.0, len(chunks), total, lines, len(rec.index),
+            "" if rec.index else " (no footer, recording was cut short)"))
+    else:
+        rec = UartRecording(args.path)
+        pending = b""
+        for t_us, data in rec.chunks(args.start, args.end):
+            pending += data
+            while b"\n" in pending:
+                line, pending = pending.split(b"\n", 1)
+                print("%10.3f  %s" % (t_us / 1e6, line.decode("ascii", "replace")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""Parse the detection lines mainNationals sends to the controller.
+
+A line looks like
+    "ball":{"found":true,"angle":12.0,...} "yellow_goal":{...} "blue_goal":{...} "line":{...}
+Sections that are missing or malformed are reported as not found. The "free"
+section carries the obstacle profile string and "frame" the sequence number
+and capture time instead of a found flag.
+"""
+
+import re
+
+SECTIONS = ("frame", "ball", "yellow_goal", "blue_goal", "line", "free")
+
+_SECTION_RE = re.compile(r'"(\w+)":\{([^{}]*)\}')
+_FIELD_RE = re.compile(r'"(\w+)":(true|false|"[^"]*"|-?[0-9.]+(?:[eE][-+]?[0-9]+)?|inf|-inf|nan)')
+
+
+def parse_message(line):
+    """Parse one message into {section: {field: value}}; found is always present"""
+    if isinstance(line, bytes):
+        line = line.decode("ascii", "replace")
+    result = {name: {"found": False} for name in SECTIONS}
+    for name, body in _SECTION_RE.findall(line):
+        fields = {}
+        for key, value in _FIELD_RE.findall(body):
+            if value in ("true", "false"):
+                fields[key] = value == "true"
+            elif value.startswith('"'):
+                fields[key] = value[1:-1]
+            else:
+                fields[key] = float(value)
+        fields.setdefault("found", False)
+        result[name] = fields
+    return result
@@ -1,5 +1,6 @@
 import sensor, image, time, math
 from pyb import UART, LED, Pin
+from top_candidates import TopK, FrameBudget
 
 # UART setup
 uart = UART(3, 57600, timeout_char=1000)
@@ -21,6 +22,12 @@ yellow_threshold = [(40, 120, -30, 15, 15, 50)]
 blue_threshold = [(-15, 20, 10, 45, -80, -10)]
 TARGET_GOAL_COLOR = "yellow"
 
+# Candidate caps (top_candidates.py): only the biggest blobs are shape scored
+BALL_TOP_K = 3
+GOAL_TOP_K = 1
+CANDIDATE_BUDGET_US = 10000  # Scoring per frame, 0 for no limit
+CAP_REPORT_EVERY = 100       # Print TOPK/BUDGET lines every this many frames, 0 = never
+
 # Camera setup
 sensor.reset()
 sensor.set_pixformat(sensor.RGB565)
@@ -47,11 +54,29 @@ def set_goal_position_pins(goal_blob, img):
         pin_center.value(1)
         return "CENTER"
 
+def blob_pixels(b):
+    return b.pixels()
+
+def blob_area(b):
+    return b.area()
+
+ball_top = TopK("ball", BALL_TOP_K)
+goal_top = TopK("goal", GOAL_TOP_K)
+ball_candidates = []
+goal_candidates = []
+budget = FrameBudget(CANDIDATE_BUDGET_US)
+
 def find_most_round_orange_blob(img):
     blobs = img.find_blobs([ORANGE_THRESH], pixels_threshold=20, area_threshold=20, merge=True)
     best_blob = None
     best_score = 0
-    for b in blobs:
+    # Only the scoring is budgeted, and the biggest blob is always scored
+    budget.start()
+    ball_top.select(blobs, blob_pixels, ball_candidates)
+    for i in range(len(ball_candidates)):
+        if i and not budget.has_time(len(ball_candidates) - i):
+            break
+        b = ball_candidates[i]
         # Estimate roundness via aspect ratio (since .roundness() is not available)
         if b.h() == 0: continue
         aspect_ratio = float(b.w()) / b.h()
@@ -64,19 +89,20 @@ def find_most_round_orange_blob(img):
 
 def find_best_goal_blob(img, threshold):
     blobs = img.find_blobs(threshold, pixels_threshold=20, area_threshold=50, merge=True)
-    if not blobs:
-        return None
-    blobs.sort(key=lambda b: b.area(), reverse=True)
-    return blobs[0]
+    best = goal_top.select(blobs, blob_area, goal_candidates)
+    return best[0] if best else None
 
 # Main loop
 clock = time.clock()
+frame_count = 0
 while True:
     clock.tick()
     img = sensor.snapshot()
+    frame_count += 1
 
     # --- Ball Detection (Always) ---
     orange_blob = find_most_round_orange_blob(img)
+    budget.finish()
     angle = 0
     out = 0
     if orange_blob:
@@ -118,3 +144,7 @@ while True:
     # Output info
     print("Angle: %.1f°, OUT=%d" % (angle, out))
     print("FPS:", clock.fps())
+    if CAP_REPORT_EVERY and frame_count % CAP_REPORT_EVERY == 0:
+        print(ball_top.report())
+        print(goal_top.report())
+        print(budget.report())
@@ -0,0 +1,93 @@
+import math
+from array import array
+
+# Colour calibration shared by the OpenMV scripts. Instead of printing the LAB
+# value of one pixel every frame, LAB histograms of whole regions (the mirror
+# ring, a box where the ball or a goal is held) are summed over many frames
+# and one short line per region is printed every N frames:
+#
+#   CAL,name,frames,pixels,L1,L5,L50,L95,L99,A1,...,A99,B1,...,B99
+#
+# host/lab_thresholds.py turns these lines into threshold tuples.
+
+L_BINS = 50        # L runs 0..100
+AB_BINS = 64       # A and B run -128..127
+PERCENTILES = (1, 5, 50, 95, 99)
+
+def ring_rois(center_x, center_y, inner_radius, outer_radius, count=12, size=16):
+    """Square ROIs spaced around the middle of the mirror ring"""
+    radius = (inner_radius + outer_radius) / 2
+    rois = []
+    for i in range(count):
+        a = 2 * math.pi * i / count
+        x = int(center_x + radius * math.cos(a)) - size // 2
+        y = int(center_y + radius * math.sin(a)) - size // 2
+        rois.append((x, y, size, size))
+    return rois
+
+def _clip(roi, width, height):
+    x, y, w, h = roi
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(width, x + w), min(height, y + h)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return (x0, y0, x1 - x0, y1 - y0)
+
+def _percentiles(bins, lo, hi):
+    """Values below which each of PERCENTILES percent of the histogram lies"""
+    total = sum(bins)
+    out = []
+    if total <= 0:
+        return [0] * len(PERCENTILES)
+    width = (hi - lo + 1) / len(bins)
+    acc = 0.0
+    i = 0
+    for p in PERCENTILES:
+        target = total * p / 100.0
+        while i < len(bins) - 1 and acc + bins[i] < target:
+            acc += bins[i]
+            i += 1
+        out.append(int(lo + (i + 0.5) * width))
+    return out
+
+class LabCalibrator:
+    def __init__(self, regions, every=30):
+        """regions is a list of (name, [roi, ...]); every is frames per summary"""
+        self.regions = regions
+        self.every = every
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.pixels = [0] * len(self.regions)
+        self.hists = [(array('f', [0] * L_BINS), array('f', [0] * AB_BINS), array('f', [0] * AB_BINS))
+                      for _ in self.regions]
+
+    def add(self, img):
+        """Add one frame; returns True when a summary is due"""
+        width, height = img.width(), img.height()
+        for r, (name, rois) in enumerate(self.regions):
+            l_acc, a_acc, b_acc = self.hists[r]
+            for roi in rois:
+                roi = _clip(roi, width, height)
+                if roi is None:
+                    continue
+                n = roi[2] * roi[3]
+                # Bins come back normalised, weight them by the ROI size
+                hist = img.get_histogram(roi=roi, l_bins=L_BINS, a_bins=AB_BINS, b_bins=AB_BINS)
+                for acc, bins in ((l_acc, hist.l_bins()), (a_acc, hist.a_bins()), (b_acc, hist.b_bins())):
+                    for i in range(len(bins)):
+                        acc[i] += bins[i] * n
+                self.pixels[r] += n
+        self.frames += 1
+        return self.frames >= self.every
+
+    def summary(self):
+        """One CAL line per region for the frames so far, then start over"""
+        lines = []
+        for r, (name, rois) in enumerate(self.regions):
+            l_acc, a_acc, b_acc = self.hists[r]
+            values = _percentiles(l_acc, 0, 100) + _percentiles(a_acc, -128, 127) + _percentiles(b_acc, -128, 127)
+            lines.append("CAL,%s,%d,%d,%s" % (name, self.frames, self.pixels[r], ",".join(str(v) for v in values)))
+        self.reset()
+        return lines
@@ -1,5 +1,20 @@
-import sensor, image, time, math
+import sensor, image, time, math, gc
+from array import array
+import pyb
 from pyb import UART
+import ring_goal_detector
+import mirror_geometry
+import radial_scan
+from detection_scheduler import DetectionScheduler
+from top_candidates import TopK, FrameBudget
+import lab_calibration
+import frame_stream
+import result_buffer
+import frame_profile
+import change_detector
+import self_mask
+import threshold_adapter
+from result_buffer import BALL, YELLOW, BLUE, LINE
 
 # Initialize UART for communication with Arduino
 uart = UART(3, 115200, timeout_char=1000)  # Using UART3
@@ -36,17 +51,126 @@ BLUE_THRESHOLDS = [
     (15, 40, -128, -30, -70, -40)   # lighter blue
 ]
 
+WHITE_THRESHOLDS = [
+    (75, 100, -15, 15, -15, 15)  # field lines: bright, no colour
+]
+
+TURF_THRESHOLDS = [
+    (15, 75, -70, -10, -10, 45)  # green field carpet
+]
+
+# Goal detector: "blob" runs find_blobs per goal, "histogram" makes one pass over
+# the mirror ring and finds each goal as an arc in a bearing histogram
+GOAL_DETECTOR = "histogram"
+GOAL_BINS = 360              # Bearing bins for the histogram detector
+# The colour class table the histogram detector and the ring scan share is
+# loaded from LUT_FILE (host/build_class_lut.py writes it) or built at boot and
+# saved there. Below LUT_MIN_FREE heap bytes the goals fall back to find_blobs
+# and the line/obstacle scan is switched off.
+LUT_FILE = "class_lut.bin"
+LUT_MIN_FREE = 160000       # 64K table + ~60K bearing map + rays, with room to spare
+
+# Detection schedule: the ball is searched every frame, the goals only every
+# GOAL_EVERY_N frames (or early if the ball bearing jumps, which usually means
+# the robot turned). Skipped frames reuse the last goal result with an age.
+GOAL_EVERY_N = 3
+GOAL_MOTION_LIMIT = 15.0     # Degrees of ball bearing change that force a goal search
+
+# Change detection: while the robot stands still only the mirror blocks that
+# changed are thresholded for the ball, the last blobs are reused elsewhere and
+# the line/obstacle scan is skipped when nothing changed (change_detector.py).
+# Off by default: its ~2200 get_pixel samples per frame cost more than the
+# native find_blobs work they save once the robot moves, and a moving robot
+# never gets a static frame (python -m host.bench_change). Worth turning on
+# for a robot that mostly waits in place, such as a goalie.
+ENABLE_CHANGE_DETECTION = False
+CHANGE_MAX_REUSE = 15        # Frames of reuse before a full pass runs regardless
+
+# Robot self-mask: the chassis, wheels and screw terminals seen in the mirror
+# are learned once ("learn": drive and turn the robot around the field until
+# the mask is saved) and then left out of every scan ("use"; self_mask.py)
+SELF_MASK_MODE = None        # None, "learn" or "use"
+SELF_MASK_FILE = "self_mask.bin"
+SELF_MASK_FRAMES = 150       # Frames in which the scene moved before the mask is built
+
+# Adaptive thresholds: the ball boxes (and the goal boxes of the "blob" goal
+# detector; the histogram detector's colour table is built once) follow the
+# LAB colour of confident detections inside the hull of the boxes above.
+# Every change is printed as a THRESH line (threshold_adapter.py,
+# host/threshold_replay.py)
+ADAPTIVE_THRESHOLDS = False
+ADAPT_MIN_ROUNDNESS = 0.75   # Tracked ball blobs at least this round are sampled
+
+# Candidate caps: only the biggest BALL_TOP_K / GOAL_TOP_K blobs in the mirror
+# are tracked and scored, and selection, scoring, tracking and drawing stop
+# once the frame has spent CANDIDATE_BUDGET_US on them; find_blobs itself
+# isn't charged (top_candidates.py)
+BALL_TOP_K = 4
+GOAL_TOP_K = 3
+CANDIDATE_BUDGET_US = 4000   # 0 for no limit
+
 # Object tracking state
 last_orange_blobs = []
 last_yellow_blobs = []
 last_blue_blobs = []
 tracking_threshold = 30  # Maximum pixel distance to consider it the same object
+last_ball_angle = None
+
+ball_thresholds = threshold_adapter.ThresholdAdapter("ball", ORANGE_THRESHOLDS)
+yellow_thresholds = threshold_adapter.ThresholdAdapter("yellow", YELLOW_THRESHOLDS)
+blue_thresholds = threshold_adapter.ThresholdAdapter("blue", BLUE_THRESHOLDS)
+threshold_adapters = (ball_thresholds, yellow_thresholds, blue_thresholds)
+
+ball_top = TopK("ball", BALL_TOP_K)
+yellow_top = TopK("yellow", GOAL_TOP_K)
+blue_top = TopK("blue", GOAL_TOP_K)
+candidate_budget = FrameBudget(CANDIDATE_BUDGET_US)
+
+goal_scheduler = DetectionScheduler()
+goal_scheduler.add('goals', every=GOAL_EVERY_N, motion_limit=GOAL_MOTION_LIMIT)
 
 # Debug options
 ENABLE_DEBUG_PRINTS = True
 SHOW_MIRROR_BOUNDARY = True
 ENABLE_ROI = True
 SAVE_CALIBRATION_IMG = False  # Set to True to save a calibration image once
+ENABLE_LINE_DETECTION = True  # Ray-cast the ring for the white field boundary
+ENABLE_OBSTACLE_DETECTION = True  # Free-space profile from the same rays
+FREE_SPACE_CM_PER_CHAR = 2    # Distance step of one character in the free-space profile
+FREE_SPACE_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+ENABLE_WINDOWING = True  # Crop capture to the mirror's bounding square after calibration
+CALIBRATION_MODE = False  # Print LAB percentiles of the mirror ring and the boxes below (host/lab_thresholds.py)
+CALIBRATION_EVERY = 30    # Frames per CAL summary
+# Full-frame (x, y, w, h) boxes to hold the ball and goals in while calibrating
+CALIBRATION_ROIS = [
+    ("ball", [(150, 40, 20, 20)]),
+    ("yellow", [(140, 10, 40, 20)]),
+    ("blue", [(140, 210, 40, 20)]),
+]
+# Recording mode: stream frames with their detection line to host/frame_recorder.py.
+# None, "usb" (the debug prints share the port, the recorder skips them) or "uart"
+STREAM_MODE = None
+STREAM_UART = 1
+STREAM_BAUD = 921600
+STREAM_MAX_FPS = 5
+STREAM_BUDGET_MS = 8   # Average streaming time allowed per detection frame
+STREAM_QUALITY = 50    # JPEG quality, 0 for raw RGB565
+ENABLE_ALLOC_COUNTER = True  # Heap bytes allocated per frame, printed with the debug output
+# Garbage collection: "scheduled" collects right after the results are sent so
+# pauses stay out of detection, "auto" leaves it to MicroPython (collects when the heap is full)
+GC_POLICY = "scheduled"
+# The byte limits default to shares of the heap measured at boot (frame_profile.py),
+# printed as a GCSET line; tune them from the GC and allocation lines of a real run
+GC_COLLECT_ABOVE = None   # Bytes in use before a scheduled collection bothers; 0 collects every frame
+GC_THRESHOLD = None       # gc.threshold() bytes, a safety net for frames that allocate a lot; 0 = MicroPython's
+PROFILE_FRAMES = 64       # Frames kept in the profiling ring
+PROFILE_DUMP_EVERY = 0    # Print the ring (PROF lines) every this many frames, 0 = never
+# Latency histograms of the loop time and capture to UART send, read with host/frame_latency.py
+LATENCY_BUCKET_US = 1000
+LATENCY_BUCKETS = 128      # Longer samples share one overflow bucket
+LATENCY_REPORT_EVERY = 300 # Print LATH percentiles and start a new window every this many frames, 0 = never
+LATENCY_DUMP = False       # Print the full HIST buckets with the periodic report
+LATENCY_REQUESTS = False   # Answer "l" (histograms) and "p" (profile ring) sent over USB; polls the port every frame
 
 # — Camera setup —
 sensor.reset()
@@ -60,10 +184,153 @@ sensor.set_contrast(3)  # Increase contrast slightly
 sensor.set_brightness(0)  # Default brightness
 sensor.set_saturation(3)  # Increase saturation for better color detection
 
+streamer = None
+if STREAM_MODE == "usb":
+    streamer = frame_stream.FrameStreamer(pyb.USB_VCP(), 500000, STREAM_MAX_FPS, STREAM_BUDGET_MS, STREAM_QUALITY)
+elif STREAM_MODE == "uart":
+    stream_uart = UART(STREAM_UART, STREAM_BAUD, timeout_char=10)
+    streamer = frame_stream.FrameStreamer(stream_uart, STREAM_BAUD // 10, STREAM_MAX_FPS, STREAM_BUDGET_MS,
+                                          STREAM_QUALITY)
+
 # Create a calibration flag to run calibration once
 calibration_done = False
 frame_count = 0
 
+# Results live in fixed slots and the controller line is formatted in place,
+# so the result path allocates nothing per frame (result_buffer.py)
+results = result_buffer.Results(radial_scan.RAY_COUNT)
+message = result_buffer.MessageWriter()
+stream_frame = None
+alloc_result = result_buffer.AllocCounter()  # Filling the line and sending it
+alloc_frame = result_buffer.AllocCounter()   # The whole frame, detection included
+profile = frame_profile.ProfileRing(PROFILE_FRAMES)
+gc_policy = frame_profile.GcPolicy(profile, GC_POLICY == "scheduled", GC_COLLECT_ABOVE, GC_THRESHOLD)
+print(gc_policy.settings())
+loop_latency = frame_profile.LatencyHistogram("loop", LATENCY_BUCKET_US, LATENCY_BUCKETS)
+send_latency = frame_profile.LatencyHistogram("send", LATENCY_BUCKET_US, LATENCY_BUCKETS)
+usb = pyb.USB_VCP() if LATENCY_REQUESTS else None
+
+# Self-mask, in full-frame coordinates so it survives windowing
+robot_mask = None
+mask_learner = None
+if SELF_MASK_MODE == "use":
+    # Before windowing, sensor.width()/height() are the full frame the mask was learned on
+    robot_mask = self_mask.SelfMask.load(SELF_MASK_FILE, sensor.width(), sensor.height())
+    if robot_mask is None:
+        print("No self-mask for this frame size in", SELF_MASK_FILE, "- set SELF_MASK_MODE = \"learn\" to make one")
+elif SELF_MASK_MODE == "learn":
+    mask_learner = self_mask.SelfMaskLearner(sensor.width(), sensor.height())
+
+# Sensor window offset once windowing is applied. The mirror center is kept in
+# window coordinates, so add these to get full-frame coordinates.
+window_x = 0
+window_y = 0
+
+# Ring tables: the RGB565 colour class lookup table is built once here, the
+# goal bearing map and radial rays are (re)built whenever the mirror geometry changes
+class_lut = None
+goal_bearing_map = None
+ring_rays = None
+line_hits = None
+obstacle_hits = None
+free_space_chars = None
+calibrator = None
+changes = None
+exclusion_mask = None
+goal_hist = None
+
+def load_class_lut():
+    """Colour class table from LUT_FILE, else built here and saved; None when the heap is too small"""
+    global GOAL_DETECTOR, ENABLE_LINE_DETECTION, ENABLE_OBSTACLE_DETECTION
+    
+    gc.collect()
+    free = gc.mem_free()
+    if free < LUT_MIN_FREE:
+        print("LUT,skipped,%d bytes free, %d needed; goals by find_blobs, no line/obstacle scan" % (free, LUT_MIN_FREE))
+        GOAL_DETECTOR = "blob"
+        ENABLE_LINE_DETECTION = False
+        ENABLE_OBSTACLE_DETECTION = False
+        return None
+    
+    start = time.ticks_ms()
+    key = ring_goal_detector.thresholds_key(YELLOW_THRESHOLDS, BLUE_THRESHOLDS, WHITE_THRESHOLDS, TURF_THRESHOLDS)
+    lut = ring_goal_detector.load_class_lut(LUT_FILE, key)
+    source = "file"
+    if lut is None:
+        lut = ring_goal_detector.build_class_lut(image.rgb_to_lab, YELLOW_THRESHOLDS, BLUE_THRESHOLDS,
+                                                 WHITE_THRESHOLDS, TURF_THRESHOLDS)
+        source = "built"
+        try:
+            ring_goal_detector.save_class_lut(lut, key, LUT_FILE)
+        except OSError:
+            source = "built, not saved"
+    # Boot cost of the table: where it came from, ms, bytes, heap left
+    print("LUT,%s,%d,%d,%d" % (source, time.ticks_diff(time.ticks_ms(), start), len(lut), gc.mem_free()))
+    return lut
+
+if GOAL_DETECTOR == "histogram" or ENABLE_LINE_DETECTION or ENABLE_OBSTACLE_DETECTION:
+    class_lut = load_class_lut()
+if GOAL_DETECTOR == "histogram":
+    goal_hist = ring_goal_detector.new_histograms(GOAL_BINS)
+
+def reset_ring_tables():
+    """Drop the precomputed ring tables after the mirror geometry changed"""
+    global goal_bearing_map, ring_rays, calibrator, changes, exclusion_mask
+    goal_bearing_map = None
+    ring_rays = None
+    calibrator = None
+    changes = None
+    exclusion_mask = None
+
+def build_calibrator():
+    """LAB calibrator for the mirror ring and CALIBRATION_ROIS in current image coordinates"""
+    regions = [("ring", lab_calibration.ring_rois(MIRROR_CENTER_X, MIRROR_CENTER_Y,
+                                                  MIRROR_INNER_RADIUS, MIRROR_OUTER_RADIUS))]
+    for name, rois in CALIBRATION_ROIS:
+        regions.append((name, [(x - window_x, y - window_y, w, h) for x, y, w, h in rois]))
+    return lab_calibration.LabCalibrator(regions, CALIBRATION_EVERY)
+
+def blob_in_mirror(blob):
+    """Blob center lies on the mirror ring, not on the camera or outside the mirror"""
+    dist = distance_from_center(blob.cx(), blob.cy())
+    return MIRROR_INNER_RADIUS <= dist <= MIRROR_OUTER_RADIUS
+
+def keep_in_mirror(blobs):
+    """Drop blobs outside the mirror ring, in place"""
+    i = 0
+    while i < len(blobs):
+        if blob_in_mirror(blobs[i]):
+            i += 1
+        else:
+            blobs.pop(i)
+    return blobs
+
+def find_orange_blobs(img, roi):
+    return img.find_blobs(ball_thresholds.thresholds, roi=roi, pixels_threshold=10, area_threshold=10, merge=True, margin=10)
+
+def blob_pixels(b):
+    return b.pixels()
+
+def is_tracked(blob, tracked):
+    """blob was matched to one of last frame's blobs by track_objects()"""
+    for pair in tracked:
+        if pair[0] is blob:
+            return True
+    return False
+
+def update_thresholds():
+    """Let the adapters move their boxes and log what changed"""
+    for adapter in threshold_adapters:
+        line = adapter.update(frame_count)
+        if line:
+            print(line)
+
+def ball_score(b):
+    return b.pixels() * (1.2 - 0.004 * distance_from_center(b.cx(), b.cy()))
+
+def goal_score(b):
+    return b.pixels() * (1.0 - 0.002 * distance_from_center(b.cx(), b.cy()))
+
 def distance_from_center(x, y):
     """Calculate distance from center point of the image"""
     return math.sqrt((x - MIRROR_CENTER_X) ** 2 + (y - MIRROR_CENTER_Y) ** 2)
@@ -86,6 +353,29 @@ def create_ring_mask(img):
     mask.draw_circle(MIRROR_CENTER_X, MIRROR_CENTER_Y, MIRROR_INNER_RADIUS, color=0, thickness=-1)
     return mask
 
+def create_exclusion_mask(img):
+    """Mask of the robot's own pixels in current image coordinates, to clear before thresholding"""
+    mask = image.Image(img.width(), img.height(), image.GRAYSCALE)
+    mask.clear()
+    for rect in robot_mask.rects(window_x, window_y):
+        mask.draw_rectangle(rect, color=255, fill=True)
+    return mask
+
+def learn_self_mask(img):
+    """Feed a raw frame to the learner; build, save and switch to the mask once it has seen enough"""
+    global mask_learner, robot_mask
+    
+    mask_learner.add(img, window_x, window_y)
+    if ENABLE_DEBUG_PRINTS and frame_count % 30 == 0:
+        print(mask_learner.progress())
+    if mask_learner.counted < SELF_MASK_FRAMES:
+        return
+    robot_mask = mask_learner.build(class_lut)
+    robot_mask.save(SELF_MASK_FILE)
+    print("Self-mask saved to", SELF_MASK_FILE, "with", robot_mask.count(), "cells")
+    mask_learner = None
+    reset_ring_tables()
+
 def track_objects(current_blobs, last_blobs):
     """Simple object tracking between frames"""
     if not last_blobs:
@@ -95,6 +385,8 @@ def track_objects(current_blobs, last_blobs):
     new_blobs = []
     
     for blob in current_blobs:
+        if not candidate_budget.has_time():
+            break  # Out of time, the rest stay untracked
         x, y = blob.cx(), blob.cy()
         matched = False
         
@@ -151,57 +443,202 @@ def calibrate_mirror(img):
     MIRROR_OUTER_RADIUS = max(min(MIRROR_OUTER_RADIUS, min(img.width(), img.height()) - 10), MIRROR_INNER_RADIUS + 20)
     
     calibration_done = True
+    reset_ring_tables()
     
     if SAVE_CALIBRATION_IMG:
         img.save("calibration.jpg")
 
+def apply_mirror_window(img):
+    """Window the sensor to the mirror's bounding square and move the center into window coordinates"""
+    global MIRROR_CENTER_X, MIRROR_CENTER_Y, window_x, window_y
+    
+    x, y, w, h = mirror_geometry.mirror_window(MIRROR_CENTER_X, MIRROR_CENTER_Y, MIRROR_OUTER_RADIUS,
+                                               img.width(), img.height())
+    sensor.set_windowing((x, y, w, h))
+    window_x, window_y = x, y
+    
+    # Angles and distances are relative to the center, so shifting it keeps them correct
+    MIRROR_CENTER_X -= x
+    MIRROR_CENTER_Y -= y
+    reset_ring_tables()
+
+def find_goals_histogram(img, results):
+    """Find both goals as arcs in one bearing-histogram pass over the mirror ring"""
+    global goal_bearing_map
+    
+    if goal_bearing_map is None:
+        goal_bearing_map = ring_goal_detector.build_bearing_map(
+            MIRROR_CENTER_X, MIRROR_CENTER_Y, MIRROR_INNER_RADIUS, MIRROR_OUTER_RADIUS, GOAL_BINS)
+        goal_bearing_map = ring_goal_detector.clip_bearing_map(goal_bearing_map, img.width(), img.height())
+        if robot_mask is not None:
+            goal_bearing_map = robot_mask.mask_bearing_map(goal_bearing_map, window_x, window_y)
+        # Bytes of the map: three 'H' arrays and one 'B' array per ring sample
+        print("MAP,goal,%d,%d,%d" % (len(goal_bearing_map[0]), 7 * len(goal_bearing_map[0]), gc.mem_free()))
+    
+    yellow_hist, blue_hist = ring_goal_detector.goal_histograms(img, goal_bearing_map, class_lut, GOAL_BINS,
+                                                                goal_hist)
+    
+    for target, hist, color in ((YELLOW, yellow_hist, (255,255,0)), (BLUE, blue_hist, (0,0,255))):
+        arc = ring_goal_detector.find_goal_arc(hist[0], hist[1], GOAL_BINS)
+        if arc is None:
+            continue
+        
+        # Store goal data in results, width is the goal opening in degrees
+        results.set(target, arc['angle'], estimate_real_distance(arc['radius']), arc['width'])
+        
+        # Draw the arc edges on the image
+        for edge in (arc['left'], arc['right']):
+            ex = int(MIRROR_CENTER_X + MIRROR_OUTER_RADIUS * math.cos(math.radians(edge)))
+            ey = int(MIRROR_CENTER_Y + MIRROR_OUTER_RADIUS * math.sin(math.radians(edge)))
+            img.draw_line(MIRROR_CENTER_X, MIRROR_CENTER_Y, ex, ey, color=color)
+
+def build_free_space_chars():
+    """Profile character for every ray hit radius: distance in FREE_SPACE_CM_PER_CHAR steps, '-' if clear
+
+    Distances follow estimate_real_distance: radii at or past the outer edge
+    are the nearest ('0'), radii toward the inner edge the farthest.
+    """
+    chars = bytearray(256)
+    last = len(FREE_SPACE_CHARS) - 1
+    for h in range(256):
+        if h == radial_scan.NO_HIT:
+            chars[h] = ord('-')
+        elif h < MIRROR_INNER_RADIUS:
+            chars[h] = ord(FREE_SPACE_CHARS[last])  # Past the far edge of the ring
+        else:
+            step = int(estimate_real_distance(min(h, MIRROR_OUTER_RADIUS)) / FREE_SPACE_CM_PER_CHAR)
+            chars[h] = ord(FREE_SPACE_CHARS[max(0, min(step, last))])
+    return chars
+
+def encode_free_space(hits, out):
+    """One character per ray into out, through the per-radius table"""
+    for i in range(len(hits)):
+        out[i] = free_space_chars[hits[i]]
+    return len(hits)
+
+def scan_ring(img, results):
+    """Find the nearest field line and the obstacle profile by sampling precomputed radial rays"""
+    global ring_rays, line_hits, obstacle_hits, free_space_chars
+    
+    if ring_rays is None:
+        ring_rays = radial_scan.build_rays(MIRROR_CENTER_X, MIRROR_CENTER_Y, MIRROR_INNER_RADIUS,
+                                           MIRROR_OUTER_RADIUS, img.width(), img.height())
+        if robot_mask is not None:
+            ring_rays = robot_mask.mask_rays(ring_rays, window_x, window_y)
+        line_hits = array('B', [radial_scan.NO_HIT] * radial_scan.RAY_COUNT)
+        obstacle_hits = array('B', [radial_scan.NO_HIT] * radial_scan.RAY_COUNT)
+        free_space_chars = build_free_space_chars()
+    
+    if ENABLE_OBSTACLE_DETECTION:
+        radial_scan.scan_rays(img, ring_rays, class_lut, line_hits, obstacle_hits)
+        results.free_len = encode_free_space(obstacle_hits, results.free)
+    else:
+        radial_scan.scan_lines(img, ring_rays, class_lut, line_hits)
+    
+    if not ENABLE_LINE_DETECTION:
+        return
+    nearest = radial_scan.nearest_hit(ring_rays, line_hits)
+    if nearest is None:
+        return
+    
+    line_angle, line_radius = nearest
+    results.set(LINE, line_angle, estimate_real_distance(line_radius))
+    
+    # Draw the line hit on the image
+    lx = int(MIRROR_CENTER_X + line_radius * math.cos(math.radians(line_angle)))
+    ly = int(MIRROR_CENTER_Y + line_radius * math.sin(math.radians(line_angle)))
+    img.draw_cross(lx, ly, color=(255,255,255))
+
 # RPC function that will be called by Arduino
 def find_objects():
-    """Detect balls and goals and return their data through RPC"""
-    global last_orange_blobs, last_yellow_blobs, last_blue_blobs, frame_count
+    """Detect balls and goals into the preallocated results"""
+    global last_orange_blobs, last_yellow_blobs, last_blue_blobs, frame_count, last_ball_angle, calibrator
+    global stream_frame, changes, exclusion_mask
     
     img = sensor.snapshot()
+    capture_ms = time.ticks_ms()
+    capture_us = time.ticks_us()
     frame_count += 1
     
     # Run calibration for better center determination occasionally until calibrated
     if not calibration_done and frame_count % 10 == 0:
         calibrate_mirror(img)
+        if ENABLE_WINDOWING:
+            apply_mirror_window(img)
+            img = sensor.snapshot()  # Retake so this frame is in window coordinates too
+            capture_ms = time.ticks_ms()
+            capture_us = time.ticks_us()
+    
+    # Grab the frame for the recorder before it is filtered and drawn on
+    if streamer is not None and streamer.due():
+        stream_frame = streamer.capture(img)
+    
+    # The learner wants the raw colours, before any filtering or drawing
+    if mask_learner is not None:
+        learn_self_mask(img)
     
     # Apply ring mask if enabled
     if ENABLE_ROI:
         mask = create_ring_mask(img)
         img.mean(1, mask=mask)
     
-    # For all object detection - filter by distance from center to exclude noise outside mirror
-    def blob_in_mirror(blob):
-        dist = distance_from_center(blob.cx(), blob.cy())
-        return MIRROR_INNER_RADIUS <= dist <= MIRROR_OUTER_RADIUS
+    # Same filtered image the thresholds are applied to
+    if CALIBRATION_MODE:
+        if calibrator is None:
+            calibrator = build_calibrator()
+        if calibrator.add(img):
+            for line in calibrator.summary():
+                print(line)
+    
+    # Blank the robot's own pixels so no threshold can match them
+    if robot_mask is not None:
+        if exclusion_mask is None:
+            exclusion_mask = create_exclusion_mask(img)
+        img.clear(exclusion_mask)
     
-    # Results dictionary
-    results = {
-        'ball': {'found': False},
-        'yellow_goal': {'found': False},
-        'blue_goal': {'found': False}
-    }
+    # Which mirror blocks changed since they were last detected
+    change = change_detector.FULL
+    if ENABLE_CHANGE_DETECTION:
+        if changes is None:
+            blocks = change_detector.build_blocks(MIRROR_CENTER_X, MIRROR_CENTER_Y, MIRROR_INNER_RADIUS,
+                                                  MIRROR_OUTER_RADIUS, img.width(), img.height())
+            if robot_mask is not None:
+                blocks = robot_mask.mask_blocks(blocks, window_x, window_y)
+            changes = change_detector.ChangeDetector(blocks, max_reuse=CHANGE_MAX_REUSE)
+        change = changes.update(img)
+    
+    # Fresh slots for this frame; goal slots keep the last search until it runs again,
+    # line and free space slots keep the last scan while nothing changes
+    results.seq = frame_count
+    results.capture_ms = capture_ms
+    results.capture_us = capture_us
+    results.clear(BALL)
+    if change != change_detector.STATIC:
+        results.clear(LINE)
+        results.free_len = 0
     
     # — ORANGE BALL DETECTION —
-    orange_blobs = img.find_blobs(
-        ORANGE_THRESHOLDS,
-        pixels_threshold=10,
-        area_threshold=10,
-        merge=True,
-        margin=10
-    )
-    
-    # Filter blobs that are in the mirror area
-    orange_blobs = [b for b in orange_blobs if blob_in_mirror(b)]
+    if change == change_detector.FULL:
+        orange_blobs = find_orange_blobs(img, (0, 0, img.width(), img.height()))
+    elif change == change_detector.PARTIAL:
+        # Last frame's blobs stand where nothing changed; threshold only around the changes
+        orange_blobs, roi = change_detector.reuse_blobs(last_orange_blobs,
+                                                        changes.changed_roi(img.width(), img.height()))
+        orange_blobs.extend(find_orange_blobs(img, roi))
+    else:
+        orange_blobs = list(last_orange_blobs)
+    
+    # Filter blobs that are in the mirror area, keep the biggest few (in place)
+    candidate_budget.start()
+    keep_in_mirror(orange_blobs)
+    ball_top.select(orange_blobs, blob_pixels, orange_blobs, candidate_budget)
     orange_blobs, orange_tracked = track_objects(orange_blobs, last_orange_blobs)
     last_orange_blobs = orange_blobs
     
     # Process orange blobs (ball)
     if orange_blobs:
-        # Find the largest orange blob
-        largest_orange = max(orange_blobs, key=lambda b: b.pixels() * (1.2 - 0.004 * distance_from_center(b.cx(), b.cy())))
+        # Find the best scoring orange blob
+        largest_orange = candidate_budget.best(orange_blobs, ball_score)
         ox, oy = largest_orange.cx(), largest_orange.cy()
         dist_from_center = distance_from_center(ox, oy)
         
@@ -212,103 +649,132 @@ def find_objects():
             ball_dist = estimate_real_distance(dist_from_center)
             
             # Store ball data in results
-            results['ball'] = {
-                'found': True,
-                'angle': ball_angle,
-                'distance': ball_dist,
-                'confidence': largest_orange.roundness() * 100
-            }
+            results.set(BALL, ball_angle, ball_dist, largest_orange.roundness() * 100)
+            
+            # Sample a confident ball for the adaptive thresholds, before drawing on it
+            if (ADAPTIVE_THRESHOLDS and change != change_detector.STATIC and
+                    largest_orange.roundness() >= ADAPT_MIN_ROUNDNESS and is_tracked(largest_orange, orange_tracked)):
+                ball_thresholds.observe(img, largest_orange)
             
             # Draw detection on image
-            img.draw_rectangle(largest_orange.rect(), color=(255,128,0), thickness=2)
-            img.draw_cross(ox, oy, color=(255,128,0))
-            img.draw_string(ox+5, oy+5, "B:{:.0f}d {:.0f}cm".format(ball_angle, ball_dist), color=(255,128,0))
-    
-    # — YELLOW GOAL DETECTION —
-    yellow_blobs = img.find_blobs(
-        YELLOW_THRESHOLDS,
-        pixels_threshold=30,
-        area_threshold=50,
-        merge=True,
-        margin=10
-    )
-    
-    # Filter by mirror area
-    yellow_blobs = [b for b in yellow_blobs if blob_in_mirror(b)]
-    yellow_blobs, yellow_tracked = track_objects(yellow_blobs, last_yellow_blobs)
-    last_yellow_blobs = yellow_blobs
-    
-    # Process yellow goal
-    if yellow_blobs:
-        # Sort by area (weighted by distance from edge of mirror)
-        yellow_blobs.sort(key=lambda b: b.pixels() * (1.0 - 0.002 * distance_from_center(b.cx(), b.cy())), reverse=True)
-        # Take the largest blob
-        yb = yellow_blobs[0]
-        yx, yy = yb.cx(), yb.cy()
-        dist_from_center = distance_from_center(yx, yy)
+            if candidate_budget.has_time():
+                img.draw_rectangle(largest_orange.rect(), color=(255,128,0), thickness=2)
+                img.draw_cross(ox, oy, color=(255,128,0))
+                img.draw_string(ox+5, oy+5, "B:{:.0f}d {:.0f}cm".format(ball_angle, ball_dist), color=(255,128,0))
+    
+    # Bearing change of the ball since last frame (tenths of a degree), used as a turn cue for the goal schedule
+    ball_motion = 0
+    ball_found = results.found(BALL)
+    if ball_found and last_ball_angle is not None:
+        ball_motion = abs((results.get(BALL, result_buffer.ANGLE) - last_ball_angle + 1800) % 3600 - 1800)
+    last_ball_angle = results.get(BALL, result_buffer.ANGLE) if ball_found else None
+    
+    # A skipped search leaves the goal slots holding the last result
+    run_goals = goal_scheduler.due('goals', ball_motion / 10)
+    if run_goals:
+        results.clear(YELLOW)
+        results.clear(BLUE)
+        if GOAL_DETECTOR == "histogram":
+            find_goals_histogram(img, results)
+        else:
+            # — YELLOW GOAL DETECTION —
+            candidate_budget.pause()
+            yellow_blobs = img.find_blobs(
+                yellow_thresholds.thresholds,
+                pixels_threshold=30,
+                area_threshold=50,
+                merge=True,
+                margin=10
+            )
+    
+            candidate_budget.resume()
+    
+            # Filter by mirror area
+            keep_in_mirror(yellow_blobs)
+            yellow_top.select(yellow_blobs, blob_pixels, yellow_blobs, candidate_budget)
+            yellow_blobs, yellow_tracked = track_objects(yellow_blobs, last_yellow_blobs)
+            last_yellow_blobs = yellow_blobs
+    
+            # Process yellow goal
+            if yellow_blobs:
+                # Best by area (weighted by distance from edge of mirror)
+                yb = candidate_budget.best(yellow_blobs, goal_score)
+                yx, yy = yb.cx(), yb.cy()
+                dist_from_center = distance_from_center(yx, yy)
             
-        # Calculate angle and distance
-        yellow_angle = (math.degrees(math.atan2(yy-MIRROR_CENTER_Y, yx-MIRROR_CENTER_X)) + 360) % 360
-        yellow_dist = estimate_real_distance(dist_from_center)
+                # Calculate angle and distance
+                yellow_angle = (math.degrees(math.atan2(yy-MIRROR_CENTER_Y, yx-MIRROR_CENTER_X)) + 360) % 360
+                yellow_dist = estimate_real_distance(dist_from_center)
         
-        # Store yellow goal data in results
-        results['yellow_goal'] = {
-            'found': True,
-            'angle': yellow_angle,
-            'distance': yellow_dist
-        }
+                # Store yellow goal data in results
+                results.set(YELLOW, yellow_angle, yellow_dist)
+                if ADAPTIVE_THRESHOLDS and is_tracked(yb, yellow_tracked):
+                    yellow_thresholds.observe(img, yb)
         
-        # Draw detection on image
-        img.draw_rectangle(yb.rect(), color=(255,255,0), thickness=2)
-        img.draw_cross(yx, yy, color=(255,255,0))
-        img.draw_string(yx+5, yy+5, "Y:{:.0f}d {:.0f}cm".format(yellow_angle, yellow_dist), color=(255,255,0))
-    
-    # — BLUE GOAL DETECTION —
-    blue_blobs = img.find_blobs(
-        BLUE_THRESHOLDS,
-        pixels_threshold=30,
-        area_threshold=50,
-        merge=True,
-        margin=10
-    )
-    
-    # Filter by mirror area
-    blue_blobs = [b for b in blue_blobs if blob_in_mirror(b)]
-    blue_blobs, blue_tracked = track_objects(blue_blobs, last_blue_blobs)
-    last_blue_blobs = blue_blobs
-    
-    # Process blue goal
-    if blue_blobs:
-        # Sort by area (weighted by distance from edge of mirror)
-        blue_blobs.sort(key=lambda b: b.pixels() * (1.0 - 0.002 * distance_from_center(b.cx(), b.cy())), reverse=True)
-        # Take the largest blob
-        bb = blue_blobs[0]
-        bx, by = bb.cx(), bb.cy()
-        dist_from_center = distance_from_center(bx, by)
+                # Draw detection on image
+                if candidate_budget.has_time():
+                    img.draw_rectangle(yb.rect(), color=(255,255,0), thickness=2)
+                    img.draw_cross(yx, yy, color=(255,255,0))
+                    img.draw_string(yx+5, yy+5, "Y:{:.0f}d {:.0f}cm".format(yellow_angle, yellow_dist), color=(255,255,0))
+    
+            # — BLUE GOAL DETECTION —
+            candidate_budget.pause()
+            blue_blobs = img.find_blobs(
+                blue_thresholds.thresholds,
+                pixels_threshold=30,
+                area_threshold=50,
+                merge=True,
+                margin=10
+            )
+    
+            candidate_budget.resume()
+    
+            # Filter by mirror area
+            keep_in_mirror(blue_blobs)
+            blue_top.select(blue_blobs, blob_pixels, blue_blobs, candidate_budget)
+            blue_blobs, blue_tracked = track_objects(blue_blobs, last_blue_blobs)
+            last_blue_blobs = blue_blobs
+    
+            # Process blue goal
+            if blue_blobs:
+                # Best by area (weighted by distance from edge of mirror)
+                bb = candidate_budget.best(blue_blobs, goal_score)
+                bx, by = bb.cx(), bb.cy()
+                dist_from_center = distance_from_center(bx, by)
             
-        # Calculate angle and distance
-        blue_angle = (math.degrees(math.atan2(by-MIRROR_CENTER_Y, bx-MIRROR_CENTER_X)) + 360) % 360
-        blue_dist = estimate_real_distance(dist_from_center)
+                # Calculate angle and distance
+                blue_angle = (math.degrees(math.atan2(by-MIRROR_CENTER_Y, bx-MIRROR_CENTER_X)) + 360) % 360
+                blue_dist = estimate_real_distance(dist_from_center)
         
-        # Store blue goal data in results
-        results['blue_goal'] = {
-            'found': True,
-            'angle': blue_angle,
-            'distance': blue_dist
-        }
+                # Store blue goal data in results
+                results.set(BLUE, blue_angle, blue_dist)
+                if ADAPTIVE_THRESHOLDS and is_tracked(bb, blue_tracked):
+                    blue_thresholds.observe(img, bb)
         
-        # Draw detection on image
-        img.draw_rectangle(bb.rect(), color=(0,0,255), thickness=2)
-        img.draw_cross(bx, by, color=(0,0,255))
-        img.draw_string(bx+5, by+5, "B:{:.0f}d {:.0f}cm".format(blue_angle, blue_dist), color=(0,0,255))
+                # Draw detection on image
+                if candidate_budget.has_time():
+                    img.draw_rectangle(bb.rect(), color=(0,0,255), thickness=2)
+                    img.draw_cross(bx, by, color=(0,0,255))
+                    img.draw_string(bx+5, by+5, "B:{:.0f}d {:.0f}cm".format(blue_angle, blue_dist), color=(0,0,255))
+
+    candidate_budget.finish()
+    if run_goals:
+        goal_scheduler.update('goals', None)
+    goal_age = goal_scheduler.age('goals')
+    results.put(YELLOW, result_buffer.AGE, goal_age)
+    results.put(BLUE, result_buffer.AGE, goal_age)
+    
+    # — FIELD LINE AND OBSTACLE DETECTION —
+    if (ENABLE_LINE_DETECTION or ENABLE_OBSTACLE_DETECTION) and change != change_detector.STATIC:
+        scan_ring(img, results)
     
+    if ADAPTIVE_THRESHOLDS:
+        update_thresholds()
+
     # Debug prints
     if ENABLE_DEBUG_PRINTS and frame_count % 10 == 0:
         print("FPS: {:.1f}".format(clock.fps()))
-        print("Results:", results)
-    
-    # Return the results
-    return results
+        print("Goal schedule:", goal_scheduler.stats('goals'))
 
 # UART setup (ensure this is not duplicated if already present from previous RPC setup)
 # If uart object was already created for RPC, it can be reused. Otherwise, create it.
@@ -326,63 +792,83 @@ try:
 except NameError:
     clock = time.clock()
 
+def print_latency(dump):
+    for hist in (loop_latency, send_latency):
+        print(hist.summary())
+        if dump:
+            print(hist.dump())
+
+def serve_requests():
+    """Answer single-letter requests from the host on the USB port"""
+    if usb is None or not usb.any():
+        return
+    request = usb.read()
+    if b"l" in request:
+        print_latency(True)
+    if b"p" in request:
+        for line in profile.lines():
+            print(line)
+
 # Main loop
+loop_start_us = None
 while True:
     clock.tick()
-    # The find_objects() function should already be defined in your script
-    # and is assumed to handle image capture and blob detection, returning a dictionary.
-    # It also handles its own debug drawing on the image if needed.
-    data = find_objects() 
-
-    # Format the string for Arduino
-    # Ball
-    ball_str = '"ball":{'
-    if data['ball'].get('found', False): # Use .get for safety
-        ball_str += '"found":true,'
-        ball_str += '"angle":%.1f,' % data['ball'].get('angle', 0.0)
-        ball_str += '"distance":%.1f,' % data['ball'].get('distance', 0.0)
-        ball_str += '"confidence":%.1f' % data['ball'].get('confidence', 0.0)
-    else:
-        ball_str += '"found":false'
-    ball_str += '}'
-
-    # Yellow Goal
-    yellow_goal_str = '"yellow_goal":{'
-    if data['yellow_goal'].get('found', False):
-        yellow_goal_str += '"found":true,'
-        yellow_goal_str += '"angle":%.1f,' % data['yellow_goal'].get('angle', 0.0)
-        yellow_goal_str += '"distance":%.1f' % data['yellow_goal'].get('distance', 0.0)
-    else:
-        yellow_goal_str += '"found":false'
-    yellow_goal_str += '}'
-
-    # Blue Goal
-    blue_goal_str = '"blue_goal":{'
-    if data['blue_goal'].get('found', False):
-        blue_goal_str += '"found":true,'
-        blue_goal_str += '"angle":%.1f,' % data['blue_goal'].get('angle', 0.0)
-        blue_goal_str += '"distance":%.1f' % data['blue_goal'].get('distance', 0.0)
-    else:
-        blue_goal_str += '"found":false'
-    blue_goal_str += '}'
+    frame_start_us = time.ticks_us()
+    if loop_start_us is not None:
+        loop_latency.add(time.ticks_diff(frame_start_us, loop_start_us))
+    loop_start_us = frame_start_us
+    gc_policy.frame_start()
+    # find_objects() captures, detects into the preallocated results and
+    # handles its own debug drawing on the image
+    if ENABLE_ALLOC_COUNTER:
+        alloc_frame.start()
+    find_objects()
 
-    # Combine and send
-    # Ensure frame_count is incremented if find_objects() doesn't do it and it's used for debug prints
-    global frame_count # Assuming frame_count is a global incremented in find_objects or here
-    try:
-        frame_count +=1 
-    except NameError: # if frame_count is not global or not defined yet
-        frame_count = 1
+    # Format the line for Arduino in place and send it. Frame sequence number,
+    # capture time and processing time so far (ms) let the controller spot
+    # stale or dropped frames and measure latency
+    if ENABLE_ALLOC_COUNTER:
+        alloc_result.start()
+    result_buffer.format_message(results, message, time.ticks_diff(time.ticks_ms(), results.capture_ms),
+                                 FREE_SPACE_CM_PER_CHAR)
+    uart.write(message.view())
+    send_latency.add(time.ticks_diff(time.ticks_us(), results.capture_us))
+    if ENABLE_ALLOC_COUNTER:
+        alloc_result.stop()
 
+    if stream_frame is not None:
+        streamer.send(stream_frame, results.seq, results.capture_ms, message.view(),
+                      (window_x, window_y), (MIRROR_CENTER_X, MIRROR_CENTER_Y))
+        stream_frame = None
+    if ENABLE_ALLOC_COUNTER:
+        alloc_frame.stop()
 
-    output_str = ball_str + " " + yellow_goal_str + " " + blue_goal_str + "\\n"
-    uart.write(output_str)
+    # Collect here, between frames, rather than whenever the heap fills mid-detection
+    gc_policy.collect(results.seq, frame_start_us)
 
     # Debug print from OpenMV side (less frequently)
     if ENABLE_DEBUG_PRINTS and frame_count % 30 == 0:
-        # The find_objects() function might already print FPS and its own results.
-        # This print confirms what's sent to Arduino.
-        # print("FPS: {:.1f}".format(clock.fps())) # This might be redundant if find_objects prints it
-        print("Sent to Arduino:", output_str.strip())
+        print("Sent to Arduino:", bytes(message.view()).decode().strip())
+        if streamer is not None:
+            print(streamer.stats())
+        if ENABLE_ALLOC_COUNTER:
+            print(alloc_result.report("result"))
+            print(alloc_frame.report("frame"))
+        print(gc_policy.report())
+        if changes is not None:
+            print(changes.report())
+        print(ball_top.report())
+        if GOAL_DETECTOR != "histogram":
+            print(yellow_top.report())
+            print(blue_top.report())
+        print(candidate_budget.report())
+    if PROFILE_DUMP_EVERY and frame_count % PROFILE_DUMP_EVERY == 0:
+        for line in profile.lines():
+            print(line)
+    if LATENCY_REPORT_EVERY and frame_count % LATENCY_REPORT_EVERY == 0:
+        print_latency(LATENCY_DUMP)
+        loop_latency.reset()
+        send_latency.reset()
+    serve_requests()
 
     time.sleep_ms(50) # Send data at approximately 20Hz
@@ -0,0 +1,13 @@
+# Mirror geometry helpers shared by the OpenMV scripts and the host emulator.
+
+def mirror_window(center_x, center_y, outer_radius, frame_width, frame_height):
+    """Bounding square of the mirror as an (x, y, w, h) window clipped to the frame.
+
+    Everything outside MIRROR_OUTER_RADIUS is wasted work, so the sensor can be
+    windowed to this square at capture time.
+    """
+    x0 = max(0, center_x - outer_radius)
+    y0 = max(0, center_y - outer_radius)
+    x1 = min(frame_width, center_x + outer_radius + 1)
+    y1 = min(frame_height, center_y + outer_radius + 1)
+    return (x0, y0, x1 - x0, y1 - y0)
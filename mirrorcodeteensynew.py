@@ -1,5 +1,6 @@
 import sensor, image, time, math
 from pyb import UART, Pin
+from detection_scheduler import DetectionScheduler
 
 # UART setup (optional)
 uart = UART(3, 57600, timeout_char=1000)
@@ -15,6 +16,13 @@ ORANGE_THRESH = (40, 100, 20, 127, 20, 120)
 yellow_threshold = [(60, 115, -25, 5, 20, 65)]
 blue_threshold = [(-20, 30, 0, 50, -90, -5)]
 
+# Detection schedule: ball every frame, each goal every GOAL_EVERY_N frames.
+# The goals are phased so at most one goal search runs per frame.
+GOAL_EVERY_N = 4
+scheduler = DetectionScheduler()
+scheduler.add('yellow', every=GOAL_EVERY_N, phase=0)
+scheduler.add('blue', every=GOAL_EVERY_N, phase=GOAL_EVERY_N // 2)
+
 # Camera setup
 sensor.reset()
 sensor.set_pixformat(sensor.RGB565)
@@ -126,7 +134,9 @@ while True:
         pin_right.value(0)
 
     # --- Yellow Goal ---
-    yellow_blob = find_best_goal_blob(img, yellow_threshold)
+    if scheduler.due('yellow'):
+        scheduler.update('yellow', find_best_goal_blob(img, yellow_threshold))
+    yellow_blob, yellow_age = scheduler.result('yellow')
     yellow_angle = None
     if yellow_blob:
         x = yellow_blob.cx()
@@ -146,7 +156,9 @@ while True:
             img.draw_string(yellow_blob.x(), yellow_blob.y() - 20, "YELLOW: " + pos, color=(255, 255, 0))
 
     # --- Blue Goal ---
-    blue_blob = find_best_goal_blob(img, blue_threshold)
+    if scheduler.due('blue'):
+        scheduler.update('blue', find_best_goal_blob(img, blue_threshold))
+    blue_blob, blue_age = scheduler.result('blue')
     blue_angle = None
     if blue_blob:
         x = blue_blob.cx()
@@ -162,9 +174,9 @@ while True:
         img.draw_string(x + 10, y, "B: %.1f°" % blue_angle, color=(0, 0, 255))
 
     # Debug print
-    print("Ball: %.1f°, Yellow: %s, Blue: %s" % (
+    print("Ball: %.1f°, Yellow: %s (age %d), Blue: %s (age %d)" % (
         ball_angle,
-        "%.1f°" % yellow_angle if yellow_angle is not None else "None",
-        "%.1f°" % blue_angle if blue_angle is not None else "None"
+        "%.1f°" % yellow_angle if yellow_angle is not None else "None", yellow_age,
+        "%.1f°" % blue_angle if blue_angle is not None else "None", blue_age
     ))
     print("FPS:", clock.fps())
@@ -0,0 +1,189 @@
+from array import array
+
+# Motion-cued ball proposals for the forward-camera scripts. The loose
+# reflective black ball threshold also matches shadows, screws, wheels and
+# robot edges, and every match used to be shape scored. MotionMap samples
+# one brightness value per cell of a coarse grid each frame and marks the
+# cells that changed since the previous frame. Robot rotation pans the whole
+# forward view sideways, so the previous grid is first aligned with the
+# horizontal shift that best matches the column brightness profiles (to an
+# eighth of a cell, interpolating between the cells), and a cell counts as
+# moving when it differs from the shifted previous grid. top() then ranks the
+# candidate blobs by the moving cells around them, with a bonus near the
+# last ball position so a ball lying still keeps its place, and only the
+# best k go on to shape scoring.
+
+CELL = 12          # Grid cell size in pixels, one sample per cell
+DIFF = 10          # Brightness change (r5 + g6 + b5 units) that marks a cell as moving
+MAX_SHIFT = 4      # Cells of sideways rotation searched each frame
+TRACK_RADIUS = 30  # Pixels from the last ball that still get the tracking bonus
+TRACK_BONUS = 8    # Worth this many moving cells
+TRACK_FRAMES = 15  # Frames the last ball position is trusted for
+
+def brightness(value):
+    """Cheap brightness of a raw RGB565 pixel, 0-125"""
+    return ((value >> 11) & 0x1F) + ((value >> 5) & 0x3F) + (value & 0x1F)
+
+class MotionMap:
+    def __init__(self, width, height, cell=CELL, diff=DIFF, max_shift=MAX_SHIFT):
+        self.cell = cell
+        self.cols = width // cell
+        self.rows = height // cell
+        n = self.cols * self.rows
+        self.cur = bytearray(n)
+        self.prev = bytearray(n)
+        self.cur_profile = array('i', [0] * self.cols)
+        self.prev_profile = array('i', [0] * self.cols)
+        self.moving = bytearray(n)
+        self.sat = array('H', [0] * ((self.cols + 1) * (self.rows + 1)))  # Summed moving cells
+        self.diff = diff
+        self.max_shift = max_shift
+        self.costs = array('i', [0] * (2 * max_shift + 1))
+        self.shift = 0        # Eighths of a cell
+        self.primed = False
+        self.marked = False   # A moving map exists (two frames seen)
+        self.last_x = 0
+        self.last_y = 0
+        self.last_age = TRACK_FRAMES
+        # frames, candidates, scored, moving cells, |shift| summed
+        self.stats = array('i', [0] * 5)
+
+    def update(self, img):
+        """Sample img, estimate the sideways shift since the last frame and mark the moving cells"""
+        self.cur, self.prev = self.prev, self.cur
+        self.cur_profile, self.prev_profile = self.prev_profile, self.cur_profile
+        cur = self.cur
+        profile = self.cur_profile
+        cols = self.cols
+        cell = self.cell
+        half = cell // 2
+        get_pixel = img.get_pixel
+        for c in range(cols):
+            profile[c] = 0
+        i = 0
+        for r in range(self.rows):
+            y = r * cell + half
+            for c in range(cols):
+                v = brightness(get_pixel(c * cell + half, y, False))
+                cur[i] = v
+                profile[c] += v
+                i += 1
+        self.last_age += 1
+        if not self.primed:
+            self.primed = True
+            return
+        self.shift = self.best_shift()
+        self.mark_moving()
+        self.marked = True
+        self.stats[0] += 1
+        self.stats[4] += abs(self.shift)
+
+    def shift_cost(self, s):
+        """Mean column profile difference with cur column c matched to prev column c - s"""
+        cur = self.cur_profile
+        prev = self.prev_profile
+        lo = max(0, s)
+        hi = min(self.cols, self.cols + s)
+        cost = 0
+        for c in range(lo, hi):
+            cost += abs(cur[c] - prev[c - s])
+        return cost * 16 // (hi - lo)
+
+    def best_shift(self):
+        """Sideways shift since the last frame in eighths of a cell"""
+        costs = self.costs
+        m = self.max_shift
+        best = m
+        for k in range(2 * m + 1):
+            costs[k] = self.shift_cost(k - m)
+            # Ties favour no rotation
+            if costs[k] + abs(k - m) < costs[best] + abs(best - m):
+                best = k
+        # Parabola through the neighbours for the fraction of a cell
+        if 0 < best < 2 * m:
+            left = costs[best - 1]
+            right = costs[best + 1]
+            curve = left - 2 * costs[best] + right
+            if curve > 0:
+                return (best - m) * 8 + max(-4, min(4, (left - right) * 4 // curve))
+        return (best - m) * 8
+
+    def mark_moving(self):
+        cur = self.cur
+        prev = self.prev
+        moving = self.moving
+        sat = self.sat
+        cols = self.cols
+        diff = self.diff
+        shift = self.shift
+        last = cols - 1
+        w = cols + 1
+        count = 0
+        i = 0
+        for r in range(self.rows):
+            row_sum = 0
+            base = r * cols
+            for c in range(cols):
+                # Where this cell was in the previous grid, interpolated between two cells
+                pos = c * 8 - shift
+                m = 0
+                if 0 <= pos <= last * 8:
+                    pc = pos >> 3
+                    f = pos & 7
+                    before = prev[base + pc] * (8 - f)
+                    if f:
+                        before += prev[base + pc + 1] * f
+                    if abs(cur[i] * 8 - before) >= diff * 8:
+                        m = 1
+                        count += 1
+                moving[i] = m
+                row_sum += m
+                sat[(r + 1) * w + c + 1] = sat[r * w + c + 1] + row_sum
+                i += 1
+        self.stats[3] += count
+
+    def motion(self, rect):
+        """Moving cells under rect (x, y, w, h), grown by one cell"""
+        cell = self.cell
+        c0 = max(0, rect[0] // cell - 1)
+        r0 = max(0, rect[1] // cell - 1)
+        c1 = min(self.cols, (rect[0] + rect[2] - 1) // cell + 2)
+        r1 = min(self.rows, (rect[1] + rect[3] - 1) // cell + 2)
+        if c1 <= c0 or r1 <= r0:
+            return 0
+        w = self.cols + 1
+        sat = self.sat
+        return sat[r1 * w + c1] - sat[r0 * w + c1] - sat[r1 * w + c0] + sat[r0 * w + c0]
+
+    def prescore(self, blob):
+        score = self.motion(blob.rect()) if self.marked else 0
+        if self.last_age < TRACK_FRAMES:
+            dx = blob.cx() - self.last_x
+            dy = blob.cy() - self.last_y
+            if dx * dx + dy * dy <= TRACK_RADIUS * TRACK_RADIUS:
+                score += TRACK_BONUS
+        return score * 65536 + min(blob.pixels(), 65535)
+
+    def top(self, blobs, k):
+        """The k candidates most worth shape scoring"""
+        self.stats[1] += len(blobs)
+        if len(blobs) > k:
+            blobs = sorted(blobs, key=self.prescore, reverse=True)[:k]
+        self.stats[2] += len(blobs)
+        return blobs
+
+    def seen(self, blob):
+        """Remember where the ball was found for the tracking bonus"""
+        self.last_x = blob.cx()
+        self.last_y = blob.cy()
+        self.last_age = 0
+
+    def report(self):
+        """PROPOSE,frames,candidates and scored per frame (tenths),moving cells per frame,|shift| (tenths of a cell);
+        then start over"""
+        s = self.stats
+        n = s[0] if s[0] else 1
+        line = "PROPOSE,%d,%d,%d,%d,%d" % (s[0], s[1] * 10 // n, s[2] * 10 // n, s[3] // n, s[4] * 10 // (8 * n))
+        for i in range(5):
+            s[i] = 0
+        return line
@@ -10,6 +10,11 @@
 #include <Arduino.h>
 #include <Adafruit_Sensor.h>
 #include <Adafruit_LSM303_U.h>
+#include "vision_stream_parser.h"
+#include "ir_ring.h"
+
+// Print every IR sweep as "IR,ms,v0,...,v11" for host/ir_harness.cpp
+#define LOG_IR 0
 
 // IMU setup for LSM303DLHC
 Adafruit_LSM303_Mag_Unified mag = Adafruit_LSM303_Mag_Unified(12345);
@@ -26,13 +31,13 @@ const int MOTOR3_DIR = 9;
 const int MOTOR4_PWM = 6;
 const int MOTOR4_DIR = 11;
 
-// UART buffer for OpenMV communication
-const int BUFFER_SIZE = 100;
-char serialBuffer[BUFFER_SIZE];
-int bufferPos = 0;
+// Streaming parser for OpenMV communication (no line buffer)
+VisionStreamParser visionParser;
 
-// Variables for IR sensors (kept for fallback)
-int sensorValues[NUM_SENSORS];
+// Variables for IR sensors (kept for fallback). The ring is read one
+// sensor per loop() and gives a continuous bearing; the strongest sensor is
+// still kept for the align threshold.
+IRRing irRing;
 int strongestSignalIndex = -1;
 int strongestSignalValue = 0;
 
@@ -70,27 +75,39 @@ const int ALIGN_THRESHOLD = 700;    // Alignment threshold for the ball
 const float BALL_CLOSE_DISTANCE = 15.0; // cm - when to push the ball
 const float ANGLE_TOLERANCE = 0.15; // radians (~8.6 degrees)
 
+// IR fallback speed from the ring's distance estimate: slow close to the
+// ball so the robot doesn't overrun it, full speed when it is far away
+const float IR_NEAR_DISTANCE = 20.0;   // cm, at or below this drive at IR_NEAR_SPEED
+const float IR_FAR_DISTANCE = 80.0;    // cm, at or beyond this drive at IR_FAR_SPEED
+const int IR_NEAR_SPEED = 120;
+const int IR_FAR_SPEED = 220;
+
 // Function prototypes
 void initializeIMU();
 float getHeading();
 void findStrongestSignal();
+bool ballInPushRange();
 void moveTowardsBall();
+void driveToward(float bearing, int speed);
 void alignWithBall();
 void pushBallStraight();
 void stopMotors();
 void readOpenMVData();
-void parseOpenMVMessage(const char* message);
+void readIRSensors();
+void applyOpenMVMessage();
 void checkDetectionTimeouts();
 void moveBasedOnVisionData();
 
 void setup() {
     Serial.begin(115200);    // USB Serial for debugging
     Serial1.begin(57600);    // UART for OpenMV communication
+    visionParser.begin();
 
     // Initialize IR sensor pins (kept for fallback)
     for (int i = 0; i < NUM_SENSORS; i++) {
         pinMode(IR_PINS[i], INPUT);
     }
+    irRing.begin(IR_PINS);
 
     // Initialize motor control pins
     pinMode(MOTOR1_PWM, OUTPUT);
@@ -114,6 +131,9 @@ void loop() {
     // Read data from OpenMV camera
     readOpenMVData();
     
+    // One IR sensor per pass so the fallback bearing is always fresh
+    readIRSensors();
+    
     // Check for timeouts (detections gone stale)
     checkDetectionTimeouts();
     
@@ -123,11 +143,8 @@ void loop() {
     } 
     // Fall back to IR sensors if vision system doesn't detect the ball
     else {
-        // Find the strongest IR signal
-        findStrongestSignal();
-
         // If a strong signal is detected, align with the ball
-        if (strongestSignalValue >= ALIGN_THRESHOLD) {
+        if (ballInPushRange()) {
             alignWithBall();
             pushBallStraight();
         } else {
@@ -137,85 +154,38 @@ void loop() {
     }
 }
 
-// Parse incoming data from OpenMV
+// Parse incoming data from OpenMV one byte at a time
 void readOpenMVData() {
     while (Serial1.available()) {
-        char c = Serial1.read();
-        
-        // Process complete lines
-        if (c == '\n') {
-            serialBuffer[bufferPos] = '\0'; // Null-terminate the string
-            parseOpenMVMessage(serialBuffer);
-            bufferPos = 0; // Reset buffer for next message
-        } 
-        // Add character to buffer if not full
-        else if (bufferPos < BUFFER_SIZE - 1) {
-            serialBuffer[bufferPos++] = c;
+        if (visionParser.feed(Serial1.read())) {
+            applyOpenMVMessage();
         }
     }
 }
 
-// Parse messages from OpenMV
-void parseOpenMVMessage(const char* message) {
-    char msgType[10];
-    
-    // Check message type
-    if (sscanf(message, "%9[^,]", msgType) == 1) {
-        
+// Apply a complete line from OpenMV. Lines with too few fields or garbage
+// are rejected by the parser and never get here.
+void applyOpenMVMessage() {
+    const VisionTarget &ball = visionParser.targets[VISION_BALL];
+    if (ball.updated) {
         // Ball detection message
-        if (strcmp(msgType, "ball") == 0) {
-            float xVel, yVel;
-            if (sscanf(message, "ball,%f,%f,%f,%f,%f,%d", 
-                      &ballX, &ballY, &xVel, &yVel, &ballTheta, &ballConfidence) >= 6) {
-                
-                ballDetected = true;
-                ballDistance = sqrt(ballX*ballX + ballY*ballY); // Calculate distance
-                lastBallTime = millis(); // Update timestamp
-                
-                Serial.print("Ball: Dist=");
-                Serial.print(ballDistance);
-                Serial.print("cm, Angle=");
-                Serial.print(ballTheta * 180.0 / PI); // Convert to degrees
-                Serial.println("°");
-            }
-        }
-        
-        // Blue goal detection
-        else if (strcmp(msgType, "blue") == 0) {
-            float width, height;
-            if (sscanf(message, "blue,%f,%f,%f,%f,%d", 
-                      &blueGoalDistance, &blueGoalTheta, &width, &height, &blueGoalConfidence) >= 5) {
-                
-                blueGoalDetected = true;
-                lastBlueGoalTime = millis(); // Update timestamp
-                
-                Serial.print("Blue Goal: Dist=");
-                Serial.print(blueGoalDistance);
-                Serial.print("cm, Angle=");
-                Serial.print(blueGoalTheta * 180.0 / PI); // Convert to degrees
-                Serial.println("°");
-            }
-        }
-        
-        // Yellow goal detection
-        else if (strcmp(msgType, "yellow") == 0) {
-            float width, height;
-            if (sscanf(message, "yellow,%f,%f,%f,%f", 
-                      &yellowGoalDistance, &yellowGoalTheta, &width, &height) >= 4) {
-                
-                yellowGoalDetected = true;
-                lastYellowGoalTime = millis(); // Update timestamp
-                
-                Serial.print("Yellow Goal: Dist=");
-                Serial.print(yellowGoalDistance);
-                Serial.print("cm, Angle=");
-                Serial.print(yellowGoalTheta * 180.0 / PI); // Convert to degrees
-                Serial.println("°");
-            }
+        if (ball.found) {
+            ballX = ball.x;
+            ballY = ball.y;
+            ballTheta = ball.angle;
+            ballConfidence = (int)ball.confidence;
+            ballDetected = true;
+            ballDistance = ball.distance; // sqrt(x*x + y*y)
+            lastBallTime = millis(); // Update timestamp
+            
+            Serial.print("Ball: Dist=");
+            Serial.print(ballDistance);
+            Serial.print("cm, Angle=");
+            Serial.print(ballTheta * 180.0 / PI); // Convert to degrees
+            Serial.println("°");
         }
-        
         // No ball detection
-        else if (strcmp(msgType, "no_ball") == 0) {
+        else {
             // Only mark ball as not detected if we haven't seen it recently
             // This helps with brief detection losses
             if (millis() - lastBallTime > 100) {
@@ -223,6 +193,37 @@ void parseOpenMVMessage(const char* message) {
             }
         }
     }
+    
+    // Blue goal detection
+    const VisionTarget &blue = visionParser.targets[VISION_BLUE_GOAL];
+    if (blue.updated && blue.found) {
+        blueGoalDistance = blue.distance;
+        blueGoalTheta = blue.angle;
+        blueGoalConfidence = (int)blue.confidence;
+        blueGoalDetected = true;
+        lastBlueGoalTime = millis(); // Update timestamp
+        
+        Serial.print("Blue Goal: Dist=");
+        Serial.print(blueGoalDistance);
+        Serial.print("cm, Angle=");
+        Serial.print(blueGoalTheta * 180.0 / PI); // Convert to degrees
+        Serial.println("°");
+    }
+    
+    // Yellow goal detection
+    const VisionTarget &yellow = visionParser.targets[VISION_YELLOW_GOAL];
+    if (yellow.updated && yellow.found) {
+        yellowGoalDistance = yellow.distance;
+        yellowGoalTheta = yellow.angle;
+        yellowGoalDetected = true;
+        lastYellowGoalTime = millis(); // Update timestamp
+        
+        Serial.print("Yellow Goal: Dist=");
+        Serial.print(yellowGoalDistance);
+        Serial.print("cm, Angle=");
+        Serial.print(yellowGoalTheta * 180.0 / PI); // Convert to degrees
+        Serial.println("°");
+    }
 }
 
 // Check if detections have timed out
@@ -344,17 +345,38 @@ float getHeading() {
     return heading;
 }
 
+// Read the next IR sensor; after a full sweep the ring has a new estimate
+void readIRSensors() {
+    if (!irRing.poll()) {
+        return;
+    }
+#if LOG_IR
+    Serial.print("IR,");
+    Serial.print(millis());
+    for (int i = 0; i < NUM_SENSORS; i++) {
+        Serial.print(",");
+        Serial.print(irRing.readings[i]);
+    }
+    Serial.println();
+#endif
+}
+
 void findStrongestSignal() {
-    strongestSignalValue = 0;
-    strongestSignalIndex = -1;
+    strongestSignalValue = irRing.peak;
+    strongestSignalIndex = irRing.peakIndex;
+}
 
-    for (int i = 0; i < NUM_SENSORS; i++) {
-        sensorValues[i] = analogRead(IR_PINS[i]);
-        if (sensorValues[i] > strongestSignalValue) {
-            strongestSignalValue = sensorValues[i];
-            strongestSignalIndex = i;
-        }
+// Whether the ball is close enough for the blocking align and push. Those
+// stall loop() for seconds, so the decision takes a fresh full sweep instead
+// of the estimate poll() left, which may be from before the last push.
+bool ballInPushRange() {
+    findStrongestSignal();
+    if (strongestSignalValue < ALIGN_THRESHOLD) {
+        return false;
     }
+    irRing.sweep();
+    findStrongestSignal();
+    return strongestSignalValue >= ALIGN_THRESHOLD;
 }
 
 void moveTowardsBall() {
@@ -366,26 +388,32 @@ void moveTowardsBall() {
     }
     
     int speed = 200;
-    if (strongestSignalIndex < NUM_SENSORS / 2) {
-        // Move left
-        analogWrite(MOTOR1_PWM, speed);
-        analogWrite(MOTOR2_PWM, speed);
-        digitalWrite(MOTOR1_DIR, LOW);
-        digitalWrite(MOTOR2_DIR, HIGH);
-        analogWrite(MOTOR3_PWM, speed);
-        analogWrite(MOTOR4_PWM, speed);
-        digitalWrite(MOTOR3_DIR, HIGH);
-        digitalWrite(MOTOR4_DIR, LOW);
-    } else {
-        // Move right
-        analogWrite(MOTOR1_PWM, speed);
-        analogWrite(MOTOR2_PWM, speed);
-        digitalWrite(MOTOR1_DIR, HIGH);
-        digitalWrite(MOTOR2_DIR, LOW);
-        analogWrite(MOTOR3_PWM, speed);
-        analogWrite(MOTOR4_PWM, speed);
-        digitalWrite(MOTOR3_DIR, LOW);
-        digitalWrite(MOTOR4_DIR, HIGH);
+    float bearing = PI / 2;   // No ball: keep strafing left to search
+    if (irRing.valid) {
+        // Weighted bearing of all 12 sensors, positive to the left, and
+        // speed from the estimated distance
+        bearing = irRing.bearing;
+        float t = (irRing.distance - IR_NEAR_DISTANCE) / (IR_FAR_DISTANCE - IR_NEAR_DISTANCE);
+        t = constrain(t, 0.0, 1.0);
+        speed = IR_NEAR_SPEED + (int)(t * (IR_FAR_SPEED - IR_NEAR_SPEED));
+    }
+    driveToward(bearing, speed);
+}
+
+// Translate toward bearing (radians, 0 ahead, positive left) at speed. Each
+// wheel mixes the forward part (all DIR HIGH) with the left part (M1/M4 LOW,
+// M2/M3 HIGH, the strafe the old left/right moves used) and the fastest wheel
+// runs at speed.
+void driveToward(float bearing, int speed) {
+    float forward = cos(bearing);
+    float left = sin(bearing);
+    float wheel[4] = {forward - left, forward + left, forward + left, forward - left};
+    float largest = max(fabs(forward - left), fabs(forward + left));
+    const int pwmPins[4] = {MOTOR1_PWM, MOTOR2_PWM, MOTOR3_PWM, MOTOR4_PWM};
+    const int dirPins[4] = {MOTOR1_DIR, MOTOR2_DIR, MOTOR3_DIR, MOTOR4_DIR};
+    for (int i = 0; i < 4; i++) {
+        analogWrite(pwmPins[i], (int)(fabs(wheel[i]) / largest * speed));
+        digitalWrite(dirPins[i], wheel[i] >= 0 ? HIGH : LOW);
     }
 }
 
@@ -0,0 +1,106 @@
+/*
+ * omni_kinematics.h
+ *
+ * Description: Integer motor mixer for the 4-wheel X-drive. Replaces the
+ * float sin()/cos() of moveOmniDirectional() with a quarter-wave sine table
+ * in Q14 fixed point (16384 = 1.0, one entry per degree, interpolated to
+ * tenths, kept in flash on AVR) and per-wheel mixing coefficients, so a
+ * command costs a few integer multiplies instead of software floating point
+ * on the Uno.
+ *
+ * omniMix() takes a travel direction in tenths of a degree (0 straight
+ * ahead, positive clockwise / to the right, like moveOmniDirectional), a
+ * travel speed and a rotation speed (positive clockwise, like rotateToAngle) and writes signed
+ * PWM for M0 FL, M1 FR, M2 RL, M3 RR. If any wheel would exceed 255 all four
+ * are scaled down together, which keeps the direction of travel instead of
+ * clipping one wheel. host/kinematics_bench.cpp checks it against the float
+ * version and times both.
+ */
+
+#ifndef OMNI_KINEMATICS_H
+#define OMNI_KINEMATICS_H
+
+#include <stdint.h>
+
+#if defined(__AVR__)
+#include <avr/pgmspace.h>
+#else
+#define PROGMEM
+#define pgm_read_word(addr) (*(const uint16_t *)(addr))
+#endif
+
+const int OMNI_WHEELS = 4;
+const int OMNI_MAX_PWM = 255;
+const int OMNI_Q = 14;          // Fixed point: 1 << OMNI_Q is 1.0
+
+// round(16384 * sin(d)) for d = 0..90 degrees
+const int16_t OMNI_SINE_TABLE[91] PROGMEM = {
+  0, 286, 572, 857, 1143, 1428, 1713, 1997, 2280, 2563,
+  2845, 3126, 3406, 3686, 3964, 4240, 4516, 4790, 5063, 5334,
+  5604, 5872, 6138, 6402, 6664, 6924, 7182, 7438, 7692, 7943,
+  8192, 8438, 8682, 8923, 9162, 9397, 9630, 9860, 10087, 10311,
+  10531, 10749, 10963, 11174, 11381, 11585, 11786, 11982, 12176, 12365,
+  12551, 12733, 12911, 13085, 13255, 13421, 13583, 13741, 13894, 14044,
+  14189, 14330, 14466, 14598, 14726, 14849, 14968, 15082, 15191, 15296,
+  15396, 15491, 15582, 15668, 15749, 15826, 15897, 15964, 16026, 16083,
+  16135, 16182, 16225, 16262, 16294, 16322, 16344, 16362, 16374, 16382,
+  16384
+};
+
+// Wheel = forward * FORWARD + right * RIGHT + rotation * TURN, the same
+// signs as moveOmniDirectional() and rotateToAngle() use
+const int8_t OMNI_FORWARD[OMNI_WHEELS] = {1, 1, 1, 1};
+const int8_t OMNI_RIGHT[OMNI_WHEELS] = {1, -1, -1, 1};
+const int8_t OMNI_TURN[OMNI_WHEELS] = {1, -1, 1, -1};
+
+// sin of an angle in tenths of a degree in Q14, any angle, interpolated between table entries
+inline int16_t omniSin(int16_t tenths) {
+  tenths %= 3600;
+  if (tenths < 0) tenths += 3600;
+  int16_t sign = 1;
+  if (tenths >= 1800) {
+    tenths -= 1800;
+    sign = -1;
+  }
+  if (tenths > 900) tenths = 1800 - tenths;
+  int16_t degrees = tenths / 10;
+  int16_t fraction = tenths - degrees * 10;
+  int16_t value = (int16_t)pgm_read_word(&OMNI_SINE_TABLE[degrees]);
+  if (fraction) {
+    int16_t step = (int16_t)pgm_read_word(&OMNI_SINE_TABLE[degrees + 1]) - value;
+    value += (step * fraction + 5) / 10;
+  }
+  return sign * value;
+}
+
+inline int16_t omniCos(int16_t tenths) {
+  return omniSin(tenths + 900);
+}
+
+// Fixed-point value to the nearest integer, halves away from zero like round()
+inline int omniRound(int32_t value, int shift) {
+  const int32_t half = (int32_t)1 << (shift - 1);
+  return value >= 0 ? (int)((value + half) >> shift) : -(int)((-value + half) >> shift);
+}
+
+// Signed PWM per wheel for a translate + rotate command; direction in tenths of a degree
+inline void omniMix(int16_t angleTenths, int16_t speed, int16_t rotation, int out[OMNI_WHEELS]) {
+  int32_t forward = (int32_t)speed * omniCos(angleTenths);
+  int32_t right = (int32_t)speed * omniSin(angleTenths);
+  int32_t turn = (int32_t)rotation << OMNI_Q;
+  int largest = 0;
+  for (int i = 0; i < OMNI_WHEELS; i++) {
+    out[i] = omniRound(OMNI_FORWARD[i] * forward + OMNI_RIGHT[i] * right + OMNI_TURN[i] * turn, OMNI_Q);
+    int magnitude = out[i] < 0 ? -out[i] : out[i];
+    if (magnitude > largest) largest = magnitude;
+  }
+  if (largest <= OMNI_MAX_PWM) return;
+
+  // Scale all wheels together (one division, factor in Q15) so none saturates
+  int32_t factor = ((int32_t)OMNI_MAX_PWM << 15) / largest;
+  for (int i = 0; i < OMNI_WHEELS; i++) {
+    out[i] = omniRound((int32_t)out[i] * factor, 15);
+  }
+}
+
+#endif
@@ -1,4 +1,7 @@
 import sensor, image, time, math
+import lab_calibration
+import motion_proposals
+import frame_profile
 from pyb import UART, LED, Pin
 
 # Initialize communication
@@ -48,6 +51,17 @@ sensor.set_auto_whitebal(False)      # Disable auto white balance
 sensor.set_contrast(2)
 sensor.set_auto_exposure(False, exposure_us=2000)  # try values between 20000–40000µs
 
+# Colour calibration: hold the goal (or ball) in the middle of the view and
+# host/lab_thresholds.py turns the CAL lines into a threshold tuple. LAB
+# percentiles of the centre box are summed over CALIBRATION_EVERY frames
+# instead of printing one pixel every frame.
+CALIBRATION_MODE = False
+CALIBRATION_EVERY = 30
+CALIBRATION_BOX = 20
+calibrator = lab_calibration.LabCalibrator(
+    [("goal", [(320 // 2 - CALIBRATION_BOX // 2, 240 // 2 - CALIBRATION_BOX // 2,
+                CALIBRATION_BOX, CALIBRATION_BOX)])], CALIBRATION_EVERY)
+
 # Variables for tracking
 last_ball_time = 0
 last_ball_x = 0
@@ -59,6 +73,18 @@ last_goal = None
 goal_confidence = 0
 goal_consecutive_frames = 0
 
+# Motion-cued ball proposals: the loose ball threshold matches lots of dark
+# clutter, so candidates are ranked by the motion around them (robot rotation
+# compensated) and only the best BALL_PROPOSALS are shape scored. Off until it
+# wins on host/bench_proposals.py: there the motion map costs ~1 ms a frame
+# to save ~0.03 ms of scoring, and picks the true ball in 32 of 90 frames
+USE_MOTION_PROPOSALS = False
+BALL_PROPOSALS = 2
+PROPOSAL_REPORT_EVERY = 100  # Frames between PROPOSE/LATH prints, 0 = never
+proposals = motion_proposals.MotionMap(320, 240)
+ball_time = frame_profile.LatencyHistogram("ball", 200, 100)  # Motion map plus ball search, us
+frame_count = 0
+
 # Constants for size estimation
 BALL_DIAMETER = 4.3     # Standard RoboCup Junior ball diameter in cm
 
@@ -69,6 +95,7 @@ def find_reflective_sphere(img, threshold, pixels_min=10, area_min=20):
     max_score = 0
 
     # Find all potential ball blobs - use lower merge threshold for reflective objects
+    candidates = []
     for blob in img.find_blobs(threshold, pixels_threshold=pixels_min,
                               area_threshold=area_min, merge=True, margin=10):
         # Skip very large blobs - they're probably not the ball
@@ -79,6 +106,13 @@ def find_reflective_sphere(img, threshold, pixels_min=10, area_min=20):
         if blob.x() == 0 or blob.y() == 0 or blob.x() + blob.w() == img.width() or blob.y() + blob.h() == img.height():
             continue
 
+        candidates.append(blob)
+
+    # Shape score only where something moved (or the ball was last seen)
+    if USE_MOTION_PROPOSALS:
+        candidates = proposals.top(candidates, BALL_PROPOSALS)
+
+    for blob in candidates:
         # Calculate shape-based metrics
         circularity = blob.roundness()
 
@@ -103,6 +137,8 @@ def find_reflective_sphere(img, threshold, pixels_min=10, area_min=20):
             best_ball = blob
             ball_confidence = int(shape_score * 100)
 
+    if best_ball is not None and USE_MOTION_PROPOSALS:
+        proposals.seen(best_ball)
     return best_ball
 
 # IMPROVED: Goal blob detection function prioritizing larger objects
@@ -273,15 +309,25 @@ while True:
     clock.tick()
     img = sensor.snapshot()
 
-    r, g, b = img.get_pixel(img.width()//2, img.height()//2)
-    L, A, B = image.rgb_to_lab(r, g, b)
-    print("Goal LAB:", (L, A, B))
+    if CALIBRATION_MODE and calibrator.add(img):
+        for line in calibrator.summary():
+            print(line)
 
     # Light denoising
     img.mean(1)
 
     # --- Highly Reflective Sphere Detection ---
+    frame_count += 1
+    ball_start = time.ticks_us()
+    if USE_MOTION_PROPOSALS:
+        proposals.update(img)
     ball = find_reflective_sphere(img, ball_threshold)
+    ball_time.add(time.ticks_diff(time.ticks_us(), ball_start))
+    if PROPOSAL_REPORT_EVERY and frame_count % PROPOSAL_REPORT_EVERY == 0:
+        if USE_MOTION_PROPOSALS:
+            print(proposals.report())
+        print(ball_time.summary())
+        ball_time.reset()
     if ball:
         red_led.on()
 
@@ -0,0 +1,131 @@
+import math
+from array import array
+
+from ring_goal_detector import CLASS_WHITE, CLASS_TURF
+
+# Sparse radial scans of the mirror ring. Instead of thresholding the whole
+# image we read pixels along a fixed set of precomputed rays from
+# MIRROR_OUTER_RADIUS in to MIRROR_INNER_RADIUS and classify them with the
+# same RGB565 lookup table as the goal histogram. 64 rays x 40 samples is
+# about 2,500 pixel reads per frame, shared by the field line detector and the
+# obstacle free-space profile.
+#
+# Near and far follow estimate_real_distance(): the outer mirror edge is the
+# ground closest to the robot and the inner edge the farthest, so rays run
+# from near to far and the nearest hit is the one with the largest radius.
+
+RAY_COUNT = 64           # Rays around the ring
+RAY_STEP = 2             # Pixels between samples along a ray
+MIN_LINE_RUN = 2         # Consecutive white samples that make a line
+MIN_OBSTACLE_RUN = 2     # Consecutive non-turf, non-line samples that make an obstacle
+NO_HIT = 0               # Hit radius reported for rays that found nothing
+
+def build_rays(center_x, center_y, inner_radius, outer_radius, width, height,
+               ray_count=RAY_COUNT, step=RAY_STEP):
+    """Precompute the sample points of every ray.
+
+    Returns (bearings, offsets, xs, ys, radii): ray i samples
+    xs/ys/radii[offsets[i]:offsets[i + 1]], ordered from the outer radius
+    inward (near to far). Samples outside the width x height image are dropped.
+    """
+    bearings = array('f')
+    offsets = array('H', [0])
+    xs = array('H')
+    ys = array('H')
+    radii = array('B')
+    for i in range(ray_count):
+        bearing = i * 360.0 / ray_count
+        c = math.cos(math.radians(bearing))
+        s = math.sin(math.radians(bearing))
+        for r in range(outer_radius, inner_radius - 1, -step):
+            x = int(center_x + r * c + 0.5)
+            y = int(center_y + r * s + 0.5)
+            if 0 <= x < width and 0 <= y < height:
+                xs.append(x)
+                ys.append(y)
+                radii.append(min(255, r))
+        bearings.append(bearing)
+        offsets.append(len(xs))
+    return bearings, offsets, xs, ys, radii
+
+def scan_lines(img, rays, lut, hits=None, min_run=MIN_LINE_RUN):
+    """Radius of the nearest white field line along each ray (NO_HIT if none).
+
+    Reads each ray from near to far and stops at the first run of min_run
+    white samples, so most rays cost far fewer reads than their length. The
+    hit is the run's first (nearest) sample.
+    """
+    bearings, offsets, xs, ys, radii = rays
+    if hits is None:
+        hits = array('B', [NO_HIT] * len(bearings))
+    get_pixel = img.get_pixel
+    for i in range(len(bearings)):
+        hits[i] = NO_HIT
+        run = 0
+        for j in range(offsets[i], offsets[i + 1]):
+            if lut[get_pixel(xs[j], ys[j], False)] == CLASS_WHITE:
+                run += 1
+                if run >= min_run:
+                    hits[i] = radii[j - min_run + 1]
+                    break
+            else:
+                run = 0
+    return hits
+
+def scan_rays(img, rays, lut, line_hits, obstacle_hits,
+              min_line_run=MIN_LINE_RUN, min_obstacle_run=MIN_OBSTACLE_RUN):
+    """Field lines and obstacles in one pass over the rays.
+
+    Each ray is read from near to far (outer radius inward), noting its
+    nearest line, until its nearest obstacle (anything that is neither turf
+    nor line: robots, goals, the ball, the world outside the field) since
+    nothing behind it is visible, so the reads never exceed the ray table
+    size. Fills line_hits and obstacle_hits with hit radii (NO_HIT if none)
+    and returns the number of pixels read.
+    """
+    bearings, offsets, xs, ys, radii = rays
+    get_pixel = img.get_pixel
+    reads = 0
+    for i in range(len(bearings)):
+        line_hits[i] = NO_HIT
+        obstacle_hits[i] = NO_HIT
+        line_run = 0
+        obstacle_run = 0
+        for j in range(offsets[i], offsets[i + 1]):
+            cls = lut[get_pixel(xs[j], ys[j], False)]
+            reads += 1
+            if cls == CLASS_WHITE:
+                obstacle_run = 0
+                line_run += 1
+                if line_run >= min_line_run and line_hits[i] == NO_HIT:
+                    line_hits[i] = radii[j - min_line_run + 1]
+            elif cls == CLASS_TURF:
+                line_run = 0
+                obstacle_run = 0
+            else:
+                line_run = 0
+                obstacle_run += 1
+                if obstacle_run >= min_obstacle_run:
+                    obstacle_hits[i] = radii[j - min_obstacle_run + 1]
+                    break  # Nothing past an obstacle is visible to us
+    return reads
+
+def nearest_hit(rays, hits):
+    """(bearing, radius) of the hit nearest the robot (largest radius), or None.
+
+    A straight line hits several neighbouring rays at the same radius, so
+    the bearing is the circular mean of all rays tied for the nearest hit.
+    """
+    best = NO_HIT
+    for h in hits:
+        if h > best:   # NO_HIT is 0
+            best = h
+    if best == NO_HIT:
+        return None
+    sx = sy = 0.0
+    bearings = rays[0]
+    for i in range(len(hits)):
+        if hits[i] == best:
+            sx += math.cos(math.radians(bearings[i]))
+            sy += math.sin(math.radians(bearings[i]))
+    return (math.degrees(math.atan2(sy, sx)) + 360) % 360, best
@@ -1,5 +1,6 @@
 import sensor, image, time, math
 from pyb import UART
+from top_candidates import TopK, FrameBudget
 
 # — Color thresholds (LAB) —
 ORANGE_THRESHOLDS = [
@@ -14,6 +15,13 @@ BLUE_THRESHOLDS = [
     (10,  22, -128, 127,  -50,  -8)   # dark blue
 ]
 
+# — Candidate caps (top_candidates.py) —
+# The controller keeps only the last BALL line, and each one takes ~15 ms at
+# 9600 baud, so only the biggest orange blobs are drawn and sent
+BALL_TOP_K = 1
+CANDIDATE_BUDGET_US = 30000  # Drawing and sending per frame, 0 for no limit
+CAP_REPORT_EVERY = 100       # Print TOPK/BUDGET lines every this many frames, 0 = never
+
 # — Camera setup —
 sensor.reset()
 sensor.set_pixformat(sensor.RGB565)
@@ -26,15 +34,30 @@ sensor.set_auto_exposure(True)
 # — UART setup (Arduino link at 9600 baud) —
 uart = UART(3, 9600, timeout_char=1000)
 
+def blob_pixels(b):
+    return b.pixels()
+
+ball_top = TopK("ball", BALL_TOP_K)
+ball_candidates = []
+budget = FrameBudget(CANDIDATE_BUDGET_US)
+frame_count = 0
+
 clock = time.clock()
 while True:
     clock.tick()
     img = sensor.snapshot()
     cx, cy = img.width()//2, img.height()//2
+    frame_count += 1
 
-    # ORANGE blobs → send BALL info
+    # ORANGE blobs → send BALL info for the biggest few only. The budget
+    # starts after find_blobs, and the biggest blob is always sent
     orange_blobs = img.find_blobs(ORANGE_THRESHOLDS, pixels_threshold=5, area_threshold=5, merge=True)
-    for b in orange_blobs:
+    budget.start()
+    ball_top.select(orange_blobs, blob_pixels, ball_candidates)
+    for i in range(len(ball_candidates)):
+        if i and not budget.has_time(len(ball_candidates) - i):
+            break
+        b = ball_candidates[i]
         ox, oy = b.cx(), b.cy()
         oa = (math.degrees(math.atan2(oy-cy, ox-cx)) + 360) % 360
 
@@ -44,6 +67,7 @@ while True:
         img.draw_rectangle(b.rect(), color=(255,128,0), thickness=2)
         img.draw_cross(ox, oy, color=(255,128,0))
         img.draw_string(ox+5, oy+5, "O:{:.0f}".format(oa), color=(255,128,0))
+    budget.finish()
 
     # YELLOW blobs → just draw (optional)
     yellow_blobs = img.find_blobs(YELLOW_THRESHOLDS, pixels_threshold=50, area_threshold=100, merge=True)
@@ -77,3 +101,6 @@ while True:
         clock.fps()
        
     ))
+    if CAP_REPORT_EVERY and frame_count % CAP_REPORT_EVERY == 0:
+        print(ball_top.report())
+        print(budget.report())
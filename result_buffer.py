@@ -0,0 +1,189 @@
+import gc
+from array import array
+
+# Allocation-free result path for the OpenMV scripts. Detections go into
+# preallocated integer slots (values in tenths) instead of a fresh dict per
+# frame, and the controller line is formatted digit by digit into one
+# bytearray, so filling, formatting and sending a frame's results does not
+# touch the MicroPython heap once it has warmed up. AllocCounter measures
+# that with gc.mem_free().
+#
+# The line is the same one mainNationals has always sent:
+#   "frame":{"seq":1,"t":2,"proc":3} "ball":{...} "yellow_goal":{...} "blue_goal":{...} "line":{...} ["free":{...}]
+
+BALL = 0
+YELLOW = 1
+BLUE = 2
+LINE = 3
+TARGETS = 4
+
+# Slots of one target
+FOUND = 0
+ANGLE = 1       # Tenths of a degree
+DISTANCE = 2    # Tenths of a cm
+EXTRA = 3       # Ball confidence or goal width, tenths
+AGE = 4         # Goals: frames since the search ran
+SLOTS = 5
+
+INF = 0x3FFFFFFF    # Sent as inf
+NONE = -0x3FFFFFFF  # Field left out
+
+def tenths(value):
+    """Float to the integer slot representation"""
+    if value is None:
+        return NONE
+    if value != value or value >= 1e8 or value <= -1e8:
+        return INF
+    return round(value * 10)
+
+class Results:
+    def __init__(self, free_size=64):
+        self.values = array('i', [0] * (TARGETS * SLOTS))
+        self.free = bytearray(free_size)
+        self.free_len = 0
+        self.seq = 0
+        self.capture_ms = 0
+        self.capture_us = 0  # Capture to send latency
+
+    def clear(self, target):
+        base = target * SLOTS
+        for i in range(SLOTS):
+            self.values[base + i] = 0
+
+    def set(self, target, angle, distance, extra=None):
+        base = target * SLOTS
+        self.values[base + FOUND] = 1
+        self.values[base + ANGLE] = tenths(angle)
+        self.values[base + DISTANCE] = tenths(distance)
+        self.values[base + EXTRA] = tenths(extra)
+
+    def put(self, target, slot, value):
+        self.values[target * SLOTS + slot] = value
+
+    def found(self, target):
+        return self.values[target * SLOTS + FOUND] != 0
+
+    def get(self, target, slot):
+        return self.values[target * SLOTS + slot]
+
+class MessageWriter:
+    def __init__(self, size=512):
+        self.buf = bytearray(size)
+        self.n = 0
+        # One memoryview per line length, made the first time that length occurs
+        self.views = [None] * (size + 1)
+
+    def text(self, data):
+        buf = self.buf
+        n = self.n
+        for i in range(len(data)):
+            buf[n + i] = data[i]
+        self.n = n + len(data)
+
+    def integer(self, value):
+        buf = self.buf
+        if value < 0:
+            buf[self.n] = 45  # '-'
+            self.n += 1
+            value = -value
+        div = 1
+        while div * 10 <= value:
+            div *= 10
+        while div:
+            buf[self.n] = 48 + value // div
+            self.n += 1
+            value %= div
+            div //= 10
+
+    def tenths(self, value):
+        """A slot value as a number with one decimal, like '%.1f'"""
+        if value == INF:
+            self.text(b"inf")
+            return
+        if value < 0:
+            self.buf[self.n] = 45
+            self.n += 1
+            value = -value
+        self.integer(value // 10)
+        self.buf[self.n] = 46  # '.'
+        self.buf[self.n + 1] = 48 + value % 10
+        self.n += 2
+
+    def view(self):
+        """The formatted line, without copying"""
+        v = self.views[self.n]
+        if v is None:
+            v = memoryview(self.buf)[:self.n]
+            self.views[self.n] = v
+        return v
+
+_SECTIONS = ((BALL, b' "ball":{'), (YELLOW, b' "yellow_goal":{'), (BLUE, b' "blue_goal":{'), (LINE, b' "line":{'))
+
+def format_message(results, out, proc_ms, cm_per_char):
+    """Write the controller line for results into out, newline included"""
+    out.n = 0
+    out.text(b'"frame":{"seq":')
+    out.integer(results.seq)
+    out.text(b',"t":')
+    out.integer(results.capture_ms)
+    out.text(b',"proc":')
+    out.integer(proc_ms)
+    out.text(b'}')
+    for target, name in _SECTIONS:
+        out.text(name)
+        if not results.found(target):
+            out.text(b'"found":false}')
+            continue
+        out.text(b'"found":true,"angle":')
+        out.tenths(results.get(target, ANGLE))
+        out.text(b',"distance":')
+        out.tenths(results.get(target, DISTANCE))
+        extra = results.get(target, EXTRA)
+        if target == BALL:
+            out.text(b',"confidence":')
+            out.tenths(extra)
+        elif target != LINE:
+            if extra != NONE:
+                out.text(b',"width":')
+                out.tenths(extra)
+            out.text(b',"age":')
+            out.integer(results.get(target, AGE))
+        out.text(b'}')
+    if results.free_len:
+        out.text(b' "free":{"cm_per_char":')
+        out.integer(cm_per_char)
+        out.text(b',"profile":"')
+        for i in range(results.free_len):
+            out.buf[out.n + i] = results.free[i]
+        out.n += results.free_len
+        out.text(b'"}')
+    out.text(b'\n')
+
+class AllocCounter:
+    def __init__(self):
+        # frames, frames that allocated, bytes, most bytes in one frame, frames a collection spoiled, mem_free at start
+        self.stats = array('i', [0] * 6)
+
+    def start(self):
+        self.stats[5] = gc.mem_free()
+
+    def stop(self):
+        used = self.stats[5] - gc.mem_free()
+        s = self.stats
+        if used < 0:
+            s[4] += 1  # A collection ran in between, nothing to learn from this frame
+            return
+        s[0] += 1
+        if used:
+            s[1] += 1
+            s[2] += used
+            if used > s[3]:
+                s[3] = used
+
+    def report(self, name):
+        """ALLOC,name,frames,frames that allocated,mean bytes,max bytes,spoiled frames; then start over"""
+        s = self.stats
+        line = "ALLOC,%s,%d,%d,%d,%d,%d" % (name, s[0], s[1], s[2] // s[0] if s[0] else 0, s[3], s[4])
+        for i in range(5):
+            s[i] = 0
+        return line
@@ -0,0 +1,223 @@
+import math
+import struct
+from array import array
+
+# Angular colour histogram goal detector for the conical mirror setup.
+# A goal shows up as an arc of yellow or blue in the mirror ring, so instead of
+# running find_blobs with three threshold boxes per goal we walk the ring pixels
+# once, classify each pixel with a lookup table and count it into a bearing bin.
+# Works on the OpenMV (MicroPython) and on the host emulator (CPython).
+#
+# The lookup table takes 64K LAB conversions to build, which is slow at boot,
+# so it can be saved to flash (host/build_class_lut.py, or the camera after
+# its first build) and loaded instead:
+#
+# File: LUT_HEADER (magic, thresholds_key of the boxes it was built from),
+# then the 65536 class bytes.
+
+CLASS_NONE = 0
+CLASS_YELLOW = 1
+CLASS_BLUE = 2
+CLASS_WHITE = 3          # Field lines, used by radial_scan
+CLASS_TURF = 4           # Free field, used by radial_scan
+
+GOAL_BINS = 360          # Bearing bins around the ring (360 = 1 degree, 720 = 0.5 degree)
+RING_STEP = 2            # Sample every Nth pixel in x and y to bound the pixel reads
+MIN_BIN_COUNT = 2        # Pixels needed in a bin to count it as goal coloured
+MAX_GAP_BINS = 3         # Bins allowed to be empty inside one goal arc
+MIN_ARC_BINS = 4         # Shortest arc accepted as a goal
+
+LUT_MAGIC = b"CLUT"
+LUT_HEADER = "<4sI"      # magic, thresholds key
+
+def rgb565_to_rgb(value):
+    """Expand a raw RGB565 pixel value to an 8-bit (r, g, b) tuple"""
+    r = (value >> 11) & 0x1F
+    g = (value >> 5) & 0x3F
+    b = value & 0x1F
+    return (r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)
+
+def in_lab_threshold(lab, threshold):
+    """Check a LAB triple against one (Lmin, Lmax, Amin, Amax, Bmin, Bmax) box"""
+    return (threshold[0] <= lab[0] <= threshold[1] and
+            threshold[2] <= lab[1] <= threshold[3] and
+            threshold[4] <= lab[2] <= threshold[5])
+
+def build_class_lut(rgb_to_lab, yellow_thresholds, blue_thresholds, white_thresholds=(), turf_thresholds=()):
+    """Build a 64K table mapping every RGB565 value to a colour class.
+
+    Done once at startup so the per-frame pass is a table lookup instead of a
+    LAB conversion per pixel. rgb_to_lab is image.rgb_to_lab on the camera.
+    Earlier classes win where threshold boxes overlap.
+    """
+    classes = ((CLASS_YELLOW, yellow_thresholds), (CLASS_BLUE, blue_thresholds),
+               (CLASS_WHITE, white_thresholds), (CLASS_TURF, turf_thresholds))
+    lut = bytearray(65536)
+    for value in range(65536):
+        lab = rgb_to_lab(rgb565_to_rgb(value))
+        for cls, thresholds in classes:
+            for t in thresholds:
+                if in_lab_threshold(lab, t):
+                    lut[value] = cls
+                    break
+            if lut[value]:
+                break
+    return lut
+
+def thresholds_key(*groups):
+    """Checksum of the threshold boxes a table was built from, the same on the camera and the host"""
+    key = 0
+    for thresholds in groups:
+        key = (key * 31 + 0x55) & 0xFFFFFFFF
+        for t in thresholds:
+            for v in t:
+                key = (key * 31 + v + 128) & 0xFFFFFFFF
+    return key
+
+def save_class_lut(lut, key, path):
+    with open(path, "wb") as f:
+        f.write(struct.pack(LUT_HEADER, LUT_MAGIC, key))
+        f.write(lut)
+
+def load_class_lut(path, key):
+    """The table saved at path, None if there is none or it was built from other boxes"""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(struct.calcsize(LUT_HEADER))
+            if len(header) != struct.calcsize(LUT_HEADER):
+                return None
+            magic, saved_key = struct.unpack(LUT_HEADER, header)
+            if magic != LUT_MAGIC or saved_key != key:
+                return None
+            lut = bytearray(65536)
+            if f.readinto(lut) != len(lut):
+                return None
+    except OSError:
+        return None
+    return lut
+
+def build_bearing_map(center_x, center_y, inner_radius, outer_radius, bins=GOAL_BINS, step=RING_STEP):
+    """Precompute the ring pixels with their bearing bin and radius.
+
+    Returns (xs, ys, bin_index, radius) arrays of equal length. Bearings use the
+    same convention as find_objects(): atan2(y - cy, x - cx) in degrees, 0-360.
+    """
+    xs = array('H')
+    ys = array('H')
+    bin_index = array('H')
+    radius = array('B')
+    inner_sq = inner_radius * inner_radius
+    outer_sq = outer_radius * outer_radius
+    for y in range(max(0, center_y - outer_radius), center_y + outer_radius + 1, step):
+        dy = y - center_y
+        for x in range(max(0, center_x - outer_radius), center_x + outer_radius + 1, step):
+            dx = x - center_x
+            dist_sq = dx * dx + dy * dy
+            if dist_sq < inner_sq or dist_sq > outer_sq:
+                continue
+            angle = (math.degrees(math.atan2(dy, dx)) + 360) % 360
+            xs.append(x)
+            ys.append(y)
+            bin_index.append(int(angle * bins / 360) % bins)
+            radius.append(min(255, int(math.sqrt(dist_sq))))
+    return xs, ys, bin_index, radius
+
+def clip_bearing_map(bearing_map, width, height):
+    """Drop map entries that fall outside a width x height image"""
+    xs, ys, bin_index, radius = bearing_map
+    out = (array('H'), array('H'), array('H'), array('B'))
+    for i in range(len(xs)):
+        if xs[i] < width and ys[i] < height:
+            out[0].append(xs[i])
+            out[1].append(ys[i])
+            out[2].append(bin_index[i])
+            out[3].append(radius[i])
+    return out
+
+def new_histograms(bins=GOAL_BINS):
+    """Histogram arrays for goal_histograms to fill, allocated once and reused every frame"""
+    return ((array('H', [0] * bins), array('L', [0] * bins)),
+            (array('H', [0] * bins), array('L', [0] * bins)))
+
+def goal_histograms(img, bearing_map, lut, bins=GOAL_BINS, out=None):
+    """One pass over the ring: per-bin pixel counts and radius sums for both goals.
+
+    Fills out (from new_histograms) when given, else allocates new arrays.
+    """
+    xs, ys, bin_index, radius = bearing_map
+    if out is None:
+        out = new_histograms(bins)
+    (yellow_count, yellow_radius), (blue_count, blue_radius) = out
+    for b in range(bins):
+        yellow_count[b] = 0
+        yellow_radius[b] = 0
+        blue_count[b] = 0
+        blue_radius[b] = 0
+    get_pixel = img.get_pixel
+    for i in range(len(xs)):
+        cls = lut[get_pixel(xs[i], ys[i], False)]
+        if cls == CLASS_YELLOW:
+            b = bin_index[i]
+            yellow_count[b] += 1
+            yellow_radius[b] += radius[i]
+        elif cls == CLASS_BLUE:
+            b = bin_index[i]
+            blue_count[b] += 1
+            blue_radius[b] += radius[i]
+    return out
+
+def find_goal_arc(counts, radius_sums, bins=GOAL_BINS, min_count=MIN_BIN_COUNT,
+                  max_gap=MAX_GAP_BINS, min_arc=MIN_ARC_BINS):
+    """Find the strongest goal arc in a bearing histogram.
+
+    Returns None or a dict with the arc 'angle' (center), 'left' and 'right'
+    edge bearings, angular 'width', total 'pixels' and mean 'radius'. Arcs are
+    allowed to wrap through 0 degrees.
+    """
+    # Start scanning just after an empty bin so a wrapping arc isn't split in two
+    start = 0
+    for i in range(bins):
+        if counts[i] < min_count:
+            start = i
+            break
+    else:
+        return None  # Every bin is goal coloured, nothing sensible to report
+
+    best = None
+    run_start = -1
+    run_end = -1
+    run_pixels = 0
+    run_radius = 0
+    gap = 0
+    for k in range(1, bins + 1):
+        i = (start + k) % bins
+        if counts[i] >= min_count:
+            if run_start < 0:
+                run_start = k
+                run_pixels = 0
+                run_radius = 0
+            run_end = k
+            run_pixels += counts[i]
+            run_radius += radius_sums[i]
+            gap = 0
+        elif run_start >= 0:
+            gap += 1
+            if gap > max_gap or k == bins:
+                if run_end - run_start + 1 >= min_arc and (best is None or run_pixels > best[2]):
+                    best = (run_start, run_end, run_pixels, run_radius)
+                run_start = -1
+    if best is None:
+        return None
+
+    deg_per_bin = 360.0 / bins
+    left = ((start + best[0]) % bins) * deg_per_bin
+    width = (best[1] - best[0] + 1) * deg_per_bin
+    right = (left + width) % 360
+    return {
+        'angle': (left + width / 2) % 360,
+        'left': left,
+        'right': right,
+        'width': width,
+        'pixels': best[2],
+        'radius': best[3] / best[2]
+    }
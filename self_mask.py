@@ -0,0 +1,254 @@
+import struct
+from array import array
+
+from ring_goal_detector import CLASS_TURF
+
+# Static self-mask of the robot's own body in the mirror. The chassis,
+# wheels, screw terminals and camera mount are always at the same pixels, so
+# any threshold that matches their colour finds them every frame (the screw
+# terminals mistaken for goals in opencv2.py). SelfMaskLearner samples a
+# grid of cells while the robot is driven and turned around the field and
+# keeps the cells whose colour never changed in frames where the scene
+# moved; cells of turf colour are left out, since open carpet can look the
+# same from everywhere. The result is saved to flash and loaded at startup,
+# and the scripts drop the masked cells from their sample tables and clear
+# them (with the area outside the mirror ring) before thresholding.
+#
+# File: MASK_HEADER, then one bit per cell, row by row, least significant
+# bit first. Cells are in full-frame coordinates, so the mask survives
+# sensor windowing.
+
+MASK_MAGIC = b"SMSK"
+MASK_HEADER = "<4sHHB"   # magic, frame width, frame height, cell size
+CELL = 4                 # Cell size in pixels, one sample per cell
+TOLERANCE = 6            # Summed channel change (5-bit units, green halved) that is still the same colour
+MIN_MOTION = 0.05        # Fraction of cells that must change since the last frame for it to count
+GROW = 1                 # Cells added around the static ones
+
+def color_diff(a, b):
+    """Summed channel difference of two raw RGB565 values, green halved to 5 bits"""
+    return (abs((a >> 11) - (b >> 11)) + (abs(((a >> 5) & 0x3F) - ((b >> 5) & 0x3F)) >> 1) +
+            abs((a & 0x1F) - (b & 0x1F)))
+
+class SelfMask:
+    def __init__(self, width, height, cell=CELL, bits=None):
+        self.width = width
+        self.height = height
+        self.cell = cell
+        self.cols = (width + cell - 1) // cell
+        self.rows = (height + cell - 1) // cell
+        self.bits = bits if bits is not None else bytearray((self.cols * self.rows + 7) // 8)
+
+    def set(self, col, row):
+        i = row * self.cols + col
+        self.bits[i >> 3] |= 1 << (i & 7)
+
+    def cell_masked(self, col, row):
+        i = row * self.cols + col
+        return (self.bits[i >> 3] >> (i & 7)) & 1
+
+    def masked(self, x, y):
+        """Whether full-frame pixel (x, y) belongs to the robot"""
+        if x < 0 or y < 0 or x >= self.width or y >= self.height:
+            return 0
+        return self.cell_masked(x // self.cell, y // self.cell)
+
+    def count(self):
+        n = 0
+        for b in self.bits:
+            while b:
+                n += b & 1
+                b >>= 1
+        return n
+
+    def rects(self, offset_x=0, offset_y=0):
+        """Masked cells as (x, y, w, h) in image coordinates of a window at offset"""
+        cell = self.cell
+        for row in range(self.rows):
+            for col in range(self.cols):
+                if self.cell_masked(col, row):
+                    yield (col * cell - offset_x, row * cell - offset_y, cell, cell)
+
+    def mask_bearing_map(self, bearing_map, offset_x=0, offset_y=0):
+        """Drop the goal histogram's ring pixels that belong to the robot"""
+        xs, ys, bin_index, radius = bearing_map
+        out = (array('H'), array('H'), array('H'), array('B'))
+        for i in range(len(xs)):
+            if not self.masked(xs[i] + offset_x, ys[i] + offset_y):
+                out[0].append(xs[i])
+                out[1].append(ys[i])
+                out[2].append(bin_index[i])
+                out[3].append(radius[i])
+        return out
+
+    def mask_rays(self, rays, offset_x=0, offset_y=0):
+        """Drop radial_scan ray samples that belong to the robot"""
+        bearings, offsets, xs, ys, radii = rays
+        out_offsets = array('H', [0])
+        out_xs = array('H')
+        out_ys = array('H')
+        out_radii = array('B')
+        for i in range(len(bearings)):
+            for j in range(offsets[i], offsets[i + 1]):
+                if not self.masked(xs[j] + offset_x, ys[j] + offset_y):
+                    out_xs.append(xs[j])
+                    out_ys.append(ys[j])
+                    out_radii.append(radii[j])
+            out_offsets.append(len(out_xs))
+        return bearings, out_offsets, out_xs, out_ys, out_radii
+
+    def mask_blocks(self, blocks, offset_x=0, offset_y=0):
+        """Drop change_detector block samples that belong to the robot, and blocks left empty"""
+        rects, offsets, xs, ys = blocks
+        out_rects = array('H')
+        out_offsets = array('H', [0])
+        out_xs = array('H')
+        out_ys = array('H')
+        for i in range(len(offsets) - 1):
+            n = len(out_xs)
+            for j in range(offsets[i], offsets[i + 1]):
+                if not self.masked(xs[j] + offset_x, ys[j] + offset_y):
+                    out_xs.append(xs[j])
+                    out_ys.append(ys[j])
+            if len(out_xs) > n:
+                out_rects.extend(rects[4 * i:4 * i + 4])
+                out_offsets.append(len(out_xs))
+        return out_rects, out_offsets, out_xs, out_ys
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(struct.pack(MASK_HEADER, MASK_MAGIC, self.width, self.height, self.cell))
+            f.write(self.bits)
+
+    @classmethod
+    def load(cls, path, width, height):
+        """The mask saved at path, None if it is missing, cut short or learned on another frame size"""
+        try:
+            with open(path, "rb") as f:
+                header = f.read(struct.calcsize(MASK_HEADER))
+                if len(header) != struct.calcsize(MASK_HEADER):
+                    return None
+                magic, w, h, cell = struct.unpack(MASK_HEADER, header)
+                if magic != MASK_MAGIC or width != w or height != h or cell == 0:
+                    return None
+                mask = cls(width, height, cell)
+                if f.readinto(mask.bits) != len(mask.bits) or f.read(1):
+                    return None
+        except OSError:
+            return None
+        return mask
+
+class SelfMaskLearner:
+    def __init__(self, width, height, cell=CELL, tolerance=TOLERANCE, min_motion=MIN_MOTION):
+        self.width = width
+        self.height = height
+        self.cell = cell
+        self.cols = (width + cell - 1) // cell
+        self.rows = (height + cell - 1) // cell
+        n = self.cols * self.rows
+        self.reference = array('H', [0] * n)  # First colour seen in each cell
+        self.prev = array('H', [0] * n)
+        self.cur = array('H', [0] * n)
+        self.seen = array('H', [0] * n)       # Counting frames the cell was in view
+        self.sampled = bytearray(n)
+        self.moved = bytearray(n)             # Colour left the reference at some point
+        self.tolerance = tolerance
+        self.min_motion = min_motion
+        self.frames = 0
+        self.counted = 0   # Frames in which the scene moved
+
+    def add(self, img, offset_x=0, offset_y=0):
+        """Sample a frame (a window at offset); returns whether the scene moved enough to count"""
+        cell = self.cell
+        half = cell // 2
+        w = img.width()
+        h = img.height()
+        get_pixel = img.get_pixel
+        cur = self.cur
+        prev = self.prev
+        sampled = self.sampled
+        tol = self.tolerance
+        total = 0
+        changed = 0
+        for row in range(self.rows):
+            y = row * cell + half - offset_y
+            if y < 0 or y >= h:
+                continue
+            i = row * self.cols
+            for col in range(self.cols):
+                x = col * cell + half - offset_x
+                if 0 <= x < w:
+                    v = get_pixel(x, y, False)
+                    cur[i + col] = v
+                    if sampled[i + col]:
+                        total += 1
+                        if color_diff(v, prev[i + col]) >= tol:
+                            changed += 1
+        self.frames += 1
+        counts = total > 0 and changed >= total * self.min_motion
+        if counts:
+            self.counted += 1
+        ref = self.reference
+        seen = self.seen
+        moved = self.moved
+        for row in range(self.rows):
+            y = row * cell + half - offset_y
+            if y < 0 or y >= h:
+                continue
+            i = row * self.cols
+            for col in range(self.cols):
+                x = col * cell + half - offset_x
+                if 0 <= x < w:
+                    k = i + col
+                    v = cur[k]
+                    if not sampled[k]:
+                        ref[k] = v
+                        sampled[k] = 1
+                    elif counts:
+                        if seen[k] < 0xFFFF:
+                            seen[k] += 1
+                        if not moved[k] and color_diff(v, ref[k]) >= tol:
+                            moved[k] = 1
+                    prev[k] = v
+        return counts
+
+    def build(self, lut=None, exclude=(CLASS_TURF,), grow=GROW):
+        """SelfMask of the cells that never changed in the counting frames.
+
+        lut is the RGB565 colour class table; cells whose colour is in
+        exclude are never masked. Half the counting frames must
+        have seen a cell for it to be judged.
+
+        Slivers of a body part in the cells around it can still pass
+        find_blobs' pixel threshold, so the mask grows by grow cells around
+        static cells of a colour the detectors look for (a class in lut;
+        without lut every static cell grows). Plain body colours don't
+        grow: around the camera mount and the dark edge of the frame the
+        extra cells would only be field.
+        """
+        mask = SelfMask(self.width, self.height, self.cell)
+        need = max(1, self.counted // 2)
+        cols = self.cols
+        static = bytearray(cols * self.rows)
+        for k in range(len(static)):
+            if self.seen[k] >= need and not self.moved[k]:
+                if lut is None or lut[self.reference[k]] not in exclude:
+                    static[k] = 1
+                    mask.set(k % cols, k // cols)
+        for row in range(self.rows):
+            for col in range(cols):
+                k = row * cols + col
+                if not static[k] or (lut is not None and not lut[self.reference[k]]):
+                    continue
+                for r in range(max(0, row - grow), min(self.rows, row + grow + 1)):
+                    for c in range(max(0, col - grow), min(cols, col + grow + 1)):
+                        mask.set(c, r)
+        return mask
+
+    def progress(self):
+        """SELFMASK,frames,counting frames,cells unchanged so far"""
+        unchanged = 0
+        for k in range(len(self.moved)):
+            if self.sampled[k] and not self.moved[k] and self.seen[k]:
+                unchanged += 1
+        return "SELFMASK,%d,%d,%d" % (self.frames, self.counted, unchanged)
@@ -0,0 +1,147 @@
+/*
+ * task_scheduler.h
+ *
+ * Description: Fixed-rate cooperative scheduler for the controller sketches.
+ * loop() calls poll(), which runs every task whose period has come round,
+ * in the order they were added (add the most urgent first). Tasks must
+ * return quickly; nothing is preempted.
+ *
+ * Each task counts its runs, deadline misses (finished more than deadlineUs
+ * after its release time), periods it lost because the loop was busy
+ * elsewhere, and its run time and start lateness. poll() also records the
+ * time between loop() passes. printStats() writes it all as CSV lines:
+ *
+ *   TASK,name,runs,misses,skipped,meanUs,maxUs,maxLateUs
+ *   LOOP,passes,meanUs,maxUs
+ *
+ * Only plain C++ and micros() are used, so it builds against the host
+ * Arduino stand-in (host/arduino) as well.
+ */
+
+#ifndef TASK_SCHEDULER_H
+#define TASK_SCHEDULER_H
+
+const int SCHEDULER_MAX_TASKS = 8;
+
+struct ScheduledTask {
+  const char *name;
+  void (*run)();
+  unsigned long periodUs;
+  unsigned long deadlineUs;     // Must finish this long after its release
+  unsigned long releaseUs;      // When the current period started
+  unsigned long runs;
+  unsigned long misses;         // Finished after the deadline
+  unsigned long skipped;        // Whole periods lost to a busy loop
+  unsigned long totalUs;
+  unsigned long maxUs;
+  unsigned long maxLateUs;      // Longest wait between release and start
+};
+
+struct TaskScheduler {
+  ScheduledTask tasks[SCHEDULER_MAX_TASKS];
+  int count;
+  unsigned long passes;         // poll() calls
+  unsigned long lastPollUs;
+  unsigned long loopTotalUs;
+  unsigned long loopMaxUs;
+
+  void begin() {
+    count = 0;
+    resetStats();
+  }
+
+  // Add a task; deadlineUs 0 means the end of its period. Returns its index or -1 if full.
+  int add(const char *name, void (*run)(), unsigned long periodUs, unsigned long deadlineUs = 0) {
+    if (count >= SCHEDULER_MAX_TASKS) return -1;
+    ScheduledTask &t = tasks[count];
+    t.name = name;
+    t.run = run;
+    t.periodUs = periodUs;
+    t.deadlineUs = deadlineUs ? deadlineUs : periodUs;
+    t.releaseUs = micros();
+    return count++;
+  }
+
+  // Release every task now, e.g. at the end of setup()
+  void start() {
+    unsigned long now = micros();
+    for (int i = 0; i < count; i++) tasks[i].releaseUs = now;
+    lastPollUs = now;
+  }
+
+  void resetStats() {
+    for (int i = 0; i < count; i++) {
+      ScheduledTask &t = tasks[i];
+      t.runs = t.misses = t.skipped = t.totalUs = t.maxUs = t.maxLateUs = 0;
+    }
+    passes = 0;
+    loopTotalUs = 0;
+    loopMaxUs = 0;
+    lastPollUs = micros();
+  }
+
+  // Run the tasks that are due; call this from loop() and nothing else
+  void poll() {
+    unsigned long now = micros();
+    if (passes > 0) {
+      unsigned long gap = now - lastPollUs;
+      loopTotalUs += gap;
+      if (gap > loopMaxUs) loopMaxUs = gap;
+    }
+    lastPollUs = now;
+    passes++;
+
+    for (int i = 0; i < count; i++) {
+      ScheduledTask &t = tasks[i];
+      if ((long)(now - t.releaseUs) < 0) continue;
+
+      unsigned long late = now - t.releaseUs;
+      if (late > t.maxLateUs) t.maxLateUs = late;
+      t.run();
+      unsigned long end = micros();
+      unsigned long took = end - now;
+      t.runs++;
+      t.totalUs += took;
+      if (took > t.maxUs) t.maxUs = took;
+      if (end - t.releaseUs > t.deadlineUs) t.misses++;
+
+      // Next release on the fixed grid; periods already over are dropped, not run in a burst
+      t.releaseUs += t.periodUs;
+      if ((long)(end - t.releaseUs) >= (long)t.periodUs) {
+        unsigned long lost = (end - t.releaseUs) / t.periodUs;
+        t.skipped += lost;
+        t.releaseUs += lost * t.periodUs;
+      }
+      now = end;
+    }
+  }
+
+  template <typename Output>
+  void printStats(Output &out) {
+    for (int i = 0; i < count; i++) {
+      ScheduledTask &t = tasks[i];
+      out.print("TASK,");
+      out.print(t.name);
+      out.print(',');
+      out.print(t.runs);
+      out.print(',');
+      out.print(t.misses);
+      out.print(',');
+      out.print(t.skipped);
+      out.print(',');
+      out.print(t.runs ? t.totalUs / t.runs : 0UL);
+      out.print(',');
+      out.print(t.maxUs);
+      out.print(',');
+      out.println(t.maxLateUs);
+    }
+    out.print("LOOP,");
+    out.print(passes);
+    out.print(',');
+    out.print(passes > 1 ? loopTotalUs / (passes - 1) : 0UL);
+    out.print(',');
+    out.println(loopMaxUs);
+  }
+};
+
+#endif
@@ -0,0 +1,134 @@
+from array import array
+
+# Online LAB threshold adaptation. The fixed boxes are widened until they
+# cover every venue's lighting (the four ORANGE_THRESHOLDS boxes), and the
+# wide boxes then let in everything that is vaguely the right colour.
+# ThresholdAdapter starts from those boxes and keeps running LAB percentiles
+# of the pixels of blobs the caller is confident about (a round, tracked
+# ball). Once enough blobs were seen it replaces the boxes with one box
+# around the running percentiles plus a margin (the hull of the boxes would
+# let in more than the boxes themselves), which then moves a few units per
+# update as the percentiles drift, never leaving the hull of the configured boxes (the safe bounds)
+# and never narrower than MIN_SPAN. When no confident blob was seen for
+# LOST_FRAMES frames the box walks back out towards the bounds, so a bad
+# adaptation cannot lock the ball out for good.
+#
+# Every change is returned as one line for the log:
+#
+#   THRESH,name,seq,L_lo,L_hi,A_lo,A_hi,B_lo,B_hi,samples,reason
+#
+# reason is "adapt", "relax" (walking back out) or "reset" (back to the
+# configured boxes). host/threshold_replay.py rebuilds the boxes a recorded
+# run used from these lines.
+
+LOW_PERCENTILE = 0.05
+HIGH_PERCENTILE = 0.95
+ALPHA = 0.1          # Weight of each new blob in the running percentiles
+MARGIN = 6           # LAB units added around the running percentiles
+MIN_SPAN = 12        # Narrowest a box may get in any channel
+STEP = 2             # Most an edge may move per update
+MIN_SAMPLES = 20     # Confident blobs before the first adaptation
+UPDATE_EVERY = 5     # Confident blobs per update after that
+LOST_FRAMES = 90     # Frames without a confident blob before the box relaxes, STEP per frame
+MIN_PIXELS = 30      # Blobs smaller than this are not sampled
+
+def hull(boxes):
+    """Smallest box holding all of boxes"""
+    out = list(boxes[0])
+    for box in boxes[1:]:
+        for i in range(0, 6, 2):
+            out[i] = min(out[i], box[i])
+            out[i + 1] = max(out[i + 1], box[i + 1])
+    return tuple(out)
+
+class ThresholdAdapter:
+    def __init__(self, name, thresholds, bounds=None):
+        """thresholds is the configured list of LAB boxes; bounds defaults to their hull"""
+        self.name = name
+        self.configured = thresholds
+        self.bounds = bounds if bounds is not None else hull(thresholds)
+        self.thresholds = thresholds   # What find_blobs should use now
+        self.box = array('i', self.bounds)
+        self.stats = array('f', self.bounds)   # Running percentiles, same layout as a box
+        self.samples = 0     # Confident blobs seen
+        self.pending = 0     # Confident blobs since the last update
+        self.lost = 0        # Frames since the last confident blob
+        self.changes = 0
+
+    def observe(self, img, blob):
+        """Add the pixels of a confident blob to the running percentiles"""
+        if blob.pixels() < MIN_PIXELS:
+            return
+        hist = img.get_histogram(thresholds=[self.bounds], roi=blob.rect())
+        low = hist.get_percentile(LOW_PERCENTILE)
+        high = hist.get_percentile(HIGH_PERCENTILE)
+        values = (low.l_value(), high.l_value(), low.a_value(), high.a_value(), low.b_value(), high.b_value())
+        stats = self.stats
+        if self.samples == 0:
+            for i in range(6):
+                stats[i] = values[i]
+        else:
+            for i in range(6):
+                stats[i] += ALPHA * (values[i] - stats[i])
+        self.samples += 1
+        self.pending += 1
+        self.lost = 0
+
+    def update(self, seq):
+        """Once per frame: move the box if due; returns a THRESH line when it changed, else None"""
+        if self.pending and self.samples >= MIN_SAMPLES and (self.samples == MIN_SAMPLES or
+                                                            self.pending >= UPDATE_EVERY):
+            self.pending = 0
+            target = self._target()
+            if self.thresholds is self.configured:
+                for i in range(6):
+                    self.box[i] = target[i]
+            return self._move(target, seq, "adapt")
+        self.lost += 1
+        if self.lost >= LOST_FRAMES and self.thresholds is not self.configured:
+            return self._move(self.bounds, seq, "relax")
+        return None
+
+    def _target(self):
+        """Running percentiles plus MARGIN, at least MIN_SPAN wide, inside the bounds"""
+        bounds = self.bounds
+        stats = self.stats
+        target = [0] * 6
+        for i in range(0, 6, 2):
+            lo = int(stats[i]) - MARGIN
+            hi = int(stats[i + 1] + 0.5) + MARGIN
+            short = MIN_SPAN - (hi - lo)
+            if short > 0:
+                lo -= short // 2
+                hi += short - short // 2
+            # Slide a box that sticks out back inside, then clip it
+            if lo < bounds[i]:
+                hi += bounds[i] - lo
+                lo = bounds[i]
+            if hi > bounds[i + 1]:
+                lo -= hi - bounds[i + 1]
+                hi = bounds[i + 1]
+            target[i] = max(lo, bounds[i])
+            target[i + 1] = hi
+        return target
+
+    def _move(self, target, seq, reason):
+        box = self.box
+        moved = False
+        for i in range(6):
+            step = max(-STEP, min(STEP, target[i] - box[i]))
+            if step:
+                box[i] += step
+                moved = True
+        if reason == "adapt" and self.thresholds is self.configured:
+            moved = True   # First box, or the first one after a reset
+        if reason == "relax" and tuple(box) == tuple(self.bounds):
+            # Fully relaxed, back to the configured boxes
+            self.thresholds = self.configured
+            reason = "reset"
+        elif moved:
+            self.thresholds = [tuple(box)]
+        else:
+            return None
+        self.changes += 1
+        return "THRESH,%s,%d,%d,%d,%d,%d,%d,%d,%d,%s" % ((self.name, seq) + tuple(box) + (self.samples, reason))
@@ -0,0 +1,179 @@
+import time
+from array import array
+
+# Bounded candidate extraction. find_blobs returns every blob that passed
+# pixels_threshold, and with a low threshold and sensor noise that can be
+# dozens per frame; the scripts then scored, tracked, drew and sent every one
+# of them (a uart.write per orange blob at 9600 baud stalls the loop for
+# ~15 ms a blob). TopK keeps only the k best blobs of a class by a cheap
+# pre-score (pixels, which find_blobs has already counted) in a fixed-size
+# min-heap, so the expensive work runs on at most k candidates. FrameBudget
+# bounds that work in time: once the frame has used its budget, has_time()
+# says no and the remaining candidates are skipped (the first candidate of a
+# selection is always taken, so a late frame still reports its biggest blob).
+# pause()/resume() keep work that isn't per candidate, like find_blobs, out
+# of the budget. Both count how often their cap was hit:
+#
+#   TOPK,name,frames,offered per frame (tenths),kept per frame (tenths),frames over k
+#   BUDGET,frames,frames over budget,candidates skipped,longest frame us
+
+class TopK:
+    def __init__(self, name, k):
+        self.name = name
+        self.k = k
+        self.scores = array('f', [0.0] * k)
+        self.items = [None] * k
+        self.size = 0
+        # frames, offered, kept, frames over k
+        self.stats = array('i', [0] * 4)
+
+    def clear(self):
+        for i in range(self.size):
+            self.items[i] = None   # Let last frame's blobs go
+        self.size = 0
+
+    def push(self, score, item):
+        """Offer one item; returns whether it is among the k best so far"""
+        scores = self.scores
+        items = self.items
+        if self.size < self.k:
+            # Sift the new leaf up
+            i = self.size
+            self.size += 1
+            while i > 0:
+                parent = (i - 1) >> 1
+                if scores[parent] <= score:
+                    break
+                scores[i] = scores[parent]
+                items[i] = items[parent]
+                i = parent
+            scores[i] = score
+            items[i] = item
+            return True
+        if self.k == 0 or score <= scores[0]:
+            return False
+        self._replace_root(score, item, self.size)
+        return True
+
+    def _replace_root(self, score, item, size):
+        scores = self.scores
+        items = self.items
+        i = 0
+        while True:
+            child = 2 * i + 1
+            if child >= size:
+                break
+            if child + 1 < size and scores[child + 1] < scores[child]:
+                child += 1
+            if scores[child] >= score:
+                break
+            scores[i] = scores[child]
+            items[i] = items[child]
+            i = child
+        scores[i] = score
+        items[i] = item
+
+    def select(self, blobs, prescore, out, budget=None):
+        """The k best of blobs by prescore into out, best first; returns out.
+
+        With a FrameBudget, blobs stop being offered once it runs out.
+        """
+        self.clear()
+        n = len(blobs)
+        for i in range(n):
+            if i and budget is not None and not budget.has_time(n - i):
+                break
+            b = blobs[i]
+            self.push(prescore(b), b)
+        s = self.stats
+        s[0] += 1
+        s[1] += n
+        s[2] += self.size
+        if n > self.k:
+            s[3] += 1
+        # Heap sort in place: popping the smallest to the back leaves them best first
+        size = self.size
+        scores = self.scores
+        items = self.items
+        while size > 1:
+            size -= 1
+            score = scores[size]
+            item = items[size]
+            scores[size] = scores[0]
+            items[size] = items[0]
+            self._replace_root(score, item, size)
+        del out[:]
+        for i in range(self.size):
+            out.append(items[i])
+        return out
+
+    def report(self):
+        """TOPK line for the frames so far, then start over"""
+        s = self.stats
+        n = s[0] if s[0] else 1
+        line = "TOPK,%s,%d,%d,%d,%d" % (self.name, s[0], s[1] * 10 // n, s[2] * 10 // n, s[3])
+        for i in range(4):
+            s[i] = 0
+        return line
+
+class FrameBudget:
+    def __init__(self, budget_us):
+        """budget_us of candidate work per frame, 0 for no limit"""
+        self.budget_us = budget_us
+        self.start_us = 0
+        self.paused_us = 0
+        self.over = False
+        # frames, frames over budget, candidates skipped, longest frame us
+        self.stats = array('i', [0] * 4)
+
+    def start(self):
+        """Call once per frame before the candidate work"""
+        self.start_us = time.ticks_us()
+        self.over = False
+        self.stats[0] += 1
+
+    def finish(self):
+        """Call once per frame after the candidate work"""
+        spent = time.ticks_diff(time.ticks_us(), self.start_us)
+        if spent > self.stats[3]:
+            self.stats[3] = spent
+
+    def pause(self):
+        """Stop charging the frame, e.g. around a find_blobs call"""
+        self.paused_us = time.ticks_us()
+
+    def resume(self):
+        """Charge the frame again; the time since pause() doesn't count"""
+        self.start_us = time.ticks_add(self.start_us, time.ticks_diff(time.ticks_us(), self.paused_us))
+
+    def has_time(self, pending=1):
+        """Whether the next candidate may still be worked on; if not, the pending ones count as skipped"""
+        if not self.budget_us or time.ticks_diff(time.ticks_us(), self.start_us) < self.budget_us:
+            return True
+        if not self.over:
+            self.over = True
+            self.stats[1] += 1
+        self.stats[2] += pending
+        return False
+
+    def best(self, items, score):
+        """Highest scoring of items (best first by a cheap pre-score), scored while there is time"""
+        best = None
+        best_score = 0
+        n = len(items)
+        for i in range(n):
+            if i and not self.has_time(n - i):
+                break
+            s = score(items[i])
+            if best is None or s > best_score:
+                best = items[i]
+                best_score = s
+        return best
+
+    def report(self):
+        """BUDGET line for the frames so far, then start over"""
+        s = self.stats
+        line = "BUDGET,%d,%d,%d,%d" % (s[0], s[1], s[2], s[3])
+        for i in range(4):
+            s[i] = 0
+        return line
@@ -0,0 +1,585 @@
+/*
+ * vision_stream_parser.h
+ *
+ * Description: Incremental parser for the OpenMV -> controller UART link.
+ * Bytes are fed one at a time as they arrive from Serial1; there is no line
+ * buffer, no strstr() and no atof(). Understands both formats we send:
+ *
+ *   mainNationals pseudo-JSON:
+ *     "ball":{"found":true,"angle":12.0,...} "yellow_goal":{...} "blue_goal":{...}
+ *     "line":{...} "free":{"cm_per_char":2,"profile":"..."}
+ *   optionally led by "frame":{"seq":N,"t":captureMs,"proc":ms}
+ *   movetogoal1 CSV, one object per line:
+ *     ball,x,y,xVel,yVel,theta,confidence / blue,dist,theta,w,h,confidence /
+ *     yellow,dist,theta,w,h / no_ball
+ *
+ * Values go into a staging copy and are committed when the newline arrives,
+ * so a partial or garbled line never changes the published targets. Anything
+ * unexpected drops the rest of the line and parsing resumes at the next '\n'.
+ * Only plain C++ is used so the same header builds for the Arduino and for
+ * the host harness (host/parser_harness.cpp).
+ */
+
+#ifndef VISION_STREAM_PARSER_H
+#define VISION_STREAM_PARSER_H
+
+#include <math.h>
+#include <stdint.h>
+#include <string.h>
+
+const int VISION_MAX_LINE = 512;        // Longer lines are treated as garbage
+const int VISION_KEY_SIZE = 16;         // Longest section/field/type name + 1
+const int VISION_FREE_BEARINGS = 64;    // Free-space profile entries
+const uint8_t VISION_FREE_CLEAR = 255;  // No obstacle on this bearing
+
+// One detected object. JSON angles are camera degrees; CSV theta is radians
+// as movetogoal1 expects it.
+struct VisionTarget {
+  bool found;
+  bool updated;       // Set when the last committed line mentioned this target
+  float angle;
+  float distance;
+  float confidence;
+  float width;
+  float height;
+  float x;
+  float y;
+  int age;            // Frames since the target was actually searched for
+};
+
+enum VisionTargetId {
+  VISION_BALL = 0,
+  VISION_YELLOW_GOAL,
+  VISION_BLUE_GOAL,
+  VISION_LINE,
+  VISION_TARGET_COUNT
+};
+
+struct VisionStreamParser {
+  // Published results, valid after feed() returns true
+  VisionTarget targets[VISION_TARGET_COUNT];
+  uint8_t freeSpaceCm[VISION_FREE_BEARINGS];
+  int freeSpaceCount;
+  bool freeSpaceUpdated;
+
+  // Frame header: camera frame number, capture time on the camera's clock and
+  // camera processing time before sending (ms)
+  uint32_t frameSeq;
+  uint32_t frameCaptureMs;
+  uint32_t frameProcessingMs;
+  bool frameUpdated;
+
+  // Counters for debugging the link
+  unsigned long lines;
+  unsigned long errors;
+
+  void begin() {
+    memset(this, 0, sizeof(*this));
+    for (int i = 0; i < VISION_TARGET_COUNT; i++) {
+      targets[i].distance = 100.0;
+    }
+    stage = *this;
+    state = LINE_START;
+  }
+
+  // Consume one byte. Returns true when a complete, well-formed line was
+  // committed to targets/freeSpaceCm.
+  bool feed(char c) {
+    if (c == '\n') {
+      bool ok = state != SKIP_LINE && finishLine();
+      state = LINE_START;
+      length = 0;
+      if (ok) {
+        commit();
+        lines++;
+      } else {
+        errors++;
+      }
+      return ok;
+    }
+    if (c == '\r' || state == SKIP_LINE) {
+      return false;
+    }
+    if (++length > VISION_MAX_LINE) {
+      fail();
+      return false;
+    }
+
+    switch (state) {
+      case LINE_START:
+        startLine();
+        if (c == '"') {
+          format = FORMAT_JSON;
+          startKey();
+          state = JSON_KEY;
+        } else if (isLetter(c)) {
+          format = FORMAT_CSV;
+          keyLength = 0;
+          appendKey(c);
+          state = CSV_TYPE;
+        } else if (c != ' ') {
+          fail();
+        }
+        break;
+
+      // ----- pseudo-JSON -----
+      case JSON_SEEK:
+        if (c == '"') {
+          startKey();
+          state = JSON_KEY;
+        } else if (c == '}' && section != NO_SECTION) {
+          section = NO_SECTION;
+        } else if (c != ' ' && c != ',') {
+          fail();
+        }
+        break;
+
+      case JSON_KEY:
+        if (c == '"') {
+          state = JSON_COLON;
+        } else {
+          appendKey(c);
+        }
+        break;
+
+      case JSON_COLON:
+        if (c != ':') {
+          fail();
+        } else {
+          state = JSON_VALUE;
+        }
+        break;
+
+      case JSON_VALUE:
+        if (c == ' ') {
+          break;
+        } else if (c == '{') {
+          // Only the top level holds sections
+          if (section != NO_SECTION) {
+            fail();
+          } else {
+            section = sectionFromKey();
+            state = JSON_SEEK;
+          }
+        } else if (section == NO_SECTION) {
+          fail();
+        } else if (c == '"') {
+          field = fieldFromKey();
+          profileIndex = 0;
+          state = JSON_STRING;
+        } else if (isNumberStart(c)) {
+          field = fieldFromKey();
+          startNumber(c);
+          state = JSON_NUMBER;
+        } else if (isLetter(c)) {
+          // true/false; inf/nan/null leave the field unchanged
+          field = fieldFromKey();
+          if (c == 't' || c == 'f') {
+            storeBool(c == 't');
+          }
+          state = JSON_WORD;
+        } else {
+          fail();
+        }
+        break;
+
+      case JSON_NUMBER:
+        if (!numberChar(c)) {
+          storeNumber();
+          state = JSON_SEEK;
+          feedSeek(c);
+        }
+        break;
+
+      case JSON_WORD:
+        if (!isLetter(c)) {
+          state = JSON_SEEK;
+          feedSeek(c);
+        }
+        break;
+
+      case JSON_STRING:
+        if (c == '"') {
+          if (section == SECTION_FREE && field == FIELD_PROFILE) {
+            stage.freeSpaceCount = profileIndex;
+            stage.freeSpaceUpdated = true;
+          }
+          state = JSON_SEEK;
+        } else if (section == SECTION_FREE && field == FIELD_PROFILE &&
+                   profileIndex < VISION_FREE_BEARINGS) {
+          // Keep the raw step here, scaled by cm_per_char on commit
+          stage.freeSpaceCm[profileIndex++] = profileStep(c);
+        }
+        break;
+
+      // ----- CSV -----
+      case CSV_TYPE:
+        if (c == ',') {
+          csvType = csvTypeFromKey();
+          if (csvType == NO_SECTION) {
+            fail();
+          } else {
+            csvField = 0;
+            state = CSV_VALUE;
+          }
+        } else if (isLetter(c) || c == '_') {
+          appendKey(c);
+        } else {
+          fail();
+        }
+        break;
+
+      case CSV_VALUE:
+        if (isNumberStart(c)) {
+          startNumber(c);
+          state = CSV_NUMBER;
+        } else if (c != ' ') {
+          fail();
+        }
+        break;
+
+      case CSV_NUMBER:
+        if (c == ',') {
+          storeCsvNumber();
+          state = CSV_VALUE;
+        } else if (!numberChar(c)) {
+          fail();
+        }
+        break;
+
+      default:
+        fail();
+        break;
+    }
+    return false;
+  }
+
+ private:
+  enum State {
+    LINE_START, SKIP_LINE,
+    JSON_SEEK, JSON_KEY, JSON_COLON, JSON_VALUE, JSON_NUMBER, JSON_WORD, JSON_STRING,
+    CSV_TYPE, CSV_VALUE, CSV_NUMBER
+  };
+  enum Format { FORMAT_JSON, FORMAT_CSV };
+  enum Section {
+    NO_SECTION = -1,
+    SECTION_BALL = VISION_BALL,
+    SECTION_YELLOW = VISION_YELLOW_GOAL,
+    SECTION_BLUE = VISION_BLUE_GOAL,
+    SECTION_LINE = VISION_LINE,
+    SECTION_FREE,
+    SECTION_FRAME,
+    SECTION_IGNORED    // Well-formed but unknown, skipped
+  };
+  enum Field {
+    FIELD_IGNORED, FIELD_FOUND, FIELD_ANGLE, FIELD_DISTANCE, FIELD_CONFIDENCE,
+    FIELD_WIDTH, FIELD_HEIGHT, FIELD_X, FIELD_Y, FIELD_AGE,
+    FIELD_CM_PER_CHAR, FIELD_PROFILE, FIELD_SEQ, FIELD_TIME, FIELD_PROCESSING
+  };
+
+  // Line being parsed: staged results plus the state machine
+  struct Stage {
+    VisionTarget targets[VISION_TARGET_COUNT];
+    uint8_t freeSpaceCm[VISION_FREE_BEARINGS];
+    int freeSpaceCount;
+    bool freeSpaceUpdated;
+    int cmPerChar;
+    uint32_t frameSeq;
+    uint32_t frameCaptureMs;
+    uint32_t frameProcessingMs;
+    bool frameUpdated;
+    Stage &operator=(const VisionStreamParser &p) {
+      memcpy(targets, p.targets, sizeof(targets));
+      memcpy(freeSpaceCm, p.freeSpaceCm, sizeof(freeSpaceCm));
+      freeSpaceCount = p.freeSpaceCount;
+      freeSpaceUpdated = false;
+      cmPerChar = 2;
+      frameSeq = p.frameSeq;
+      frameCaptureMs = p.frameCaptureMs;
+      frameProcessingMs = p.frameProcessingMs;
+      frameUpdated = false;
+      return *this;
+    }
+  } stage;
+  State state;
+  Format format;
+  int length;
+  char key[VISION_KEY_SIZE];
+  int keyLength;
+  int section;
+  int field;
+  int csvType;
+  int csvField;
+  int profileIndex;
+
+  // Number being read: mantissa * 10^exponent
+  bool negative;
+  bool seenDot;
+  bool inExponent;
+  bool exponentNegative;
+  int exponentDigits;
+  uint32_t mantissa;
+  int exponent;
+  int explicitExponent;
+
+  static bool isLetter(char c) { return (c >= 'a' && c <= 'z') || (c >= 'A' && c <= 'Z'); }
+  static bool isDigit(char c) { return c >= '0' && c <= '9'; }
+  static bool isNumberStart(char c) { return isDigit(c) || c == '-' || c == '.'; }
+
+  void fail() { state = SKIP_LINE; }
+
+  void startLine() {
+    stage = *this;
+    for (int i = 0; i < VISION_TARGET_COUNT; i++) {
+      stage.targets[i].updated = false;
+    }
+    section = NO_SECTION;
+    csvType = NO_SECTION;
+  }
+
+  void startKey() { keyLength = 0; }
+
+  void appendKey(char c) {
+    if (keyLength < VISION_KEY_SIZE - 1) {
+      key[keyLength++] = c;
+    } else {
+      fail();
+    }
+  }
+
+  bool keyIs(const char *name) {
+    key[keyLength] = '\0';
+    return strcmp(key, name) == 0;
+  }
+
+  int sectionFromKey() {
+    if (keyIs("ball")) return SECTION_BALL;
+    if (keyIs("yellow_goal")) return SECTION_YELLOW;
+    if (keyIs("blue_goal")) return SECTION_BLUE;
+    if (keyIs("line")) return SECTION_LINE;
+    if (keyIs("free")) return SECTION_FREE;
+    if (keyIs("frame")) return SECTION_FRAME;
+    return SECTION_IGNORED;
+  }
+
+  int fieldFromKey() {
+    if (keyIs("found")) return FIELD_FOUND;
+    if (keyIs("angle")) return FIELD_ANGLE;
+    if (keyIs("distance")) return FIELD_DISTANCE;
+    if (keyIs("confidence")) return FIELD_CONFIDENCE;
+    if (keyIs("width")) return FIELD_WIDTH;
+    if (keyIs("height")) return FIELD_HEIGHT;
+    if (keyIs("x")) return FIELD_X;
+    if (keyIs("y")) return FIELD_Y;
+    if (keyIs("age")) return FIELD_AGE;
+    if (keyIs("cm_per_char")) return FIELD_CM_PER_CHAR;
+    if (keyIs("profile")) return FIELD_PROFILE;
+    if (keyIs("seq")) return FIELD_SEQ;
+    if (keyIs("t")) return FIELD_TIME;
+    if (keyIs("proc")) return FIELD_PROCESSING;
+    return FIELD_IGNORED;
+  }
+
+  int csvTypeFromKey() {
+    if (keyIs("ball")) return SECTION_BALL;
+    if (keyIs("blue")) return SECTION_BLUE;
+    if (keyIs("yellow")) return SECTION_YELLOW;
+    return NO_SECTION;
+  }
+
+  // Same alphabet as mainNationals' encode_free_space()
+  static uint8_t profileStep(char c) {
+    if (c >= '0' && c <= '9') return c - '0';
+    if (c >= 'A' && c <= 'Z') return c - 'A' + 10;
+    if (c >= 'a' && c <= 'z') return c - 'a' + 36;
+    return VISION_FREE_CLEAR;
+  }
+
+  void startNumber(char c) {
+    negative = c == '-';
+    seenDot = c == '.';
+    inExponent = false;
+    exponentNegative = false;
+    exponentDigits = 0;
+    mantissa = isDigit(c) ? c - '0' : 0;
+    exponent = 0;
+    explicitExponent = 0;
+  }
+
+  // Accumulate one character of a number; false if it ends the number
+  bool numberChar(char c) {
+    if (isDigit(c)) {
+      if (inExponent) {
+        if (explicitExponent < 100) explicitExponent = explicitExponent * 10 + (c - '0');
+        exponentDigits++;
+      } else if (mantissa < 429496729UL) {  // Still fits a uint32_t after one more digit
+        mantissa = mantissa * 10 + (c - '0');
+        if (seenDot) exponent--;
+      } else if (!seenDot) {
+        exponent++;  // Out of precision, keep the magnitude
+      }
+      return true;
+    }
+    if (c == '.' && !seenDot && !inExponent) {
+      seenDot = true;
+      return true;
+    }
+    if ((c == 'e' || c == 'E') && !inExponent) {
+      inExponent = true;
+      return true;
+    }
+    if ((c == '-' || c == '+') && inExponent && exponentDigits == 0) {
+      exponentNegative = c == '-';
+      return true;
+    }
+    return false;
+  }
+
+  float numberValue() {
+    int e = exponent + (exponentNegative ? -explicitExponent : explicitExponent);
+    float value = (float)mantissa;
+    for (; e > 0; e--) value *= 10.0f;
+    for (; e < 0; e++) value *= 0.1f;
+    return negative ? -value : value;
+  }
+
+  // Exact value of a non-negative whole number (float only has 24 bits)
+  uint32_t numberInteger() {
+    int e = exponent + (exponentNegative ? -explicitExponent : explicitExponent);
+    uint32_t value = negative ? 0 : mantissa;
+    for (; e > 0; e--) value *= 10;
+    for (; e < 0; e++) value /= 10;
+    return value;
+  }
+
+  // Re-examine the character that ended a JSON value
+  void feedSeek(char c) {
+    if (c == '}' && section != NO_SECTION) {
+      section = NO_SECTION;
+    } else if (c != ',' && c != ' ') {
+      fail();
+    }
+  }
+
+  void storeBool(bool value) {
+    if (section >= 0 && section < VISION_TARGET_COUNT && field == FIELD_FOUND) {
+      stage.targets[section].found = value;
+      stage.targets[section].updated = true;
+    }
+  }
+
+  void storeNumber() {
+    if (section == SECTION_FRAME) {
+      uint32_t value = numberInteger();
+      switch (field) {
+        case FIELD_SEQ: stage.frameSeq = value; stage.frameUpdated = true; break;
+        case FIELD_TIME: stage.frameCaptureMs = value; break;
+        case FIELD_PROCESSING: stage.frameProcessingMs = value; break;
+        default: break;
+      }
+      return;
+    }
+    float value = numberValue();
+    if (section == SECTION_FREE) {
+      if (field == FIELD_CM_PER_CHAR) stage.cmPerChar = (int)value;
+      return;
+    }
+    if (section < 0 || section >= VISION_TARGET_COUNT) {
+      return;
+    }
+    VisionTarget &t = stage.targets[section];
+    switch (field) {
+      case FIELD_ANGLE: t.angle = value; break;
+      case FIELD_DISTANCE: t.distance = value; break;
+      case FIELD_CONFIDENCE: t.confidence = value; break;
+      case FIELD_WIDTH: t.width = value; break;
+      case FIELD_HEIGHT: t.height = value; break;
+      case FIELD_X: t.x = value; break;
+      case FIELD_Y: t.y = value; break;
+      case FIELD_AGE: t.age = (int)value; break;
+      default: break;
+    }
+  }
+
+  // Column order of the movetogoal1 CSV messages
+  void storeCsvNumber() {
+    float value = numberValue();
+    VisionTarget &t = stage.targets[csvType];
+    if (csvType == SECTION_BALL) {
+      // ball,x,y,xVel,yVel,theta,confidence
+      switch (csvField) {
+        case 0: t.x = value; break;
+        case 1: t.y = value; break;
+        case 4: t.angle = value; break;
+        case 5: t.confidence = value; break;
+        default: break;
+      }
+    } else {
+      // blue,dist,theta,w,h,confidence and yellow,dist,theta,w,h
+      switch (csvField) {
+        case 0: t.distance = value; break;
+        case 1: t.angle = value; break;
+        case 2: t.width = value; break;
+        case 3: t.height = value; break;
+        case 4: t.confidence = value; break;
+        default: break;
+      }
+    }
+    csvField++;
+  }
+
+  // Validate the end of a line before committing it
+  bool finishLine() {
+    if (format == FORMAT_JSON) {
+      if (state == JSON_NUMBER || state == JSON_WORD) {
+        return false;  // Value not closed by '}'
+      }
+      return state == JSON_SEEK && section == NO_SECTION;
+    }
+    if (state == CSV_TYPE) {
+      // Single word lines
+      if (!keyIs("no_ball")) return false;
+      stage.targets[VISION_BALL].found = false;
+      stage.targets[VISION_BALL].updated = true;
+      return true;
+    }
+    if (state != CSV_NUMBER) {
+      return false;
+    }
+    storeCsvNumber();
+    // Same minimum column counts as the old sscanf() checks
+    int needed = csvType == SECTION_BALL ? 6 : (csvType == SECTION_BLUE ? 5 : 4);
+    if (csvField < needed) {
+      return false;
+    }
+    VisionTarget &t = stage.targets[csvType];
+    if (csvType == SECTION_BALL) {
+      t.distance = sqrtf(t.x * t.x + t.y * t.y);
+    }
+    t.found = true;
+    t.updated = true;
+    return true;
+  }
+
+  void commit() {
+    memcpy(targets, stage.targets, sizeof(targets));
+    frameUpdated = stage.frameUpdated;
+    if (frameUpdated) {
+      frameSeq = stage.frameSeq;
+      frameCaptureMs = stage.frameCaptureMs;
+      frameProcessingMs = stage.frameProcessingMs;
+    }
+    freeSpaceUpdated = stage.freeSpaceUpdated;
+    if (freeSpaceUpdated) {
+      freeSpaceCount = stage.freeSpaceCount;
+      for (int i = 0; i < freeSpaceCount; i++) {
+        uint8_t step = stage.freeSpaceCm[i];
+        int cm = step * stage.cmPerChar;
+        freeSpaceCm[i] = step == VISION_FREE_CLEAR ? VISION_FREE_CLEAR
+                         : (cm < VISION_FREE_CLEAR ? cm : VISION_FREE_CLEAR - 1);
+      }
+    }
+  }
+};
+
+#endif